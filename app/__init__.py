@@ -5,7 +5,6 @@ import string
 import time
 import uuid
 from contextlib import contextmanager
-from threading import Lock
 from time import monotonic
 
 from celery import Celery, Task, current_task
@@ -25,19 +24,22 @@ from werkzeug.exceptions import HTTPException as WerkzeugHTTPException
 from werkzeug.local import LocalProxy
 
 from app import config
+from app.aws.job_cache import JobCache
+from app.aws.job_row_store import JobRowStore
 from app.clients import NotificationProviderClients
 from app.clients.cloudwatch.aws_cloudwatch import AwsCloudwatchClient
 from app.clients.document_download import DocumentDownloadClient
 from app.clients.email.aws_ses import AwsSesClient
 from app.clients.email.aws_ses_stub import AwsSesStubClient
 from app.clients.sms.aws_sns import AwsSnsClient
+from app.model_cache import ModelCache
 from notifications_utils import logging, request_helper
 from notifications_utils.clients.encryption.encryption_client import Encryption
 from notifications_utils.clients.redis.redis_client import RedisClient
 from notifications_utils.clients.zendesk.zendesk_client import ZendeskClient
 
-job_cache = {}
-job_cache_lock = Lock()
+job_cache = JobCache()
+job_row_store = JobRowStore()
 
 
 class NotifyCelery(Celery):
@@ -103,6 +105,7 @@ zendesk_client = None
 # safe to do this for monkeypatching because all real work happens in redis_store.init_app()
 # called in create_app()
 redis_store = RedisClient()
+model_cache = ModelCache(redis_store)
 document_download_client = None
 
 # safe for monkey patching, all work down in
@@ -239,6 +242,9 @@ def create_app(application):
 
     notify_celery.init_app(application)
     redis_store.init_app(application)
+    model_cache.init_app(application)
+    job_cache.init_app(application)
+    job_row_store.init_app(application)
 
     register_blueprint(application)
 
@@ -1,12 +1,18 @@
 import os
 import uuid
+from threading import Lock
 
+import cachetools
+import jwt
 from flask import current_app, g, request
 from sqlalchemy.orm.exc import NoResultFound
 
 from app.serialised_models import SerialisedService
+from notifications_python_client.authentication import __bound__ as TOKEN_LEEWAY
 from notifications_python_client.authentication import (
     decode_jwt_token,
+    decode_token,
+    epoch_seconds,
     get_token_issuer,
 )
 from notifications_python_client.errors import (
@@ -26,6 +32,15 @@ TOKEN_MESSAGE_ONE = (
 TOKEN_MESSAGE_TWO = "at https://docs.notifications.service.gov.uk/rest-api.html#authorisation-header"  # nosec B105
 GENERAL_TOKEN_ERROR_MESSAGE = TOKEN_MESSAGE_ONE + TOKEN_MESSAGE_TWO
 
+# Clients reuse a token for as long as it is valid, so remember the ones whose
+# signature has been checked (with the api key that signed them) until then
+verified_tokens = cachetools.TLRUCache(
+    maxsize=10_000,
+    ttu=lambda token, verified, now: verified[2],
+    timer=epoch_seconds,
+)
+verified_tokens_lock = Lock()
+
 
 class AuthError(Exception):
     def __init__(self, message, code, service_id=None, api_key_id=None):
@@ -142,68 +157,106 @@ def _decode_jwt_token(auth_token, api_keys, service_id=None):
         for api_key in api_keys:
             return api_key
 
+    api_key = _get_verified_api_key(auth_token, api_keys)
+    if api_key is None:
+        for api_key in _candidate_api_keys(auth_token, api_keys):
+            if _verify_jwt_token(auth_token, api_key, service_id):
+                break
+        else:
+            # service has API keys, but none matching the one the user provided
+            err_msg = "Invalid token: API key not found"
+            current_app.logger.error(err_msg)
+            raise AuthError(err_msg, 403, service_id=service_id)
+
+    if api_key.expiry_date:
+        err_msg = "Invalid token: API key revoked"
+        current_app.logger.error(err_msg)
+        raise AuthError(
+            err_msg,
+            403,
+            service_id=service_id,
+            api_key_id=api_key.id,
+        )
+
+    return api_key
+
+
+def _get_verified_api_key(auth_token, api_keys):
+    with verified_tokens_lock:
+        verified = verified_tokens.get(auth_token)
+    if verified is None:
+        return None
+    api_key_id, secret, _ = verified
     for api_key in api_keys:
-        try:
-            decode_jwt_token(auth_token, api_key.secret)
-        except TypeError:
-            err_msg = "Invalid token: type error"
-            current_app.logger.exception(err_msg)
-            raise AuthError(
-                "Invalid token: type error",
-                403,
-                service_id=service_id,
-                api_key_id=api_key.id,
-            )
-        except TokenExpiredError:
-            if not current_app.config.get("ALLOW_EXPIRED_API_TOKEN", False):
-                err_msg = (
-                    "Error: Your system clock must be accurate to within 30 seconds"
-                )
-                current_app.logger.exception(err_msg)
-                raise AuthError(
-                    err_msg, 403, service_id=service_id, api_key_id=api_key.id
-                )
-        except TokenAlgorithmError:
-            err_msg = "Invalid token: algorithm used is not HS256"
+        # the key might have been deleted, or rotated if it is an internal one
+        if api_key.id == api_key_id and api_key.secret == secret:
+            return api_key
+    return None
+
+
+def _candidate_api_keys(auth_token, api_keys):
+    """
+    The key a token names in its kid header if there is one, otherwise all of
+    them, as the token does not say which one signed it.
+    """
+    try:
+        key_id = jwt.get_unverified_header(auth_token).get("kid")
+    except jwt.InvalidTokenError:
+        key_id = None
+    if key_id is not None:
+        for api_key in api_keys:
+            if str(api_key.id) == key_id:
+                return [api_key]
+    return api_keys
+
+
+def _verify_jwt_token(auth_token, api_key, service_id):
+    """
+    Return whether auth_token was signed by api_key, raising AuthError if it
+    was but is not valid.
+    """
+    try:
+        decode_jwt_token(auth_token, api_key.secret)
+    except TypeError:
+        err_msg = "Invalid token: type error"
+        current_app.logger.exception(err_msg)
+        raise AuthError(
+            "Invalid token: type error",
+            403,
+            service_id=service_id,
+            api_key_id=api_key.id,
+        )
+    except TokenExpiredError:
+        if not current_app.config.get("ALLOW_EXPIRED_API_TOKEN", False):
+            err_msg = "Error: Your system clock must be accurate to within 30 seconds"
             current_app.logger.exception(err_msg)
             raise AuthError(err_msg, 403, service_id=service_id, api_key_id=api_key.id)
-        except TokenDecodeError:
-            # we attempted to validate the token but it failed meaning it was not signed using this api key.
-            # Let's try the next one
-            # TODO: Change this so it doesn't also catch `TokenIssuerError` or `TokenIssuedAtError` exceptions (which
-            # are children of `TokenDecodeError`) as these should cause an auth error immediately rather than
-            # continue on to check the next API key
-            current_app.logger.exception(
-                "TokenDecodeError. Couldn't decode auth token for given api key"
-            )
-            continue
-        except TokenError:
-            current_app.logger.exception("TokenError")
-            # General error when trying to decode and validate the token
-            raise AuthError(
-                GENERAL_TOKEN_ERROR_MESSAGE,
-                403,
-                service_id=service_id,
-                api_key_id=api_key.id,
-            )
-
-        if api_key.expiry_date:
-            err_msg = "Invalid token: API key revoked"
-            current_app.logger.error(err_msg, exc_info=True)
-            raise AuthError(
-                err_msg,
-                403,
-                service_id=service_id,
-                api_key_id=api_key.id,
-            )
-
-        return api_key
-    else:
-        # service has API keys, but none matching the one the user provided
-        # if we get here, we probably hit TokenDecodeErrors earlier
-        err_msg = "Invalid token: API key not found"
-        current_app.logger.error(err_msg, exc_info=True)
-        raise AuthError(err_msg, 403, service_id=service_id)
+        return True
+    except TokenAlgorithmError:
+        err_msg = "Invalid token: algorithm used is not HS256"
+        current_app.logger.exception(err_msg)
+        raise AuthError(err_msg, 403, service_id=service_id, api_key_id=api_key.id)
+    except TokenDecodeError:
+        # we attempted to validate the token but it failed meaning it was not signed using this api key.
+        # TODO: Change this so it doesn't also catch `TokenIssuerError` or `TokenIssuedAtError` exceptions (which
+        # are children of `TokenDecodeError`) as these should cause an auth error immediately rather than
+        # continue on to check the next API key
+        return False
+    except TokenError:
+        current_app.logger.exception("TokenError")
+        # General error when trying to decode and validate the token
+        raise AuthError(
+            GENERAL_TOKEN_ERROR_MESSAGE,
+            403,
+            service_id=service_id,
+            api_key_id=api_key.id,
+        )
+
+    # the token can be used until it is TOKEN_LEEWAY seconds old
+    expires_at = int(decode_token(auth_token)["iat"]) + TOKEN_LEEWAY
+    with verified_tokens_lock:
+        verified_tokens[auth_token] = (api_key.id, api_key.secret, expires_at)
+    return True
 
 
 def _get_auth_token(req):
@@ -0,0 +1,163 @@
+import sys
+import time
+from collections import OrderedDict
+from threading import RLock
+
+# Jobs can be scheduled 3 days ahead and reports cover 7 days, keep a day spare
+DEFAULT_TTL = 8 * 24 * 60 * 60
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def sizeof(value):
+    """Rough number of bytes held by a cached value, following dicts, lists, tuples and sets."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sizeof(key) + sizeof(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(sizeof(item) for item in value)
+    return size
+
+
+class _Entry:
+    __slots__ = ("value", "expiry", "views", "size")
+
+    def __init__(self, value, expiry):
+        self.value = value
+        self.expiry = expiry
+        self.views = {}
+        self.size = sizeof(value)
+
+
+class JobCache:
+    """
+    Per-process cache of job csv files, bounded by an approximate byte budget.
+
+    Entries are evicted least recently used first once the budget is exceeded,
+    and expired entries are dropped as soon as they are read. Views derived
+    from a cached value (e.g. the phone numbers of a job) are stored on the
+    entry they came from, so they are counted against the budget and expire
+    and get evicted together with it.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = RLock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def init_app(self, app):
+        self.max_bytes = app.config["JOB_CACHE_MAX_BYTES"]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        entry = self._entries.get(str(key))
+        return entry is not None and entry.expiry >= time.time()
+
+    def set(self, key, value):
+        """Cache value under key, returns False if it is too big to ever fit in the budget."""
+        key = str(key)
+        entry = _Entry(value, time.time() + self.ttl)
+        with self._lock:
+            self._remove(key)
+            if entry.size > self.max_bytes:
+                return False
+            self._entries[key] = entry
+            self.bytes += entry.size
+            self._evict()
+        return True
+
+    def get(self, key):
+        """Return a (value, expiry) tuple, or None if key is not cached or has expired."""
+        with self._lock:
+            entry = self._lookup(str(key))
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry.value, entry.expiry
+
+    def get_view(self, key, name, derive):
+        """
+        Return the view called name of the value cached under key, building it
+        with derive(value) the first time it is asked for. Returns None if key
+        is not cached.
+        """
+        key = str(key)
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if name in entry.views:
+                self.hits += 1
+                return entry.views[name]
+            self.misses += 1
+
+        # parsing a big job can take a while, don't hold up other lookups
+        view = derive(entry.value)
+
+        with self._lock:
+            if self._entries.get(key) is entry and name not in entry.views:
+                size = sizeof(view)
+                entry.views[name] = view
+                entry.size += size
+                self.bytes += size
+                self._evict()
+        return view
+
+    def clean(self):
+        """Drop all expired entries, returning their keys."""
+        now = time.time()
+        with self._lock:
+            expired = [
+                key for key, entry in self._entries.items() if entry.expiry < now
+            ]
+            for key in expired:
+                self._remove(key)
+            self.expirations += len(expired)
+        return expired
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expiry < time.time():
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self.bytes -= entry.size
+            self.evictions += 1
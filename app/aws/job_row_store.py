@@ -0,0 +1,180 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from collections import OrderedDict
+from threading import Lock
+
+# Same lifetime as the in-memory job cache, see app/aws/job_cache.py
+DEFAULT_TTL = 8 * 24 * 60 * 60
+DEFAULT_MAX_OPEN = 64
+
+MAGIC = b"NJRS"
+VERSION = 1
+FILE_SUFFIX = ".rows"
+
+# magic, version, number of phone numbers, number of personalisation rows
+_HEADER = struct.Struct("<4sHxxQQ")
+_SPAN = struct.Struct("<QQ")
+_OFFSET_SIZE = 8
+
+
+def _column(values):
+    """Concatenate the encoded values of a column, with where each value ends."""
+    data = bytearray()
+    ends = []
+    for value in values:
+        data += value
+        ends.append(len(data))
+    return data, ends
+
+
+class JobRows:
+    """
+    Read-only view of one job's row file.
+
+    The file holds a header, an index of offsets for each column and then the
+    columns themselves, so row N of either column is found with one index read
+    and the page cache is shared by every process on the node.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.phone_count, self.personalisation_count = (
+            _HEADER.unpack_from(self._mmap, 0)
+        )
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a version {VERSION} job row file")
+        self._phone_index = _HEADER.size
+        self._personalisation_index = (
+            self._phone_index + (self.phone_count + 1) * _OFFSET_SIZE
+        )
+
+    def _read(self, index, count, row):
+        if not 0 <= row < count:
+            return None
+        start, end = _SPAN.unpack_from(self._mmap, index + row * _OFFSET_SIZE)
+        return self._mmap[start:end]
+
+    def phone(self, row):
+        value = self._read(self._phone_index, self.phone_count, row)
+        return None if value is None else value.decode("utf-8")
+
+    def personalisation(self, row):
+        value = self._read(self._personalisation_index, self.personalisation_count, row)
+        return None if value is None else json.loads(value)
+
+
+class JobRowStore:
+    """
+    Per-node store of job rows, one memory-mapped file per job.
+
+    Files are written once, to a temporary name that is then renamed into
+    place, so a worker never sees a half written file and two workers
+    building the same job at once just race to an identical result.
+    """
+
+    def __init__(self, directory=None, ttl=DEFAULT_TTL, max_open=DEFAULT_MAX_OPEN):
+        self.directory = directory or os.path.join(
+            tempfile.gettempdir(), "notify-job-rows"
+        )
+        self.ttl = ttl
+        self.max_open = max_open
+        self._open = OrderedDict()
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.directory = app.config["JOB_ROW_STORE_DIR"]
+
+    def path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}{FILE_SUFFIX}")
+
+    def open(self, job_id):
+        """Return the rows of a job, or None if they have not been stored on this node."""
+        job_id = str(job_id)
+        with self._lock:
+            rows = self._open.get(job_id)
+            if rows is not None:
+                self._open.move_to_end(job_id)
+                return rows
+        try:
+            rows = JobRows(self.path(job_id))
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # left by an older version, treat it as missing so it gets rebuilt
+            return None
+        return self._remember(job_id, rows)
+
+    def build(self, job_id, phones, personalisation):
+        """
+        Store a job's rows, given the dicts of row number to phone number and
+        to personalisation that extract_phones/extract_personalisation return.
+        """
+        job_id = str(job_id)
+        phone_data, phone_ends = _column(
+            phones[row].encode("utf-8") for row in range(len(phones))
+        )
+        personalisation_data, personalisation_ends = _column(
+            json.dumps(personalisation[row], separators=(",", ":")).encode("utf-8")
+            for row in range(len(personalisation))
+        )
+
+        phone_start = (
+            _HEADER.size
+            + (len(phone_ends) + 1 + len(personalisation_ends) + 1) * _OFFSET_SIZE
+        )
+        personalisation_start = phone_start + len(phone_data)
+        index = [phone_start] + [phone_start + end for end in phone_ends]
+        index += [personalisation_start]
+        index += [personalisation_start + end for end in personalisation_ends]
+
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f".{job_id}")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(
+                    _HEADER.pack(
+                        MAGIC, VERSION, len(phone_ends), len(personalisation_ends)
+                    )
+                )
+                f.write(struct.pack(f"<{len(index)}Q", *index))
+                f.write(phone_data)
+                f.write(personalisation_data)
+            os.replace(tmp_path, self.path(job_id))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return self._remember(job_id, JobRows(self.path(job_id)))
+
+    def clean(self):
+        """Delete row files older than the ttl, returning the ids of their jobs."""
+        if not os.path.isdir(self.directory):
+            return []
+        cutoff = time.time() - self.ttl
+        expired = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(FILE_SUFFIX):
+                    continue
+                if entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+                    expired.append(entry.name[: -len(FILE_SUFFIX)])
+        with self._lock:
+            for job_id in expired:
+                self._open.pop(job_id, None)
+        return expired
+
+    def _remember(self, job_id, rows):
+        # maps are closed when the last reference goes, not here, because
+        # another greenlet may still be reading a row from the one we drop
+        with self._lock:
+            self._open[job_id] = rows
+            self._open.move_to_end(job_id)
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return rows
@@ -1,16 +1,21 @@
 import csv
 import datetime
 import re
-import time
+import shutil
+import tempfile
 import urllib
-from io import StringIO
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+from io import StringIO, TextIOWrapper
+from threading import Lock
 
 import botocore
 import gevent
 from boto3 import Session
+from boto3.exceptions import S3UploadFailedError
 from flask import current_app
 
-from app import job_cache, job_cache_lock
+from app import job_cache, job_row_store
 from app.clients import AWS_CLIENT_CONFIG
 
 # from app.service.rest import get_service_by_id
@@ -20,6 +25,23 @@ from notifications_utils import aware_utcnow
 FILE_LOCATION_STRUCTURE = "service-{}-notify/{}.csv"
 NEW_FILE_LOCATION_STRUCTURE = "{}-service-notify/{}.csv"
 
+# Error codes S3 uses for a key that isn't there. Without s3:ListBucket
+# permission it answers AccessDenied rather than admit the key is missing.
+MISSING_KEY_ERROR_CODES = {"NoSuchKey", "404", "AccessDenied"}
+THROTTLING_ERROR_CODES = {"Throttling", "RequestTimeout", "SlowDown"}
+
+# How many jobs to remember the key layout of, see get_job_object
+MAX_REMEMBERED_JOB_LOCATIONS = 10_000
+
+# Jobs bigger than this are spooled to disk, see get_job_lines_and_metadata_from_s3
+JOB_SPOOL_MAX_MEMORY = 1024 * 1024
+JOB_SPOOL_CHUNK_SIZE = 64 * 1024
+
+S3Object = namedtuple("S3Object", ["body", "metadata", "etag"])
+
+_job_locations = OrderedDict()
+_job_locations_lock = Lock()
+
 # Temporarily extend cache to 7 days
 ttl = 60 * 60 * 24 * 7
 
@@ -32,16 +54,63 @@ def get_service_id_from_key(key):
 
 
 def set_job_cache(key, value):
-    # current_app.logger.debug(f"Setting {key} in the job_cache to {value}.")
-
-    with job_cache_lock:
-        job_cache[key] = (value, time.time() + 8 * 24 * 60 * 60)
+    job_cache.set(key, value)
 
 
 def get_job_cache(key):
-    key = str(key)
-    ret = job_cache.get(key)
-    return ret
+    return job_cache.get(key)
+
+
+def get_job_cache_view(job_id, job, name, derive):
+    """
+    Return a view of a job csv (its phone numbers, its personalisation) that is
+    derived from, and cached alongside, the csv itself.
+    """
+    view = job_cache.get_view(job_id, name, derive)
+    if view is None:
+        # the job was evicted, or is too big to cache
+        view = derive(job)
+    return view
+
+
+def store_job(service_id, job_id, job):
+    """
+    Write a job's phone numbers and personalisation to this node's row store,
+    where every worker on the node can read them without going back to S3.
+    If that fails, or the job is missing, the csv is kept in the in-memory
+    job cache instead and None is returned.
+    """
+    if job is not None:
+        try:
+            return job_row_store.build(
+                job_id,
+                extract_phones(job, service_id, job_id),
+                extract_personalisation(job),
+            )
+        except OSError:
+            current_app.logger.exception(
+                f"Couldn't store rows of job {job_id} on disk, keeping it in memory"
+            )
+    # Even if it is None, put it here so we don't keep asking S3 for it
+    set_job_cache(job_id, job)
+    return None
+
+
+def get_job_rows(service_id, job_id):
+    """
+    Return (rows, job) for a job: its rows from this node's row store or,
+    when they couldn't be stored there, its csv from the in-memory job cache.
+    Both are None if the job is missing.
+    """
+    rows = job_row_store.open(job_id)
+    if rows is not None:
+        return rows, None
+    job = get_job_cache(job_id)
+    if job is not None:
+        # skip expiration date from cache, we don't need it here
+        return None, job[0]
+    job = get_job_from_s3(service_id, job_id)
+    return store_job(service_id, job_id, job), job
 
 
 def len_job_cache():
@@ -51,46 +120,54 @@ def len_job_cache():
 
 
 def clean_cache():
-    current_time = time.time()
-    keys_to_delete = []
-
-    with job_cache_lock:
-        for key, (_, expiry_time) in job_cache.items():
-            if expiry_time < current_time:
-                keys_to_delete.append(key)
-
-        current_app.logger.debug(
-            f"Deleting the following keys from the job_cache: {keys_to_delete}"
-        )
-        for key in keys_to_delete:
-            del job_cache[key]
-
+    keys_deleted = job_cache.clean()
+    current_app.logger.debug(
+        f"Deleted the following keys from the job_cache: {keys_deleted}"
+    )
+    current_app.logger.info(f"job_cache stats: {job_cache.stats()}")
+    jobs_deleted = job_row_store.clean()
+    current_app.logger.debug(
+        f"Deleted the rows of the following jobs from the row store: {jobs_deleted}"
+    )
 
-def get_s3_client():
 
-    access_key = current_app.config["CSV_UPLOAD_BUCKET"]["access_key_id"]
-    secret_key = current_app.config["CSV_UPLOAD_BUCKET"]["secret_access_key"]
-    region = current_app.config["CSV_UPLOAD_BUCKET"]["region"]
-    session = Session(
+@lru_cache(maxsize=8)
+def _get_s3_session(access_key, secret_key, region):
+    # Building a session is slow and every client/resource made from it gets
+    # its own connection pool, so share one per set of credentials
+    return Session(
         aws_access_key_id=access_key,
         aws_secret_access_key=secret_key,
         region_name=region,
     )
-    s3_client = session.client("s3", config=AWS_CLIENT_CONFIG)
-    return s3_client
 
 
-def get_s3_resource():
-    access_key = current_app.config["CSV_UPLOAD_BUCKET"]["access_key_id"]
-    secret_key = current_app.config["CSV_UPLOAD_BUCKET"]["secret_access_key"]
-    region = current_app.config["CSV_UPLOAD_BUCKET"]["region"]
-    session = Session(
-        aws_access_key_id=access_key,
-        aws_secret_access_key=secret_key,
-        region_name=region,
+@lru_cache(maxsize=8)
+def _get_s3_client(access_key, secret_key, region):
+    session = _get_s3_session(access_key, secret_key, region)
+    return session.client("s3", config=AWS_CLIENT_CONFIG)
+
+
+@lru_cache(maxsize=8)
+def _get_s3_resource(access_key, secret_key, region):
+    session = _get_s3_session(access_key, secret_key, region)
+    return session.resource("s3", config=AWS_CLIENT_CONFIG)
+
+
+def _get_csv_upload_credentials():
+    return (
+        current_app.config["CSV_UPLOAD_BUCKET"]["access_key_id"],
+        current_app.config["CSV_UPLOAD_BUCKET"]["secret_access_key"],
+        current_app.config["CSV_UPLOAD_BUCKET"]["region"],
     )
-    s3_resource = session.resource("s3", config=AWS_CLIENT_CONFIG)
-    return s3_resource
+
+
+def get_s3_client():
+    return _get_s3_client(*_get_csv_upload_credentials())
+
+
+def get_s3_resource():
+    return _get_s3_resource(*_get_csv_upload_credentials())
 
 
 def _get_bucket_name():
@@ -237,14 +314,14 @@ def get_job_id_from_s3_object_key(key):
 def read_s3_file(bucket_name, object_key, s3res):
     """
     This method runs during the 'regenerate job cache' task.
-    Note that in addition to retrieving the jobs and putting them
-    into the cache, this method also does some pre-processing by
-    putting a list of all phone numbers into the cache as well.
+    Note that in addition to retrieving the jobs, this method also
+    does some pre-processing by writing the phone numbers and the
+    personalisation of every row to the row store on this node.
 
-    This means that when the report needs to be regenerated, it
-    can easily find the phone numbers in the cache through job_cache[<job_id>_phones]
-    and the personalization through job_cache[<job_id>_personalisation], which
-    in theory should make report generation a lot faster.
+    This means that when the report needs to be regenerated, any
+    worker can find the phone number and personalisation of a row
+    without downloading and parsing the job, which in theory should
+    make report generation a lot faster.
 
     We are moving processing from the front end where the user can see it
     in wait time, to this back end process.
@@ -253,19 +330,23 @@ def read_s3_file(bucket_name, object_key, s3res):
         job_id = get_job_id_from_s3_object_key(object_key)
         service_id = get_service_id_from_key(object_key)
 
-        if get_job_cache(job_id) is None:
+        if job_row_store.open(job_id) is None and get_job_cache(job_id) is None:
             job = (
                 s3res.Object(bucket_name, object_key)
                 .get()["Body"]
                 .read()
                 .decode("utf-8")
             )
-            set_job_cache(job_id, job)
-            set_job_cache(f"{job_id}_phones", extract_phones(job, service_id, job_id))
-            set_job_cache(
-                f"{job_id}_personalisation",
-                extract_personalisation(job),
-            )
+            if store_job(service_id, job_id, job) is None:
+                get_job_cache_view(
+                    job_id,
+                    job,
+                    "phones",
+                    lambda job: extract_phones(job, service_id, job_id),
+                )
+                get_job_cache_view(
+                    job_id, job, "personalisation", extract_personalisation
+                )
     except botocore.exceptions.ClientError as e:
         if e.response["Error"]["Code"] == "NoSuchKey":
             current_app.logger.error(f"NoSuchKey: {object_key}")
@@ -305,6 +386,7 @@ def get_s3_files():
     current_app.logger.info(
         f"job_cache length after regen: {len_job_cache()} #notify-debug-admin-1200"
     )
+    current_app.logger.info(f"job_cache stats: {job_cache.stats()}")
 
 
 def get_s3_file(bucket_name, file_location, access_key, secret_key, region):
@@ -396,13 +478,106 @@ def get_old_job_location(service_id, job_id):
     )
 
 
-def get_job_and_metadata_from_s3(service_id, job_id):
+def get_s3_object_data(bucket_name, object_key, byte_range=None, etag=None):
+    """
+    Fetch the body and metadata of an object in a single GET.
+
+    byte_range is an inclusive (first, last) pair of byte offsets, to fetch
+    only part of the body. If etag is given the GET is conditional, and None
+    is returned if the object still has that etag.
+    """
+    params = {"Bucket": bucket_name, "Key": object_key}
+    if byte_range is not None:
+        params["Range"] = "bytes={}-{}".format(*byte_range)
+    if etag is not None:
+        params["IfNoneMatch"] = etag
     try:
-        obj = get_s3_object(*get_job_location(service_id, job_id))
-    except botocore.exceptions.ClientError:
-        obj = get_s3_object(*get_old_job_location(service_id, job_id))
+        response = get_s3_client().get_object(**params)
+    except botocore.exceptions.ClientError as e:
+        if e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 304:
+            return None
+        raise
+    return S3Object(
+        body=response["Body"].read(),
+        metadata=response.get("Metadata", {}),
+        etag=response.get("ETag"),
+    )
+
 
-    return obj.get()["Body"].read().decode("utf-8"), obj.get()["Metadata"]
+def _is_missing_key(error):
+    return error.response["Error"].get("Code") in MISSING_KEY_ERROR_CODES
+
+
+def _with_job_location(service_id, job_id, request):
+    """
+    Call request(bucket_name, object_key) for a job's csv, trying the key
+    layout the job was last found under first and falling back to the
+    other one if the key isn't there.
+    """
+    # TODO
+    # for transition on optimizing the s3 partition, we have
+    # to check for the file location using the new way and the
+    # old way.  After this has been on production for a few weeks
+    # we should remove the check for the old way.
+    job_id = str(job_id)
+    locations = [get_job_location, get_old_job_location]
+    with _job_locations_lock:
+        if _job_locations.get(job_id) is get_old_job_location:
+            locations.reverse()
+
+    for location in locations:
+        bucket_name, object_key, *_ = location(service_id, job_id)
+        try:
+            result = request(bucket_name, object_key)
+        except botocore.exceptions.ClientError as e:
+            if _is_missing_key(e) and location is not locations[-1]:
+                continue
+            raise
+        with _job_locations_lock:
+            _job_locations[job_id] = location
+            _job_locations.move_to_end(job_id)
+            if len(_job_locations) > MAX_REMEMBERED_JOB_LOCATIONS:
+                _job_locations.popitem(last=False)
+        return result
+
+
+def get_job_object(service_id, job_id, byte_range=None, etag=None):
+    """Fetch a job's csv and its metadata in one request, see get_s3_object_data."""
+    return _with_job_location(
+        service_id,
+        job_id,
+        lambda bucket_name, object_key: get_s3_object_data(
+            bucket_name, object_key, byte_range=byte_range, etag=etag
+        ),
+    )
+
+
+def get_job_and_metadata_from_s3(service_id, job_id):
+    job = get_job_object(service_id, job_id)
+    return job.body.decode("utf-8"), job.metadata
+
+
+def get_job_lines_and_metadata_from_s3(service_id, job_id):
+    """
+    Like get_job_and_metadata_from_s3, but returns the csv as an iterator of
+    lines so a big job is never held in memory as one string.
+
+    The body is copied to a temporary file, which stays in memory until it
+    gets big, rather than read straight off the socket, because a paced job
+    can take hours to get through and S3 won't keep the connection open.
+    """
+    response = _with_job_location(
+        service_id,
+        job_id,
+        lambda bucket_name, object_key: get_s3_client().get_object(
+            Bucket=bucket_name, Key=object_key
+        ),
+    )
+    spool = tempfile.SpooledTemporaryFile(max_size=JOB_SPOOL_MAX_MEMORY)
+    shutil.copyfileobj(response["Body"], spool, JOB_SPOOL_CHUNK_SIZE)
+    spool.seek(0)
+    lines = TextIOWrapper(spool, encoding="utf-8", newline="")
+    return lines, response.get("Metadata", {})
 
 
 def get_job_from_s3(service_id, job_id):
@@ -423,34 +598,12 @@ def get_job_from_s3(service_id, job_id):
     max_retries = 4
     backoff_factor = 0.2
 
-    if not file_exists(
-        FILE_LOCATION_STRUCTURE.format(service_id, job_id)
-    ) and not file_exists(NEW_FILE_LOCATION_STRUCTURE.format(service_id, job_id)):
-        current_app.logger.error(
-            f"This file with service_id {service_id} and job_id {job_id} does not exist"
-        )
-        return None
-
     while retries < max_retries:
 
         try:
-            # TODO
-            # for transition on optimizing the s3 partition, we have
-            # to check for the file location using the new way and the
-            # old way.  After this has been on production for a few weeks
-            # we should remove the check for the old way.
-            try:
-                obj = get_s3_object(*get_job_location(service_id, job_id))
-                return obj.get()["Body"].read().decode("utf-8")
-            except botocore.exceptions.ClientError:
-                obj = get_s3_object(*get_old_job_location(service_id, job_id))
-                return obj.get()["Body"].read().decode("utf-8")
+            return get_job_object(service_id, job_id).body.decode("utf-8")
         except botocore.exceptions.ClientError as e:
-            if e.response["Error"]["Code"] in [
-                "Throttling",
-                "RequestTimeout",
-                "SlowDown",
-            ]:
+            if e.response["Error"]["Code"] in THROTTLING_ERROR_CODES:
                 current_app.logger.exception(
                     f"Retrying job fetch service_id {service_id} job_id {job_id} retry_count={retries}",
                 )
@@ -458,8 +611,12 @@ def get_job_from_s3(service_id, job_id):
                 sleep_time = backoff_factor * (2**retries)  # Exponential backoff
                 gevent.sleep(sleep_time)
                 continue
+            elif _is_missing_key(e):
+                current_app.logger.error(
+                    f"This file with service_id {service_id} and job_id {job_id} does not exist"
+                )
+                return None
             else:
-                # Typically this is "NoSuchKey"
                 current_app.logger.exception(
                     f"Failed to get job with service_id {service_id} job_id {job_id}",
                 )
@@ -547,32 +704,20 @@ def extract_personalisation(job):
 
 def get_phone_number_from_s3(service_id, job_id, job_row_number):
 
-    job = get_job_cache(job_id)
-    if job is None:
-        job = get_job_from_s3(service_id, job_id)
-        # Even if it is None, put it here to avoid KeyErrors
-        set_job_cache(job_id, job)
+    rows, job = get_job_rows(service_id, job_id)
+    if rows is not None:
+        phone_to_return = rows.phone(job_row_number)
+    elif job is not None:
+        phones = get_job_cache_view(
+            job_id, job, "phones", lambda job: extract_phones(job, service_id, job_id)
+        )
+        phone_to_return = phones.get(job_row_number)
     else:
-        # skip expiration date from cache, we don't need it here
-        job = job[0]
-
-    if job is None:
         current_app.logger.error(
             f"Couldnt find phone for job with service_id {service_id} job_id {job_id} because job is missing"
         )
         return "Unavailable"
 
-    phones = get_job_cache(f"{job_id}_phones")
-    if phones is None:
-        phones = extract_phones(job, service_id, job_id)
-        set_job_cache(f"{job_id}_phones", phones)
-    else:
-        phones = phones[
-            0
-        ]  # we only want the phone numbers not the cache expiration time
-
-    # If we can find the quick dictionary, use it
-    phone_to_return = phones[job_row_number]
     if phone_to_return:
         return phone_to_return
     else:
@@ -585,16 +730,10 @@ def get_phone_number_from_s3(service_id, job_id, job_row_number):
 def get_personalisation_from_s3(service_id, job_id, job_row_number):
     # We don't want to constantly pull down a job from s3 every time we need the personalisation.
     # At the same time we don't want to store it in redis or the db
-    # So this is a little recycling mechanism to reduce the number of downloads.
-    job = get_job_cache(job_id)
-
-    if job is None:
-        job = get_job_from_s3(service_id, job_id)
-        # Even if it is None, put it here to avoid KeyErrors
-        set_job_cache(job_id, job)
-    else:
-        # skip expiration date from cache, we don't need it here
-        job = job[0]
+    # So the rows are kept on local disk, shared by every worker on the node.
+    rows, job = get_job_rows(service_id, job_id)
+    if rows is not None:
+        return rows.personalisation(job_row_number)
     # If the job is None after our attempt to retrieve it from s3, it
     # probably means the job is old and has been deleted from s3, in
     # which case there is nothing we can do.  It's unlikely to run into
@@ -606,17 +745,21 @@ def get_personalisation_from_s3(service_id, job_id, job_row_number):
         )
         return {}
 
-    personalisation = get_job_cache(f"{job_id}_personalisation")
-    if personalisation is None:
-        set_job_cache(f"{job_id}_personalisation", extract_personalisation(job))
-
-    return get_job_cache(f"{job_id}_personalisation")[0].get(job_row_number)
+    personalisation = get_job_cache_view(
+        job_id, job, "personalisation", extract_personalisation
+    )
+    return personalisation.get(job_row_number)
 
 
 def get_job_metadata_from_s3(service_id, job_id):
-
-    obj = get_s3_object(*get_job_location(service_id, job_id))
-    return obj.get()["Metadata"]
+    # HEAD rather than GET, we don't want to download the whole csv for its metadata
+    return _with_job_location(
+        service_id,
+        job_id,
+        lambda bucket_name, object_key: get_s3_client().head_object(
+            Bucket=bucket_name, Key=object_key
+        )["Metadata"],
+    )
 
 
 def remove_job_from_s3(service_id, job_id):
@@ -678,3 +821,29 @@ def s3upload(
             f"Unable to upload {key}to S3 bucket because of {e}"
         )
         raise e
+
+
+def s3upload_fileobj(
+    fileobj, bucket_name, file_location, content_type="binary/octet-stream"
+):
+    """
+    Upload a file object with a managed transfer, which reads it in chunks and
+    uses a multipart upload once it is bigger than the transfer threshold,
+    instead of sending the whole body in one request like s3upload does.
+    """
+    try:
+        get_s3_client().upload_fileobj(
+            fileobj,
+            bucket_name,
+            file_location,
+            ExtraArgs={"ServerSideEncryption": "AES256", "ContentType": content_type},
+        )
+    except (
+        botocore.exceptions.NoCredentialsError,
+        botocore.exceptions.ClientError,
+        S3UploadFailedError,
+    ):
+        current_app.logger.exception(
+            f"Unable to upload {file_location} to S3 bucket {bucket_name}"
+        )
+        raise
@@ -0,0 +1,204 @@
+import json
+from time import monotonic, time
+
+import gevent
+from flask import current_app
+
+from app import redis_store
+from app.config import QueueNames
+from app.enums import NotificationType
+
+ACTIVE_JOBS_KEY = "job-scheduler-active-jobs"
+SEND_COUNT_KEY_PREFIX = "job-scheduler-sends"
+STATS_KEY_PREFIX = "job-scheduler-stats"
+
+# How many seconds of provider sends we average over to get the send rate
+SEND_RATE_WINDOW = 30
+# How often a running job re-reads the shared pipeline state
+REFRESH_INTERVAL = 5
+# A job that has not refreshed for this long is assumed to be dead
+ACTIVE_JOB_TIMEOUT = REFRESH_INTERVAL * 6
+
+
+def _send_count_key(second):
+    return f"{SEND_COUNT_KEY_PREFIX}-{second}"
+
+
+def _stats_key(job_id):
+    return f"{STATS_KEY_PREFIX}-{job_id}"
+
+
+def record_provider_send(count=1):
+    """Count messages handed to SNS/SES, so jobs can be paced on the real send rate."""
+    if not redis_store.active:
+        return
+    try:
+        key = _send_count_key(int(time()))
+        pipe = redis_store.pipeline()
+        pipe.incr(key, count)
+        pipe.expire(key, SEND_RATE_WINDOW * 2)
+        pipe.execute()
+    except Exception:
+        current_app.logger.exception("Failed to record provider send for job scheduler")
+
+
+def get_send_rate():
+    """Messages per second accepted by SNS/SES over the last SEND_RATE_WINDOW seconds."""
+    if not redis_store.active:
+        return 0.0
+    now = int(time())
+    pipe = redis_store.pipeline()
+    # skip the current second, it is still being counted
+    for second in range(now - SEND_RATE_WINDOW, now):
+        pipe.get(_send_count_key(second))
+    counts = pipe.execute()
+    return sum(int(count) for count in counts if count) / SEND_RATE_WINDOW
+
+
+def get_queue_depth(notification_type):
+    """Number of tasks waiting between process_job and the provider for this notification type."""
+    send_queue = (
+        QueueNames.SEND_EMAIL
+        if notification_type == NotificationType.EMAIL
+        else QueueNames.SEND_SMS
+    )
+    return sum(
+        redis_store.llen(queue) or 0 for queue in (QueueNames.DATABASE, send_queue)
+    )
+
+
+def get_active_job_count(job_id):
+    """Heartbeat this job and return how many jobs are currently sharing the pipeline."""
+    if not redis_store.active:
+        return 1
+    now = time()
+    pipe = redis_store.pipeline()
+    pipe.zadd(ACTIVE_JOBS_KEY, {str(job_id): now})
+    pipe.zremrangebyscore(ACTIVE_JOBS_KEY, "-inf", now - ACTIVE_JOB_TIMEOUT)
+    pipe.zcard(ACTIVE_JOBS_KEY)
+    pipe.expire(ACTIVE_JOBS_KEY, ACTIVE_JOB_TIMEOUT)
+    result = pipe.execute()
+    return max(result[2], 1)
+
+
+def get_job_scheduler_stats(job_id):
+    """Most recent pacing decision for a job, or None if it is not being paced."""
+    stats = redis_store.get(_stats_key(job_id))
+    if stats is None:
+        return None
+    return json.loads(stats)
+
+
+class JobScheduler:
+    """
+    Token bucket that paces the rows of one job.
+
+    Every job gets an equal share of the pipeline capacity. The capacity starts
+    from the rate SNS/SES are actually accepting messages, with some headroom so
+    a job running alone can keep ramping up, and is scaled back when tasks start
+    backing up on the database and send queues.
+    """
+
+    def __init__(self, job_id, notification_type):
+        self.job_id = str(job_id)
+        self.notification_type = notification_type
+        self.min_rate = current_app.config["JOB_SCHEDULER_MIN_RATE"]
+        self.max_rate = current_app.config["JOB_SCHEDULER_MAX_RATE"]
+        self.headroom = current_app.config["JOB_SCHEDULER_HEADROOM"]
+        self.target_queue_depth = current_app.config["JOB_SCHEDULER_TARGET_QUEUE_DEPTH"]
+        self.max_batch_size = current_app.config["JOB_SAVE_BATCH_SIZE"]
+
+        self.send_rate = 0.0
+        self.queue_depth = 0
+        self.active_jobs = 1
+        self.pipeline_rate = self.min_rate
+        self.rate = self.min_rate
+        self.tokens = self.rate
+        self._last_refill = monotonic()
+        self._last_refresh = None
+
+    def refresh(self):
+        try:
+            self.send_rate = get_send_rate()
+            self.queue_depth = get_queue_depth(self.notification_type)
+            self.active_jobs = get_active_job_count(self.job_id)
+        except Exception:
+            # pacing must never stop a job, so carry on as if it had the pipeline to itself at the minimum rate
+            current_app.logger.exception(
+                f"Failed to read pipeline state for job {self.job_id}, pacing at the minimum rate"
+            )
+            self.send_rate = 0.0
+            self.queue_depth = 0
+            self.active_jobs = 1
+
+        pipeline_rate = max(self.send_rate * self.headroom, self.min_rate)
+        if self.queue_depth > self.target_queue_depth:
+            pipeline_rate *= self.target_queue_depth / self.queue_depth
+        self.pipeline_rate = min(pipeline_rate, self.max_rate)
+        self.rate = max(self.pipeline_rate / self.active_jobs, self.min_rate)
+        self._last_refresh = monotonic()
+
+        stats = self.stats()
+        try:
+            redis_store.set(
+                _stats_key(self.job_id), json.dumps(stats), ex=ACTIVE_JOB_TIMEOUT
+            )
+        except Exception:
+            current_app.logger.exception(f"Failed to save stats for job {self.job_id}")
+        current_app.logger.info(f"Pacing job {self.job_id}: {stats}")
+
+    def stats(self):
+        return {
+            "job_id": self.job_id,
+            "rate": round(self.rate, 2),
+            "pipeline_rate": round(self.pipeline_rate, 2),
+            "send_rate": round(self.send_rate, 2),
+            "queue_depth": self.queue_depth,
+            "active_jobs": self.active_jobs,
+        }
+
+    def _capacity(self):
+        # allow at most one second of burst so a paused job can't flood the queues
+        return max(self.rate, 1)
+
+    def _refill(self):
+        now = monotonic()
+        self.tokens = min(
+            self.tokens + (now - self._last_refill) * self.rate, self._capacity()
+        )
+        self._last_refill = now
+
+    def batch_size(self):
+        """How many rows to hand to one save task, about one second of this job's budget."""
+        return max(1, min(int(self.rate), self.max_batch_size))
+
+    def acquire(self, count=1):
+        """Block (cooperatively) until this job may enqueue another `count` rows."""
+        while True:
+            if (
+                self._last_refresh is None
+                or monotonic() - self._last_refresh >= REFRESH_INTERVAL
+            ):
+                self.refresh()
+            self._refill()
+            # a batch bigger than the bucket goes once the bucket is full and
+            # leaves it in debt, so the average rate still holds
+            needed = min(count, self._capacity())
+            if self.tokens >= needed:
+                self.tokens -= count
+                return
+            gevent.sleep((needed - self.tokens) / self.rate)
+
+    def finish(self):
+        """Stop counting this job as active. Called from a finally, so it never raises."""
+        try:
+            if redis_store.active:
+                pipe = redis_store.pipeline()
+                pipe.zrem(ACTIVE_JOBS_KEY, self.job_id)
+                pipe.execute()
+            redis_store.delete(_stats_key(self.job_id))
+        except Exception:
+            # left behind, the job drops out of the active count after ACTIVE_JOB_TIMEOUT
+            current_app.logger.exception(
+                f"Failed to finish job scheduler for job {self.job_id}"
+            )
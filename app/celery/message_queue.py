@@ -0,0 +1,169 @@
+import json
+from collections import defaultdict
+from time import monotonic, sleep
+
+from flask import current_app
+
+from app import db, redis_store
+from app.celery import provider_tasks
+from app.dao.notifications_dao import dao_batch_insert_notifications
+from app.models import Notification
+from app.utils import utc_now
+
+MESSAGE_QUEUE = "message_queue"
+MESSAGE_QUEUE_DEAD_LETTERS = "message_queue_dead_letters"
+MESSAGE_QUEUE_PROCESSING_PREFIX = "message_queue_processing"
+
+# How long an idle consumer blocks on redis before checking whether it should stop
+IDLE_TIMEOUT = 1
+
+
+def notifications_from_message_queue(chunk):
+    """
+    Decode a chunk popped from the message_queue, returning the notifications
+    to insert and the raw values that could not be decoded.
+    """
+    notifications = []
+    malformed = []
+    for notification_bytes in chunk:
+        try:
+            notification_dict = json.loads(notification_bytes.decode("utf-8"))
+            notification_dict["status"] = notification_dict.pop("notification_status")
+            queue = notification_dict.pop("queue", None)
+            if not notification_dict.get("created_at"):
+                notification_dict["created_at"] = utc_now()
+            elif isinstance(notification_dict["created_at"], list):
+                notification_dict["created_at"] = notification_dict["created_at"][0]
+            notification = Notification(**notification_dict)
+            notification.delivery_queue = queue
+        except (ValueError, KeyError, TypeError):
+            current_app.logger.exception("Malformed notification in message_queue")
+            malformed.append(notification_bytes)
+            continue
+        # notify-api-749 do not write to db
+        # if we have a verify_code we know this is the authentication notification at login time
+        # and not csv (containing PII) provided by the user, so allow verify_code to continue to exist
+        if "verify_code" in str(notification.personalisation):
+            continue
+        notifications.append(notification)
+    return notifications, malformed
+
+
+def dead_letter(values):
+    pipe = redis_store.pipeline()
+    pipe.rpush(MESSAGE_QUEUE_DEAD_LETTERS, *values)
+    pipe.ltrim(
+        MESSAGE_QUEUE_DEAD_LETTERS,
+        -current_app.config["MESSAGE_QUEUE_DEAD_LETTER_MAX_LENGTH"],
+        -1,
+    )
+    pipe.execute()
+
+
+def persist_message_queue_chunk(chunk):
+    """
+    Insert a chunk of the message_queue and send the notifications that were
+    inserted on to the provider. Anything that cannot be inserted goes to the
+    dead letter list. Returns how many were inserted and dead lettered.
+    """
+    notifications, malformed = notifications_from_message_queue(chunk)
+    failed = malformed
+    try:
+        inserted_ids = dao_batch_insert_notifications(notifications)
+    except Exception:
+        current_app.logger.exception("Notification batch insert failed")
+        db.session.rollback()
+        inserted_ids = []
+        failed = chunk
+    if failed:
+        dead_letter(failed)
+
+    # persist_notification only defers sms, and leaves sending them to us so
+    # they are not picked up before they are in the database
+    queues = {str(n.id): n.delivery_queue for n in notifications}
+    by_queue = defaultdict(list)
+    for notification_id in inserted_ids:
+        by_queue[queues.get(str(notification_id))].append(notification_id)
+    for queue, notification_ids in by_queue.items():
+        provider_tasks.deliver_sms_in_batches(notification_ids, queue=queue)
+    return len(inserted_ids), len(failed)
+
+
+class MessageQueueConsumer:
+    """
+    Long running consumer of the message_queue, so notifications are saved as
+    soon as a batch fills up or max_wait seconds after its first notification
+    arrived, rather than on the next run of batch-insert-notifications.
+
+    Notifications are moved onto a processing list of the consumer's own and
+    that list is only deleted once its batch is committed or dead lettered. A
+    consumer that dies leaves them there, and picks them up again when it is
+    restarted with the same name. Inserts skip notifications that already
+    exist, so saving a batch twice is harmless.
+    """
+
+    def __init__(self, name, batch_size, max_wait):
+        self.name = name
+        self.processing_list = f"{MESSAGE_QUEUE_PROCESSING_PREFIX}-{name}"
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.running = False
+
+    def run(self):
+        if not redis_store.active:
+            current_app.logger.error("message_queue consumer needs redis, stopping")
+            return
+        current_app.logger.info(f"message_queue consumer {self.name} started")
+        self.running = True
+        recovering = True
+        while self.running:
+            try:
+                batch = self.unacknowledged() if recovering else []
+                recovering = False
+                batch = batch or self.collect()
+                if batch:
+                    self.flush(batch)
+            except Exception:
+                current_app.logger.exception(
+                    f"message_queue consumer {self.name} failed, retrying"
+                )
+                recovering = True
+                sleep(IDLE_TIMEOUT)
+        current_app.logger.info(f"message_queue consumer {self.name} stopped")
+
+    def stop(self, *args):
+        self.running = False
+
+    def unacknowledged(self):
+        return redis_store.lrange(self.processing_list, 0, -1) or []
+
+    def collect(self):
+        """Wait for the next batch, returns an empty one if nothing arrived for IDLE_TIMEOUT."""
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            timeout = IDLE_TIMEOUT if deadline is None else deadline - monotonic()
+            if timeout <= 0:
+                break
+            value = redis_store.blmove(MESSAGE_QUEUE, self.processing_list, timeout)
+            if value is None:
+                break
+            if deadline is None:
+                deadline = monotonic() + self.max_wait
+            batch.append(value)
+            # take whatever else is already waiting in one go
+            batch += redis_store.lmove_many(
+                MESSAGE_QUEUE, self.processing_list, self.batch_size - len(batch)
+            )
+        return batch
+
+    def flush(self, batch):
+        start = monotonic()
+        inserted, dead_lettered = persist_message_queue_chunk(batch)
+        # the batch is committed or dead lettered, so it is safe to acknowledge
+        redis_store.delete(self.processing_list, raise_exception=True)
+        current_app.logger.info(
+            f"message_queue consumer {self.name} saved a batch of {len(batch)}: "
+            f"inserted {inserted}, dead lettered {dead_lettered} "
+            f"in {(monotonic() - start) * 1000:.0f}ms"
+        )
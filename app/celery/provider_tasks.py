@@ -81,6 +81,40 @@ def deliver_sms(self, notification_id):
             raise NotificationTechnicalFailureException(message)
 
 
+@notify_celery.task(name="deliver-sms-batch")
+def deliver_sms_batch(notification_ids):
+    """
+    Send many sms in one task, see send_sms_batch_to_provider. The ones that
+    can not be sent as part of a batch go on to deliver_sms one by one, and
+    so do the ones that failed or are not in the database yet, so they are
+    retried like any other sms.
+    """
+    notifications = notifications_dao.dao_get_notifications_by_ids(notification_ids)
+    unbatched, failed = send_to_providers.send_sms_batch_to_provider(notifications)
+
+    found = {str(notification.id) for notification in notifications}
+    failed += [
+        notification_id
+        for notification_id in notification_ids
+        if str(notification_id) not in found
+    ]
+    for notification_id in unbatched:
+        deliver_sms.apply_async([str(notification_id)], queue=QueueNames.SEND_SMS)
+    for notification_id in failed:
+        deliver_sms.apply_async([str(notification_id)], queue=QueueNames.RETRY)
+
+
+def deliver_sms_in_batches(notification_ids, queue=None):
+    """Queue notification_ids for sending in batches of SMS_DELIVERY_BATCH_SIZE."""
+    queue = queue or QueueNames.SEND_SMS
+    notification_ids = [str(notification_id) for notification_id in notification_ids]
+    batch_size = current_app.config["SMS_DELIVERY_BATCH_SIZE"]
+    for start in range(0, len(notification_ids), batch_size):
+        deliver_sms_batch.apply_async(
+            [notification_ids[start : start + batch_size]], queue=queue
+        )
+
+
 @notify_celery.task(
     bind=True, name="deliver_email", max_retries=48, default_retry_delay=30
 )
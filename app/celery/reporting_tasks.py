@@ -4,15 +4,20 @@ from flask import current_app
 
 from app import notify_celery
 from app.config import QueueNames
-from app.dao.fact_billing_dao import fetch_billing_data_for_day, update_fact_billing
-from app.dao.fact_notification_status_dao import update_fact_notification_status
-from app.dao.notifications_dao import get_service_ids_with_notifications_on_date
+from app.dao.fact_billing_dao import (
+    fetch_fact_billing_changes_for_day,
+    update_fact_billing_for_day,
+)
+from app.dao.fact_notification_status_dao import (
+    update_fact_notification_status,
+    update_fact_notification_status_for_day,
+)
 from app.enums import NotificationType
 from app.utils import utc_now
 
 
 @notify_celery.task(name="create-nightly-billing")
-def create_nightly_billing(day_start=None):
+def create_nightly_billing(day_start=None, dry_run=False):
     # day_start is a datetime.date() object. e.g.
     # up to 4 days of data counting back from day_start is consolidated
     if day_start is None:
@@ -23,8 +28,10 @@ def create_nightly_billing(day_start=None):
     for i in range(0, 10):
         process_day = (day_start - timedelta(days=i)).isoformat()
 
+        # each day is its own task, so the days are rebuilt in parallel
         create_nightly_billing_for_day.apply_async(
-            kwargs={"process_day": process_day}, queue=QueueNames.REPORTING
+            kwargs={"process_day": process_day, "dry_run": dry_run},
+            queue=QueueNames.REPORTING,
         )
         current_app.logger.info(
             f"create-nightly-billing task: create-nightly-billing-for-day task created for {process_day}"
@@ -32,26 +39,38 @@ def create_nightly_billing(day_start=None):
 
 
 @notify_celery.task(name="create-nightly-billing-for-day")
-def create_nightly_billing_for_day(process_day):
+def create_nightly_billing_for_day(process_day, dry_run=False):
+    """
+    Rebuild ft_billing for process_day. With dry_run, log the rows that would
+    change instead.
+    """
     process_day = datetime.strptime(process_day, "%Y-%m-%d").date()
     current_app.logger.info(
         f"create-nightly-billing-for-day task for {process_day}: started"
     )
 
     start = utc_now()
-    transit_data = fetch_billing_data_for_day(process_day=process_day)
+    if dry_run:
+        changes = fetch_fact_billing_changes_for_day(process_day)
+        for change in changes:
+            current_app.logger.info(
+                f"create-nightly-billing-for-day task for {process_day}: dry run would write "
+                f"service {change.service_id} template {change.template_id} "
+                f"{change.notification_type} {change.provider} "
+                f"rate {change.rate} x{change.rate_multiplier} international {change.international}: "
+                f"notifications_sent {change.current_notifications_sent} -> {change.notifications_sent}, "
+                f"billable_units {change.current_billable_units} -> {change.billable_units}"
+            )
+        rows = len(changes)
+    else:
+        rows = update_fact_billing_for_day(process_day)
     end = utc_now()
 
-    current_app.logger.info(
-        f"create-nightly-billing-for-day task for {process_day}: data fetched in {(end - start).seconds} seconds"
-    )
-
-    for data in transit_data:
-        update_fact_billing(data, process_day)
-
     current_app.logger.info(
         f"create-nightly-billing-for-day task for {process_day}: "
-        f"task complete. {len(transit_data)} rows updated"
+        f"task complete{' (dry run)' if dry_run else ''}. "
+        f"{rows} rows {'would be ' if dry_run else ''}updated "
+        f"in {(end - start).seconds} seconds"
     )
 
 
@@ -66,7 +85,8 @@ def create_nightly_notification_status():
         we reject delivery receipts after this point.
 
     Because the time range of the task exceeds the minimum possible retention
-    period (3 days), we need to choose which table to query for each service.
+    period (3 days), each day is aggregated from both the notifications and
+    notification_history tables, for all services at once.
 
     The aggregation happens for 1 extra day in case:
 
@@ -77,26 +97,32 @@ def create_nightly_notification_status():
     """
 
     yesterday = utc_now().date() - timedelta(days=1)
+    days = 4
 
-    for notification_type in (NotificationType.SMS, NotificationType.EMAIL):
-        days = 4
+    for i in range(days):
+        process_day = yesterday - timedelta(days=i)
 
-        for i in range(days):
-            process_day = yesterday - timedelta(days=i)
+        create_nightly_notification_status_for_day.apply_async(
+            kwargs={"process_day": process_day.isoformat()},
+            queue=QueueNames.REPORTING,
+        )
 
-            relevant_service_ids = get_service_ids_with_notifications_on_date(
-                notification_type, process_day
-            )
 
-            for service_id in relevant_service_ids:
-                create_nightly_notification_status_for_service_and_day.apply_async(
-                    kwargs={
-                        "process_day": process_day.isoformat(),
-                        "notification_type": notification_type,
-                        "service_id": service_id,
-                    },
-                    queue=QueueNames.REPORTING,
-                )
+@notify_celery.task(name="create-nightly-notification-status-for-day")
+def create_nightly_notification_status_for_day(process_day):
+    process_day = datetime.strptime(process_day, "%Y-%m-%d").date()
+
+    start = utc_now()
+    rows = update_fact_notification_status_for_day(
+        process_day=process_day,
+        notification_types=(NotificationType.SMS, NotificationType.EMAIL),
+    )
+
+    end = utc_now()
+    current_app.logger.info(
+        f"create-nightly-notification-status-for-day task for {process_day}: "
+        f"{rows} rows written in {(end - start).seconds} seconds"
+    )
 
 
 @notify_celery.task(name="create-nightly-notification-status-for-service-and-day")
@@ -1,18 +1,22 @@
-import json
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from time import monotonic
 
 from flask import current_app
 from sqlalchemy import between, select, union
 from sqlalchemy.exc import SQLAlchemyError
 
 from app import db, get_zendesk_client, notify_celery, redis_store
+from app.celery.message_queue import MESSAGE_QUEUE, persist_message_queue_chunk
 from app.celery.tasks import (
     get_recipient_csv_and_template_and_sender_id,
     process_incomplete_jobs,
     process_job,
     process_row,
 )
-from app.clients.cloudwatch.aws_cloudwatch import AwsCloudwatchClient
+from app.clients.cloudwatch.aws_cloudwatch import (
+    AwsCloudwatchClient,
+    warn_if_out_of_quota,
+)
 from app.config import QueueNames
 from app.dao.invited_org_user_dao import (
     delete_org_invitations_created_more_than_two_days_ago,
@@ -25,7 +29,6 @@ from app.dao.jobs_dao import (
     find_missing_row_for_job,
 )
 from app.dao.notifications_dao import (
-    dao_batch_insert_notifications,
     dao_close_out_delivery_receipts,
     dao_update_delivery_receipts,
     notifications_not_yet_sent,
@@ -36,7 +39,7 @@ from app.dao.services_dao import (
 )
 from app.dao.users_dao import delete_codes_older_created_more_than_a_day_ago
 from app.enums import JobStatus, NotificationType
-from app.models import Job, Notification
+from app.models import Job
 from app.notifications.process_notifications import send_notification_to_queue
 from app.utils import utc_now
 from notifications_utils import aware_utcnow
@@ -44,6 +47,10 @@ from notifications_utils.clients.zendesk.zendesk_client import NotifySupportTick
 
 MAX_NOTIFICATION_FAILS = 10000
 
+DELIVERY_RECEIPT_CURSOR_KEY = "delivery-receipts-read-up-to"
+DELIVERY_RECEIPT_SEEN_KEY = "delivery-receipts-seen-events"
+
+
 zendesk_client = get_zendesk_client()
 
 
@@ -248,6 +255,41 @@ def check_for_services_with_high_failure_rates_or_sending_to_tv_numbers():
             zendesk_client.send_ticket_to_zendesk(ticket)
 
 
+def get_delivery_receipt_cursor():
+    """When process-delivery-receipts has read receipts up to, or None if it has not run yet."""
+    cursor = redis_store.get(DELIVERY_RECEIPT_CURSOR_KEY)
+    if cursor is None:
+        return None
+    return datetime.fromtimestamp(int(cursor) / 1000, tz=timezone.utc)
+
+
+def set_delivery_receipt_cursor(read_up_to):
+    redis_store.set(DELIVERY_RECEIPT_CURSOR_KEY, int(read_up_to.timestamp() * 1000))
+
+
+def get_seen_delivery_receipt_events(since):
+    """Ids of the cloudwatch events applied from windows that ended after since."""
+    return {
+        event_id.decode("utf-8")
+        for event_id in redis_store.zrangebyscore(
+            DELIVERY_RECEIPT_SEEN_KEY, int(since.timestamp() * 1000), "+inf"
+        )
+    }
+
+
+def set_delivery_receipt_events_seen(event_ids, read_up_to, forget_before):
+    """Remember the events applied from a window ending at read_up_to, and forget those no run will read again."""
+    if event_ids:
+        redis_store.zadd(
+            DELIVERY_RECEIPT_SEEN_KEY,
+            dict.fromkeys(event_ids, int(read_up_to.timestamp() * 1000)),
+        )
+    redis_store.zremrangebyscore(
+        DELIVERY_RECEIPT_SEEN_KEY, "-inf", int(forget_before.timestamp() * 1000)
+    )
+    redis_store.expire(DELIVERY_RECEIPT_SEEN_KEY, 24 * 60 * 60)
+
+
 @notify_celery.task(
     bind=True, max_retries=7, default_retry_delay=3600, name="process-delivery-receipts"
 )
@@ -255,32 +297,74 @@ def process_delivery_receipts(self):
     # If we need to check db settings do it here for convenience
     # current_app.logger.info(f"POOL SIZE {app.db.engine.pool.size()}")
     """
-    Every eight minutes or so (see config.py) we run this task, which searches the last ten
-    minutes of logs for delivery receipts and batch updates the db with the results.  The overlap
-    is intentional.  We don't mind re-updating things, it is better than losing data.
+    Every two minutes (see config.py) we run this task, which reads the delivery receipts
+    logged since the last run and batch updates the db with the results.
+
+    How far we have read is kept in redis, and each run reads on from there in windows of
+    at most DELIVERY_RECEIPT_WINDOW_MINUTES, so after an outage we catch up a bounded chunk
+    at a time.  The cursor only moves once a window has been applied, so a run that fails
+    part way goes over that window again, which is harmless.
+
+    Cloudwatch can make an event searchable some time after it was logged, so each run
+    starts DELIVERY_RECEIPT_OVERLAP_SECONDS before the cursor.  The ids of the events
+    applied in that overlap are kept in redis too, and their receipts are not applied twice.
 
     We also set this to retry with exponential backoff in the case of failure.  The only way this would
     fail is if, for example the db went down, or redis filled causing the app to stop processing.  But if
     it does fail, we need to go back over at some point when things are running again and process those results.
     """
     try:
-        batch_size = 1000  # in theory with postgresql this could be 10k to 20k?
+        batch_size = current_app.config["DELIVERY_RECEIPT_BATCH_SIZE"]
+        window = timedelta(
+            minutes=current_app.config["DELIVERY_RECEIPT_WINDOW_MINUTES"]
+        )
+        # cloudwatch takes a little while to make an event searchable
+        read_up_to = aware_utcnow() - timedelta(
+            seconds=current_app.config["DELIVERY_RECEIPT_LAG_SECONDS"]
+        )
+        overlap = timedelta(
+            seconds=current_app.config["DELIVERY_RECEIPT_OVERLAP_SECONDS"]
+        )
+        cursor = get_delivery_receipt_cursor()
+        if cursor is None:
+            start = read_up_to - timedelta(minutes=3)
+        else:
+            start = cursor - overlap
+        seen = get_seen_delivery_receipt_events(start)
 
         cloudwatch = AwsCloudwatchClient()
         cloudwatch.init_app(current_app)
-        start_time = aware_utcnow() - timedelta(minutes=3)
-        end_time = aware_utcnow()
-        delivered_receipts, failed_receipts = cloudwatch.check_delivery_receipts(
-            start_time, end_time
+        received = updated = windows = 0
+        while (
+            start < read_up_to
+            and windows < current_app.config["DELIVERY_RECEIPT_MAX_WINDOWS_PER_RUN"]
+        ):
+            end = min(start + window, read_up_to)
+            delivered_receipts, failed_receipts = cloudwatch.check_delivery_receipts(
+                start, end
+            )
+            applied = set()
+            for receipts, delivered in (
+                (delivered_receipts, True),
+                (failed_receipts, False),
+            ):
+                receipts = [r for r in receipts if r.event_id not in seen]
+                for i in range(0, len(receipts), batch_size):
+                    batch = receipts[i : i + batch_size]
+                    updated += dao_update_delivery_receipts(batch, delivered)
+                    received += len(batch)
+                applied.update(r.event_id for r in receipts if r.event_id)
+            set_delivery_receipt_events_seen(applied, end, end - overlap)
+            seen |= applied
+            set_delivery_receipt_cursor(end)
+            # only once the window is applied, so running out of quota can't stall the receipts
+            warn_if_out_of_quota(failed_receipts)
+            start = end
+            windows += 1
+        current_app.logger.info(
+            f"Delivery receipts: received {received}, updated {updated} notifications, "
+            f"read up to {start.isoformat()}"
         )
-        delivered_receipts = list(delivered_receipts)
-        for i in range(0, len(delivered_receipts), batch_size):
-            batch = delivered_receipts[i : i + batch_size]
-            dao_update_delivery_receipts(batch, True)
-        failed_receipts = list(failed_receipts)
-        for i in range(0, len(failed_receipts), batch_size):
-            batch = failed_receipts[i : i + batch_size]
-            dao_update_delivery_receipts(batch, False)
     except Exception as ex:
         retry_count = self.request.retries
         wait_time = 3600 * 2**retry_count
@@ -304,46 +388,27 @@ def cleanup_delivery_receipts(self):
 
 @notify_celery.task(bind=True, name="batch-insert-notifications")
 def batch_insert_notifications(self):
-    batch = []
-
-    current_len = redis_store.llen("message_queue")
-    with redis_store.pipeline():
-        # since this list is being fed by other processes, just grab what is available when
-        # this call is made and process that.
-
-        count = 0
-        while count < current_len:
-            count = count + 1
-            notification_bytes = redis_store.lpop("message_queue")
-            notification_dict = json.loads(notification_bytes.decode("utf-8"))
-            notification_dict["status"] = notification_dict.pop("notification_status")
-            if not notification_dict.get("created_at"):
-                notification_dict["created_at"] = utc_now()
-            elif isinstance(notification_dict["created_at"], list):
-                notification_dict["created_at"] = notification_dict["created_at"][0]
-            notification = Notification(**notification_dict)
-            # notify-api-749 do not write to db
-            # if we have a verify_code we know this is the authentication notification at login time
-            # and not csv (containing PII) provided by the user, so allow verify_code to continue to exist
-            if notification is None:
-                continue
-            if "verify_code" in str(notification.personalisation):
-                pass
-            else:
-                batch.append(notification)
-    try:
-        dao_batch_insert_notifications(batch)
-    except Exception:
-        current_app.logger.exception("Notification batch insert failed")
-        for n in batch:
-            # Use 'created_at' as a TTL so we don't retry infinitely
-            notification_time = n.created_at
-            if isinstance(notification_time, str):
-                notification_time = datetime.fromisoformat(n.created_at)
-            if notification_time < utc_now() - timedelta(seconds=50):
-                current_app.logger.warning(
-                    f"Abandoning stale data, could not write to db: {n.serialize_for_redis(n)}"
-                )
-                continue
-            else:
-                redis_store.rpush("message_queue", json.dumps(n.serialize_for_redis(n)))
+    start = monotonic()
+    chunk_size = current_app.config["MESSAGE_QUEUE_DRAIN_CHUNK_SIZE"]
+    popped = inserted = dead_lettered = 0
+
+    # since this list is being fed by other processes, just grab what is available when
+    # this call is made and process that.
+    remaining = redis_store.llen(MESSAGE_QUEUE) or 0
+    while remaining > 0:
+        # LPOP with a count takes the whole chunk in one atomic round trip
+        chunk = redis_store.lpop(MESSAGE_QUEUE, min(remaining, chunk_size))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        popped += len(chunk)
+
+        chunk_inserted, chunk_dead_lettered = persist_message_queue_chunk(chunk)
+        inserted += chunk_inserted
+        dead_lettered += chunk_dead_lettered
+
+    if popped:
+        current_app.logger.info(
+            f"Drained message_queue: popped {popped}, inserted {inserted}, "
+            f"dead lettered {dead_lettered} in {(monotonic() - start) * 1000:.0f}ms"
+        )
@@ -2,32 +2,34 @@ import csv
 import io
 import json
 import os
+import tempfile
 import time
+from contextlib import ExitStack, closing
 
-import gevent
 from celery.signals import task_postrun
 from flask import current_app
 from requests import HTTPError, RequestException, request
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
-from app import create_uuid, get_encryption, notify_celery
+from app import create_uuid, get_encryption, notify_celery, redis_store
 from app.aws import s3
 from app.celery import provider_tasks
+from app.celery.job_scheduler import JobScheduler
 from app.config import Config, QueueNames
 from app.dao import notifications_dao
 from app.dao.inbound_sms_dao import dao_get_inbound_sms_by_id
 from app.dao.jobs_dao import dao_get_job_by_id, dao_update_job
 from app.dao.notifications_dao import (
+    dao_create_notifications,
     dao_get_last_notification_added_for_job_id,
     get_notification_by_id,
 )
-from app.dao.service_email_reply_to_dao import dao_get_reply_to_by_id
 from app.dao.service_inbound_api_dao import get_service_inbound_api_for_service
-from app.dao.service_sms_sender_dao import dao_get_service_sms_senders_by_id
 from app.dao.services_dao import dao_fetch_all_services, dao_fetch_service_by_id
 from app.dao.templates_dao import dao_get_template_by_id
 from app.enums import JobStatus, KeyType, NotificationType
 from app.errors import TotalRequestsError
+from app.models import Notification
 from app.notifications.process_notifications import (
     get_notification,
     persist_notification,
@@ -35,7 +37,7 @@ from app.notifications.process_notifications import (
 from app.notifications.validators import check_service_over_total_message_limit
 from app.serialised_models import SerialisedService, SerialisedTemplate
 from app.service.utils import service_allowed_to_send_to
-from app.utils import DATETIME_FORMAT, hilite, utc_now
+from app.utils import DATETIME_FORMAT, hilite, midnight_n_days_ago, utc_now
 from notifications_utils.recipients import RecipientCSV
 
 encryption = get_encryption()
@@ -80,18 +82,17 @@ def process_job(job_id, sender_id=None):
         f"Starting job {job_id} processing {job.notification_count} notifications"
     )
 
-    # notify-api-1495 we are going to sleep periodically to give other
-    # jobs running at the same time a chance to get some of their messages
-    # sent.  Sleep for 1 second after every 3 sends, which gives us throughput
-    # of about 3600*3 per hour and would keep the queue clear assuming only one sender.
-    # It will also hopefully eliminate throttling when we send messages which we are
-    # currently seeing.
-    count = 0
-    for row in recipient_csv.get_rows():
-        process_row(row, template, job, service, sender_id=sender_id)
-        count = count + 1
-        if count % 3 == 0:
-            gevent.sleep(1)
+    # notify-api-1495 pace the job so that other jobs running at the same time
+    # get a fair share of the pipeline and we don't get throttled by the providers.
+    # The pace follows the measured send rate and queue depths instead of a fixed
+    # 3 rows per second.
+    scheduler = JobScheduler(job_id, template.template_type)
+    try:
+        process_rows_in_batches(
+            recipient_csv.get_rows(), template, job, service, scheduler, sender_id
+        )
+    finally:
+        scheduler.finish()
 
     # End point/Exit point for message send flow.
     job_complete(job, start=start)
@@ -120,10 +121,10 @@ def get_recipient_csv_and_template_and_sender_id(job):
     db_template = dao_get_template_by_id(job.template_id, job.template_version)
     template = db_template._as_utils_template()
 
-    contents, meta_data = s3.get_job_and_metadata_from_s3(
+    lines, meta_data = s3.get_job_lines_and_metadata_from_s3(
         service_id=str(job.service_id), job_id=str(job.id)
     )
-    recipient_csv = RecipientCSV(contents, template=template)
+    recipient_csv = RecipientCSV(lines, template=template)
 
     return recipient_csv, template, meta_data.get("sender_id")
 
@@ -167,6 +168,62 @@ def process_row(row, template, job, service, sender_id=None):
     return notification_id
 
 
+def process_rows_in_batches(rows, template, job, service, scheduler, sender_id=None):
+    """Send rows to save_sms_batch/save_email_batch, about one second of the job's budget at a time."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= scheduler.batch_size():
+            scheduler.acquire(len(batch))
+            process_rows(batch, template, job, service, sender_id=sender_id)
+            batch = []
+    if batch:
+        scheduler.acquire(len(batch))
+        process_rows(batch, template, job, service, sender_id=sender_id)
+
+
+def process_rows(rows, template, job, service, sender_id=None):
+    """Persist a chunk of rows with one save_sms_batch/save_email_batch task."""
+    notification_ids = [create_uuid() for _ in rows]
+    encrypted = encryption.encrypt(
+        {
+            "template": str(template.id),
+            "template_version": job.template_version,
+            "job": str(job.id),
+            "rows": [
+                {
+                    "id": notification_id,
+                    "to": row.recipient,
+                    "row_number": row.index,
+                    "personalisation": dict(row.personalisation),
+                }
+                for notification_id, row in zip(notification_ids, rows)
+            ],
+        }
+    )
+
+    send_fns = {
+        NotificationType.SMS: save_sms_batch,
+        NotificationType.EMAIL: save_email_batch,
+    }
+    send_fn = send_fns[template.template_type]
+
+    task_kwargs = {}
+    if sender_id:
+        task_kwargs["sender_id"] = sender_id
+
+    send_fn.apply_async(
+        (
+            str(service.id),
+            encrypted,
+        ),
+        task_kwargs,
+        queue=QueueNames.DATABASE,
+        expires=Config.DEFAULT_REDIS_EXPIRE_TIME,
+    )
+    return notification_ids
+
+
 # TODO
 # Originally this was checking a daily limit
 # It is now checking an overall limit (annual?) for the free tier
@@ -215,9 +272,7 @@ def save_sms(self, service_id, notification_id, encrypted_notification, sender_i
     )
 
     if sender_id:
-        reply_to_text = dao_get_service_sms_senders_by_id(
-            service_id, sender_id
-        ).sms_sender
+        reply_to_text = service.get_sms_sender(sender_id)
     else:
         reply_to_text = template.reply_to_text
     # Return False when trial mode services try sending notifications
@@ -270,9 +325,10 @@ def save_sms(self, service_id, notification_id, encrypted_notification, sender_i
                 f"Deliver sms for job_id: {sn.job_id} row_number: {sn.job_row_number}"
             )
         )
-        provider_tasks.deliver_sms.apply_async(
-            [str(saved_notification.id)], queue=QueueNames.SEND_SMS, countdown=60
-        )
+        if not saved_notification.awaiting_persistence:
+            provider_tasks.deliver_sms.apply_async(
+                [str(saved_notification.id)], queue=QueueNames.SEND_SMS
+            )
 
         current_app.logger.debug(
             f"SMS {saved_notification.id} created at {saved_notification.created_at} "
@@ -299,7 +355,7 @@ def save_email(
     )
 
     if sender_id:
-        reply_to_text = dao_get_reply_to_by_id(service_id, sender_id).email_address
+        reply_to_text = service.get_email_reply_to(sender_id)
     else:
         reply_to_text = template.reply_to_text
 
@@ -340,6 +396,131 @@ def save_email(
         handle_exception(self, notification, notification_id, e)
 
 
+@notify_celery.task(
+    bind=True, name="save-sms-batch", max_retries=2, default_retry_delay=600
+)
+def save_sms_batch(self, service_id, encrypted_batch, sender_id=None):
+    """Persist a chunk of job rows in one insert and queue the new ones for sending to sns."""
+    batch = encryption.decrypt(encrypted_batch)
+    service = SerialisedService.from_id(service_id)
+    template = SerialisedTemplate.from_id_and_service_id(
+        batch["template"],
+        service_id=service.id,
+        version=batch["template_version"],
+    )
+
+    if sender_id:
+        reply_to_text = service.get_sms_sender(sender_id)
+    else:
+        reply_to_text = template.reply_to_text
+
+    _save_batch(self, batch, service, NotificationType.SMS, reply_to_text)
+
+
+@notify_celery.task(
+    bind=True, name="save-email-batch", max_retries=5, default_retry_delay=300
+)
+def save_email_batch(self, service_id, encrypted_batch, sender_id=None):
+    """Persist a chunk of job rows in one insert and queue the new ones for sending to ses."""
+    batch = encryption.decrypt(encrypted_batch)
+    service = SerialisedService.from_id(service_id)
+    template = SerialisedTemplate.from_id_and_service_id(
+        batch["template"],
+        service_id=service.id,
+        version=batch["template_version"],
+    )
+
+    if sender_id:
+        reply_to_text = service.get_email_reply_to(sender_id)
+    else:
+        reply_to_text = template.reply_to_text
+
+    _save_batch(self, batch, service, NotificationType.EMAIL, reply_to_text)
+
+
+def _save_batch(task, batch, service, notification_type, reply_to_text):
+    job_id = batch["job"]
+    created_by_id = dao_get_job_by_id(job_id).created_by_id
+
+    notifications = []
+    for row in batch["rows"]:
+        try:
+            notification = _batch_row_notification(
+                batch, row, service, notification_type, reply_to_text, created_by_id
+            )
+        except Exception:
+            # one bad row must not keep the rest of the batch from being sent
+            current_app.logger.exception(
+                f"Failed to save {notification_type} {row['id']} "
+                f"for job {job_id} row {row['row_number']}"
+            )
+            continue
+        if notification is not None:
+            notifications.append(notification)
+
+    if not notifications:
+        return
+
+    try:
+        # Rows that already exist (e.g. the broker redelivered this batch) are
+        # skipped, so we only send the notifications inserted here.
+        inserted_ids = dao_create_notifications(notifications)
+    except SQLAlchemyError:
+        current_app.logger.exception(
+            f"Failed to persist {notification_type} batch for job {job_id}"
+        )
+        try:
+            task.retry(queue=QueueNames.RETRY, expires=Config.DEFAULT_REDIS_EXPIRE_TIME)
+        except task.MaxRetriesExceededError:
+            current_app.logger.exception(
+                f"Max retry failed persisting {notification_type} batch for job {job_id}"
+            )
+        return
+
+    if notification_type == NotificationType.SMS:
+        provider_tasks.deliver_sms_in_batches(inserted_ids)
+    else:
+        for notification_id in inserted_ids:
+            provider_tasks.deliver_email.apply_async(
+                [str(notification_id)], queue=QueueNames.SEND_EMAIL
+            )
+
+    current_app.logger.info(
+        f"Saved {len(inserted_ids)} of {len(batch['rows'])} {notification_type} "
+        f"notifications for job {job_id}"
+    )
+
+
+def _batch_row_notification(
+    batch, row, service, notification_type, reply_to_text, created_by_id
+):
+    # Skip rows trial mode services are not allowed to send to.
+    if not service_allowed_to_send_to(row["to"], service, KeyType.NORMAL):
+        current_app.logger.info(
+            f"{notification_type} {row['id']} failed as restricted service"
+        )
+        return None
+    # simulated=True builds the notification without writing it, _save_batch
+    # writes the whole batch itself.
+    return persist_notification(
+        template_id=batch["template"],
+        template_version=batch["template_version"],
+        recipient=row["to"],
+        service=service,
+        personalisation=row.get("personalisation"),
+        notification_type=notification_type,
+        api_key_id=None,
+        key_type=KeyType.NORMAL,
+        created_at=utc_now(),
+        created_by_id=created_by_id,
+        job_id=batch["job"],
+        job_row_number=row["row_number"],
+        notification_id=row["id"],
+        reply_to_text=reply_to_text,
+        simulated=True,
+    )
+
+
 @notify_celery.task(
     bind=True, name="save-api-email", max_retries=5, default_retry_delay=300
 )
@@ -370,7 +551,7 @@ def save_api_email_or_sms(self, encrypted_notification):
 
     original_notification = get_notification(notification["id"])
     try:
-        persist_notification(
+        saved_notification = persist_notification(
             notification_id=notification["id"],
             template_id=notification["template_id"],
             template_version=notification["template_version"],
@@ -387,7 +568,10 @@ def save_api_email_or_sms(self, encrypted_notification):
             document_download_count=notification["document_download_count"],
         )
         # Only get here if save to the db was successful (i.e. first time)
-        if original_notification is None:
+        if (
+            original_notification is None
+            and not saved_notification.awaiting_persistence
+        ):
             provider_task.apply_async([notification["id"]], queue=q)
             current_app.logger.debug(
                 f"{notification['id']} has been persisted and sent to delivery queue."
@@ -548,158 +732,179 @@ def process_incomplete_job(job_id):
         job
     )
 
-    for row in recipient_csv.get_rows():
-        if row.index > resume_from_row:
-            process_row(row, template, job, job.service, sender_id=sender_id)
+    scheduler = JobScheduler(job_id, template.template_type)
+    try:
+        process_rows_in_batches(
+            recipient_csv.get_rows(start_index=resume_from_row + 1),
+            template,
+            job,
+            job.service,
+            scheduler,
+            sender_id,
+        )
+    finally:
+        scheduler.finish()
 
     job_complete(job, resumed=True)
 
 
-def _generate_notifications_report(service_id, report_id, limit_days):
+NOTIFICATION_REPORT_DAYS = (1, 3, 5, 7)
+NOTIFICATION_REPORT_MAX_ROWS = 20000
+# Reports are written to memory up to this size and to a temporary file beyond it
+NOTIFICATION_REPORT_SPOOL_SIZE = 8 * 1024 * 1024
+
+# These columns are in the raw data but we don't show them in the report
+NOTIFICATION_REPORT_COLUMNS = {
+    "recipient": "Phone Number",
+    "template_name": "Template",
+    "created_by_name": "Sent By",
+    "carrier": "Carrier",
+    "status": "Status",
+    "created_at": "Time",
+    "job_name": "Batch File",
+    "provider_response": "Carrier Response",
+}
+
+
+def notification_report_watermark_key(service_id):
+    return f"notification-reports-watermark-{service_id}"
+
+
+def _notification_report_watermark(service_id):
+    """
+    What a service's reports were built from: the day they start on, and how
+    many notifications are in each status and when they last changed or
+    were sent. Counting statuses catches a status moving even if whatever
+    moved it left updated_at alone. If none of this has moved since the
+    reports were last built there is nothing new to put in them. Reports
+    with no notifications stay empty whatever the day, so services that
+    have sent nothing lately are skipped until they send something.
+    """
+    changes = notifications_dao.dao_get_notification_changes_for_report(
+        service_id, max(NOTIFICATION_REPORT_DAYS)
+    )
+    if not changes:
+        return "empty"
+    return "{}|{}".format(
+        midnight_n_days_ago(min(NOTIFICATION_REPORT_DAYS)).isoformat(),
+        ";".join(
+            f"{status}:{count}:{last_change.isoformat()}"
+            for status, count, last_change in changes
+        ),
+    )
 
-    # Hard code these values for now
-    page = 1
-    page_size = 20000
-    include_jobs = True
-    include_from_test_key = False
-    include_one_off = True
 
-    data = {
-        "limit_days": limit_days,
-        "include_jobs": True,
-        "include_from_test_key": False,
-        "include_one_off": True,
+def _notification_report_row(row):
+    serialized = Notification.serialize_row_for_csv(row)
+    # the recipient is not kept in the database, but jobs have it in their csv
+    if row.job_id is not None:
+        serialized["recipient"] = s3.get_phone_number_from_s3(
+            row.service_id, row.job_id, row.job_row_number
+        )
+    else:
+        serialized["recipient"] = ""
+    return {
+        header: serialized[column]
+        for column, header in NOTIFICATION_REPORT_COLUMNS.items()
     }
-    pagination = notifications_dao.get_notifications_for_service(
-        service_id,
-        filter_dict=data,
-        page=page,
-        page_size=page_size,
-        count_pages=False,
-        limit_days=limit_days,
-        include_jobs=include_jobs,
-        include_from_test_key=include_from_test_key,
-        include_one_off=include_one_off,
-    )
-    count = 0
-    if len(pagination.items) == 0:
-        current_app.logger.info(f"SKIP {service_id}")
 
-        # Delete stale report when there's no new data
-        _, file_location, _, _, _ = get_csv_location(service_id, report_id)
-        s3.delete_s3_object(file_location)
-        current_app.logger.info(f"Deleted stale report {file_location} - no new data")
-
-        return
-    start_time = time.time()
-    for notification in pagination.items:
-        count = count + 1
-        if notification.job_id is not None:
-
-            notification.personalisation = s3.get_personalisation_from_s3(
-                notification.service_id,
-                notification.job_id,
-                notification.job_row_number,
-            )
 
-            recipient = s3.get_phone_number_from_s3(
-                notification.service_id,
-                notification.job_id,
-                notification.job_row_number,
+def _generate_notifications_reports(service_id):
+    """
+    Build every notification report for a service in one pass over its
+    notifications, newest first. Each notification is serialized once and
+    written to the report of every window it falls in.
+    """
+    windows = {
+        limit_days: midnight_n_days_ago(limit_days)
+        for limit_days in NOTIFICATION_REPORT_DAYS
+    }
+    widest = max(windows)
+    counts = dict.fromkeys(windows, 0)
+
+    line = io.StringIO()
+    writer = csv.DictWriter(line, fieldnames=NOTIFICATION_REPORT_COLUMNS.values())
+
+    def encode(write, *args):
+        line.seek(0)
+        line.truncate()
+        write(*args)
+        return line.getvalue().encode("utf-8")
+
+    header = encode(writer.writeheader)
+    with ExitStack() as stack:
+        reports = {}
+        for limit_days in windows:
+            reports[limit_days] = stack.enter_context(
+                tempfile.SpooledTemporaryFile(max_size=NOTIFICATION_REPORT_SPOOL_SIZE)
             )
+            reports[limit_days].write(header)
 
-            notification.to = recipient
-            notification.normalised_to = recipient
-
-        else:
-            notification.to = ""
-            notification.normalised_to = ""
-
-        current_app.logger.debug(
-            hilite(
-                f"Processing  row {count} for service {service_id} and days {limit_days}"
+        rows = stack.enter_context(
+            closing(
+                notifications_dao.dao_get_notifications_for_report(service_id, widest)
             )
         )
+        for row in rows:
+            # newest first, so the narrower windows are always done first
+            if counts[widest] == NOTIFICATION_REPORT_MAX_ROWS:
+                break
+            line_bytes = encode(writer.writerow, _notification_report_row(row))
+            for limit_days, window_start in windows.items():
+                if (
+                    row.created_at >= window_start
+                    and counts[limit_days] < NOTIFICATION_REPORT_MAX_ROWS
+                ):
+                    reports[limit_days].write(line_bytes)
+                    counts[limit_days] += 1
+
+        for limit_days, report in reports.items():
+            report_id = f"{limit_days}-day-report"
+            bucket_name, file_location, _, _, _ = get_csv_location(
+                service_id, report_id
+            )
+            if counts[limit_days] == 0:
+                # Delete stale report when there's no new data
+                s3.delete_s3_object(file_location)
+                current_app.logger.info(
+                    f"Deleted stale report {file_location} - no new data"
+                )
+                continue
+            if bucket_name == "":
+                exp_bucket = current_app.config["CSV_UPLOAD_BUCKET"]["bucket"]
+                exp_region = current_app.config["CSV_UPLOAD_BUCKET"]["region"]
+                tier = os.getenv("NOTIFY_ENVIRONMENT")
+                raise Exception(
+                    f"No bucket name should be: {exp_bucket} with region {exp_region} and tier {tier}"
+                )
+            report.seek(0)
+            # uploading over yesterday's version replaces it in one go
+            s3.s3upload_fileobj(
+                report,
+                bucket_name=bucket_name,
+                file_location=file_location,
+                content_type="text/csv",
+            )
+    return counts
 
-    notifications = [
-        notification.serialize_for_csv() for notification in pagination.items
-    ]
-
-    current_app.logger.debug(hilite(f"RAW: {notifications}"))
-
-    # We try and get the next page of results to work out if we need provide a pagination link to the next page
-    # in our response if it exists. Note, this could be done instead by changing `count_pages` in the previous
-    # call to be True which will enable us to use Flask-Sqlalchemy to tell if there is a next page of results but
-    # this way is much more performant for services with many results (unlike Flask SqlAlchemy, this approach
-    # doesn't do an additional query to count all the results of which there could be millions but instead only
-    # asks for a single extra page of results).
-
-    # These columns are in the raw data but we don't show them in the report
-    columns_to_remove = {
-        "created_by_email_address",
-        "row_number",
-        "client_reference",
-        "template_type",
-    }
-
-    # cleanup for report presentation
-    header_renames = {
-        "recipient": "Phone Number",
-        "template_name": "Template",
-        "created_by_name": "Sent By",
-        "carrier": "Carrier",
-        "status": "Status",
-        "created_at": "Time",
-        "job_name": "Batch File",
-        "provider_response": "Carrier Response",
-    }
-
-    processed_notifications = []
-    for notification in notifications:
-        new_notification = {}
-        for old_key, new_key in header_renames.items():
-            if old_key not in columns_to_remove and old_key in notification:
-                new_notification[new_key] = notification[old_key]
-        processed_notifications.append(new_notification)
-
-    csv_bytes = io.BytesIO()
-    text_stream = io.TextIOWrapper(csv_bytes, encoding="utf-8", newline="")
-    writer = csv.DictWriter(text_stream, fieldnames=header_renames.values())
-    writer.writeheader()
-    writer.writerows(processed_notifications)
-    text_stream.flush()
-    csv_bytes.seek(0)
-
-    bucket_name, file_location, access_key, secret_key, region = get_csv_location(
-        service_id, report_id
-    )
-
-    current_app.logger.debug(
-        hilite(f"REPORT {file_location} {csv_bytes.getvalue().decode('utf-8')}")
-    )
-    if bucket_name == "":
-        exp_bucket = current_app.config["CSV_UPLOAD_BUCKET"]["bucket"]
-        exp_region = current_app.config["CSV_UPLOAD_BUCKET"]["region"]
-        tier = os.getenv("NOTIFY_ENVIRONMENT")
-        raise Exception(
-            f"No bucket name should be: {exp_bucket} with region {exp_region} and tier {tier}"
-        )
 
-    # Delete yesterday's version of this report
-    s3.delete_s3_object(file_location)
+@notify_celery.task(name="generate-notifications-reports-for-service")
+def generate_notification_reports_for_service(service_id):
+    watermark = _notification_report_watermark(service_id)
+    watermark_key = notification_report_watermark_key(service_id)
+    last_watermark = redis_store.get(watermark_key)
+    if last_watermark is not None and last_watermark.decode("utf-8") == watermark:
+        current_app.logger.info(f"SKIP {service_id}, no change since its last reports")
+        return
 
-    s3.s3upload(
-        filedata=csv_bytes,
-        region=region,
-        bucket_name=bucket_name,
-        file_location=file_location,
+    start_time = time.time()
+    counts = _generate_notifications_reports(service_id)
+    redis_store.set(
+        watermark_key, watermark, ex=(max(NOTIFICATION_REPORT_DAYS) + 1) * 24 * 60 * 60
     )
-    elapsed_time = str(time.time() - start_time)
-    elapsed_time = elapsed_time.split(".")
     current_app.logger.info(
-        hilite(
-            f"generate-notifications-report uploaded {file_location} elapsed_time = {elapsed_time[0]} seconds"
-        )
+        f"generate-notifications-reports for service {service_id} wrote "
+        f"{counts} rows in {time.time() - start_time:.0f} seconds"
     )
 
 
@@ -707,13 +912,12 @@ def _generate_notifications_report(service_id, report_id, limit_days):
 def generate_notification_reports_task():
     services = dao_fetch_all_services(only_active=True)
     for service in services:
-
-        limit_days = [1, 3, 5, 7]
-        for limit_day in limit_days:
-
-            report_id = f"{limit_day}-day-report"
-            _generate_notifications_report(service.id, report_id, limit_day)
-    current_app.logger.info("Notifications report generation complete")
+        generate_notification_reports_for_service.apply_async(
+            [str(service.id)], queue=QueueNames.PERIODIC
+        )
+    current_app.logger.info(
+        f"Notifications report generation queued for {len(services)} services"
+    )
 
 
 NEW_FILE_LOCATION_STRUCTURE = "{}-service-notify/{}.csv"
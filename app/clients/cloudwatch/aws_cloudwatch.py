@@ -1,6 +1,7 @@
 import json
 import os
 import re
+from collections import namedtuple
 
 from boto3 import client
 from flask import current_app
@@ -9,6 +10,31 @@ from app.clients import AWS_CLIENT_CONFIG, Client
 from app.cloudfoundry_config import cloud_config
 from app.utils import hilite
 
+DeliveryReceipt = namedtuple(
+    "DeliveryReceipt",
+    [
+        "message_id",
+        "status",
+        "carrier",
+        "provider_response",
+        "timestamp",
+        "price_in_usd",
+        # the id cloudwatch gave the event the receipt was read from
+        "event_id",
+    ],
+    defaults=(None,),
+)
+
+
+def warn_if_out_of_quota(failed_receipts):
+    if any(
+        failure.provider_response == "No quota left for account"
+        for failure in failed_receipts
+    ):
+        current_app.logger.warning(
+            hilite("**********NO QUOTA LEFT TO SEND MESSAGES!!!**********")
+        )
+
 
 class AwsCloudwatchClient(Client):
     """
@@ -48,30 +74,22 @@ class AwsCloudwatchClient(Client):
         return self._is_localstack
 
     def _get_log(self, log_group_name, start, end):
-        # Check all cloudwatch logs from the time the notification was sent (currently 5 minutes previously) until now
-        next_token = None
-        all_log_events = []
-
+        """
+        Yield the events logged from start up to, but not including, end, a
+        page at a time, so consecutive windows never see the same event twice.
+        """
+        kwargs = {
+            "logGroupName": log_group_name,
+            "startTime": int(start.timestamp() * 1000),
+            "endTime": int(end.timestamp() * 1000) - 1,
+        }
         while True:
-            if next_token:
-                response = self._client.filter_log_events(
-                    logGroupName=log_group_name,
-                    nextToken=next_token,
-                    startTime=int(start.timestamp() * 1000),
-                    endTime=int(end.timestamp() * 1000),
-                )
-            else:
-                response = self._client.filter_log_events(
-                    logGroupName=log_group_name,
-                    startTime=int(start.timestamp() * 1000),
-                    endTime=int(end.timestamp() * 1000),
-                )
-            log_events = response.get("events", [])
-            all_log_events.extend(log_events)
+            response = self._client.filter_log_events(**kwargs)
+            yield from response.get("events", [])
             next_token = response.get("nextToken")
             if not next_token:
                 break
-        return all_log_events
+            kwargs["nextToken"] = next_token
 
     def warn_if_dev_is_opted_out(self, provider_response, notification_id):
         if (
@@ -94,7 +112,7 @@ class AwsCloudwatchClient(Client):
         account_number = ses_domain_arn.split(":")
         return account_number
 
-    def event_to_db_format(self, event):
+    def event_to_receipt(self, event):
 
         # massage the data into the form the db expects.  When we switch
         # from filter_log_events to log insights this will be convenient
@@ -115,14 +133,14 @@ class AwsCloudwatchClient(Client):
             message_cost = float(message_cost)
 
         my_timestamp = self._aws_value_or_default(event, "notification", "timestamp")
-        return {
-            "notification.messageId": event["notification"]["messageId"],
-            "status": event["status"],
-            "delivery.phoneCarrier": phone_carrier,
-            "delivery.providerResponse": provider_response,
-            "@timestamp": my_timestamp,
-            "delivery.priceInUSD": message_cost,
-        }
+        return DeliveryReceipt(
+            message_id=event["notification"]["messageId"],
+            status=event["status"],
+            carrier=phone_carrier,
+            provider_response=provider_response,
+            timestamp=my_timestamp or None,
+            price_in_usd=message_cost,
+        )
 
     # Here is an example of how to get the events with log insights
     # def do_log_insights():
@@ -167,46 +185,37 @@ class AwsCloudwatchClient(Client):
     # So for now, use filter_log_events and grab all log_events over a 10 minute interval,
     # and run this on a schedule.
     def check_delivery_receipts(self, start, end):
+        """
+        Return the delivered and failed receipts logged from start up to, but
+        not including, end, with one receipt per message.
+        """
         region = cloud_config.sns_region
         account_number = self._extract_account_number(cloud_config.ses_domain_arn)
         log_group_name = f"sns/{region}/{account_number[4]}/DirectPublishToPhoneNumber"
-        delivered_event_set = self._get_receipts(log_group_name, start, end)
-        current_app.logger.info(
-            (f"Delivered message count: {len(delivered_event_set)}")
-        )
+        delivered_receipts = self._get_receipts(log_group_name, start, end)
+        current_app.logger.info((f"Delivered message count: {len(delivered_receipts)}"))
         log_group_name = (
             f"sns/{region}/{account_number[4]}/DirectPublishToPhoneNumber/Failure"
         )
-        failed_event_set = self._get_receipts(log_group_name, start, end)
-        current_app.logger.info((f"Failed message count: {len(failed_event_set)}"))
-        raise_exception = False
-        for failure in failed_event_set:
-            try:
-                failure = json.loads(failure)
-                if "No quota left for account" == failure["delivery.providerResponse"]:
-                    current_app.logger.warning(
-                        hilite("**********NO QUOTA LEFT TO SEND MESSAGES!!!**********")
-                    )
-                    raise_exception = True
-            except Exception:
-                current_app.logger.exception("Malformed delivery receipt")
-        if raise_exception:
-            raise Exception("No Quota Left")
-
-        return delivered_event_set, failed_event_set
+        failed_receipts = self._get_receipts(log_group_name, start, end)
+        current_app.logger.info((f"Failed message count: {len(failed_receipts)}"))
+        return delivered_receipts, failed_receipts
 
     def _get_receipts(self, log_group_name, start, end):
-        event_set = set()
-        all_events = self._get_log(log_group_name, start, end)
-        for event in all_events:
+        # SNS can log a message more than once, keep the last receipt for each
+        receipts = {}
+        for event in self._get_log(log_group_name, start, end):
             try:
-                actual_event = self.event_to_db_format(event["message"])
-                event_set.add(json.dumps(actual_event))
+                receipt = self.event_to_receipt(event["message"])._replace(
+                    event_id=event.get("eventId")
+                )
             except Exception:
                 current_app.logger.exception(
                     f"Could not format delivery receipt {event} for db insert"
                 )
-        return event_set
+                continue
+            receipts[receipt.message_id] = receipt
+        return list(receipts.values())
 
     def _aws_value_or_default(self, event, top_level, second_level):
         if event.get(top_level) is None or event[top_level].get(second_level) is None:
@@ -3,7 +3,6 @@ import re
 from time import monotonic
 
 import botocore
-import phonenumbers
 from boto3 import client
 from flask import current_app
 
@@ -11,6 +10,7 @@ from app.clients import AWS_CLIENT_CONFIG
 from app.clients.sms import SmsClient
 from app.cloudfoundry_config import cloud_config
 from app.utils import hilite
+from notifications_utils.recipients import InvalidPhoneError, parse_phone_number
 
 
 class AwsSnsClient(SmsClient):
@@ -49,56 +49,53 @@ class AwsSnsClient(SmsClient):
         return sender and re.match(self._valid_sender_regex, sender)
 
     def send_sms(self, to, content, reference, sender=None, international=False):
-        matched = False
         if "+" not in to:
             to = f"+{to}"
 
-        for match in phonenumbers.PhoneNumberMatcher(to, None):
-            matched = True
-            to = phonenumbers.format_number(
-                match.number, phonenumbers.PhoneNumberFormat.E164
-            )
+        try:
+            # validated and parsed when the notification was persisted, so
+            # this is normally answered from the cache
+            to = parse_phone_number(to).e164
+        except InvalidPhoneError:
+            self.current_app.logger.error("No valid numbers found in {}".format(to))
+            raise ValueError("No valid numbers found for SMS delivery")
 
-            # See documentation
-            # https://docs.aws.amazon.com/sns/latest/dg/sms_publish-to-phone.html#sms_publish_sdk
-            attributes = {
-                "AWS.SNS.SMS.SMSType": {
-                    "DataType": "String",
-                    "StringValue": "Transactional",
-                }
+        # See documentation
+        # https://docs.aws.amazon.com/sns/latest/dg/sms_publish-to-phone.html#sms_publish_sdk
+        attributes = {
+            "AWS.SNS.SMS.SMSType": {
+                "DataType": "String",
+                "StringValue": "Transactional",
             }
+        }
 
-            if self._valid_sender_number(sender):
+        if self._valid_sender_number(sender):
 
-                attributes["AWS.MM.SMS.OriginationNumber"] = {
-                    "DataType": "String",
-                    "StringValue": sender,
-                }
-            else:
-                attributes["AWS.MM.SMS.OriginationNumber"] = {
-                    "DataType": "String",
-                    "StringValue": self.current_app.config["AWS_US_TOLL_FREE_NUMBER"],
-                }
-
-            try:
-                start_time = monotonic()
-                response = self._client.publish(
-                    PhoneNumber=to, Message=content, MessageAttributes=attributes
-                )
-                current_app.logger.info(hilite(f"send response = {response}"))
-            except botocore.exceptions.ClientError as e:
-                self.current_app.logger.exception("An error occurred sending sms")
-                raise str(e)
-            except Exception as e:
-                self.current_app.logger.exception("An error occurred sending sms")
-                raise str(e)
-            finally:
-                elapsed_time = monotonic() - start_time
-                self.current_app.logger.info(
-                    "AWS SNS request finished in {}".format(elapsed_time)
-                )
-            return response["MessageId"]
+            attributes["AWS.MM.SMS.OriginationNumber"] = {
+                "DataType": "String",
+                "StringValue": sender,
+            }
+        else:
+            attributes["AWS.MM.SMS.OriginationNumber"] = {
+                "DataType": "String",
+                "StringValue": self.current_app.config["AWS_US_TOLL_FREE_NUMBER"],
+            }
 
-        if not matched:
-            self.current_app.logger.error("No valid numbers found in {}".format(to))
-            raise ValueError("No valid numbers found for SMS delivery")
+        try:
+            start_time = monotonic()
+            response = self._client.publish(
+                PhoneNumber=to, Message=content, MessageAttributes=attributes
+            )
+            current_app.logger.info(hilite(f"send response = {response}"))
+        except botocore.exceptions.ClientError as e:
+            self.current_app.logger.exception("An error occurred sending sms")
+            raise str(e)
+        except Exception as e:
+            self.current_app.logger.exception("An error occurred sending sms")
+            raise str(e)
+        finally:
+            elapsed_time = monotonic() - start_time
+            self.current_app.logger.info(
+                "AWS SNS request finished in {}".format(elapsed_time)
+            )
+        return response["MessageId"]
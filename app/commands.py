@@ -2,6 +2,7 @@ import csv
 import functools
 import itertools
 import secrets
+import signal
 import uuid
 from datetime import datetime, timedelta
 from os import getenv
@@ -17,6 +18,12 @@ from sqlalchemy.orm.exc import NoResultFound
 
 from app import db, redis_store
 from app.aws import s3
+from app.celery.job_scheduler import get_job_scheduler_stats
+from app.celery.message_queue import (
+    MESSAGE_QUEUE,
+    MESSAGE_QUEUE_DEAD_LETTERS,
+    MessageQueueConsumer,
+)
 from app.celery.nightly_tasks import cleanup_unfinished_jobs
 from app.celery.tasks import (
     generate_notification_reports_task,
@@ -798,6 +805,47 @@ def clear_redis_list(name_of_list):
     )
 
 
+@notify_command(name="replay-message-queue-dead-letters")
+def replay_message_queue_dead_letters():
+    chunk_size = current_app.config["MESSAGE_QUEUE_DRAIN_CHUNK_SIZE"]
+    replayed = 0
+    while chunk := redis_store.lpop(MESSAGE_QUEUE_DEAD_LETTERS, chunk_size):
+        redis_store.rpush(MESSAGE_QUEUE, *chunk)
+        replayed += len(chunk)
+    current_app.logger.info(
+        f"Moved {replayed} notifications from {MESSAGE_QUEUE_DEAD_LETTERS} back to {MESSAGE_QUEUE}"
+    )
+
+
+@notify_command(name="run-message-queue-consumer")
+@click.option(
+    "-n",
+    "--name",
+    default=lambda: getenv("CF_INSTANCE_INDEX", "0"),
+    help="Name of this consumer, must stay the same across restarts",
+)
+def run_message_queue_consumer(name):
+    consumer = MessageQueueConsumer(
+        name,
+        batch_size=current_app.config["MESSAGE_QUEUE_DRAIN_CHUNK_SIZE"],
+        max_wait=current_app.config["MESSAGE_QUEUE_CONSUMER_MAX_WAIT"],
+    )
+    signal.signal(signal.SIGTERM, consumer.stop)
+    signal.signal(signal.SIGINT, consumer.stop)
+    consumer.run()
+
+
+@notify_command(name="show-job-pacing")
+@click.option("-j", "--job_id", required=True, help="Job id")
+def show_job_pacing(job_id):
+    stats = get_job_scheduler_stats(job_id)
+    if stats is None:
+        print(f"Job {job_id} is not currently being paced")
+        return
+    for key, value in stats.items():
+        print(f"{key}: {value}")
+
+
 @notify_command(name="update-templates")
 def update_templates():
     with open(current_app.config["CONFIG_FILES"] + "/templates.json") as f:
@@ -1,4 +1,5 @@
 import json
+import tempfile
 from datetime import datetime, timedelta
 from os import getenv, path
 
@@ -96,6 +97,8 @@ class Config(object):
     SQLALCHEMY_STATEMENT_TIMEOUT = 1200
     PAGE_SIZE = 20
     API_PAGE_SIZE = 250
+    # Largest page of a service's notifications, which are fetched a page at a time
+    NOTIFICATIONS_MAX_PAGE_SIZE = int(getenv("NOTIFICATIONS_MAX_PAGE_SIZE", 1000))
     REDIS_URL = cloud_config.redis_url
     REDIS_ENABLED = getenv("REDIS_ENABLED", "1") == "1"
     EXPIRE_CACHE_TEN_MINUTES = 600
@@ -347,6 +350,53 @@ class Config(object):
 
     HIGH_VOLUME_SERVICE = json.loads(getenv("HIGH_VOLUME_SERVICE", "[]"))
 
+    # Pacing of csv jobs, see app/celery/job_scheduler.py. Rates are rows per second.
+    JOB_SCHEDULER_MIN_RATE = float(getenv("JOB_SCHEDULER_MIN_RATE", 3))
+    JOB_SCHEDULER_MAX_RATE = float(getenv("JOB_SCHEDULER_MAX_RATE", 100))
+    JOB_SCHEDULER_HEADROOM = float(getenv("JOB_SCHEDULER_HEADROOM", 1.5))
+    JOB_SCHEDULER_TARGET_QUEUE_DEPTH = int(
+        getenv("JOB_SCHEDULER_TARGET_QUEUE_DEPTH", 500)
+    )
+    # Most rows a single save-sms-batch/save-email-batch task will carry
+    JOB_SAVE_BATCH_SIZE = int(getenv("JOB_SAVE_BATCH_SIZE", 100))
+    # Memory budget for the per-process cache of job csv files, see app/aws/job_cache.py
+    JOB_CACHE_MAX_BYTES = int(getenv("JOB_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+    # How long and how many services and templates each process keeps, see app/model_cache.py
+    MODEL_CACHE_TTL = int(getenv("MODEL_CACHE_TTL", 60 * 60))
+    MODEL_CACHE_MAX_SIZE = int(getenv("MODEL_CACHE_MAX_SIZE", 4096))
+    # Where the rows of job csv files are shared between the workers on a node,
+    # see app/aws/job_row_store.py
+    JOB_ROW_STORE_DIR = getenv(
+        "JOB_ROW_STORE_DIR", path.join(tempfile.gettempdir(), "notify-job-rows")
+    )
+    # Most sms a deliver-sms-batch task sends, and how many of them it sends at once
+    SMS_DELIVERY_BATCH_SIZE = int(getenv("SMS_DELIVERY_BATCH_SIZE", 100))
+    SMS_DELIVERY_CONCURRENCY = int(getenv("SMS_DELIVERY_CONCURRENCY", 10))
+    # Most delivery receipts process-delivery-receipts applies in one statement
+    DELIVERY_RECEIPT_BATCH_SIZE = int(getenv("DELIVERY_RECEIPT_BATCH_SIZE", 20_000))
+    # process-delivery-receipts reads cloudwatch in windows of this many minutes, up to
+    # DELIVERY_RECEIPT_MAX_WINDOWS_PER_RUN of them, stopping this many seconds short of now
+    DELIVERY_RECEIPT_WINDOW_MINUTES = int(getenv("DELIVERY_RECEIPT_WINDOW_MINUTES", 10))
+    DELIVERY_RECEIPT_MAX_WINDOWS_PER_RUN = int(
+        getenv("DELIVERY_RECEIPT_MAX_WINDOWS_PER_RUN", 6)
+    )
+    DELIVERY_RECEIPT_LAG_SECONDS = int(getenv("DELIVERY_RECEIPT_LAG_SECONDS", 60))
+    # and reading again this many seconds before where the last run stopped, for events
+    # cloudwatch only made searchable after their window was read
+    DELIVERY_RECEIPT_OVERLAP_SECONDS = int(
+        getenv("DELIVERY_RECEIPT_OVERLAP_SECONDS", 5 * 60)
+    )
+    # Most notifications batch-insert-notifications pops from redis at once
+    MESSAGE_QUEUE_DRAIN_CHUNK_SIZE = int(getenv("MESSAGE_QUEUE_DRAIN_CHUNK_SIZE", 1000))
+    # Longest a notification waits in run-message-queue-consumer for its batch to fill up
+    MESSAGE_QUEUE_CONSUMER_MAX_WAIT = float(
+        getenv("MESSAGE_QUEUE_CONSUMER_MAX_WAIT", 0.5)
+    )
+    # Notifications that could not be inserted are kept for replaying, up to this many
+    MESSAGE_QUEUE_DEAD_LETTER_MAX_LENGTH = int(
+        getenv("MESSAGE_QUEUE_DEAD_LETTER_MAX_LENGTH", 100_000)
+    )
+
     DOCUMENT_DOWNLOAD_API_HOST = getenv(
         "DOCUMENT_DOWNLOAD_API_HOST", "http://localhost:7000"
     )
@@ -1,7 +1,8 @@
 from sqlalchemy import select
 
-from app import db
+from app import db, model_cache
 from app.dao.dao_utils import autocommit
+from app.model_cache import email_branding_key
 from app.models import EmailBranding
 
 
@@ -39,3 +40,4 @@ def dao_update_email_branding(email_branding, **kwargs):
     for key, value in kwargs.items():
         setattr(email_branding, key, value or None)
     db.session.add(email_branding)
+    model_cache.invalidate_on_commit(email_branding_key(email_branding.id))
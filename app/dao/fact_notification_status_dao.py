@@ -88,6 +88,80 @@ def update_fact_notification_status(process_day, notification_type, service_id):
     )
 
 
+@autocommit
+def update_fact_notification_status_for_day(process_day, notification_types):
+    """
+    Rebuild the ft_notification_status rows of every service for process_day
+    with one scan of NotificationAllTimeView, rather than one scan for each
+    service as update_fact_notification_status does. Returns how many rows
+    were written.
+    """
+    start_date = get_midnight_in_utc(process_day)
+    end_date = get_midnight_in_utc(process_day + timedelta(days=1))
+
+    # delete any existing rows in case some no longer exist e.g. if all messages are sent.
+    # This is committed with the new rows, so the day is never seen empty.
+    stmt = delete(FactNotificationStatus).where(
+        FactNotificationStatus.local_date == process_day,
+        FactNotificationStatus.notification_type.in_(notification_types),
+    )
+    db.session.execute(stmt)
+
+    query = (
+        select(
+            literal(process_day).label("process_day"),
+            NotificationAllTimeView.template_id,
+            NotificationAllTimeView.service_id,
+            func.coalesce(
+                NotificationAllTimeView.job_id, "00000000-0000-0000-0000-000000000000"
+            ).label("job_id"),
+            NotificationAllTimeView.notification_type,
+            NotificationAllTimeView.key_type,
+            NotificationAllTimeView.status,
+            func.count().label("notification_count"),
+        )
+        .select_from(NotificationAllTimeView)
+        .where(
+            NotificationAllTimeView.created_at >= start_date,
+            NotificationAllTimeView.created_at < end_date,
+            NotificationAllTimeView.notification_type.in_(notification_types),
+            NotificationAllTimeView.key_type.in_((KeyType.NORMAL, KeyType.TEAM)),
+        )
+        .group_by(
+            NotificationAllTimeView.service_id,
+            NotificationAllTimeView.notification_type,
+            NotificationAllTimeView.template_id,
+            "job_id",
+            NotificationAllTimeView.key_type,
+            NotificationAllTimeView.status,
+        )
+    )
+
+    table = FactNotificationStatus.__table__
+    stmt = insert(table).from_select(
+        [
+            FactNotificationStatus.local_date,
+            FactNotificationStatus.template_id,
+            FactNotificationStatus.service_id,
+            FactNotificationStatus.job_id,
+            FactNotificationStatus.notification_type,
+            FactNotificationStatus.key_type,
+            FactNotificationStatus.notification_status,
+            FactNotificationStatus.notification_count,
+        ],
+        query,
+    )
+    # a task for one service and day may have written rows since the delete
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(table.primary_key),
+        set_={
+            "notification_count": stmt.excluded.notification_count,
+            "updated_at": utc_now(),
+        },
+    )
+    return db.session.connection().execute(stmt).rowcount
+
+
 def fetch_notification_status_for_service_by_month(start_date, end_date, service_id):
     stmt = (
         select(
@@ -235,8 +235,9 @@ def dao_get_paginated_most_recent_inbound_sms_by_user_number_for_service(
 
 # TODO remove this when billing dao PR is merged.
 class Pagination:
-    def __init__(self, items, page, per_page, total):
+    def __init__(self, items, page, per_page, total, next_cursor=None):
         self.items = items
+        self.next_cursor = next_cursor
         self.page = page
         self.per_page = per_page
         self.total = total
@@ -1,4 +1,3 @@
-import json
 import os
 from datetime import datetime, timedelta
 from time import time
@@ -6,17 +5,27 @@ from time import time
 from flask import current_app
 from sqlalchemy import (
     TIMESTAMP,
+    Float,
+    Integer,
+    Text,
+    and_,
     asc,
+    bindparam,
     cast,
+    column,
     delete,
     desc,
     func,
+    inspect,
+    literal,
     or_,
     select,
     text,
+    tuple_,
     union,
     update,
 )
+from sqlalchemy.dialects.postgresql import ARRAY, UUID, insert
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.sql import functions
@@ -29,11 +38,16 @@ from app.dao.inbound_sms_dao import Pagination
 from app.enums import KeyType, NotificationStatus, NotificationType
 from app.models import (
     FactNotificationStatus,
+    Job,
     Notification,
     NotificationHistory,
     Template,
+    TemplateHistory,
+    User,
 )
 from app.utils import (
+    decode_cursor,
+    encode_cursor,
     escape_special_characters,
     get_midnight_in_utc,
     midnight_n_days_ago,
@@ -130,6 +144,48 @@ def dao_create_notification(notification):
                     )
 
 
+def _notification_insert_values(notification):
+    values = {}
+    for attr in inspect(Notification).column_attrs:
+        column = attr.columns[0]
+        value = getattr(notification, attr.key)
+        if value is None and column.default is not None and column.default.is_scalar:
+            value = column.default.arg
+        values[column.key] = value
+    return values
+
+
+def dao_create_notifications(notifications):
+    """
+    Insert many notifications in one statement, skipping any that already exist.
+
+    Returns the ids of the notifications that were actually inserted, so callers
+    only send those on to the providers.
+    """
+    for notification in notifications:
+        # notify-api-749 and notify-api-742, same as dao_create_notification
+        if "verify_code" not in str(notification.personalisation):
+            notification.personalisation = ""
+        notification.to = "1"
+        notification.normalised_to = "1"
+
+    return _insert_notifications(notifications)
+
+
+def _insert_notifications(notifications):
+    if not notifications:
+        return []
+    stmt = (
+        insert(Notification)
+        .values([_notification_insert_values(n) for n in notifications])
+        .on_conflict_do_nothing()
+        .returning(Notification.id)
+    )
+    inserted_ids = db.session.execute(stmt).scalars().all()
+    db.session.commit()
+    return inserted_ids
+
+
 def country_records_delivery(phone_prefix):
     dlr = INTERNATIONAL_BILLING_RATES[phone_prefix]["attributes"]["dlr"]
     return dlr and dlr.lower() == "yes"
@@ -251,48 +307,93 @@ def dao_update_notification(notification):
     db.session.add(notification)
 
 
-def get_notifications_for_job(
-    service_id, job_id, filter_dict=None, page=1, page_size=None
-):
-    if page_size is None:
-        page_size = current_app.config["PAGE_SIZE"]
+def _decode_keyset_cursor(cursor, sort_columns):
+    values = decode_cursor(cursor)
+    if len(values) != len(sort_columns):
+        raise ValueError(f"{cursor} is not a cursor for {sort_columns}")
+    decoded = []
+    for value, sort_column in zip(values, sort_columns):
+        python_type = sort_column.type.python_type
+        if python_type is datetime:
+            decoded.append(datetime.fromisoformat(str(value)))
+        else:
+            decoded.append(python_type(str(value)))
+    return decoded
 
-    stmt = select(Notification).where(
-        Notification.service_id == service_id, Notification.job_id == job_id
-    )
-    stmt = _filter_query(stmt, filter_dict)
-    stmt = stmt.order_by(asc(Notification.job_row_number))
 
-    results = db.session.execute(stmt).scalars().all()
-
-    page_size = current_app.config["PAGE_SIZE"]
-    offset = (page - 1) * page_size
-    paginated_results = results[offset : offset + page_size]
-    pagination = Pagination(paginated_results, page, page_size, len(results))
-    return pagination
+def _keyset_page(stmt, sort_columns, page_size, cursor=None, page=1, descending=False):
+    """
+    Fetch one page of stmt ordered by sort_columns, the last of which must be
+    unique. With a cursor the page starts straight after the row the cursor
+    was made from, which the database finds through the index on the sort
+    columns instead of reading and discarding an offset's worth of rows.
+    Without one it falls back to the offset of the page number. One row more
+    than the page is fetched to tell whether there is another page.
+
+    Returns the page and the cursor for the next one, or None for the last.
+    Raises ValueError for a cursor that was not made for these sort columns.
+    """
+    if cursor is not None:
+        key = tuple_(*sort_columns)
+        after = tuple_(
+            *(
+                literal(value, sort_column.type)
+                for value, sort_column in zip(
+                    _decode_keyset_cursor(cursor, sort_columns), sort_columns
+                )
+            )
+        )
+        stmt = stmt.where(key < after if descending else key > after)
+    else:
+        stmt = stmt.offset((page - 1) * page_size)
+    order = desc if descending else asc
+    stmt = stmt.order_by(*(order(sort_column) for sort_column in sort_columns))
+    items = db.session.execute(stmt.limit(page_size + 1)).scalars().all()
+    if len(items) <= page_size:
+        return items, None
+    items = items[:page_size]
+    last = items[-1]
+    return items, encode_cursor(
+        *(getattr(last, sort_column.key) for sort_column in sort_columns)
+    )
 
 
-def get_recent_notifications_for_job(
-    service_id, job_id, filter_dict=None, page=1, page_size=None
+def _get_page_of_notifications_for_job(
+    service_id, job_id, filter_dict, page, page_size, cursor, descending
 ):
     if page_size is None:
         page_size = current_app.config["PAGE_SIZE"]
 
-    stmt = select(Notification).where(
-        Notification.service_id == service_id,
-        Notification.job_id == job_id,
+    filters = [Notification.service_id == service_id, Notification.job_id == job_id]
+    stmt = _filter_query(select(Notification).where(*filters), filter_dict)
+    items, next_cursor = _keyset_page(
+        stmt,
+        [Notification.job_row_number, Notification.id],
+        page_size,
+        cursor=cursor,
+        page=page,
+        descending=descending,
     )
+    total = db.session.execute(
+        _filter_query(select(func.count(Notification.id)).where(*filters), filter_dict)
+    ).scalar()
+    return Pagination(items, page, page_size, total, next_cursor=next_cursor)
 
-    stmt = _filter_query(stmt, filter_dict)
-    stmt = stmt.order_by(desc(Notification.job_row_number))
-    results = db.session.execute(stmt).scalars().all()
 
-    page_size = current_app.config["PAGE_SIZE"]
-    offset = (page - 1) * page_size
-    paginated_results = results[offset : offset + page_size]
+def get_notifications_for_job(
+    service_id, job_id, filter_dict=None, page=1, page_size=None, cursor=None
+):
+    return _get_page_of_notifications_for_job(
+        service_id, job_id, filter_dict, page, page_size, cursor, descending=False
+    )
 
-    pagination = Pagination(paginated_results, page, page_size, len(results))
-    return pagination
+
+def get_recent_notifications_for_job(
+    service_id, job_id, filter_dict=None, page=1, page_size=None, cursor=None
+):
+    return _get_page_of_notifications_for_job(
+        service_id, job_id, filter_dict, page, page_size, cursor, descending=True
+    )
 
 
 def dao_get_notification_count_for_job_id(*, job_id):
@@ -469,25 +570,70 @@ def get_notification_by_id(notification_id, service_id=None, _raise=False):
     )
 
 
-def get_notifications_for_service(
+def dao_get_notifications_by_ids(notification_ids):
+    stmt = select(Notification).where(Notification.id.in_(notification_ids))
+    return db.session.execute(stmt).scalars().all()
+
+
+def dao_update_notifications_to_sending(sent, sent_by):
+    """
+    Record a batch of notifications the provider accepted in one UPDATE
+    joined against the (notification id, message id, billable units) tuples
+    in sent, unnested from one array per column like
+    dao_update_delivery_receipts. Notifications that already reached a final
+    status keep it. Returns how many notifications were updated.
+    """
+    now = utc_now()
+    sent_table = (
+        func.unnest(
+            bindparam("ids", [s[0] for s in sent], type_=ARRAY(UUID(as_uuid=True))),
+            bindparam("message_ids", [s[1] for s in sent], type_=ARRAY(Text)),
+            bindparam("billable_units", [s[2] for s in sent], type_=ARRAY(Integer)),
+        )
+        .table_valued(
+            column("id", UUID(as_uuid=True)),
+            column("message_id", Text),
+            column("billable_units", Integer),
+        )
+        .render_derived(name="sent")
+    )
+
+    stmt = (
+        update(Notification)
+        .where(Notification.id == sent_table.c.id)
+        .values(
+            message_id=sent_table.c.message_id,
+            billable_units=sent_table.c.billable_units,
+            sent_at=now,
+            sent_by=sent_by,
+            updated_at=now,
+            status=case(
+                (
+                    Notification.status.in_(NotificationStatus.completed_types()),
+                    Notification.status,
+                ),
+                else_=literal(NotificationStatus.SENDING, Notification.status.type),
+            ),
+            # notify-api-742 remove phone numbers from db
+            to="1",
+            normalised_to="1",
+        )
+    )
+    updated = db.session.execute(stmt).rowcount
+    db.session.commit()
+    return updated
+
+
+def _notifications_for_service_filters(
     service_id,
-    filter_dict=None,
-    page=1,
-    page_size=None,
-    count_pages=True,
     limit_days=None,
     key_type=None,
-    personalisation=False,
     include_jobs=False,
     include_from_test_key=False,
     older_than=None,
     client_reference=None,
     include_one_off=True,
-    error_out=True,
 ):
-    if page_size is None:
-        page_size = current_app.config["PAGE_SIZE"]
-
     filters = [Notification.service_id == service_id]
 
     if limit_days is not None:
@@ -515,6 +661,39 @@ def get_notifications_for_service(
     if client_reference is not None:
         filters.append(Notification.client_reference == client_reference)
 
+    return filters
+
+
+def get_notifications_for_service(
+    service_id,
+    filter_dict=None,
+    page=1,
+    page_size=None,
+    count_pages=True,
+    limit_days=None,
+    key_type=None,
+    personalisation=False,
+    include_jobs=False,
+    include_from_test_key=False,
+    older_than=None,
+    client_reference=None,
+    include_one_off=True,
+    error_out=True,
+):
+    if page_size is None:
+        page_size = current_app.config["PAGE_SIZE"]
+
+    filters = _notifications_for_service_filters(
+        service_id,
+        limit_days=limit_days,
+        key_type=key_type,
+        include_jobs=include_jobs,
+        include_from_test_key=include_from_test_key,
+        older_than=older_than,
+        client_reference=client_reference,
+        include_one_off=include_one_off,
+    )
+
     stmt = select(Notification).where(*filters)
     stmt = _filter_query(stmt, filter_dict)
     if personalisation:
@@ -528,6 +707,44 @@ def get_notifications_for_service(
     return pagination
 
 
+def get_page_of_notifications_for_service(
+    service_id,
+    filter_dict=None,
+    page=1,
+    page_size=None,
+    cursor=None,
+    limit_days=None,
+    include_jobs=False,
+    include_from_test_key=False,
+    include_one_off=True,
+):
+    """
+    A page of a service's notifications, newest first, with keyset pagination
+    on (created_at, id) so that deep pages cost the same as the first one.
+    Returns the notifications and the cursor for the next page, or None if
+    this is the last page.
+    """
+    if page_size is None:
+        page_size = current_app.config["PAGE_SIZE"]
+
+    filters = _notifications_for_service_filters(
+        service_id,
+        limit_days=limit_days,
+        include_jobs=include_jobs,
+        include_from_test_key=include_from_test_key,
+        include_one_off=include_one_off,
+    )
+    stmt = _filter_query(select(Notification).where(*filters), filter_dict)
+    return _keyset_page(
+        stmt,
+        [Notification.created_at, Notification.id],
+        page_size,
+        cursor=cursor,
+        page=page,
+        descending=True,
+    )
+
+
 def _filter_query(stmt, filter_dict=None):
     if filter_dict is None:
         return stmt
@@ -548,10 +765,104 @@ def _filter_query(stmt, filter_dict=None):
     return stmt
 
 
+def _select_notification_csv_rows():
+    """
+    Select what Notification.serialize_row_for_csv needs, with the template,
+    job and user joined in rather than lazy loaded one notification at a time.
+    """
+    return (
+        select(
+            Notification.id,
+            Notification.service_id,
+            Notification.job_id,
+            Notification.job_row_number,
+            Notification.to,
+            Notification.client_reference,
+            Notification.carrier,
+            Notification.provider_response,
+            Notification.status,
+            Notification.created_at,
+            TemplateHistory.name.label("template_name"),
+            TemplateHistory.template_type,
+            Job.original_file_name.label("job_name"),
+            User.name.label("created_by_name"),
+            User.email_address.label("created_by_email_address"),
+        )
+        .join(
+            TemplateHistory,
+            and_(
+                TemplateHistory.id == Notification.template_id,
+                TemplateHistory.version == Notification.template_version,
+            ),
+        )
+        .outerjoin(Job, Job.id == Notification.job_id)
+        .outerjoin(User, User.id == Notification.created_by_id)
+    )
+
+
+def dao_get_notification_csv_rows(notification_ids):
+    """
+    Rows for Notification.serialize_row_for_csv for a page of notifications,
+    fetched in one query and returned in the order of notification_ids.
+    """
+    if not notification_ids:
+        return []
+    stmt = _select_notification_csv_rows().where(Notification.id.in_(notification_ids))
+    rows = {row.id: row for row in db.session.execute(stmt)}
+    return [rows[notification_id] for notification_id in notification_ids]
+
+
+def dao_get_notifications_for_report(service_id, limit_days):
+    """
+    Stream rows for Notification.serialize_row_for_csv of a service's
+    notifications from the last limit_days, for its notification reports,
+    newest first.
+    """
+    stmt = (
+        _select_notification_csv_rows()
+        .where(
+            Notification.service_id == service_id,
+            Notification.created_at >= midnight_n_days_ago(limit_days),
+            Notification.key_type != KeyType.TEST,
+        )
+        .order_by(desc(Notification.created_at))
+        .execution_options(yield_per=1000)
+    )
+    return db.session.execute(stmt)
+
+
+def dao_get_notification_changes_for_report(service_id, limit_days):
+    """
+    For each status, how many of a service's notifications from the last
+    limit_days are in it and when the latest of them changed or was sent.
+    """
+    stmt = (
+        select(
+            Notification.status,
+            func.count(),
+            func.max(
+                func.greatest(
+                    func.coalesce(Notification.updated_at, Notification.created_at),
+                    Notification.sent_at,
+                )
+            ),
+        )
+        .where(
+            Notification.service_id == service_id,
+            Notification.created_at >= midnight_n_days_ago(limit_days),
+            Notification.key_type != KeyType.TEST,
+        )
+        .group_by(Notification.status)
+        .order_by(Notification.status)
+    )
+    return db.session.execute(stmt).all()
+
+
 def sanitize_successful_notification_by_id(notification_id, carrier, provider_response):
     update_query = """
     update notifications set provider_response=:response, carrier=:carrier,
-    notification_status='delivered', sent_at=:sent_at, "to"='1', normalised_to='1'
+    notification_status='delivered', sent_at=:sent_at, updated_at=:sent_at,
+    "to"='1', normalised_to='1'
     where id=:notification_id
     """
 
@@ -919,67 +1230,69 @@ def get_service_ids_with_notifications_on_date(notification_type, date):
 
 
 def dao_update_delivery_receipts(receipts, delivered):
+    """
+    Apply a batch of DeliveryReceipts in one UPDATE joined against the
+    receipts unnested from one array per column, so the statement stays the
+    same size however many receipts there are. Returns how many notifications
+    were updated.
+    """
     start_time_millis = time() * 1000
-    new_receipts = []
-    for r in receipts:
-        if isinstance(r, str):
-            r = json.loads(r)
-        new_receipts.append(r)
-
-    receipts = new_receipts
-    id_to_carrier = {
-        r["notification.messageId"]: r["delivery.phoneCarrier"] for r in receipts
-    }
-    id_to_provider_response = {
-        r["notification.messageId"]: r["delivery.providerResponse"] for r in receipts
-    }
-    id_to_timestamp = {r["notification.messageId"]: r["@timestamp"] for r in receipts}
+    # a receipt can show up in more than one search, the last one wins
+    receipts_by_message_id = {r.message_id: r for r in receipts}
 
-    id_to_message_cost = {
-        r["notification.messageId"]: r["delivery.priceInUSD"] for r in receipts
-    }
     status_to_update_with = NotificationStatus.DELIVERED
     if not delivered:
         status_to_update_with = NotificationStatus.FAILED
 
+    received = receipts_by_message_id.values()
+    receipts_table = (
+        func.unnest(
+            bindparam("message_ids", list(receipts_by_message_id), type_=ARRAY(Text)),
+            bindparam("carriers", [r.carrier for r in received], type_=ARRAY(Text)),
+            bindparam(
+                "provider_responses",
+                [r.provider_response for r in received],
+                type_=ARRAY(Text),
+            ),
+            bindparam("timestamps", [r.timestamp for r in received], type_=ARRAY(Text)),
+            bindparam(
+                "message_costs",
+                [r.price_in_usd for r in received],
+                type_=ARRAY(Float),
+            ),
+        )
+        .table_valued(
+            column("message_id", Text),
+            column("carrier", Text),
+            column("provider_response", Text),
+            column("sent_at", Text),
+            column("message_cost", Float),
+        )
+        .render_derived(name="receipts")
+    )
+
     stmt = (
         update(Notification)
-        .where(Notification.message_id.in_(id_to_carrier.keys()))
+        .where(Notification.message_id == receipts_table.c.message_id)
         .values(
-            carrier=case(
-                *[
-                    (Notification.message_id == key, value)
-                    for key, value in id_to_carrier.items()
-                ]
-            ),
+            carrier=receipts_table.c.carrier,
             status=status_to_update_with,
-            sent_at=case(
-                *[
-                    (Notification.message_id == key, cast(value, TIMESTAMP))
-                    for key, value in id_to_timestamp.items()
-                ]
-            ),
-            provider_response=case(
-                *[
-                    (Notification.message_id == key, value)
-                    for key, value in id_to_provider_response.items()
-                ]
-            ),
-            message_cost=case(
-                *[
-                    (Notification.message_id == key, value)
-                    for key, value in id_to_message_cost.items()
-                ]
+            sent_at=func.coalesce(
+                cast(receipts_table.c.sent_at, TIMESTAMP), Notification.sent_at
             ),
+            provider_response=receipts_table.c.provider_response,
+            message_cost=receipts_table.c.message_cost,
+            updated_at=utc_now(),
         )
     )
-    db.session.execute(stmt)
+    updated = db.session.execute(stmt).rowcount
     db.session.commit()
     elapsed_time = (time() * 1000) - start_time_millis
     current_app.logger.info(
-        f"#loadtestperformance batch update query time: \
-        updated {len(receipts)} notification in {elapsed_time} ms"
+        f"#loadtestperformance batch update query time: "
+        f"updated {updated} of {len(receipts)} notifications in {elapsed_time} ms"
     )
+    return updated
 
 
 def dao_close_out_delivery_receipts():
@@ -990,7 +1303,11 @@ def dao_close_out_delivery_receipts():
             Notification.status == NotificationStatus.PENDING,
             Notification.sent_at < THREE_DAYS_AGO,
         )
-        .values(status=NotificationStatus.FAILED, provider_response="Technical Failure")
+        .values(
+            status=NotificationStatus.FAILED,
+            provider_response="Technical Failure",
+            updated_at=utc_now(),
+        )
     )
     result = db.session.execute(stmt)
 
@@ -1002,7 +1319,11 @@ def dao_close_out_delivery_receipts():
 
 
 def dao_batch_insert_notifications(batch):
-    db.session.bulk_save_objects(batch)
-    db.session.commit()
-    current_app.logger.info(f"Batch inserted notifications: {len(batch)}")
-    return len(batch)
+    """
+    Insert the notifications drained from the redis message_queue in one
+    statement. Ones that are already in the table are skipped, so a batch can
+    safely be replayed. Returns the ids of the notifications that were inserted.
+    """
+    inserted_ids = _insert_notifications(batch)
+    current_app.logger.info(f"Batch inserted notifications: {len(inserted_ids)}")
+    return inserted_ids
@@ -1,9 +1,10 @@
 from sqlalchemy import desc, select
 
-from app import db
+from app import db, model_cache
 from app.dao.dao_utils import autocommit
 from app.errors import InvalidRequest
 from app.exceptions import ArchiveValidationError
+from app.model_cache import service_senders_key
 from app.models import ServiceEmailReplyTo
 
 
@@ -48,6 +49,7 @@ def add_reply_to_email_address_for_service(service_id, email_address, is_default
         service_id=service_id, email_address=email_address, is_default=is_default
     )
     db.session.add(new_reply_to)
+    model_cache.invalidate_on_commit(service_senders_key(service_id))
     return new_reply_to
 
 
@@ -66,6 +68,7 @@ def update_reply_to_email_address(service_id, reply_to_id, email_address, is_def
     reply_to_update.email_address = email_address
     reply_to_update.is_default = is_default
     db.session.add(reply_to_update)
+    model_cache.invalidate_on_commit(service_senders_key(service_id))
     return reply_to_update
 
 
@@ -90,6 +93,7 @@ def archive_reply_to_email_address(service_id, reply_to_id):
     reply_to_archive.archived = True
 
     db.session.add(reply_to_archive)
+    model_cache.invalidate_on_commit(service_senders_key(service_id))
     return reply_to_archive
 
 
@@ -1,7 +1,8 @@
 from sqlalchemy import delete, select
 
-from app import db
+from app import db, model_cache
 from app.dao.dao_utils import autocommit
+from app.model_cache import service_key
 from app.models import ServicePermission
 
 
@@ -15,6 +16,7 @@ def dao_fetch_service_permissions(service_id):
 def dao_add_service_permission(service_id, permission):
     service_permission = ServicePermission(service_id=service_id, permission=permission)
     db.session.add(service_permission)
+    model_cache.invalidate_on_commit(service_key(service_id))
 
 
 def dao_remove_service_permission(service_id, permission):
@@ -24,5 +26,6 @@ def dao_remove_service_permission(service_id, permission):
         ServicePermission.permission == permission,
     )
     result = db.session.execute(stmt)
+    model_cache.invalidate_on_commit(service_key(service_id))
     db.session.commit()
     return result.rowcount
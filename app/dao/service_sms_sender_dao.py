@@ -1,8 +1,9 @@
 from sqlalchemy import desc, select
 
-from app import db
+from app import db, model_cache
 from app.dao.dao_utils import autocommit
 from app.exceptions import ArchiveValidationError
+from app.model_cache import service_senders_key
 from app.models import ServiceSmsSender
 
 
@@ -56,6 +57,7 @@ def dao_add_sms_sender_for_service(
     )
 
     db.session.add(new_sms_sender)
+    model_cache.invalidate_on_commit(service_senders_key(service_id))
     return new_sms_sender
 
 
@@ -75,6 +77,7 @@ def dao_update_service_sms_sender(
     if not sms_sender_to_update.inbound_number_id and sms_sender:
         sms_sender_to_update.sms_sender = sms_sender
     db.session.add(sms_sender_to_update)
+    model_cache.invalidate_on_commit(service_senders_key(service_id))
     return sms_sender_to_update
 
 
@@ -85,6 +88,7 @@ def update_existing_sms_sender_with_inbound_number(
     service_sms_sender.sms_sender = sms_sender
     service_sms_sender.inbound_number_id = inbound_number_id
     db.session.add(service_sms_sender)
+    model_cache.invalidate_on_commit(service_senders_key(service_sms_sender.service_id))
     return service_sms_sender
 
 
@@ -109,6 +113,7 @@ def archive_sms_sender(service_id, sms_sender_id):
     sms_sender_to_archive.archived = True
 
     db.session.add(sms_sender_to_archive)
+    model_cache.invalidate_on_commit(service_senders_key(service_id))
     return sms_sender_to_archive
 
 
@@ -6,7 +6,7 @@ from sqlalchemy import Float, cast, delete, select
 from sqlalchemy.orm import joinedload
 from sqlalchemy.sql.expression import and_, asc, case, func
 
-from app import db
+from app import db, model_cache
 from app.dao.dao_utils import VersionOptions, autocommit, version_class
 from app.dao.date_util import (
     generate_date_range,
@@ -24,6 +24,7 @@ from app.enums import (
     ServicePermissionType,
     UserState,
 )
+from app.model_cache import service_key, template_key
 from app.models import (
     AnnualBilling,
     ApiKey,
@@ -293,11 +294,14 @@ def dao_archive_service(service_id):
     for template in service.templates:
         if not template.archived:
             template.archived = True
+            model_cache.invalidate_on_commit(template_key(template.id, service_id))
 
     for api_key in service.api_keys:
         if not api_key.expiry_date:
             api_key.expiry_date = utc_now()
 
+    model_cache.invalidate_on_commit(service_key(service_id))
+
 
 def dao_fetch_service_by_id_and_user(service_id, user_id):
 
@@ -360,6 +364,9 @@ def dao_create_service(
 @version_class(Service)
 def dao_update_service(service):
     db.session.add(service)
+    # reading the id must not flush the update before version_class has seen it
+    with db.session.no_autoflush:
+        model_cache.invalidate_on_commit(service_key(service.id))
 
 
 def dao_add_user_to_service(service, user, permissions=None, folder_permissions=None):
@@ -456,6 +463,7 @@ def delete_service_and_all_associated_db_objects(service):
         user.organizations = []
         service.users.remove(user)
     _delete_commit(delete(Service.get_history_model()).where(Service.id == service.id))
+    model_cache.invalidate_on_commit(service_key(service.id))
     db.session.delete(service)
     db.session.commit()
     for user in users:
@@ -742,6 +750,7 @@ def dao_suspend_service(service_id):
             api_key.expiry_date = utc_now()
 
     service.active = False
+    model_cache.invalidate_on_commit(service_key(service_id))
 
 
 @autocommit
@@ -750,6 +759,7 @@ def dao_resume_service(service_id):
     service = db.session.get(Service, service_id)
 
     service.active = True
+    model_cache.invalidate_on_commit(service_key(service_id))
 
 
 def dao_fetch_active_users_for_service(service_id):
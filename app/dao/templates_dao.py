@@ -2,8 +2,9 @@ import uuid
 
 from sqlalchemy import asc, desc, select
 
-from app import db
+from app import db, model_cache
 from app.dao.dao_utils import VersionOptions, autocommit, version_class
+from app.model_cache import template_key
 from app.models import Template, TemplateHistory, TemplateRedacted
 from app.utils import utc_now
 
@@ -34,6 +35,9 @@ def dao_create_template(template):
 @version_class(VersionOptions(Template, history_class=TemplateHistory))
 def dao_update_template(template):
     db.session.add(template)
+    # reading the ids must not flush the update before version_class has seen it
+    with db.session.no_autoflush:
+        model_cache.invalidate_on_commit(template_key(template.id, template.service_id))
 
 
 @autocommit
@@ -1,28 +1,35 @@
 import json
 import os
+from collections import defaultdict, namedtuple
 from contextlib import suppress
+from functools import partial
 from urllib import parse
 
 from cachetools import TTLCache, cached
 from flask import current_app
+from gevent.pool import Pool
 
 from app import (
     create_uuid,
     db,
+    model_cache,
     notification_provider_clients,
     redis_store,
 )
 from app.aws.s3 import get_personalisation_from_s3, get_phone_number_from_s3
+from app.celery.job_scheduler import record_provider_send
 from app.celery.test_key_tasks import send_email_response, send_sms_response
 from app.dao.email_branding_dao import dao_get_email_branding_by_id
 from app.dao.notifications_dao import (
     dao_update_notification,
+    dao_update_notifications_to_sending,
+    get_notification_by_id,
     update_notification_message_id,
 )
 from app.dao.provider_details_dao import get_provider_details_by_notification_type
-from app.dao.service_sms_sender_dao import dao_get_sms_senders_by_service_id
 from app.enums import BrandType, KeyType, NotificationStatus, NotificationType
 from app.exceptions import NotificationTechnicalFailureException
+from app.model_cache import email_branding_key
 from app.serialised_models import SerialisedService, SerialisedTemplate
 from app.utils import hilite, utc_now
 from notifications_utils.clients.redis import total_limit_cache_key
@@ -87,43 +94,9 @@ def send_sms_to_provider(notification):
                 # providers as a slow down of our providers can cause us to run out of DB connections
                 # Therefore we pull all the data from our DB models into `send_sms_kwargs`now before
                 # closing the session (as otherwise it would be reopened immediately)
-
-                # We start by trying to get the phone number from a job in s3.  If we fail, we assume
-                # the phone number is for the verification code on login, which is not a job.
-                recipient = None
-                # It is our 2facode, maybe
-                recipient = _get_verify_code(notification)
-                if recipient is None:
-                    recipient = get_phone_number_from_s3(
-                        notification.service_id,
-                        notification.job_id,
-                        notification.job_row_number,
-                    )
-
-                # TODO current we allow US phone numbers to be uploaded without the country code (1)
-                # This will break certain international phone numbers (Norway, Denmark, East Timor)
-                # When we officially announce support for international numbers, US numbers must contain
-                # their country code.
-                recipient = str(recipient)
-                if len(recipient) == 10:
-                    if os.getenv("NOTIFY_ENVIRONMENT") not in [
-                        "test"
-                    ]:  # we want to test intl support
-                        recipient = f"1{recipient}"
-
-                sender_numbers = get_sender_numbers(notification)
-                if notification.reply_to_text not in sender_numbers:
-                    raise ValueError(
-                        f"{notification.reply_to_text} not in {sender_numbers} #notify-debug-admin-1701"
-                    )
-
-                send_sms_kwargs = {
-                    "to": recipient,
-                    "content": str(template),
-                    "reference": str(notification.id),
-                    "sender": notification.reply_to_text,
-                    "international": notification.international,
-                }
+                send_sms_kwargs = _send_sms_kwargs(
+                    notification, template, get_sender_numbers(notification)
+                )
                 db.session.close()  # no commit needed as no changes to objects have been made above
                 real_sender_number = notification.reply_to_text
                 # interleave spaces to bypass PII scrubbing since sender number is not PII
@@ -147,6 +120,7 @@ def send_sms_to_provider(notification):
                 current_app.logger.info(hilite(msg))
                 notification.billable_units = template.fragment_count
                 update_notification_to_sending(notification, provider)
+                record_provider_send()
 
                 cache_key = total_limit_cache_key(service.id)
                 redis_store.incr(cache_key)
@@ -154,6 +128,177 @@ def send_sms_to_provider(notification):
     return message_id
 
 
+BatchedSms = namedtuple(
+    "BatchedSms",
+    ["notification_id", "service_id", "provider", "kwargs", "billable_units"],
+)
+
+
+def send_sms_batch_to_provider(notifications):
+    """
+    Send a batch of sms to the provider at once. Sends run concurrently on a
+    pool of SMS_DELIVERY_CONCURRENCY greenlets, and the ones that were
+    accepted are marked as sending in one update.
+
+    Returns the ids of the notifications that can not be sent in a batch
+    (test keys, inactive services, ones that were already sent), which are
+    for send_sms_to_provider, and the ids of the ones that failed.
+    """
+    batch = []
+    unbatched = []
+    failed = []
+    for notification in notifications:
+        try:
+            batched = _batched_sms(notification)
+        except Exception:
+            current_app.logger.exception(f"FAILED send to sms {notification.id}")
+            failed.append(notification.id)
+            continue
+        if batched is None:
+            unbatched.append(notification.id)
+        else:
+            batch.append(batched)
+    if not batch:
+        return unbatched, failed
+
+    # see send_sms_to_provider, everything we need is in the batch now
+    db.session.close()
+    app = current_app._get_current_object()
+    pool = Pool(current_app.config["SMS_DELIVERY_CONCURRENCY"])
+    message_ids = pool.map(partial(_send_batched_sms, app), batch)
+
+    sent = defaultdict(list)
+    providers = {}
+    for batched, message_id in zip(batch, message_ids):
+        if message_id is None:
+            failed.append(batched.notification_id)
+        else:
+            sent[batched.provider.name].append(
+                (batched.notification_id, message_id, batched.billable_units)
+            )
+            providers[batched.provider.name] = batched.provider
+            redis_store.incr(total_limit_cache_key(batched.service_id))
+    for provider_name, provider_sent in sent.items():
+        # these have been sent, so they must never be retried from here
+        try:
+            dao_update_notifications_to_sending(provider_sent, provider_name)
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception(
+                f"FAILED to record a batch of sms sent by {provider_name}, "
+                f"recording them one at a time: "
+                f"{[(str(n), m) for n, m, _ in provider_sent]}"
+            )
+            _record_sms_sent(providers[provider_name], provider_sent)
+        record_provider_send(len(provider_sent))
+
+    current_app.logger.info(
+        f"Sent {sum(len(p) for p in sent.values())} of a batch of "
+        f"{len(notifications)} sms, {len(failed)} failed"
+    )
+    return unbatched, failed
+
+
+def _record_sms_sent(provider, provider_sent):
+    """Record sent notifications one at a time, as send_sms_to_provider does."""
+    for notification_id, message_id, billable_units in provider_sent:
+        try:
+            update_notification_message_id(notification_id, message_id)
+            notification = get_notification_by_id(notification_id, _raise=True)
+            notification.billable_units = billable_units
+            update_notification_to_sending(notification, provider)
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception(
+                f"FAILED to record sms {notification_id} sent as {message_id}"
+            )
+
+
+def _batched_sms(notification):
+    """Everything needed to send notification in a batch, or None if it can not be."""
+    if notification.status != NotificationStatus.CREATED:
+        return None
+    if notification.key_type == KeyType.TEST:
+        return None
+    service = SerialisedService.from_id(notification.service_id)
+    if not service.active:
+        return None
+
+    if "verify_code" not in str(notification.personalisation):
+        notification.personalisation = get_personalisation_from_s3(
+            notification.service_id,
+            notification.job_id,
+            notification.job_row_number,
+        )
+    template_model = SerialisedTemplate.from_id_and_service_id(
+        template_id=notification.template_id,
+        service_id=service.id,
+        version=notification.template_version,
+    )
+    template = SMSMessageTemplate(
+        template_model.__dict__,
+        values=notification.personalisation,
+        prefix=service.name,
+        show_prefix=service.prefix_sms,
+    )
+    return BatchedSms(
+        notification_id=notification.id,
+        service_id=service.id,
+        provider=provider_to_use(NotificationType.SMS, notification.international),
+        kwargs=_send_sms_kwargs(notification, template, service.sms_sender_numbers),
+        billable_units=template.fragment_count,
+    )
+
+
+def _send_batched_sms(app, batched):
+    with app.app_context():
+        try:
+            return batched.provider.send_sms(**batched.kwargs)
+        except Exception:
+            current_app.logger.exception(
+                f"FAILED send to sms {batched.notification_id}"
+            )
+            return None
+
+
+def _send_sms_kwargs(notification, template, sender_numbers):
+    # We start by trying to get the phone number from a job in s3.  If we fail, we assume
+    # the phone number is for the verification code on login, which is not a job.
+    recipient = None
+    # It is our 2facode, maybe
+    recipient = _get_verify_code(notification)
+    if recipient is None:
+        recipient = get_phone_number_from_s3(
+            notification.service_id,
+            notification.job_id,
+            notification.job_row_number,
+        )
+
+    # TODO current we allow US phone numbers to be uploaded without the country code (1)
+    # This will break certain international phone numbers (Norway, Denmark, East Timor)
+    # When we officially announce support for international numbers, US numbers must contain
+    # their country code.
+    recipient = str(recipient)
+    if len(recipient) == 10:
+        if os.getenv("NOTIFY_ENVIRONMENT") not in [
+            "test"
+        ]:  # we want to test intl support
+            recipient = f"1{recipient}"
+
+    if notification.reply_to_text not in sender_numbers:
+        raise ValueError(
+            f"{notification.reply_to_text} not in {sender_numbers} #notify-debug-admin-1701"
+        )
+
+    return {
+        "to": recipient,
+        "content": str(template),
+        "reference": str(notification.id),
+        "sender": notification.reply_to_text,
+        "international": notification.international,
+    }
+
+
 def _get_verify_code(notification):
     key = f"2facode-{notification.id}".replace(" ", "")
     recipient = redis_store.get(key)
@@ -163,11 +308,7 @@ def _get_verify_code(notification):
 
 
 def get_sender_numbers(notification):
-    possible_senders = dao_get_sms_senders_by_service_id(notification.service_id)
-    sender_numbers = []
-    for possible_sender in possible_senders:
-        sender_numbers.append(possible_sender.sms_sender)
-    return sender_numbers
+    return SerialisedService.from_id(notification.service_id).sms_sender_numbers
 
 
 def send_email_to_provider(notification):
@@ -229,6 +370,7 @@ def send_email_to_provider(notification):
             )
             notification.reference = reference
             update_notification_to_sending(notification, provider)
+            record_provider_send()
 
 
 def update_notification_to_sending(notification, provider):
@@ -293,10 +435,16 @@ def get_html_email_options(service):
             "brand_banner": False,
         }
     if isinstance(service, SerialisedService):
-        branding = dao_get_email_branding_by_id(service.email_branding)
-    else:
-        branding = service.email_branding
+        return model_cache.get(
+            email_branding_key(service.email_branding),
+            lambda: _email_branding_options(
+                dao_get_email_branding_by_id(service.email_branding)
+            ),
+        )
+    return _email_branding_options(service.email_branding)
+
 
+def _email_branding_options(branding):
     logo_url = (
         get_logo_url(current_app.config["ADMIN_BASE_URL"], branding.logo)
         if branding.logo
@@ -26,6 +26,7 @@ from app.dao.jobs_dao import (
 )
 from app.dao.notifications_dao import (
     dao_get_notification_count_for_job_id,
+    dao_get_notification_csv_rows,
     get_notifications_for_job,
     get_recent_notifications_for_job,
 )
@@ -33,6 +34,7 @@ from app.dao.services_dao import dao_fetch_service_by_id
 from app.dao.templates_dao import dao_get_template_by_id
 from app.enums import JobStatus, NotificationStatus
 from app.errors import InvalidRequest, register_errors
+from app.models import Notification
 from app.schemas import (
     JobSchema,
     UnarchivedTemplateSchema,
@@ -121,31 +123,42 @@ def get_all_notifications_for_service_job(service_id, job_id):
         if "page_size" in data
         else current_app.config.get("PAGE_SIZE")
     )
-    paginated_notifications = get_notifications_for_job(
-        service_id, job_id, filter_dict=data, page=page, page_size=page_size
-    )
+    page_size = min(page_size, current_app.config["NOTIFICATIONS_MAX_PAGE_SIZE"])
+    try:
+        paginated_notifications = get_notifications_for_job(
+            service_id,
+            job_id,
+            filter_dict=data,
+            page=page,
+            page_size=page_size,
+            cursor=data.get("cursor"),
+        )
+    except ValueError:
+        raise InvalidRequest({"cursor": ["Invalid pagination cursor"]}, status_code=400)
 
     kwargs = request.args.to_dict()
     kwargs["service_id"] = service_id
     kwargs["job_id"] = job_id
 
-    for notification in paginated_notifications.items:
-        if notification.job_id is not None:
-            recipient = phones[notification.job_row_number]
-            notification.to = recipient
-            notification.normalised_to = recipient
-
-    for notification in paginated_notifications.items:
-        if notification.job_id is not None:
-            notification.personalisation = personalisation[notification.job_row_number]
-
     notifications = None
     if data.get("format_for_csv"):
-        notifications = [
-            notification.serialize_for_csv()
-            for notification in paginated_notifications.items
-        ]
+        notifications = []
+        for row in dao_get_notification_csv_rows(
+            [notification.id for notification in paginated_notifications.items]
+        ):
+            serialized = Notification.serialize_row_for_csv(row)
+            serialized["recipient"] = phones[row.job_row_number]
+            notifications.append(serialized)
     else:
+        for notification in paginated_notifications.items:
+            if notification.job_id is not None:
+                recipient = phones[notification.job_row_number]
+                notification.to = recipient
+                notification.normalised_to = recipient
+                notification.personalisation = personalisation[
+                    notification.job_row_number
+                ]
+
         notifications = notification_with_template_schema.dump(
             paginated_notifications.items, many=True
         )
@@ -178,43 +191,50 @@ def get_recent_notifications_for_service_job(service_id, job_id):
         if "page_size" in data
         else current_app.config.get("PAGE_SIZE")
     )
-    paginated_notifications = get_recent_notifications_for_job(
-        service_id,
-        job_id,
-        filter_dict=data,
-        page=page,
-        page_size=page_size,
-    )
+    page_size = min(page_size, current_app.config["NOTIFICATIONS_MAX_PAGE_SIZE"])
+    try:
+        paginated_notifications = get_recent_notifications_for_job(
+            service_id,
+            job_id,
+            filter_dict=data,
+            page=page,
+            page_size=page_size,
+            cursor=data.get("cursor"),
+        )
+    except ValueError:
+        raise InvalidRequest({"cursor": ["Invalid pagination cursor"]}, status_code=400)
 
     kwargs = request.args.to_dict()
     kwargs["service_id"] = service_id
     kwargs["job_id"] = job_id
 
-    for notification in paginated_notifications.items:
-        if notification.job_id is not None:
-            recipient = get_phone_number_from_s3(
-                notification.service_id,
-                notification.job_id,
-                notification.job_row_number,
-            )
-            notification.to = recipient
-            notification.normalised_to = recipient
-
-    for notification in paginated_notifications.items:
-        if notification.job_id is not None:
-            notification.personalisation = get_personalisation_from_s3(
-                notification.service_id,
-                notification.job_id,
-                notification.job_row_number,
-            )
-
     notifications = None
     if data.get("format_for_csv"):
-        notifications = [
-            notification.serialize_for_csv()
-            for notification in paginated_notifications.items
-        ]
+        notifications = []
+        for row in dao_get_notification_csv_rows(
+            [notification.id for notification in paginated_notifications.items]
+        ):
+            serialized = Notification.serialize_row_for_csv(row)
+            serialized["recipient"] = get_phone_number_from_s3(
+                row.service_id, row.job_id, row.job_row_number
+            )
+            notifications.append(serialized)
     else:
+        for notification in paginated_notifications.items:
+            if notification.job_id is not None:
+                recipient = get_phone_number_from_s3(
+                    notification.service_id,
+                    notification.job_id,
+                    notification.job_row_number,
+                )
+                notification.to = recipient
+                notification.normalised_to = recipient
+                notification.personalisation = get_personalisation_from_s3(
+                    notification.service_id,
+                    notification.job_id,
+                    notification.job_row_number,
+                )
+
         notifications = notification_with_template_schema.dump(
             paginated_notifications.items, many=True
         )
@@ -226,7 +246,7 @@ def get_recent_notifications_for_service_job(service_id, job_id):
             total=paginated_notifications.total,
             links=pagination_links(
                 paginated_notifications,
-                ".get_all_notifications_for_service_job",
+                ".get_recent_notifications_for_service_job",
                 **kwargs,
             ),
         ),
@@ -0,0 +1,243 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+INVALIDATION_CHANNEL = "model-cache-invalidations"
+DEFAULT_TTL = 60 * 60
+DEFAULT_MAX_SIZE = 4096
+# Without redis to hear about updates from other processes, entries are only trusted briefly
+UNSUBSCRIBED_TTL = 2
+REDIS_TTL = int(timedelta(days=7).total_seconds())
+RESUBSCRIBE_DELAY = 5
+STATS_LOG_INTERVAL = 5 * 60
+
+
+def email_branding_key(email_branding_id):
+    return f"email_branding-{email_branding_id}"
+
+
+def service_key(service_id):
+    return f"service-{service_id}"
+
+
+def service_senders_key(service_id):
+    return f"service-{service_id}-senders"
+
+
+def template_key(template_id, service_id, version=None):
+    return f"service-{service_id}-template-{template_id}-version-{version}"
+
+
+class ModelCache:
+    """
+    Two tier cache of serialised models: a per-process tier in front of a
+    redis tier shared by every process.
+
+    Updates are broadcast on INVALIDATION_CHANNEL once they are committed, and
+    each process listens for them on a thread of its own, so the local tier
+    can keep entries for as long as ttl. Until that thread is subscribed (or
+    if redis is not enabled) entries are only kept for UNSUBSCRIBED_TTL.
+
+    Only one thread per process loads a missing key, others asking for it at
+    the same time wait for that load rather than going to redis or the
+    database themselves.
+    """
+
+    def __init__(self, redis_client, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        self.redis_client = redis_client
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._loading = {}
+        self._listener_pid = None
+        self._stats_logged_at = time.monotonic()
+        self.subscribed = False
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        self.max_size = app.config["MODEL_CACHE_MAX_SIZE"]
+        self.ttl = app.config["MODEL_CACHE_TTL"]
+        if not event.contains(Session, "after_commit", self._after_commit):
+            event.listen(Session, "after_commit", self._after_commit)
+            event.listen(Session, "after_soft_rollback", self._after_soft_rollback)
+
+    def get(self, key, load):
+        """
+        Return the value cached under key, calling load() for it if it is in
+        neither tier. Values must be serialisable to json.
+        """
+        self._listen()
+        self._log_stats()
+        value = self._get_local(key)
+        if value is not None:
+            return value
+
+        with self._single_flight(key) as loading:
+            # whoever we waited for has probably loaded it already
+            value = self._get_local(key)
+            if value is not None:
+                return value
+            generation = loading[2]
+            value = self._get_redis(key)
+            if value is None:
+                value = load()
+                self.misses += 1
+                # invalidated while loading, what we loaded may be from before the change
+                if loading[2] == generation:
+                    self.redis_client.set(key, json.dumps(value), ex=REDIS_TTL)
+            else:
+                self.redis_hits += 1
+            if loading[2] == generation:
+                self._set_local(key, value)
+        return value
+
+    def invalidate(self, key):
+        """Drop key from both tiers here, and from the local tier of every other process."""
+        self.evict(key)
+        self.redis_client.delete(key)
+        self.redis_client.publish(INVALIDATION_CHANNEL, key)
+
+    def invalidate_on_commit(self, key):
+        """Invalidate key once the current transaction is committed."""
+        from app import db
+
+        db.session.info.setdefault("model_cache_invalidations", set()).add(key)
+
+    def evict(self, key):
+        with self._lock:
+            if key in self._loading:
+                self._loading[key][2] += 1
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            for loading in self._loading.values():
+                loading[2] += 1
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.local_hits + self.redis_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "subscribed": self.subscribed,
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "local_hit_rate": self.local_hits / lookups if lookups else 0,
+            "redis_hit_rate": (
+                self.redis_hits / (self.redis_hits + self.misses)
+                if self.redis_hits + self.misses
+                else 0
+            ),
+        }
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expiry = entry
+            if expiry < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.local_hits += 1
+            return value
+
+    def _set_local(self, key, value):
+        ttl = self.ttl if self.subscribed else UNSUBSCRIBED_TTL
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _get_redis(self, key):
+        cached = self.redis_client.get(key)
+        if cached:
+            return json.loads(cached.decode("utf-8"))
+        return None
+
+    @contextmanager
+    def _single_flight(self, key):
+        # a lock, how many threads want it, and how many times key was evicted meanwhile
+        with self._lock:
+            loading = self._loading.setdefault(key, [threading.Lock(), 0, 0])
+            loading[1] += 1
+        try:
+            with loading[0]:
+                yield loading
+        finally:
+            with self._lock:
+                loading[1] -= 1
+                if not loading[1]:
+                    del self._loading[key]
+
+    def _listen(self):
+        # checked against the pid as forked workers do not inherit the listening thread
+        if not self.redis_client.active or self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            self.subscribed = False
+            # nor the invalidations of whatever the parent had cached
+            self._entries.clear()
+        threading.Thread(
+            target=self._receive_invalidations,
+            args=(current_app.logger,),
+            name="model-cache-invalidations",
+            daemon=True,
+        ).start()
+
+    def _receive_invalidations(self, logger):
+        while True:
+            try:
+                pubsub = self.redis_client.pubsub()
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                for message in pubsub.listen():
+                    if message["type"] == "subscribe":
+                        # (re)connected, anything published before now was missed
+                        self.clear()
+                        self.subscribed = True
+                    elif message["type"] == "message":
+                        self.evict(message["data"].decode("utf-8"))
+            except Exception:
+                logger.exception(
+                    f"Lost subscription to {INVALIDATION_CHANNEL}, resubscribing"
+                )
+            self.subscribed = False
+            self.clear()
+            time.sleep(RESUBSCRIBE_DELAY)
+
+    def _log_stats(self):
+        if time.monotonic() - self._stats_logged_at < STATS_LOG_INTERVAL:
+            return
+        self._stats_logged_at = time.monotonic()
+        current_app.logger.info(f"model_cache stats: {self.stats()}")
+
+    def _after_commit(self, session):
+        # a savepoint being released, the transaction it is part of may still roll back
+        if session.in_nested_transaction():
+            return
+        for key in session.info.pop("model_cache_invalidations", ()):
+            self.invalidate(key)
+
+    def _after_soft_rollback(self, session, previous_transaction):
+        if previous_transaction.parent is None:
+            session.info.pop("model_cache_invalidations", None)
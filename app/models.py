@@ -1554,6 +1554,12 @@ class Notification(db.Model):
 
     # queue_name = db.Column(db.Text, nullable=True)
 
+    # Not a column: set by persist_notification when it leaves the notification
+    # on the redis message_queue, whose consumer sends it once it is saved.
+    awaiting_persistence = False
+    # Not a column: the queue its consumer sends it on, if not the usual one.
+    delivery_queue = None
+
     __table_args__ = (
         db.ForeignKeyConstraint(
             ["template_id", "template_version"],
@@ -1667,6 +1673,10 @@ class Notification(db.Model):
 
     @property
     def formatted_status(self):
+        return self.format_status(self.template.template_type, self.status)
+
+    @staticmethod
+    def format_status(template_type, status):
         return {
             NotificationType.EMAIL: {
                 NotificationStatus.FAILED: "Failed",
@@ -1689,7 +1699,7 @@ class Notification(db.Model):
                 NotificationStatus.CREATED: "Sending",
                 NotificationStatus.SENT: "Sent internationally",
             },
-        }[self.template.template_type].get(self.status, self.status)
+        }[template_type].get(status, status)
 
     def get_created_by_name(self):
         if self.created_by:
@@ -1719,7 +1729,7 @@ class Notification(db.Model):
                     value = None
                 elif column.name.endswith("_id") or column.name == "id":
                     value = getattr(obj, column.name)
-                    value = str(value)
+                    value = None if value is None else str(value)
                 else:
                     value = getattr(obj, column.name)
                 if column.name in ["message_id", "api_key_id"]:
@@ -1750,6 +1760,27 @@ class Notification(db.Model):
 
         return serialized
 
+    @classmethod
+    def serialize_row_for_csv(cls, row):
+        """
+        serialize_for_csv for a row of dao_get_notification_csv_rows, which
+        has the template, job and user columns already joined in.
+        """
+        return {
+            "row_number": "" if row.job_row_number is None else row.job_row_number + 1,
+            "recipient": row.to,
+            "client_reference": row.client_reference or "",
+            "template_name": row.template_name,
+            "template_type": row.template_type,
+            "job_name": row.job_name or "",
+            "carrier": row.carrier,
+            "provider_response": row.provider_response,
+            "status": cls.format_status(row.template_type, row.status),
+            "created_at": row.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "created_by_name": row.created_by_name,
+            "created_by_email_address": row.created_by_email_address,
+        }
+
     def serialize(self):
         template_dict = {
             "version": self.template.version,
@@ -6,6 +6,7 @@ from flask import current_app
 
 from app import redis_store
 from app.celery import provider_tasks
+from app.celery.message_queue import MESSAGE_QUEUE
 from app.config import QueueNames
 from app.dao.notifications_dao import (
     dao_create_notification,
@@ -19,7 +20,7 @@ from app.models import Notification
 from app.utils import hilite, utc_now
 from notifications_utils.recipients import (
     format_email_address,
-    get_international_phone_info,
+    parse_phone_number,
     validate_and_format_phone_number,
 )
 from notifications_utils.template import PlainTextEmailTemplate, SMSMessageTemplate
@@ -84,6 +85,7 @@ def persist_notification(
     billable_units=None,
     document_download_count=None,
     updated_at=None,
+    queue=None,
 ):
     notification_created_at = created_at or utc_now()
     if not notification_id:
@@ -115,16 +117,13 @@ def persist_notification(
     )
 
     if notification_type == NotificationType.SMS:
-        formatted_recipient = validate_and_format_phone_number(
-            recipient, international=True
-        )
+        recipient_info = parse_phone_number(recipient)
         current_app.logger.info(
             hilite(
                 f"Persisting notification with job_id: {job_id} row_number: {job_row_number}"
             )
         )
-        recipient_info = get_international_phone_info(formatted_recipient)
-        notification.normalised_to = formatted_recipient
+        notification.normalised_to = recipient_info.e164
         notification.international = recipient_info.international
         notification.phone_prefix = recipient_info.country_prefix
         notification.rate_multiplier = recipient_info.billable_units
@@ -149,10 +148,12 @@ def persist_notification(
                 dao_create_notification(notification)
 
             else:
-                redis_store.rpush(
-                    "message_queue",
-                    json.dumps(notification.serialize_for_redis(notification)),
-                )
+                fields = notification.serialize_for_redis(notification)
+                if queue:
+                    # the queue send_notification_to_queue would have used
+                    fields["queue"] = queue
+                redis_store.rpush(MESSAGE_QUEUE, json.dumps(fields))
+                notification.awaiting_persistence = True
         else:
             dao_create_notification(notification)
 
@@ -177,7 +178,7 @@ def send_notification_to_queue_detached(
         deliver_task = provider_tasks.deliver_email
 
     try:
-        deliver_task.apply_async([str(notification_id)], queue=queue, countdown=60)
+        deliver_task.apply_async([str(notification_id)], queue=queue)
     except Exception:
         dao_delete_notifications_by_id(notification_id)
         raise
@@ -188,6 +189,10 @@ def send_notification_to_queue_detached(
 
 
 def send_notification_to_queue(notification, queue=None):
+    if notification.awaiting_persistence:
+        # the message_queue consumer sends it once it is in the database, on
+        # the queue given to persist_notification
+        return
     send_notification_to_queue_detached(
         notification.key_type,
         notification.notification_type,
@@ -6,21 +6,18 @@ from sqlalchemy.orm.exc import NoResultFound
 
 from app import redis_store
 from app.dao.notifications_dao import dao_get_notification_count_for_service
-from app.dao.service_email_reply_to_dao import dao_get_reply_to_by_id
-from app.dao.service_sms_sender_dao import dao_get_service_sms_senders_by_id
 from app.enums import KeyType, NotificationType, ServicePermissionType, TemplateType
 from app.errors import BadRequestError, TotalRequestsError
 from app.models import ServicePermission
 from app.notifications.process_notifications import create_content_for_notification
-from app.serialised_models import SerialisedTemplate
+from app.serialised_models import SerialisedService, SerialisedTemplate
 from app.service.utils import service_allowed_to_send_to
 from app.utils import get_public_notify_type_text
 from notifications_utils import SMS_CHAR_COUNT_LIMIT
 from notifications_utils.clients.redis import total_limit_cache_key
 from notifications_utils.recipients import (
-    get_international_phone_info,
+    parse_phone_number,
     validate_and_format_email_address,
-    validate_and_format_phone_number,
 )
 
 
@@ -138,17 +135,13 @@ def validate_and_format_recipient(
     )
 
     if notification_type == NotificationType.SMS:
-        international_phone_info = check_if_service_can_send_to_number(service, send_to)
-
-        return validate_and_format_phone_number(
-            number=send_to, international=international_phone_info.international
-        )
+        return check_if_service_can_send_to_number(service, send_to).e164
     elif notification_type == NotificationType.EMAIL:
         return validate_and_format_email_address(email_address=send_to)
 
 
 def check_if_service_can_send_to_number(service, number):
-    international_phone_info = get_international_phone_info(number)
+    international_phone_info = parse_phone_number(number)
 
     if service.permissions and isinstance(service.permissions[0], ServicePermission):
         permissions = [p.permission for p in service.permissions]
@@ -221,7 +214,7 @@ def check_reply_to(service_id, reply_to_id, type_):
 def check_service_email_reply_to_id(service_id, reply_to_id, notification_type):
     if reply_to_id:
         try:
-            return dao_get_reply_to_by_id(service_id, reply_to_id).email_address
+            return SerialisedService.from_id(service_id).get_email_reply_to(reply_to_id)
         except NoResultFound:
             message = "email_reply_to_id {} does not exist in database for service id {}".format(
                 reply_to_id, service_id
@@ -232,9 +225,7 @@ def check_service_email_reply_to_id(service_id, reply_to_id, notification_type):
 def check_service_sms_sender_id(service_id, sms_sender_id, notification_type):
     if sms_sender_id:
         try:
-            return dao_get_service_sms_senders_by_id(
-                service_id, sms_sender_id
-            ).sms_sender
+            return SerialisedService.from_id(service_id).get_sms_sender(sms_sender_id)
         except NoResultFound:
             message = (
                 "sms_sender_id {} does not exist in database for service id {}".format(
@@ -270,6 +270,7 @@ def send_notifications_on_mou_signed(organization_id):
             api_key_id=None,
             key_type=KeyType.NORMAL,
             reply_to_text=notify_service.get_default_reply_to_email_address(),
+            queue=QueueNames.NOTIFY,
         )
         saved_notification.personalisation = personalisation
 
@@ -678,6 +678,7 @@ class NotificationsFilterSchema(Schema):
     status = fields.Nested(NotificationStatusFieldOnlySchema, many=True)
     page = fields.Int(required=False)
     page_size = fields.Int(required=False)
+    cursor = fields.String(required=False)
     limit_days = fields.Int(required=False)
     include_jobs = fields.Boolean(required=False)
     include_from_test_key = fields.Boolean(required=False)
@@ -4,12 +4,13 @@ from threading import RLock
 
 import cachetools
 from flask import current_app
+from sqlalchemy.orm.exc import NoResultFound
 from werkzeug.utils import cached_property
 
-from app import db, redis_store
+from app import db, model_cache
 from app.dao.api_key_dao import get_model_api_keys
 from app.dao.services_dao import dao_fetch_service_by_id
-from notifications_utils.clients.redis import RequestCache
+from app.model_cache import service_key, service_senders_key, template_key
 from notifications_utils.serialised_model import (
     SerialisedModel,
     SerialisedModelCollection,
@@ -17,7 +18,6 @@ from notifications_utils.serialised_model import (
 
 caches = defaultdict(partial(cachetools.TTLCache, maxsize=1024, ttl=2))
 locks = defaultdict(RLock)
-redis_cache = RequestCache(redis_store)
 
 
 def memory_cache(func):
@@ -49,12 +49,14 @@ class SerialisedTemplate(SerialisedModel):
     }
 
     @classmethod
-    @memory_cache
     def from_id_and_service_id(cls, template_id, service_id, version=None):
-        return cls(cls.get_dict(template_id, service_id, version)["data"])
+        template_dict = model_cache.get(
+            template_key(template_id, service_id, version),
+            lambda: cls.get_dict(template_id, service_id, version),
+        )
+        return cls(template_dict["data"])
 
     @staticmethod
-    @redis_cache.set("service-{service_id}-template-{template_id}-version-{version}")
     def get_dict(template_id, service_id, version):
         from app.dao import templates_dao
         from app.schemas import template_schema
@@ -88,12 +90,13 @@ class SerialisedService(SerialisedModel):
     }
 
     @classmethod
-    @memory_cache
     def from_id(cls, service_id):
-        return cls(cls.get_dict(service_id)["data"])
+        service_dict = model_cache.get(
+            service_key(service_id), lambda: cls.get_dict(service_id)
+        )
+        return cls(service_dict["data"])
 
     @staticmethod
-    @redis_cache.set("service-{service_id}")
     def get_dict(service_id):
         from app.schemas import service_schema
 
@@ -102,6 +105,57 @@ class SerialisedService(SerialisedModel):
 
         return {"data": service_dict}
 
+    @staticmethod
+    def get_senders_dict(service_id):
+        from app.dao.service_email_reply_to_dao import dao_get_reply_to_by_service_id
+        from app.dao.service_sms_sender_dao import dao_get_sms_senders_by_service_id
+
+        senders_dict = {
+            "sms_senders": {
+                str(sender.id): sender.sms_sender
+                for sender in dao_get_sms_senders_by_service_id(service_id)
+            },
+            "email_reply_to": {
+                str(reply_to.id): reply_to.email_address
+                for reply_to in dao_get_reply_to_by_service_id(service_id)
+            },
+        }
+        db.session.commit()
+
+        return senders_dict
+
+    @cached_property
+    def _senders(self):
+        return model_cache.get(
+            service_senders_key(self.id), lambda: self.get_senders_dict(self.id)
+        )
+
+    @cached_property
+    def sms_sender_numbers(self):
+        return frozenset(self._senders["sms_senders"].values())
+
+    @cached_property
+    def email_reply_to_addresses(self):
+        return frozenset(self._senders["email_reply_to"].values())
+
+    def get_sms_sender(self, sms_sender_id):
+        """The number of one of the service's sms senders, unless it has been archived."""
+        try:
+            return self._senders["sms_senders"][str(sms_sender_id)]
+        except KeyError:
+            raise NoResultFound(
+                f"No sms sender {sms_sender_id} for service {self.id}"
+            ) from None
+
+    def get_email_reply_to(self, reply_to_id):
+        """The address of one of the service's reply to addresses, unless it has been archived."""
+        try:
+            return self._senders["email_reply_to"][str(reply_to_id)]
+        except KeyError:
+            raise NoResultFound(
+                f"No reply to address {reply_to_id} for service {self.id}"
+            ) from None
+
     @cached_property
     def api_keys(self):
         return SerialisedAPIKeyCollection.from_service_id(self.id)
@@ -90,7 +90,7 @@ from app.dao.templates_dao import dao_get_template_by_id
 from app.dao.users_dao import get_user_by_id
 from app.enums import KeyType
 from app.errors import InvalidRequest, register_errors
-from app.models import EmailBranding, Permission, Service
+from app.models import EmailBranding, Notification, Permission, Service
 from app.notifications.process_notifications import (
     persist_notification,
     send_notification_to_queue,
@@ -539,10 +539,7 @@ def get_all_notifications_for_service(service_id):
         if "page_size" in data
         else current_app.config.get("PAGE_SIZE")
     )
-    # HARD CODE TO 100 for now.  1000 or 10000 causes reports to time out before they complete (if big)
-    # Tests are relying on the value in config (20), whereas the UI seems to pass 10000
-    if page_size > 100:
-        page_size = 100
+    page_size = min(page_size, current_app.config["NOTIFICATIONS_MAX_PAGE_SIZE"])
     limit_days = data.get("limit_days")
     include_jobs = data.get("include_jobs", True)
     include_from_test_key = data.get("include_from_test_key", False)
@@ -558,84 +555,77 @@ def get_all_notifications_for_service(service_id):
     )
     start_time = time.time()
     current_app.logger.debug(f"Start report generation  with page.size {page_size}")
-    pagination = notifications_dao.get_notifications_for_service(
-        service_id,
-        filter_dict=data,
-        page=page,
-        page_size=page_size,
-        count_pages=False,
-        limit_days=limit_days,
-        include_jobs=include_jobs,
-        include_from_test_key=include_from_test_key,
-        include_one_off=include_one_off,
-    )
+    try:
+        items, next_cursor = notifications_dao.get_page_of_notifications_for_service(
+            service_id,
+            filter_dict=data,
+            page=page,
+            page_size=page_size,
+            cursor=data.get("cursor"),
+            limit_days=limit_days,
+            include_jobs=include_jobs,
+            include_from_test_key=include_from_test_key,
+            include_one_off=include_one_off,
+        )
+    except ValueError:
+        raise InvalidRequest({"cursor": ["Invalid pagination cursor"]}, status_code=400)
     current_app.logger.debug(f"Query complete at {int(time.time()-start_time)*1000}")
 
-    for notification in pagination.items:
-        if notification.job_id is not None:
-            current_app.logger.debug(
-                f"Processing job_id {notification.job_id} at {int(time.time()-start_time)*1000}"
-            )
-            notification.personalisation = get_personalisation_from_s3(
-                notification.service_id,
-                notification.job_id,
-                notification.job_row_number,
-            )
-
-            recipient = get_phone_number_from_s3(
-                notification.service_id,
-                notification.job_id,
-                notification.job_row_number,
-            )
-
-            notification.to = recipient
-            notification.normalised_to = recipient
-
-        else:
-            notification.to = ""
-            notification.normalised_to = ""
-
     kwargs = request.args.to_dict()
     kwargs["service_id"] = service_id
 
     if data.get("format_for_csv"):
-        notifications = [
-            notification.serialize_for_csv() for notification in pagination.items
-        ]
+        notifications = []
+        for row in notifications_dao.dao_get_notification_csv_rows(
+            [notification.id for notification in items]
+        ):
+            serialized = Notification.serialize_row_for_csv(row)
+            if row.job_id is not None:
+                serialized["recipient"] = get_phone_number_from_s3(
+                    row.service_id, row.job_id, row.job_row_number
+                )
+            else:
+                serialized["recipient"] = ""
+            notifications.append(serialized)
     else:
-        notifications = notification_with_template_schema.dump(
-            pagination.items, many=True
-        )
-    current_app.logger.debug(f"number of notifications are {len(notifications)}")
+        for notification in items:
+            if notification.job_id is not None:
+                current_app.logger.debug(
+                    f"Processing job_id {notification.job_id} at {int(time.time()-start_time)*1000}"
+                )
+                notification.personalisation = get_personalisation_from_s3(
+                    notification.service_id,
+                    notification.job_id,
+                    notification.job_row_number,
+                )
 
-    # We try and get the next page of results to work out if we need provide a pagination link to the next page
-    # in our response if it exists. Note, this could be done instead by changing `count_pages` in the previous
-    # call to be True which will enable us to use Flask-Sqlalchemy to tell if there is a next page of results but
-    # this way is much more performant for services with many results (unlike Flask SqlAlchemy, this approach
-    # doesn't do an additional query to count all the results of which there could be millions but instead only
-    # asks for a single extra page of results).
-    next_page_of_pagination = notifications_dao.get_notifications_for_service(
-        service_id,
-        filter_dict=data,
-        page=page + 1,
-        page_size=page_size,
-        count_pages=False,
-        limit_days=limit_days,
-        include_jobs=include_jobs,
-        include_from_test_key=include_from_test_key,
-        include_one_off=include_one_off,
-        error_out=False,  # False so that if there are no results, it doesn't end in aborting with a 404
-    )
+                recipient = get_phone_number_from_s3(
+                    notification.service_id,
+                    notification.job_id,
+                    notification.job_row_number,
+                )
+
+                notification.to = recipient
+                notification.normalised_to = recipient
+
+            else:
+                notification.to = ""
+                notification.normalised_to = ""
+
+        notifications = notification_with_template_schema.dump(items, many=True)
+    current_app.logger.debug(f"number of notifications are {len(notifications)}")
 
     return (
         jsonify(
             notifications=notifications,
             page_size=page_size,
+            next_cursor=next_cursor,
             links=(
                 get_prev_next_pagination_links(
                     page,
-                    len(next_page_of_pagination.items),
+                    next_cursor is not None,
                     ".get_all_notifications_for_service",
+                    next_cursor=next_cursor,
                     **kwargs,
                 )
                 if count_pages
@@ -42,6 +42,7 @@ def send_notification_to_service_users(
             api_key_id=None,
             key_type=KeyType.NORMAL,
             reply_to_text=notify_service.get_default_reply_to_email_address(),
+            queue=QueueNames.NOTIFY,
         )
         redis_store.set(
             f"email-personalisation-{notification.id}",
@@ -145,6 +145,7 @@ def update_user_attribute(user_id):
             api_key_id=None,
             key_type=KeyType.NORMAL,
             reply_to_text=reply_to,
+            queue=QueueNames.NOTIFY,
         )
         saved_notification.personalisation = personalisation
 
@@ -383,6 +384,7 @@ def create_2fa_code(
         api_key_id=None,
         key_type=KeyType.NORMAL,
         reply_to_text=reply_to,
+        queue=QueueNames.NOTIFY,
     )
     saved_notification.personalisation = personalisation
     key = f"2facode-{saved_notification.id}".replace(" ", "")
@@ -1,5 +1,7 @@
+import json
 import os
 import re
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime, timedelta, timezone
 
 from flask import abort, current_app, url_for
@@ -15,26 +17,54 @@ DATE_FORMAT = "%Y-%m-%d"
 def pagination_links(pagination, endpoint, **kwargs):
     if "page" in kwargs:
         kwargs.pop("page", None)
+    kwargs.pop("cursor", None)
     links = {}
     if pagination.has_prev:
         links["prev"] = url_for(endpoint, page=pagination.prev_num, **kwargs)
     if pagination.has_next:
+        next_cursor = getattr(pagination, "next_cursor", None)
+        if next_cursor:
+            kwargs["cursor"] = next_cursor
         links["next"] = url_for(endpoint, page=pagination.next_num, **kwargs)
+        kwargs.pop("cursor", None)
         links["last"] = url_for(endpoint, page=pagination.pages, **kwargs)
     return links
 
 
-def get_prev_next_pagination_links(current_page, next_page_exists, endpoint, **kwargs):
+def get_prev_next_pagination_links(
+    current_page, next_page_exists, endpoint, next_cursor=None, **kwargs
+):
     if "page" in kwargs:
         kwargs.pop("page", None)
+    kwargs.pop("cursor", None)
     links = {}
     if current_page > 1:
         links["prev"] = url_for(endpoint, page=current_page - 1, **kwargs)
     if next_page_exists:
+        if next_cursor:
+            kwargs["cursor"] = next_cursor
         links["next"] = url_for(endpoint, page=current_page + 1, **kwargs)
     return links
 
 
+def encode_cursor(*values):
+    """
+    Opaque keyset pagination cursor, holding the sort key of the last item on
+    a page so the next page can start straight after it.
+    """
+    return urlsafe_b64encode(json.dumps(values, default=str).encode("utf-8")).decode(
+        "ascii"
+    )
+
+
+def decode_cursor(cursor):
+    """The values a cursor from encode_cursor was made from, raises ValueError for anything else."""
+    values = json.loads(urlsafe_b64decode(cursor.encode("ascii")))
+    if not isinstance(values, list):
+        raise ValueError(f"{cursor} is not a pagination cursor")
+    return values
+
+
 def url_with_token(data, url, config, base_url=None):
     from notifications_utils.url_safe_token import generate_token
 
@@ -155,7 +155,7 @@ def process_sms_or_email_notification(
                 f"Notification {notification_id} failed to save to high volume queue. Using normal flow instead"
             )
 
-    persist_notification(
+    notification = persist_notification(
         notification_id=notification_id,
         template_id=template.id,
         template_version=template.version,
@@ -171,7 +171,7 @@ def process_sms_or_email_notification(
         document_download_count=document_download_count,
     )
 
-    if not simulated:
+    if not simulated and not notification.awaiting_persistence:
         queue_name = None
         send_notification_to_queue_detached(
             key_type=api_user.key_type,
@@ -62,6 +62,20 @@ class RedisClient:
             return deleted
             """
         )
+        # move up to ARGV[1] values from the head of one list to the tail of another
+        self.scripts["move-list-values"] = self.redis_store.register_script(
+            """
+            local moved = {}
+            for i=1, tonumber(ARGV[1]) do
+                local value = redis.call('lmove', KEYS[1], KEYS[2], 'LEFT', 'RIGHT')
+                if not value then
+                    break
+                end
+                moved[i] = value
+            end
+            return moved
+            """
+        )
 
     def delete_by_pattern(self, pattern, raise_exception=False):
         r"""
@@ -165,13 +179,37 @@ class RedisClient:
 
         return None
 
-    def rpush(self, key, value):
+    def rpush(self, key, *values):
+        if self.active:
+            self.redis_store.rpush(key, *values)
+
+    def lpop(self, key, count=None):
+        """
+        Pop one value, or with count up to that many values as a list in a
+        single atomic LPOP. Returns None when the list is empty.
+        """
+        if self.active:
+            return self.redis_store.lpop(key, count)
+
+    def lrange(self, key, start, end):
+        if self.active:
+            return self.redis_store.lrange(key, start, end)
+
+    def blmove(self, source, destination, timeout):
+        """
+        Move the value at the head of source to the tail of destination,
+        waiting up to timeout seconds for one to arrive. Returns None on timeout.
+        """
         if self.active:
-            self.redis_store.rpush(key, value)
+            return self.redis_store.blmove(source, destination, timeout)
 
-    def lpop(self, key):
+    def lmove_many(self, source, destination, count):
+        """Atomically move up to count values from the head of source to the tail of destination."""
         if self.active:
-            return self.redis_store.lpop(key)
+            return self.scripts["move-list-values"](
+                keys=[source, destination], args=[count]
+            )
+        return []
 
     def llen(self, key):
         if self.active:
@@ -181,6 +219,34 @@ class RedisClient:
         if self.active:
             return self.redis_store.ltrim(key, start, end)
 
+    def zadd(self, key, mapping):
+        if self.active:
+            return self.redis_store.zadd(key, mapping)
+
+    def zrangebyscore(self, key, min, max):
+        if self.active:
+            return self.redis_store.zrangebyscore(key, min, max)
+        return []
+
+    def zremrangebyscore(self, key, min, max):
+        if self.active:
+            return self.redis_store.zremrangebyscore(key, min, max)
+
+    def expire(self, key, seconds):
+        if self.active:
+            return self.redis_store.expire(key, seconds)
+
+    def publish(self, channel, message, raise_exception=False):
+        message = prepare_value(message)
+        if self.active:
+            try:
+                return self.redis_store.publish(channel, message)
+            except Exception as e:
+                self.__handle_exception(e, raise_exception, "publish", channel)
+
+    def pubsub(self):
+        return self.redis_store.pubsub()
+
     def delete(self, *keys, raise_exception=False):
         keys = [prepare_value(k) for k in keys]
         if self.active:
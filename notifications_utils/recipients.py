@@ -13,6 +13,7 @@ from ordered_set import OrderedSet
 from phonenumbers.phonenumberutil import NumberParseException
 
 from notifications_utils.formatters import (
+    ALL_WHITESPACE,
     strip_all_whitespace,
     strip_and_remove_obscure_whitespace,
 )
@@ -29,6 +30,15 @@ from . import EMAIL_REGEX_PATTERN, hostname_part, tld_part
 
 us_prefix = "1"
 
+# How many distinct phone numbers to keep parsed, per process
+PHONE_NUMBER_CACHE_SIZE = 10_000
+
+# The ways people usually write a US number, all of which are validated as the
+# same E.164 number so a column only checks each number once
+US_PHONE_NUMBER_FORMAT = re.compile(
+    r"^(?:\+?1[ .-]?)?(?:\(([2-9]\d{2})\)|([2-9]\d{2}))[ .-]?(\d{3})[ .-]?(\d{4})$"
+)
+
 first_column_headings = {
     "email": ["email address"],
     "sms": ["phone number"],
@@ -41,6 +51,32 @@ first_column_headings = {
 address_columns = InsensitiveDict.from_keys(first_column_headings["letter"])
 
 
+def strip_all_whitespace_from_lines(lines, extra_characters=""):
+    """
+    Line by line equivalent of strip_all_whitespace for a whole file, which
+    only ever holds on to the blank lines it has not yet seen the end of.
+    """
+    characters = ALL_WHITESPACE + extra_characters
+    lines = iter(lines)
+    for line in lines:
+        line = line.lstrip(characters)
+        if line:
+            break
+    else:
+        return
+
+    blank_lines = []
+    for next_line in lines:
+        if next_line.strip(characters):
+            yield line
+            yield from blank_lines
+            blank_lines = []
+            line = next_line
+        else:
+            blank_lines.append(next_line)
+    yield line.rstrip(characters)
+
+
 class RecipientCSV:
     max_rows = 100_000
 
@@ -56,7 +92,19 @@ class RecipientCSV:
         allow_international_letters=False,
         should_validate=True,
     ):
-        self.file_data = strip_all_whitespace(file_data, extra_characters=",")
+        if file_data is None or isinstance(file_data, str):
+            self.file_data = strip_all_whitespace(file_data, extra_characters=",")
+            self._stream = None
+        else:
+            # An iterable of lines, e.g. an open file, which is read lazily
+            # and only once, so big files never have to be held in memory
+            self.file_data = None
+            self._stream = csv.reader(
+                strip_all_whitespace_from_lines(file_data, extra_characters=","),
+                quoting=csv.QUOTE_MINIMAL,
+                skipinitialspace=True,
+            )
+            self._stream_column_headers = None
         self.max_errors_shown = max_errors_shown
         self.max_initial_rows_shown = max_initial_rows_shown
         self.guestlist = guestlist
@@ -66,10 +114,13 @@ class RecipientCSV:
         self.remaining_messages = remaining_messages
         self.rows_as_list = None
         self.should_validate = should_validate
+        self._row_lists = None
+        self._error_row_indexes = None
+        self._error_rows = None
 
     def __len__(self):
         if not hasattr(self, "_len"):
-            self._len = len(self.rows)
+            self._len = len(self.row_lists)
         return self._len
 
     def __getitem__(self, requested_index):
@@ -101,6 +152,7 @@ class RecipientCSV:
         self.template_type = self._template.template_type
         self.recipient_column_headers = first_column_headings[self.template_type]
         self.placeholders = self._template.placeholders
+        self._recipient_errors = {}
 
     @property
     def placeholders(self):
@@ -131,7 +183,7 @@ class RecipientCSV:
             or self.more_rows_than_can_send
             or self.too_many_rows
             or (not self.allowed_to_send_to)
-            or any(self.rows_with_errors)
+            or bool(self.error_row_indexes)
         )  # `or` is 3x faster than using `any()` here
 
     @property
@@ -140,8 +192,15 @@ class RecipientCSV:
             return True
         if not self.guestlist:
             return True
+        column_headers = self._raw_column_headers
         return all(
-            allowed_to_send_to(row.recipient, self.guestlist) for row in self.rows
+            allowed_to_send_to(
+                Row.recipient_from_dict(
+                    self._row_dict(row, column_headers), self.recipient_column_headers
+                ),
+                self.guestlist,
+            )
+            for row in self.row_lists[: self.max_rows]
         )
 
     @property
@@ -152,58 +211,173 @@ class RecipientCSV:
 
     @property
     def _rows(self):
+        if self._stream is not None:
+            return self._stream
         return csv.reader(
             StringIO(self.file_data.strip()),
             quoting=csv.QUOTE_MINIMAL,
             skipinitialspace=True,
         )
 
-    def get_rows(self):
-        column_headers = self._raw_column_headers  # this is for caching
-        length_of_column_headers = len(column_headers)
-
+    @property
+    def row_lists(self):
+        """
+        Every row of the file after the header, as the list of values the csv
+        module gives. Read once, so a stream can still be iterated afterwards.
+        """
+        if self._row_lists is None:
+            self._raw_column_headers  # a stream's header row has to come off first
+            self._row_lists = list(self._data_rows())
+        return self._row_lists
+
+    def _data_rows(self):
+        if self._row_lists is not None:
+            return iter(self._row_lists)
         rows_as_lists_of_columns = self._rows
+        if self._stream is None:
+            # a stream's header row was consumed by _raw_column_headers
+            next(rows_as_lists_of_columns, None)  # skip the header row
+        return rows_as_lists_of_columns
+
+    def get_rows(self, start_index=0):
+        """
+        Yield the rows of the file, starting from row start_index. Rows before
+        it are parsed as csv but never turned into Row objects.
+
+        When the file was given as a stream, and row_lists has not been read,
+        this can only be done once.
+        """
+        column_headers = self._raw_column_headers  # this is for caching
 
-        next(rows_as_lists_of_columns, None)  # skip the header row
+        for index, row in enumerate(self._data_rows()):
+            if index < start_index:
+                continue
 
-        for index, row in enumerate(rows_as_lists_of_columns):
             if index >= self.max_rows:
                 yield None
                 continue
 
-            output_dict = {}
+            yield self._make_row(self._row_dict(row, column_headers), index)
 
-            for column_name, column_value in zip(column_headers, row):
-                column_value = strip_and_remove_obscure_whitespace(column_value)
+    def _row_dict(self, row, column_headers):
+        length_of_column_headers = len(column_headers)
 
-                if (
-                    InsensitiveDict.make_key(column_name)
-                    in self.recipient_column_headers_as_column_keys
-                ):
-                    output_dict[column_name] = column_value or None
-                else:
-                    insert_or_append_to_dict(
-                        output_dict, column_name, column_value or None
-                    )
+        output_dict = {}
+
+        for column_name, column_value in zip(column_headers, row):
+            column_value = strip_and_remove_obscure_whitespace(column_value)
+
+            if (
+                InsensitiveDict.make_key(column_name)
+                in self.recipient_column_headers_as_column_keys
+            ):
+                output_dict[column_name] = column_value or None
+            else:
+                insert_or_append_to_dict(output_dict, column_name, column_value or None)
+
+        length_of_row = len(row)
+
+        if length_of_column_headers < length_of_row:
+            output_dict[None] = row[length_of_column_headers:]
+        elif length_of_column_headers > length_of_row:
+            for key in column_headers[length_of_row:]:
+                insert_or_append_to_dict(output_dict, key, None)
+
+        return output_dict
+
+    def _make_row(self, row_dict, index):
+        return Row(
+            row_dict,
+            index=index,
+            error_fn=self._get_error_for_field,
+            recipient_column_headers=self.recipient_column_headers,
+            placeholders=self.placeholders_as_column_keys,
+            template=self.template,
+            allow_international_letters=self.allow_international_letters,
+            validate_row=self.should_validate,
+        )
+
+    @property
+    def error_row_indexes(self):
+        """
+        The indexes of the rows with an error, worked out without building a
+        Row for every row. Recipients are validated a column at a time first,
+        so each distinct recipient is only checked once.
+        """
+        if self._error_row_indexes is None:
+            self._error_row_indexes = (
+                self._find_error_row_indexes() if self.should_validate else []
+            )
+        return self._error_row_indexes
+
+    def _find_error_row_indexes(self):
+        column_headers = self._raw_column_headers
+        row_lists = self.row_lists[: self.max_rows]
+        self._validate_recipient_columns(row_lists, column_headers)
+
+        if self.template_type == "letter":
+            # postal addresses are checked across several cells of a row
+            return [
+                index
+                for index, row in enumerate(row_lists)
+                if self._make_row(self._row_dict(row, column_headers), index).has_error
+            ]
+
+        # the content of a template without placeholders is the same for every row
+        check_content = bool(self.template.placeholders)
+        if not check_content and self._content_has_error({}):
+            return list(range(len(row_lists)))
+
+        error_row_indexes = []
+        for index, row in enumerate(row_lists):
+            row_dict = self._row_dict(row, column_headers)
+            if any(
+                self._get_error_for_field(key, value) for key, value in row_dict.items()
+            ) or (check_content and self._content_has_error(row_dict)):
+                error_row_indexes.append(index)
+        return error_row_indexes
+
+    def _content_has_error(self, row_dict):
+        # the same checks Row makes of the template
+        self.template.values = row_dict
+        if self.template_type != "email" and self.template.is_message_too_long():
+            return True
+        return self.template.is_message_empty()
 
-            length_of_row = len(row)
-
-            if length_of_column_headers < length_of_row:
-                output_dict[None] = row[length_of_column_headers:]
-            elif length_of_column_headers > length_of_row:
-                for key in column_headers[length_of_row:]:
-                    insert_or_append_to_dict(output_dict, key, None)
-
-            yield Row(
-                output_dict,
-                index=index,
-                error_fn=self._get_error_for_field,
-                recipient_column_headers=self.recipient_column_headers,
-                placeholders=self.placeholders_as_column_keys,
-                template=self.template,
-                allow_international_letters=self.allow_international_letters,
-                validate_row=self.should_validate,
+    def _validate_recipient_columns(self, row_lists, column_headers):
+        recipient_columns = [
+            index
+            for index, column_header in enumerate(column_headers)
+            if InsensitiveDict.make_key(column_header)
+            in self.recipient_column_headers_as_column_keys
+        ]
+        if not recipient_columns or self.template_type == "letter":
+            return
+        recipients = {
+            strip_and_remove_obscure_whitespace(row[column])
+            for row in row_lists
+            for column in recipient_columns
+            if column < len(row)
+        }
+        recipients.discard("")
+        self._recipient_errors.update(
+            get_recipient_errors(
+                recipients.difference(self._recipient_errors),
+                self.template_type,
+                allow_international_sms=self.allow_international_sms,
             )
+        )
+
+    def _recipient_error(self, recipient):
+        if recipient not in self._recipient_errors:
+            self._recipient_errors.update(
+                get_recipient_errors(
+                    [recipient],
+                    self.template_type,
+                    allow_international_sms=self.allow_international_sms,
+                )
+            )
+        return self._recipient_errors[recipient]
 
     @property
     def more_rows_than_can_send(self):
@@ -219,12 +393,30 @@ class RecipientCSV:
 
     @property
     def displayed_rows(self):
-        if any(self.rows_with_errors) and not self.missing_column_headers:
+        if self.error_row_indexes and not self.missing_column_headers:
             return self.initial_rows_with_errors
         return self.initial_rows
 
     def _filter_rows(self, attr):
-        return (row for row in self.rows if row and getattr(row, attr))
+        # every row that matches one of these filters has an error
+        return (row for row in self._rows_with_errors if getattr(row, attr))
+
+    @property
+    def _rows_with_errors(self):
+        if self._error_rows is None:
+            if self.rows_as_list is not None:
+                self._error_rows = [
+                    self.rows_as_list[index] for index in self.error_row_indexes
+                ]
+            else:
+                column_headers = self._raw_column_headers
+                self._error_rows = [
+                    self._make_row(
+                        self._row_dict(self.row_lists[index], column_headers), index
+                    )
+                    for index in self.error_row_indexes
+                ]
+        return self._error_rows
 
     @property
     def rows_with_errors(self):
@@ -252,6 +444,10 @@ class RecipientCSV:
 
     @property
     def _raw_column_headers(self):
+        if self._stream is not None:
+            if self._stream_column_headers is None:
+                self._stream_column_headers = next(self._stream, [])
+            return self._stream_column_headers
         for row in self._rows:
             return row
         return []
@@ -345,16 +541,9 @@ class RecipientCSV:
                 else:
                     return Cell.missing_field_error
 
-            try:
-                if self.template_type == "email":
-                    validate_email_address(value)
-                if self.template_type == "sms":
-                    validate_phone_number(
-                        value, international=self.allow_international_sms
-                    )
-            except (InvalidEmailError, InvalidPhoneError) as error:
-                current_app.logger.exception(f"Email or phone error for {value}")
-                return str(error)
+            error = self._recipient_error(value)
+            if error:
+                return error
 
         if InsensitiveDict.make_key(key) not in self.placeholders_as_column_keys:
             return
@@ -448,6 +637,13 @@ class Row(InsensitiveDict):
         columns = [self.get(column).data for column in self.recipient_column_headers]
         return columns[0] if len(columns) == 1 else columns
 
+    @staticmethod
+    def recipient_from_dict(row_dict, recipient_column_headers):
+        """What recipient would be for a Row of row_dict, without building one."""
+        row_dict = InsensitiveDict(row_dict)
+        columns = [row_dict.get(column) for column in recipient_column_headers]
+        return columns[0] if len(columns) == 1 else columns
+
     @property
     def as_postal_address(self):
         from notifications_utils.postal_address import PostalAddress
@@ -505,9 +701,24 @@ class InvalidAddressError(InvalidEmailError):
     pass
 
 
+@lru_cache(maxsize=PHONE_NUMBER_CACHE_SIZE)
+def _cached_parse(number, region):
+    return phonenumbers.parse(number, region)
+
+
+def _parse(number, region):
+    """
+    phonenumbers.parse, remembered for strings since validating one number
+    parses it several times over. Callers must not modify what it returns.
+    """
+    if isinstance(number, str):
+        return _cached_parse(number, region)
+    return phonenumbers.parse(number, region)
+
+
 def normalize_phone_number(phonenumber):
     if isinstance(phonenumber, str):
-        phonenumber = phonenumbers.parse(phonenumber, "US")
+        phonenumber = _parse(phonenumber, "US")
     return phonenumbers.format_number(phonenumber, phonenumbers.PhoneNumberFormat.E164)
 
 
@@ -528,17 +739,51 @@ international_phone_info = namedtuple(
 )
 
 
-def get_international_phone_info(number):
-    number = validate_phone_number(number, international=True)
-    prefix = _get_country_code(number)
+ParsedPhoneNumber = namedtuple(
+    "ParsedPhoneNumber",
+    [
+        "e164",
+        "international",
+        "country_prefix",
+        "billable_units",
+    ],
+)
 
-    return international_phone_info(
+
+@lru_cache(maxsize=PHONE_NUMBER_CACHE_SIZE)
+def _cached_parse_phone_number(number):
+    e164 = _validate_phone_number(number, international=True)
+    prefix = _get_country_code(e164)
+    return ParsedPhoneNumber(
+        e164=e164,
         international=(prefix != us_prefix),
         country_prefix=prefix,
         billable_units=get_billable_units_for_prefix(prefix),
     )
 
 
+def parse_phone_number(number):
+    """
+    Validate a phone number, allowing international ones, and work out
+    everything sending to it needs to know. The result is remembered for the
+    raw string, so the checks, persisting and sending a message do one parse
+    between them. Raises InvalidPhoneError.
+    """
+    if isinstance(number, str):
+        return _cached_parse_phone_number(number)
+    return _cached_parse_phone_number.__wrapped__(number)
+
+
+def get_international_phone_info(number):
+    parsed = parse_phone_number(number)
+
+    return international_phone_info(
+        international=parsed.international,
+        country_prefix=parsed.country_prefix,
+        billable_units=parsed.billable_units,
+    )
+
+
 # NANP_COUNTRY_AREA_CODES are the list of area codes in the North American Numbering Plan
 # that have their own entry in international_billing_rates.yml.
 # Source: https://en.wikipedia.org/wiki/List_of_North_American_Numbering_Plan_area_codes
@@ -565,7 +810,7 @@ _NANP_COUNTRY_AREA_CODES = [
 
 
 def _get_country_code(number):
-    parsed = phonenumbers.parse(number, "US")
+    parsed = _parse(number, "US")
     country_code = str(parsed.country_code)
     if country_code == us_prefix:
         area_code = str(parsed.national_number)[:3]
@@ -590,7 +835,7 @@ def use_numeric_sender(number):
 
 def validate_us_phone_number(number):
     try:
-        parsed = phonenumbers.parse(number, "US")
+        parsed = _parse(number, "US")
         if not is_us_phone_number(number):
             raise InvalidPhoneError("Not a US number")
         if phonenumbers.is_valid_number(parsed):
@@ -627,11 +872,17 @@ def show_mangled_number_clues(number):
 
 
 def validate_phone_number(number, international=False):
+    if international:
+        return parse_phone_number(number).e164
+    return _validate_phone_number(number, international)
+
+
+def _validate_phone_number(number, international):
     if (not international) or is_us_phone_number(number):
         return validate_us_phone_number(number)
 
     try:
-        parsed = phonenumbers.parse(number, None)
+        parsed = _parse(number, None)
         number = f"{parsed.country_code}{parsed.national_number}"
         if len(number) < 8:
             raise InvalidPhoneError("Not enough digits")
@@ -720,6 +971,89 @@ def validate_and_format_email_address(email_address):
     return format_email_address(validate_email_address(email_address))
 
 
+@lru_cache(maxsize=1)
+def _compile_us_national_number_pattern():
+    """
+    Everything phonenumbers checks before calling a 10 digit national number
+    valid for the US, from its own metadata, as one precompiled pattern.
+    """
+    metadata = phonenumbers.PhoneMetadata.metadata_for_region("US")
+    number_descs = [
+        metadata.premium_rate,
+        metadata.toll_free,
+        metadata.shared_cost,
+        metadata.voip,
+        metadata.personal_number,
+        metadata.pager,
+        metadata.uan,
+        metadata.voicemail,
+        metadata.fixed_line,
+        metadata.mobile,
+    ]
+    patterns = [
+        f"(?:{number_desc.national_number_pattern})"
+        for number_desc in number_descs
+        if number_desc is not None
+        and number_desc.national_number_pattern
+        and (not number_desc.possible_length or 10 in number_desc.possible_length)
+    ]
+    return re.compile(
+        f"(?=(?:{metadata.general_desc.national_number_pattern})$)"
+        f"(?:{'|'.join(patterns)})$"
+    )
+
+
+def _is_valid_us_number(e164):
+    """
+    Whether a +1 number of 10 digits passes validate_phone_number as a US
+    number. False only means it needs checking the slow way.
+    """
+    national_number = e164[2:]
+    return national_number[:3] not in _NANP_COUNTRY_AREA_CODES and bool(
+        _compile_us_national_number_pattern().match(national_number)
+    )
+
+
+def _us_e164(recipient):
+    """The E.164 form of a US number written one of the usual ways, or None."""
+    match = US_PHONE_NUMBER_FORMAT.match(recipient)
+    if not match:
+        return None
+    area_code = match.group(1) or match.group(2)
+    return f"+1{area_code}{match.group(3)}{match.group(4)}"
+
+
+def _get_recipient_error(recipient, template_type, allow_international_sms):
+    try:
+        if template_type == "email":
+            validate_email_address(recipient)
+        if template_type == "sms":
+            validate_phone_number(recipient, international=allow_international_sms)
+    except (InvalidEmailError, InvalidPhoneError) as error:
+        current_app.logger.exception(f"Email or phone error for {recipient}")
+        return str(error)
+    return None
+
+
+def get_recipient_errors(recipients, template_type, allow_international_sms=False):
+    """
+    Validate a column of email addresses or phone numbers, returning a dict of
+    each distinct recipient to its error, or None if it is valid. A valid US
+    number is recognised without the full validation, however it is written,
+    anything else is validated as it was written.
+    """
+    errors = {}
+    for recipient in set(recipients):
+        us_number = _us_e164(recipient) if template_type == "sms" else None
+        if us_number and _is_valid_us_number(us_number):
+            errors[recipient] = None
+        else:
+            errors[recipient] = _get_recipient_error(
+                recipient, template_type, allow_international_sms
+            )
+    return errors
+
+
 @lru_cache(maxsize=32, typed=False)
 def format_recipient(recipient):
     if not isinstance(recipient, str):
@@ -1,9 +1,34 @@
 import ast
 import unicodedata
+from functools import lru_cache
 
 from regex import regex
 
 
+class TranslationTable(dict):
+    """
+    What a SanitiseText class encodes each character to, keyed by ordinal so it
+    can be given to str.translate. encode_char always gives the same result for
+    a character, so each one is worked out the first time it is seen.
+    """
+
+    def __init__(self, sanitiser):
+        super().__init__((ord(c), c) for c in sanitiser.ALLOWED_CHARACTERS)
+        self.sanitiser = sanitiser
+        self.allowed_ascii_characters = frozenset(
+            c for c in sanitiser.ALLOWED_CHARACTERS if c.isascii()
+        )
+
+    def __missing__(self, ordinal):
+        self[ordinal] = encoded = self.sanitiser.encode_char(chr(ordinal))
+        return encoded
+
+
+@lru_cache(maxsize=None)
+def get_translation_table(sanitiser):
+    return TranslationTable(sanitiser)
+
+
 class SanitiseText:
     ALLOWED_CHARACTERS = set()
 
@@ -27,7 +52,10 @@ class SanitiseText:
 
     @classmethod
     def encode(cls, content):
-        return "".join(cls.encode_char(char) for char in content)
+        table = get_translation_table(cls)
+        if content.isascii() and table.allowed_ascii_characters.issuperset(content):
+            return content
+        return content.translate(table)
 
     @classmethod
     def get_non_compatible_characters(cls, content):
@@ -36,12 +64,11 @@ class SanitiseText:
 
         This follows the same rules as `cls.encode`, but returns just the characters that encode would replace with `?`
         """
+        table = get_translation_table(cls)
         return set(
             c
-            for c in content
-            if c not in cls.ALLOWED_CHARACTERS
-            and cls.is_extended_language(c) is False
-            and cls.downgrade_character(c) is None
+            for c in set(content)
+            if c not in cls.ALLOWED_CHARACTERS and table[ord(c)] == "?"
         )
 
     @staticmethod
@@ -1,6 +1,7 @@
 import math
 import re
 from abc import ABC, abstractmethod
+from collections import namedtuple
 from functools import lru_cache
 from html import unescape
 from os import path
@@ -9,7 +10,7 @@ from jinja2 import Environment, FileSystemLoader, select_autoescape
 from markupsafe import Markup
 
 from notifications_utils import MAGIC_SEQUENCE, SMS_CHAR_COUNT_LIMIT
-from notifications_utils.field import Field, PlainTextField
+from notifications_utils.field import Field, Placeholder, PlainTextField
 from notifications_utils.formatters import (
     add_prefix,
     add_trailing_newline,
@@ -38,6 +39,21 @@ from notifications_utils.sanitise_text import SanitiseSMS
 from notifications_utils.take import Take
 from notifications_utils.template_change import TemplateChange
 
+# How many compiled renderings to keep, each one is a template split into pieces
+COMPILED_TEMPLATE_CACHE_SIZE = 1024
+
+# The characters a message can be made of to be sent as GSM-7, including all
+# the characters str.isspace() is true for. Anything else means it is sent as
+# UCS-2.
+SMS_GSM_CHARACTERS = frozenset(
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+    "_@?£!$\"¥#è¤é%ù&ì\\ò(Ç)*:Ø+;ÄäøÆ,<ÖöæÑñÅß.>ÜüåÉ/§à¡¿'-="
+    " \t\n\v\f\r\x1c\x1d\x1e\x1f\x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004"
+    "\u2005\u2006\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000"
+)
+
+SMSFragments = namedtuple("SMSFragments", ["encoding", "length", "count"])
+
 template_env = Environment(
     autoescape=select_autoescape(),
     loader=FileSystemLoader(
@@ -118,6 +134,24 @@ class Template(ABC):
     def placeholders(self):
         return get_placeholders(self.content)
 
+    def _compiled(self, render):
+        """
+        Return render(self), from the compiled form of this template if its
+        values allow it. See CompiledTemplate.
+        """
+        compiled = compile_template(
+            type(self),
+            render,
+            self.content,
+            getattr(self, "_subject", None),
+            getattr(self, "prefix", None),
+        )
+        if compiled is not None:
+            values = CompiledTemplate.values_for(self)
+            if values is not None:
+                return compiled.render(values)
+        return render(self)
+
     @property
     def missing_data(self):
         return list(
@@ -170,7 +204,9 @@ class BaseSMSTemplate(Template):
         self.prefix = prefix
         self.show_prefix = show_prefix
         self.sender = sender
-        self._content_count = None
+        self._unsanitised_content = None
+        self._encoded_content = None
+        self._fragments = None
         super().__init__(template, values)
 
     @property
@@ -181,9 +217,10 @@ class BaseSMSTemplate(Template):
     def values(self, value):
         # If we change the values of the template it’s possible the
         # content count will have changed, so we need to reset the
-        # cached count.
-        if self._content_count is not None:
-            self._content_count = None
+        # cached content and counts.
+        self._unsanitised_content = None
+        self._encoded_content = None
+        self._fragments = None
 
         # Assigning to super().values doesn’t work here. We need to get
         # the property object instead, which has the special method
@@ -193,14 +230,16 @@ class BaseSMSTemplate(Template):
 
     @property
     def content_with_placeholders_filled_in(self):
-        # We always call SMSMessageTemplate.__str__ regardless of
-        # subclass, to avoid any HTML formatting. SMS templates differ
+        # We always render as SMSMessageTemplate.__str__ does regardless
+        # of subclass, to avoid any HTML formatting. SMS templates differ
         # in that the content can include the service name as a prefix.
         # So historically we’ve returned the fully-formatted message,
         # rather than some plain-text represenation of the content. To
         # preserve compatibility for consumers of the API we maintain
         # that behaviour by overriding this method here.
-        return SMSMessageTemplate.__str__(self)
+        if self._encoded_content is None:
+            self._encoded_content = self._compiled(SMSMessageTemplate._render)
+        return self._encoded_content
 
     @property
     def prefix(self):
@@ -219,9 +258,7 @@ class BaseSMSTemplate(Template):
         Also note that if values aren't provided, will calculate the raw length of the unsubstituted placeholders,
         as in the message `foo ((placeholder))` has a length of 19.
         """
-        if self._content_count is None:
-            self._content_count = len(self._get_unsanitised_content())
-        return self._content_count
+        return len(self._get_unsanitised_content())
 
     @property
     def content_count_without_prefix(self):
@@ -233,47 +270,20 @@ class BaseSMSTemplate(Template):
             return self.content_count
 
     @property
-    def fragment_count(self):
+    def fragments(self):
         """
-        A fragment is up to 140 bytes, which could consist of 160 GSM chars, 140 ascii chars, or 70 ucs-2 chars,
-        or any combination thereof.
-
-        Since we are supporting more or less "all" languages, it doesn't seem like we really want to count chars,
-        and that counting bytes should suffice.
+        The encoding, length and number of fragments of the message as it will
+        be sent, see get_sms_fragments.
         """
-
-        # check if all chars are in the GSM-7 character set
-        def gsm_check(x):
-            rule = re.compile(
-                r'^[\sa-zA-Z0-9_@?£!1$"¥#è?¤é%ù&ì\\ò(Ç)*:Ø+;ÄäøÆ,<LÖlöæ\-=ÑñÅß.>ÜüåÉ/§à¡¿\']+$'
+        if self._fragments is None:
+            self._fragments = get_sms_fragments(
+                self.content_with_placeholders_filled_in
             )
-            gsm_match = rule.search(x)
-            if gsm_match is None:
-                return False
-            return True
-
-        message_str = self.content_with_placeholders_filled_in
+        return self._fragments
 
-        content_len = len(message_str)
-
-        """
-        Checks for GSM-7 char set, calculates msg size, and
-        then fragments based on multipart message rules. ASCII
-        was not specifically called out as almost all messages will
-        switch from 7bit GSM to Unicode.
-
-        Calculations are based on https://messente.com/documentation/tools/sms-length-calculator
-        """
-        if gsm_check(message_str):
-            if content_len <= 160:
-                return math.ceil(content_len / 160)
-            else:
-                return math.ceil(content_len / 153)
-        else:
-            if content_len <= 70:
-                return math.ceil(content_len / 70)
-            else:
-                return math.ceil(content_len / 67)
+    @property
+    def fragment_count(self):
+        return self.fragments.count
 
     def is_message_too_long(self):
         """
@@ -290,6 +300,13 @@ class BaseSMSTemplate(Template):
     def _get_unsanitised_content(self):
         # This is faster to call than SMSMessageTemplate.__str__ if all
         # you need to know is how many characters are in the message
+        if self._unsanitised_content is None:
+            self._unsanitised_content = self._compiled(
+                BaseSMSTemplate._render_unsanitised_content
+            )
+        return self._unsanitised_content
+
+    def _render_unsanitised_content(self):
         if self.values:
             values = self.values
         else:
@@ -307,6 +324,9 @@ class BaseSMSTemplate(Template):
 
 class SMSMessageTemplate(BaseSMSTemplate):
     def __str__(self):
+        return self.content_with_placeholders_filled_in
+
+    def _render(self):
         return sms_encode(self._get_unsanitised_content())
 
 
@@ -474,7 +494,10 @@ class SubjectMixin:
 
     @property
     def subject(self):
-        return Markup(
+        return Markup(self._compiled(SubjectMixin._render_subject))
+
+    def _render_subject(self):
+        return (
             Take(
                 Field(
                     self._subject,
@@ -497,6 +520,9 @@ class BaseEmailTemplate(SubjectMixin, Template):
 
     @property
     def html_body(self):
+        return Take(self._compiled(BaseEmailTemplate._render_html_body))
+
+    def _render_html_body(self):
         return (
             Take(
                 Field(
@@ -554,6 +580,9 @@ class BaseEmailTemplate(SubjectMixin, Template):
 
 class PlainTextEmailTemplate(BaseEmailTemplate):
     def __str__(self):
+        return self._compiled(PlainTextEmailTemplate._render)
+
+    def _render(self):
         return (
             Take(
                 Field(
@@ -572,7 +601,10 @@ class PlainTextEmailTemplate(BaseEmailTemplate):
 
     @property
     def subject(self):
-        return Markup(
+        return Markup(self._compiled(PlainTextEmailTemplate._render_subject))
+
+    def _render_subject(self):
+        return (
             Take(
                 Field(
                     self._subject,
@@ -614,7 +646,14 @@ class HTMLEmailTemplate(BaseEmailTemplate):
 
     @property
     def preheader(self):
-        return " ".join(
+        preheader = self._compiled(HTMLEmailTemplate._render_preheader)
+        # cut to length once the values are in, which is why it isn’t compiled
+        return " ".join(preheader.split())[
+            : self.PREHEADER_LENGTH_IN_CHARACTERS
+        ].strip()
+
+    def _render_preheader(self):
+        return (
             Take(
                 Field(
                     self.content,
@@ -628,22 +667,30 @@ class HTMLEmailTemplate(BaseEmailTemplate):
             .then(add_trailing_newline)
             .then(notify_email_preheader_markdown)
             .then(do_nice_typography)
-            .split()
-        )[: self.PREHEADER_LENGTH_IN_CHARACTERS].strip()
+        )
+
+    @property
+    def branding(self):
+        return (
+            ("govuk_banner", self.govuk_banner),
+            ("complete_html", self.complete_html),
+            ("brand_logo", self.brand_logo),
+            ("brand_text", self.brand_text),
+            ("brand_colour", self.brand_colour),
+            ("brand_banner", self.brand_banner),
+            ("brand_name", self.brand_name),
+        )
 
     def __str__(self):
+        shell = compile_email_shell(self.jinja_template, self.branding)
+        if shell is not None:
+            return shell.render(self.subject, self.html_body, self.preheader)
         return self.jinja_template.render(
             {
                 "subject": self.subject,
                 "body": self.html_body,
                 "preheader": self.preheader,
-                "govuk_banner": self.govuk_banner,
-                "complete_html": self.complete_html,
-                "brand_logo": self.brand_logo,
-                "brand_text": self.brand_text,
-                "brand_colour": self.brand_colour,
-                "brand_banner": self.brand_banner,
-                "brand_name": self.brand_name,
+                **dict(self.branding),
             }
         )
 
@@ -711,6 +758,23 @@ def get_sms_fragment_count(character_count, non_gsm_characters):
         return 1 if character_count <= 160 else math.ceil(float(character_count) / 153)
 
 
+def get_sms_fragments(message):
+    """
+    A fragment is up to 140 bytes, which could consist of 160 GSM chars, 140 ascii chars, or 70 ucs-2 chars,
+    or any combination thereof.
+
+    A message made only of SMS_GSM_CHARACTERS is sent as GSM-7, anything else
+    as UCS-2. The fragments are then counted based on multipart message rules,
+    see https://messente.com/documentation/tools/sms-length-calculator
+    """
+    length = len(message)
+    if message and SMS_GSM_CHARACTERS.issuperset(message):
+        per_fragment = 160 if length <= 160 else 153
+        return SMSFragments("GSM-7", length, math.ceil(length / per_fragment))
+    per_fragment = 70 if length <= 70 else 67
+    return SMSFragments("UCS-2", length, math.ceil(length / per_fragment))
+
+
 def non_gsm_characters(content):
     """
     Returns a set of all the non gsm characters in a text. this doesn't include characters that we will downgrade (eg
@@ -737,3 +801,150 @@ def do_nice_typography(value):
 @lru_cache(maxsize=1024)
 def get_placeholders(content):
     return Field(content).placeholders
+
+
+class CompiledTemplate:
+    """
+    Part of a template rendered once with a marker standing in for each
+    placeholder, split into the static fragments between the markers.
+
+    The formatting treats a value made of letters, digits and single spaces
+    exactly like a marker, as long as every placeholder is set apart from the
+    text around it. So for a row whose values are all like that, rendering is
+    just putting the values where the markers were. Any other row is rendered
+    in full as before.
+    """
+
+    marker_prefix = "XNOTIFYPLACEHOLDER"
+    marker = marker_prefix + "{}X"
+    marker_pattern = re.compile(marker_prefix + r"(\d+)X")
+    safe_value = re.compile(r"[A-Za-z0-9]+(?: [A-Za-z0-9]+)*")
+
+    def __init__(self, fragments, slots):
+        self.fragments = fragments
+        self.slots = slots
+
+    @classmethod
+    def from_rendered(cls, rendered, placeholders):
+        parts = cls.marker_pattern.split(rendered)
+        slots = [placeholders[int(index)] for index in parts[1::2]]
+        if rendered.lower().count(cls.marker_prefix.lower()) != len(slots):
+            # the formatting changed a marker, so it can’t be relied on
+            return None
+        return cls(parts[0::2], slots)
+
+    @classmethod
+    def can_compile(cls, text):
+        if cls.marker_prefix.lower() in text.lower():
+            return False
+        for match in Field.placeholder_pattern.finditer(text):
+            if Placeholder.from_match(match).is_conditional():
+                return False
+            start, end = match.span()
+            if start and not text[start - 1].isspace():
+                return False
+            after = text[end : end + 2]
+            # a number followed by a full stop at the start of a line is a list
+            starts_line = not text[:start].rpartition("\n")[2].strip()
+            if after[:1] and after[0] in ",!?;:" + ("" if starts_line else "."):
+                after = after[1:]
+            if after[:1] and not after[0].isspace():
+                return False
+        return True
+
+    @classmethod
+    def values_for(cls, template):
+        """The values of a template, if they can all be put in a compiled rendering."""
+        values = {}
+        for placeholder in template.placeholders:
+            value = template.values.get(placeholder)
+            if value is None or isinstance(value, list):
+                return None
+            value = str(value)
+            if not cls.safe_value.fullmatch(value):
+                return None
+            values[placeholder] = value
+        return values
+
+    def render(self, values):
+        output = [self.fragments[0]]
+        for placeholder, fragment in zip(self.slots, self.fragments[1:]):
+            output.append(values[placeholder])
+            output.append(fragment)
+        return "".join(output)
+
+
+@lru_cache(maxsize=COMPILED_TEMPLATE_CACHE_SIZE)
+def compile_template(template_class, render, content, subject=None, prefix=None):
+    """
+    Compile what render makes of a template with this content, subject and
+    prefix, or return None if it can’t be compiled.
+    """
+    if not all(
+        CompiledTemplate.can_compile(text)
+        for text in (content, subject)
+        if text is not None
+    ):
+        return None
+    template = {"template_type": template_class.template_type, "content": content}
+    if subject is not None:
+        template["subject"] = subject
+    placeholders = list(get_placeholders(content))
+    if subject is not None:
+        placeholders += get_placeholders(subject)
+    markers = {
+        placeholder: CompiledTemplate.marker.format(index)
+        for index, placeholder in enumerate(placeholders)
+    }
+    if prefix is None:
+        instance = template_class(template, values=markers)
+    else:
+        instance = template_class(template, values=markers, prefix=prefix)
+    return CompiledTemplate.from_rendered(str(render(instance)), placeholders)
+
+
+class EmailShell:
+    """
+    Everything an email template renders around the message for one
+    branding, split into the static fragments between where the subject,
+    preheader and body go.
+    """
+
+    marker_prefix = "XNOTIFYEMAILSHELL"
+    marker = marker_prefix + "{}X"
+    marker_pattern = re.compile(marker_prefix + r"(subject|body|preheader)X")
+
+    def __init__(self, fragments, slots):
+        self.fragments = fragments
+        self.slots = slots
+
+    def render(self, subject, body, preheader):
+        values = {"subject": subject, "body": body, "preheader": preheader}
+        output = [self.fragments[0]]
+        for slot, fragment in zip(self.slots, self.fragments[1:]):
+            output.append(values[slot])
+            output.append(fragment)
+        return "".join(output)
+
+
+@lru_cache(maxsize=COMPILED_TEMPLATE_CACHE_SIZE)
+def compile_email_shell(jinja_template, branding):
+    """
+    Render jinja_template with this branding (as pairs of name and value)
+    once, or return None if the branding could be mistaken for a marker.
+    """
+    if any(
+        EmailShell.marker_prefix.lower() in value.lower()
+        for _, value in branding
+        if isinstance(value, str)
+    ):
+        return None
+    rendered = jinja_template.render(
+        {
+            slot: Markup(EmailShell.marker.format(slot))
+            for slot in ("subject", "body", "preheader")
+        }
+        | dict(branding)
+    )
+    parts = EmailShell.marker_pattern.split(rendered)
+    return EmailShell(parts[0::2], parts[1::2])
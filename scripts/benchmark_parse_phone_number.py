@@ -0,0 +1,83 @@
+"""
+Time validating and parsing phone numbers, the way the sms send path does.
+
+Run from the project directory with:
+
+    poetry run python scripts/benchmark_parse_phone_number.py
+
+Prints microseconds per number for US and international numbers. Fresh
+numbers are ones not parsed before. Repeated numbers are answered from the
+caches. The send path checks the number, formats it, works out its
+international info and formats it again for the provider, all from one parse.
+"""
+
+import sys
+import timeit
+from functools import partial
+from itertools import cycle
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from notifications_utils import recipients  # noqa: E402
+from notifications_utils.recipients import (  # noqa: E402
+    get_international_phone_info,
+    parse_phone_number,
+    validate_and_format_phone_number,
+)
+
+REPEAT = 5
+NUMBER = 2_000
+
+NUMBERS = {
+    "US": "+1 (202) 867-{:04}".format,
+    "international": "+44 7700 9{:05}".format,
+}
+
+
+def best_microseconds(statement, setup=lambda: None):
+    return (
+        min(timeit.repeat(statement, setup, repeat=REPEAT, number=NUMBER))
+        / NUMBER
+        * 1e6
+    )
+
+
+def clear_caches():
+    recipients._cached_parse_phone_number.cache_clear()
+    recipients._cached_parse.cache_clear()
+
+
+def fresh(numbers, step):
+    """Call step with a number nothing has been parsed for yet."""
+    return lambda: step(next(numbers))
+
+
+def send_path(number):
+    validate_and_format_phone_number(number, international=True)
+    get_international_phone_info(number)
+    return parse_phone_number(number).e164
+
+
+def run():
+    print(f"{'number':<15}{'fresh':>12}{'repeated':>12}{'send path':>14}")
+    for name, number_format in NUMBERS.items():
+        # the caches are cleared before each repeat, so NUMBER numbers are enough
+        numbers = map(number_format, cycle(range(NUMBER)))
+        clear_caches()
+        fresh_parse = best_microseconds(
+            fresh(numbers, parse_phone_number), clear_caches
+        )
+        clear_caches()
+        fresh_send = best_microseconds(fresh(numbers, send_path), clear_caches)
+        repeated = best_microseconds(partial(parse_phone_number, number_format(0)))
+        print(
+            f"{name:<15}"
+            f"{fresh_parse:>10.1f}us"
+            f"{repeated:>10.1f}us"
+            f"{fresh_send:>12.1f}us"
+        )
+
+
+if __name__ == "__main__":
+    run()
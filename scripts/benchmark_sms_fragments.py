@@ -0,0 +1,77 @@
+"""
+Time rendering an sms and counting its fragments, the way the send path does.
+
+Run from the project directory with:
+
+    poetry run python scripts/benchmark_sms_fragments.py
+
+Prints microseconds per message for plain GSM-7, extended GSM and UCS-2
+content, for get_sms_fragments on its own and for a template rendered and
+counted as sending a message does.
+"""
+
+import sys
+import timeit
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from notifications_utils.template import (  # noqa: E402
+    SMSMessageTemplate,
+    get_sms_fragments,
+)
+
+REPEAT = 5
+NUMBER = 2_000
+
+CONTENT = {
+    "GSM-7": (
+        "Hello ((name)), your appointment is on ((date)) at ((time)). "
+        "Reply STOP to opt out. " * 3
+    ),
+    "extended GSM": (
+        "Hello ((name)), your code is [((code))] {valid} for 10 minutes. "
+        "Costs are ~€5 | see ^this^ \\ that. " * 3
+    ),
+    "UCS-2": (
+        "Helô ((name)), ŵnewch chi gadarnhau eich apwyntiad ar ((date)) am ((time))? "
+        "Diolch yn fawr. " * 3
+    ),
+}
+
+VALUES = {"name": "Jo", "date": "1 March", "time": "10am", "code": "123456"}
+
+
+def best_microseconds(statement):
+    return min(timeit.repeat(statement, repeat=REPEAT, number=NUMBER)) / NUMBER * 1e6
+
+
+def count_fragments(content):
+    message = str(
+        SMSMessageTemplate({"content": content, "template_type": "sms"}, VALUES)
+    )
+    return lambda: get_sms_fragments(message)
+
+
+def render_and_count(content):
+    def send():
+        template = SMSMessageTemplate(
+            {"content": content, "template_type": "sms"}, VALUES
+        )
+        return str(template), template.content_count, template.fragment_count
+
+    return send
+
+
+def run():
+    print(f"{'content':<14}{'count only':>14}{'render + count':>18}")
+    for name, content in CONTENT.items():
+        print(
+            f"{name:<14}"
+            f"{best_microseconds(count_fragments(content)):>12.1f}us"
+            f"{best_microseconds(render_and_count(content)):>16.1f}us"
+        )
+
+
+if __name__ == "__main__":
+    run()
@@ -1,9 +1,12 @@
 import time
 import uuid
+from datetime import timedelta
+from unittest.mock import call
 
 import jwt
 import pytest
 from flask import g, request
+from freezegun import freeze_time
 
 from app import db
 from app.authentication.auth import (
@@ -14,10 +17,15 @@ from app.authentication.auth import (
     _get_token_issuer,
     requires_auth,
     requires_internal_auth,
+    verified_tokens,
 )
 from app.dao.api_key_dao import expire_api_key, get_model_api_keys, get_unsigned_secrets
 from app.dao.services_dao import dao_fetch_service_by_id
-from notifications_python_client.authentication import create_jwt_token
+from app.utils import utc_now
+from notifications_python_client.authentication import (
+    create_jwt_token,
+    decode_jwt_token,
+)
 from tests import create_admin_authorization_header, create_service_authorization_header
 from tests.conftest import set_config_values
 
@@ -238,6 +246,93 @@ def test_decode_jwt_token_returns_error_with_no_secrets(client):
     assert exc.value.short_message == "Invalid token: API key not found"
 
 
+@pytest.mark.parametrize(
+    "kid, expected_secrets_tried",
+    [
+        ("test-key", ["test-key"]),
+        ("unknown", ["normal-key", "test-key"]),
+        (None, ["normal-key", "test-key"]),
+    ],
+)
+def test_decode_jwt_token_only_tries_the_key_named_by_the_token(
+    client, sample_api_key, sample_test_api_key, mocker, kid, expected_secrets_tried
+):
+    key_ids = {"normal-key": sample_api_key.id, "test-key": sample_test_api_key.id}
+    headers = {"typ": "JWT", "alg": "HS256"}
+    if kid:
+        headers["kid"] = str(key_ids.get(kid, uuid.uuid4()))
+    token = create_custom_jwt_token(
+        headers=headers,
+        payload={"iss": str(sample_api_key.service_id), "iat": int(time.time())},
+        secret=sample_test_api_key.secret,
+    )
+    decode_mock = mocker.patch(
+        "app.authentication.auth.decode_jwt_token", wraps=decode_jwt_token
+    )
+    mock_logger = mocker.patch("app.authentication.auth.current_app.logger")
+
+    api_key = _decode_jwt_token(token, [sample_api_key, sample_test_api_key])
+
+    assert api_key == sample_test_api_key
+    secrets = {
+        "normal-key": sample_api_key.secret,
+        "test-key": sample_test_api_key.secret,
+    }
+    assert decode_mock.call_args_list == [
+        call(token, secrets[name]) for name in expected_secrets_tried
+    ]
+    mock_logger.exception.assert_not_called()
+
+
+def test_decode_jwt_token_remembers_verified_tokens(
+    client, sample_api_key, sample_test_api_key, mocker
+):
+    token = create_jwt_token(
+        secret=sample_test_api_key.secret,
+        client_id=str(sample_test_api_key.service_id),
+    )
+    decode_mock = mocker.patch(
+        "app.authentication.auth.decode_jwt_token", wraps=decode_jwt_token
+    )
+
+    for _ in range(2):
+        assert (
+            _decode_jwt_token(token, [sample_api_key, sample_test_api_key])
+            == sample_test_api_key
+        )
+
+    assert decode_mock.call_count == 2
+    assert verified_tokens[token][0] == sample_test_api_key.id
+
+    # but not the key that verified them, it still has to be current
+    expire_api_key(sample_test_api_key.service_id, sample_test_api_key.id)
+    with pytest.raises(AuthError) as exc:
+        _decode_jwt_token(token, [sample_api_key, sample_test_api_key])
+    assert exc.value.short_message == "Invalid token: API key revoked"
+
+    with pytest.raises(AuthError) as exc:
+        _decode_jwt_token(token, [sample_api_key])
+    assert exc.value.short_message == "Invalid token: API key not found"
+
+
+def test_decode_jwt_token_forgets_tokens_once_they_expire(
+    client, sample_api_key, mocker
+):
+    token = create_jwt_token(
+        secret=sample_api_key.secret, client_id=str(sample_api_key.service_id)
+    )
+    _decode_jwt_token(token, [sample_api_key])
+
+    with freeze_time(utc_now() + timedelta(seconds=31)):
+        assert token not in verified_tokens
+        with pytest.raises(AuthError) as exc:
+            _decode_jwt_token(token, [sample_api_key])
+    assert (
+        exc.value.short_message
+        == "Error: Your system clock must be accurate to within 30 seconds"
+    )
+
+
 @pytest.mark.parametrize("service_id", ["not-a-valid-id", 1234])
 def test_requires_auth_should_not_allow_service_id_with_the_wrong_data_type(
     client, service_jwt_secret, service_id
@@ -0,0 +1,121 @@
+import time
+
+import pytest
+
+from app.aws.job_cache import JobCache, sizeof
+
+
+@pytest.fixture
+def now(monkeypatch):
+    clock = {"now": 1_000_000.0}
+    monkeypatch.setattr(time, "time", lambda: clock["now"])
+    return clock
+
+
+def test_get_returns_value_and_expiry(now):
+    cache = JobCache(ttl=10)
+    cache.set("job", "phone number\r\n+15555555555")
+
+    assert cache.get("job") == ("phone number\r\n+15555555555", now["now"] + 10)
+    assert cache.stats()["hits"] == 1
+
+
+def test_get_missing_key_counts_a_miss():
+    cache = JobCache()
+
+    assert cache.get("job") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_keys_are_stringified(fake_uuid):
+    cache = JobCache()
+    cache.set(fake_uuid, "csv")
+
+    assert cache.get(str(fake_uuid))[0] == "csv"
+
+
+def test_expired_entries_are_dropped_when_read(now):
+    cache = JobCache(ttl=10)
+    cache.set("job", "csv")
+    now["now"] += 11
+
+    assert cache.get("job") is None
+    assert len(cache) == 0
+    assert cache.stats()["bytes"] == 0
+    assert cache.stats()["expirations"] == 1
+
+
+def test_clean_drops_only_expired_entries(now):
+    cache = JobCache(ttl=10)
+    cache.set("old", "csv")
+    now["now"] += 5
+    cache.set("new", "csv")
+    now["now"] += 6
+
+    assert cache.clean() == ["old"]
+    assert "old" not in cache
+    assert "new" in cache
+
+
+def test_least_recently_used_entry_is_evicted_first():
+    entry_size = sizeof("a" * 100)
+    cache = JobCache(max_bytes=entry_size * 2)
+    cache.set("first", "a" * 100)
+    cache.set("second", "b" * 100)
+    cache.get("first")
+
+    cache.set("third", "c" * 100)
+
+    assert "first" in cache
+    assert "second" not in cache
+    assert "third" in cache
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == entry_size * 2
+
+
+def test_value_bigger_than_the_budget_is_not_cached():
+    cache = JobCache(max_bytes=10)
+
+    assert cache.set("job", "a" * 100) is False
+    assert "job" not in cache
+    assert cache.stats()["bytes"] == 0
+
+
+def test_overwriting_a_key_replaces_its_size():
+    cache = JobCache()
+    cache.set("job", "a" * 100)
+    cache.set("job", "a")
+
+    assert cache.stats()["bytes"] == sizeof("a")
+
+
+def test_views_are_derived_once_and_charged_to_their_entry():
+    cache = JobCache()
+    cache.set("job", "a,b")
+    calls = []
+
+    def derive(value):
+        calls.append(value)
+        return value.split(",")
+
+    assert cache.get_view("job", "columns", derive) == ["a", "b"]
+    assert cache.get_view("job", "columns", derive) == ["a", "b"]
+    assert calls == ["a,b"]
+    assert len(cache) == 1
+    assert cache.stats()["bytes"] == sizeof("a,b") + sizeof("a,b".split(","))
+
+
+def test_views_go_with_their_entry(now):
+    cache = JobCache(ttl=10)
+    cache.set("job", "a,b")
+    cache.get_view("job", "columns", lambda value: value.split(","))
+    now["now"] += 11
+
+    assert cache.get_view("job", "columns", lambda value: value.split(",")) is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_view_of_a_missing_key_is_none():
+    cache = JobCache()
+
+    assert cache.get_view("job", "columns", pytest.fail) is None
@@ -0,0 +1,94 @@
+import os
+import time
+
+import pytest
+
+from app.aws.job_row_store import JobRows, JobRowStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobRowStore(directory=str(tmp_path / "rows"))
+
+
+def test_build_and_read_rows(store):
+    store.build(
+        "job",
+        {0: "15555555555", 1: "15555555556"},
+        {0: {"name": "Tim", "city": "Zürich"}, 1: {"name": "Tom"}},
+    )
+
+    rows = store.open("job")
+    assert rows.phone(0) == "15555555555"
+    assert rows.phone(1) == "15555555556"
+    assert rows.personalisation(0) == {"name": "Tim", "city": "Zürich"}
+    assert rows.personalisation(1) == {"name": "Tom"}
+
+
+def test_rows_can_be_read_by_another_process(store):
+    store.build("job", {0: "15555555555"}, {0: {"name": "Tim"}})
+
+    rows = JobRows(store.path("job"))
+
+    assert rows.phone(0) == "15555555555"
+    assert rows.personalisation(0) == {"name": "Tim"}
+
+
+def test_rows_past_the_end_of_a_column_are_none(store):
+    # extract_phones gives up at the first corrupt row, so the columns can differ in length
+    rows = store.build("job", {0: "15555555555"}, {0: {}, 1: {"name": "Tom"}})
+
+    assert rows.phone(1) is None
+    assert rows.phone(-1) is None
+    assert rows.personalisation(1) == {"name": "Tom"}
+    assert rows.personalisation(2) is None
+
+
+def test_empty_job(store):
+    rows = store.build("job", {}, {})
+
+    assert rows.phone(0) is None
+    assert rows.personalisation(0) is None
+
+
+def test_open_job_that_was_never_stored(store):
+    assert store.open("job") is None
+
+
+def test_open_ignores_files_in_an_unknown_format(store):
+    os.makedirs(store.directory)
+    with open(store.path("job"), "wb") as f:
+        f.write(b"not a job row file, but long enough to have a header")
+
+    assert store.open("job") is None
+
+
+def test_build_leaves_no_temporary_files(store):
+    store.build("job", {0: "15555555555"}, {0: {}})
+
+    assert os.listdir(store.directory) == ["job.rows"]
+
+
+def test_open_keeps_a_bounded_number_of_maps(tmp_path):
+    store = JobRowStore(directory=str(tmp_path), max_open=2)
+    for job_id in ("a", "b", "c"):
+        store.build(job_id, {0: job_id}, {0: {}})
+
+    assert list(store._open) == ["b", "c"]
+    assert store.open("a").phone(0) == "a"
+    assert list(store._open) == ["c", "a"]
+
+
+def test_clean_deletes_old_rows(store):
+    store.build("old", {0: "15555555555"}, {0: {}})
+    store.build("new", {0: "15555555556"}, {0: {}})
+    an_old_time = time.time() - store.ttl - 1
+    os.utime(store.path("old"), (an_old_time, an_old_time))
+
+    assert store.clean() == ["old"]
+    assert store.open("old") is None
+    assert store.open("new").phone(0) == "15555555556"
+
+
+def test_clean_before_anything_was_stored(store):
+    assert store.clean() == []
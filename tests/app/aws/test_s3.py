@@ -1,6 +1,8 @@
 import os
 import time
+from collections import OrderedDict
 from datetime import timedelta
+from io import BytesIO
 from os import getenv
 from unittest.mock import MagicMock, Mock, call, patch
 
@@ -8,7 +10,7 @@ import botocore
 import pytest
 from botocore.exceptions import ClientError
 
-from app import job_cache
+from app import job_cache, job_row_store
 from app.aws import s3
 from app.aws.s3 import (
     cleanup_old_s3_objects,
@@ -76,11 +78,27 @@ def test_cleanup_old_s3_objects(mocker):
     mock_remove_csv_object.assert_called_once_with("A")
 
 
+@pytest.fixture(autouse=True)
+def empty_job_cache(mocker, tmp_path):
+    mocker.patch.object(job_row_store, "directory", str(tmp_path))
+    mocker.patch.object(job_row_store, "_open", OrderedDict())
+    mocker.patch.object(s3, "_job_locations", OrderedDict())
+    for cached in (s3._get_s3_session, s3._get_s3_client, s3._get_s3_resource):
+        cached.cache_clear()
+    job_cache.clear()
+    yield
+    job_cache.clear()
+
+
+@pytest.fixture
+def row_store_unavailable(mocker):
+    mocker.patch.object(job_row_store, "build", side_effect=PermissionError())
+
+
 def test_read_s3_file_success(client, mocker):
     mock_s3res = MagicMock()
     mock_extract_personalisation = mocker.patch("app.aws.s3.extract_personalisation")
     mock_extract_phones = mocker.patch("app.aws.s3.extract_phones")
-    mock_set_job_cache = mocker.patch("app.aws.s3.set_job_cache")
     mock_get_job_id = mocker.patch("app.aws.s3.get_job_id_from_s3_object_key")
     bucket_name = "test_bucket"
     object_key = "test_object_key"
@@ -92,18 +110,29 @@ def test_read_s3_file_success(client, mocker):
         "Body": MagicMock(read=MagicMock(return_value=file_content.encode("utf-8")))
     }
     mock_s3res.Object.return_value = mock_s3_object
-    mock_extract_phones.return_value = ["1234567890"]
-    mock_extract_personalisation.return_value = {"name": "John Doe"}
+    mock_extract_phones.return_value = {0: "1234567890"}
+    mock_extract_personalisation.return_value = {0: {"name": "John Doe"}}
 
     read_s3_file(bucket_name, object_key, mock_s3res)
     mock_get_job_id.assert_called_once_with(object_key)
     mock_s3res.Object.assert_called_once_with(bucket_name, object_key)
-    expected_calls = [
-        call(job_id, file_content),
-        call(f"{job_id}_phones", ["1234567890"]),
-        call(f"{job_id}_personalisation", {"name": "John Doe"}),
-    ]
-    mock_set_job_cache.assert_has_calls(expected_calls, any_order=True)
+    mock_extract_phones.assert_called_once_with(file_content, mocker.ANY, job_id)
+    mock_extract_personalisation.assert_called_once_with(file_content)
+
+    rows = job_row_store.open(job_id)
+    assert rows.phone(0) == "1234567890"
+    assert rows.personalisation(0) == {"name": "John Doe"}
+    # the csv itself isn't kept in memory once its rows are on disk
+    assert s3.get_job_cache(job_id) is None
+
+
+def test_read_s3_file_skips_jobs_already_in_the_row_store(client, mocker):
+    job_row_store.build("12345", {0: "1234567890"}, {0: {}})
+    mock_s3res = MagicMock()
+
+    read_s3_file("test_bucket", "service-XX-notify/12345.csv", mock_s3res)
+
+    mock_s3res.Object.assert_not_called()
 
 
 def test_download_from_s3_success(mocker):
@@ -274,41 +303,46 @@ def mock_s3_get_object_no_such_key(*args, **kwargs):
 
 def test_get_job_from_s3_exponential_backoff_on_throttling(mocker):
     # We try multiple times to retrieve the job, and if we can't we return None
-    mock_get_object = mocker.patch(
-        "app.aws.s3.get_s3_object", side_effect=mock_s3_get_object_slowdown
-    )
-    mocker.patch("app.aws.s3.file_exists", return_value=True)
+    mock_s3_client = mocker.patch("app.aws.s3.get_s3_client").return_value
+    mock_s3_client.get_object.side_effect = mock_s3_get_object_slowdown
+    mock_sleep = mocker.patch("app.aws.s3.gevent.sleep")
     job = get_job_from_s3("service_id", "job_id")
     assert job is None
-    assert mock_get_object.call_count == 8
+    assert mock_s3_client.get_object.call_count == 4
+    assert mock_sleep.call_count == 4
 
 
 def test_get_job_from_s3_exponential_backoff_on_no_such_key(mocker):
-    # We try multiple times to retrieve the job, and if we can't we return None
-    mock_get_object = mocker.patch(
-        "app.aws.s3.get_s3_object", side_effect=mock_s3_get_object_no_such_key
-    )
-    mocker.patch("app.aws.s3.file_exists", return_value=True)
+    # Both key layouts are tried once, and then we give up
+    mock_s3_client = mocker.patch("app.aws.s3.get_s3_client").return_value
+    mock_s3_client.get_object.side_effect = mock_s3_get_object_no_such_key
     job = get_job_from_s3("service_id", "job_id")
     assert job is None
-    assert mock_get_object.call_count == 2
+    assert mock_s3_client.get_object.call_count == 2
+    mock_s3_client.head_object.assert_not_called()
 
 
 def test_get_job_from_s3_exponential_backoff_on_random_exception(mocker):
     # We try multiple times to retrieve the job, and if we can't we return None
-    mock_get_object = mocker.patch("app.aws.s3.get_s3_object", side_effect=Exception())
-    mocker.patch("app.aws.s3.file_exists", return_value=True)
+    mock_s3_client = mocker.patch("app.aws.s3.get_s3_client").return_value
+    mock_s3_client.get_object.side_effect = Exception()
     job = get_job_from_s3("service_id", "job_id")
     assert job is None
-    assert mock_get_object.call_count == 1
+    assert mock_s3_client.get_object.call_count == 1
 
 
-def test_get_job_from_s3_exponential_backoff_file_not_found(mocker):
-    mock_get_object = mocker.patch("app.aws.s3.get_s3_object", return_value=None)
-    mocker.patch("app.aws.s3.file_exists", return_value=False)
-    job = get_job_from_s3("service_id", "job_id")
-    assert job is None
-    assert mock_get_object.call_count == 0
+def test_get_job_from_s3_makes_a_single_get(notify_api, mocker):
+    mock_s3_client = mocker.patch("app.aws.s3.get_s3_client").return_value
+    mock_s3_client.get_object.return_value = {
+        "Body": MagicMock(read=MagicMock(return_value=b"phone number\r\n1")),
+    }
+
+    assert get_job_from_s3("service-id", "job-id") == "phone number\r\n1"
+    mock_s3_client.get_object.assert_called_once_with(
+        Bucket=notify_api.config["CSV_UPLOAD_BUCKET"]["bucket"],
+        Key="service-id-service-notify/job-id.csv",
+    )
+    mock_s3_client.head_object.assert_not_called()
 
 
 @pytest.mark.parametrize(
@@ -359,6 +393,20 @@ def test_remove_csv_object(notify_api, mocker):
     )
 
 
+def test_s3upload_fileobj_uses_a_managed_transfer(mocker):
+    mock_client = mocker.patch("app.aws.s3.get_s3_client").return_value
+    report = BytesIO(b"Phone Number\r\n")
+
+    s3.s3upload_fileobj(report, "bucket", "report.csv", content_type="text/csv")
+
+    mock_client.upload_fileobj.assert_called_once_with(
+        report,
+        "bucket",
+        "report.csv",
+        ExtraArgs={"ServerSideEncryption": "AES256", "ContentType": "text/csv"},
+    )
+
+
 def test_remove_csv_object_alternate(notify_api, mocker):
     get_s3_mock = mocker.patch("app.aws.s3.get_s3_object")
     remove_s3_object(
@@ -479,48 +527,146 @@ def test_get_s3_resource(mocker):
     assert result
 
 
+def test_get_s3_client_and_resource_share_one_session(mocker):
+    mock_session = mocker.patch("app.aws.s3.Session")
+    mocker.patch("app.aws.s3.current_app").config = {
+        "CSV_UPLOAD_BUCKET": {
+            "access_key_id": "test_access_key",
+            "secret_access_key": "test_s_key",
+            "region": "us-west-100",
+        }
+    }
+
+    assert get_s3_client() is get_s3_client()
+    assert get_s3_resource() is get_s3_resource()
+    mock_session.assert_called_once()
+    mock_session.return_value.client.assert_called_once()
+    mock_session.return_value.resource.assert_called_once()
+
+
 def test_get_job_and_metadata_from_s3(mocker):
-    mock_get_s3_object = mocker.patch("app.aws.s3.get_s3_object")
+    mock_s3_client = mocker.patch("app.aws.s3.get_s3_client").return_value
     mock_get_job_location = mocker.patch("app.aws.s3.get_job_location")
 
-    mock_get_job_location.return_value = {"bucket_name", "new_key"}
-    mock_s3_object = MagicMock()
-    mock_s3_object.get.return_value = {
+    mock_get_job_location.return_value = ("bucket_name", "new_key")
+    mock_s3_client.get_object.return_value = {
         "Body": MagicMock(read=MagicMock(return_value=b"job data")),
         "Metadata": {"key": "value"},
     }
-    mock_get_s3_object.return_value = mock_s3_object
     result = get_job_and_metadata_from_s3("service_id", "job_id")
 
     mock_get_job_location.assert_called_once_with("service_id", "job_id")
-    # mock_get_s3_object.assert_called_once_with("bucket_name", "new_key")
+    mock_s3_client.get_object.assert_called_once_with(
+        Bucket="bucket_name", Key="new_key"
+    )
     assert result == ("job data", {"key": "value"})
 
 
 def test_get_job_and_metadata_from_s3_fallback_to_old_location(mocker):
     mock_get_job_location = mocker.patch("app.aws.s3.get_job_location")
     mock_get_old_job_location = mocker.patch("app.aws.s3.get_old_job_location")
-    mock_get_job_location.return_value = {"bucket_name", "new_key"}
-    mock_get_s3_object = mocker.patch("app.aws.s3.get_s3_object")
-    # mock_get_s3_object.side_effect = [ClientError({"Error": {}}, "GetObject"), mock_s3_object]
-    mock_get_old_job_location.return_value = {"bucket_name", "old_key"}
-    mock_s3_object = MagicMock()
-    mock_s3_object.get.return_value = {
-        "Body": MagicMock(read=MagicMock(return_value=b"old job data")),
-        "Metadata": {"old_key": "old_value"},
-    }
-    mock_get_s3_object.side_effect = [
-        ClientError({"Error": {}}, "GetObject"),
-        mock_s3_object,
+    mock_get_job_location.return_value = ("bucket_name", "new_key")
+    mock_get_old_job_location.return_value = ("bucket_name", "old_key")
+    mock_s3_client = mocker.patch("app.aws.s3.get_s3_client").return_value
+    mock_s3_client.get_object.side_effect = [
+        ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject"),
+        {
+            "Body": MagicMock(read=MagicMock(return_value=b"old job data")),
+            "Metadata": {"old_key": "old_value"},
+        },
     ]
     result = get_job_and_metadata_from_s3("service_id", "job_id")
     mock_get_job_location.assert_called_once_with("service_id", "job_id")
     mock_get_old_job_location.assert_called_once_with("service_id", "job_id")
-    # mock_get_s3_object.assert_any_call("bucket_name", "new_key")
-    # mock_get_s3_object.assert_any_call("bucket_name", "old_key")
+    assert mock_s3_client.get_object.call_args_list == [
+        call(Bucket="bucket_name", Key="new_key"),
+        call(Bucket="bucket_name", Key="old_key"),
+    ]
     assert result == ("old job data", {"old_key": "old_value"})
 
 
+def test_get_job_lines_and_metadata_from_s3(mocker):
+    mocker.patch("app.aws.s3.JOB_SPOOL_MAX_MEMORY", 8)
+    mock_s3_client = mocker.patch("app.aws.s3.get_s3_client").return_value
+    mock_s3_client.get_object.return_value = {
+        "Body": BytesIO("phone number,name\r\n+15555555555,Zoë\r\n".encode()),
+        "Metadata": {"sender_id": "1"},
+    }
+
+    lines, metadata = s3.get_job_lines_and_metadata_from_s3("service_id", "job_id")
+
+    assert list(lines) == ["phone number,name\r\n", "+15555555555,Zoë\r\n"]
+    assert metadata == {"sender_id": "1"}
+    mock_s3_client.get_object.assert_called_once()
+
+
+def test_get_job_object_remembers_the_old_location(mocker):
+    mocker.patch("app.aws.s3.get_job_location", return_value=("bucket_name", "new_key"))
+    mocker.patch(
+        "app.aws.s3.get_old_job_location", return_value=("bucket_name", "old_key")
+    )
+    mock_s3_client = mocker.patch("app.aws.s3.get_s3_client").return_value
+
+    def _get_object(Bucket, Key):
+        if Key == "new_key":
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": MagicMock(read=MagicMock(return_value=b"job data"))}
+
+    mock_s3_client.get_object.side_effect = _get_object
+
+    s3.get_job_object("service_id", "job_id")
+    s3.get_job_object("service_id", "job_id")
+
+    assert [c.kwargs["Key"] for c in mock_s3_client.get_object.call_args_list] == [
+        "new_key",
+        "old_key",
+        "old_key",
+    ]
+
+
+def test_get_job_object_does_not_fall_back_when_throttled(mocker):
+    mock_s3_client = mocker.patch("app.aws.s3.get_s3_client").return_value
+    mock_s3_client.get_object.side_effect = mock_s3_get_object_slowdown
+
+    with pytest.raises(ClientError):
+        s3.get_job_object("service_id", "job_id")
+    assert mock_s3_client.get_object.call_count == 1
+
+
+def test_get_s3_object_data_ranged_and_conditional(mocker):
+    mock_s3_client = mocker.patch("app.aws.s3.get_s3_client").return_value
+    mock_s3_client.get_object.return_value = {
+        "Body": MagicMock(read=MagicMock(return_value=b"phone")),
+        "Metadata": {"template_id": "1"},
+        "ETag": '"abc"',
+    }
+
+    result = s3.get_s3_object_data("bucket", "key", byte_range=(0, 4), etag='"xyz"')
+
+    assert result == s3.S3Object(b"phone", {"template_id": "1"}, '"abc"')
+    mock_s3_client.get_object.assert_called_once_with(
+        Bucket="bucket", Key="key", Range="bytes=0-4", IfNoneMatch='"xyz"'
+    )
+
+
+def test_get_s3_object_data_not_modified(mocker):
+    mock_s3_client = mocker.patch("app.aws.s3.get_s3_client").return_value
+    mock_s3_client.get_object.side_effect = ClientError(
+        {"Error": {"Code": "304"}, "ResponseMetadata": {"HTTPStatusCode": 304}},
+        "GetObject",
+    )
+
+    assert s3.get_s3_object_data("bucket", "key", etag='"abc"') is None
+
+
+def test_get_job_metadata_from_s3_does_not_download_the_job(mocker):
+    mock_s3_client = mocker.patch("app.aws.s3.get_s3_client").return_value
+    mock_s3_client.head_object.return_value = {"Metadata": {"template_id": "1"}}
+
+    assert s3.get_job_metadata_from_s3("service_id", "job_id") == {"template_id": "1"}
+    mock_s3_client.get_object.assert_not_called()
+
+
 def test_get_s3_object_client_error(mocker):
     mock_get_s3_resource = mocker.patch("app.aws.s3.get_s3_resource")
     mock_current_app = mocker.patch("app.aws.s3.current_app")
@@ -625,28 +771,85 @@ def test_set_and_get_job_cache_and_expiry(monkeypatch):
     monkeypatch.setattr(time, "time", lambda: fake_time + (9 * 24 * 60 * 60))
 
     # clean_cache should remove expired entries
-    job_cache["other"] = ("foo", fake_time + 10)
     s3.clean_cache()
     assert "k" not in job_cache
+    assert len(job_cache) == 0
 
 
-def test_read_s3_file_populates_cache(monkeypatch):
+def test_read_s3_file_populates_cache(monkeypatch, row_store_unavailable):
     fake_csv = "Phone number,Name\r\n+1-555-1234,Alice"
     obj = MagicMock()
     obj.get.return_value = {"Body": MagicMock(read=lambda: fake_csv.encode())}
     s3res = MagicMock(Object=lambda b, o: obj)
-    monkeypatch.setattr(s3, "get_job_cache", lambda k: None)
     monkeypatch.setattr(s3, "extract_phones", lambda job, sid, jid: {"0", "15551234"})
     monkeypatch.setattr(
         s3, "extract_personalisation", lambda job: {0: {"Name": "Alice"}}
     )
-    monkeypatch.setattr(
-        s3, "set_job_cache", lambda k, v: job_cache.update({k: (v, time.time() + 1)})
-    )
     s3.read_s3_file("bucket", "service-XX-notify/66.csv", s3res)
     assert job_cache.get("66")[0].startswith("Phone number")
-    assert job_cache.get("66_phones")[0] == {"0", "15551234"}
-    assert job_cache.get("66_personalisation")[0] == {0: {"Name": "Alice"}}
+    assert job_cache.get_view("66", "phones", None) == {"0", "15551234"}
+    assert job_cache.get_view("66", "personalisation", None) == {0: {"Name": "Alice"}}
+    # the views are kept on the job's entry, not as entries of their own
+    assert len(job_cache) == 1
+
+
+def test_get_phone_number_from_s3_only_downloads_and_parses_the_job_once(mocker):
+    mock_get_job = mocker.patch(
+        "app.aws.s3.get_job_from_s3",
+        return_value="phone number,name\r\n+15555555555,Tim\r\n+15555555556,Tom",
+    )
+    mock_extract_phones = mocker.patch(
+        "app.aws.s3.extract_phones", wraps=extract_phones
+    )
+
+    assert get_phone_number_from_s3("service_id", "fff", 0) == "15555555555"
+    assert get_phone_number_from_s3("service_id", "fff", 1) == "15555555556"
+    assert get_personalisation_from_s3("service_id", "fff", 1) == {
+        "phone number": "+15555555556",
+        "name": "Tom",
+    }
+    mock_get_job.assert_called_once()
+    mock_extract_phones.assert_called_once()
+
+
+def test_get_phone_number_from_s3_reads_rows_stored_by_another_worker(mocker):
+    job_row_store.build("fff", {0: "15555555555"}, {0: {"name": "Tim"}})
+    mock_get_job = mocker.patch("app.aws.s3.get_job_from_s3")
+
+    assert get_phone_number_from_s3("service_id", "fff", 0) == "15555555555"
+    assert get_personalisation_from_s3("service_id", "fff", 0) == {"name": "Tim"}
+    mock_get_job.assert_not_called()
+
+
+def test_get_phone_number_from_s3_for_a_row_past_the_end_of_the_job(mocker):
+    mocker.patch(
+        "app.aws.s3.get_job_from_s3", return_value="phone number\r\n+15555555555"
+    )
+
+    assert get_phone_number_from_s3("service_id", "fff", 1) == "Unavailable"
+    assert get_personalisation_from_s3("service_id", "fff", 1) is None
+
+
+def test_get_phone_number_from_s3_remembers_missing_jobs(mocker):
+    mock_get_job = mocker.patch("app.aws.s3.get_job_from_s3", return_value=None)
+
+    assert get_phone_number_from_s3("service_id", "fff", 0) == "Unavailable"
+    assert get_personalisation_from_s3("service_id", "fff", 0) == {}
+    mock_get_job.assert_called_once()
+
+
+def test_get_phone_number_from_s3_falls_back_to_memory_without_a_row_store(
+    mocker, row_store_unavailable
+):
+    mock_get_job = mocker.patch(
+        "app.aws.s3.get_job_from_s3",
+        return_value="phone number\r\n+15555555555\r\n+15555555556",
+    )
+
+    assert get_phone_number_from_s3("service_id", "ggg", 0) == "15555555555"
+    assert get_phone_number_from_s3("service_id", "ggg", 1) == "15555555556"
+    mock_get_job.assert_called_once()
+    assert "ggg" in job_cache
 
 
 @patch("app.aws.s3.current_app")
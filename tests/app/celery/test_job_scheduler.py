@@ -0,0 +1,164 @@
+import pytest
+
+from app.celery import job_scheduler
+from app.celery.job_scheduler import JobScheduler, get_queue_depth
+from app.config import QueueNames
+from app.enums import NotificationType
+
+
+@pytest.fixture
+def pipeline_state(mocker):
+    state = {"send_rate": 0.0, "queue_depth": 0, "active_jobs": 1}
+    mocker.patch(
+        "app.celery.job_scheduler.get_send_rate",
+        side_effect=lambda: state["send_rate"],
+    )
+    mocker.patch(
+        "app.celery.job_scheduler.get_queue_depth",
+        side_effect=lambda notification_type: state["queue_depth"],
+    )
+    mocker.patch(
+        "app.celery.job_scheduler.get_active_job_count",
+        side_effect=lambda job_id: state["active_jobs"],
+    )
+    return state
+
+
+def test_scheduler_starts_at_min_rate_when_nothing_has_been_sent(
+    notify_api, pipeline_state, fake_uuid
+):
+    scheduler = JobScheduler(fake_uuid, NotificationType.SMS)
+    scheduler.refresh()
+
+    assert scheduler.rate == notify_api.config["JOB_SCHEDULER_MIN_RATE"]
+
+
+def test_scheduler_lets_a_lone_job_ramp_up_past_the_send_rate(
+    notify_api, pipeline_state, fake_uuid
+):
+    pipeline_state["send_rate"] = 20
+    scheduler = JobScheduler(fake_uuid, NotificationType.SMS)
+    scheduler.refresh()
+
+    assert scheduler.rate == 20 * notify_api.config["JOB_SCHEDULER_HEADROOM"]
+
+
+def test_scheduler_splits_capacity_between_active_jobs(
+    notify_api, pipeline_state, fake_uuid
+):
+    pipeline_state["send_rate"] = 40
+    pipeline_state["active_jobs"] = 4
+    scheduler = JobScheduler(fake_uuid, NotificationType.SMS)
+    scheduler.refresh()
+
+    assert scheduler.pipeline_rate == 60
+    assert scheduler.rate == 15
+
+
+def test_scheduler_backs_off_when_queues_are_deep(
+    notify_api, pipeline_state, fake_uuid
+):
+    target = notify_api.config["JOB_SCHEDULER_TARGET_QUEUE_DEPTH"]
+    pipeline_state["send_rate"] = 40
+    pipeline_state["queue_depth"] = target * 2
+    scheduler = JobScheduler(fake_uuid, NotificationType.SMS)
+    scheduler.refresh()
+
+    assert scheduler.rate == 30
+
+
+def test_scheduler_never_goes_below_min_or_above_max_rate(
+    notify_api, pipeline_state, fake_uuid
+):
+    scheduler = JobScheduler(fake_uuid, NotificationType.SMS)
+
+    pipeline_state["send_rate"] = 10_000
+    scheduler.refresh()
+    assert scheduler.rate == notify_api.config["JOB_SCHEDULER_MAX_RATE"]
+
+    pipeline_state["active_jobs"] = 10_000
+    scheduler.refresh()
+    assert scheduler.rate == notify_api.config["JOB_SCHEDULER_MIN_RATE"]
+
+
+def test_scheduler_stats(notify_api, pipeline_state, fake_uuid):
+    pipeline_state.update(send_rate=10, queue_depth=7, active_jobs=2)
+    scheduler = JobScheduler(fake_uuid, NotificationType.SMS)
+    scheduler.refresh()
+
+    assert scheduler.stats() == {
+        "job_id": fake_uuid,
+        "rate": 7.5,
+        "pipeline_rate": 15,
+        "send_rate": 10,
+        "queue_depth": 7,
+        "active_jobs": 2,
+    }
+
+
+def test_acquire_does_not_sleep_while_tokens_are_available(
+    notify_api, pipeline_state, fake_uuid, mocker
+):
+    mock_sleep = mocker.patch("app.celery.job_scheduler.gevent.sleep")
+    scheduler = JobScheduler(fake_uuid, NotificationType.SMS)
+
+    for _ in range(int(notify_api.config["JOB_SCHEDULER_MIN_RATE"])):
+        scheduler.acquire()
+
+    assert not mock_sleep.called
+
+
+def test_acquire_sleeps_until_the_next_token(
+    notify_api, pipeline_state, fake_uuid, mocker
+):
+    scheduler = JobScheduler(fake_uuid, NotificationType.SMS)
+    scheduler.refresh()
+    scheduler.tokens = 0
+
+    def _sleep(seconds):
+        scheduler.tokens = 1
+
+    mock_sleep = mocker.patch(
+        "app.celery.job_scheduler.gevent.sleep", side_effect=_sleep
+    )
+    scheduler.acquire()
+
+    mock_sleep.assert_called_once()
+    assert 0 < mock_sleep.call_args[0][0] <= 1 / scheduler.rate
+
+
+@pytest.mark.parametrize(
+    "notification_type, send_queue",
+    [
+        (NotificationType.SMS, QueueNames.SEND_SMS),
+        (NotificationType.EMAIL, QueueNames.SEND_EMAIL),
+    ],
+)
+def test_get_queue_depth(notify_api, mocker, notification_type, send_queue):
+    depths = {QueueNames.DATABASE: 3, send_queue: 4}
+    mocker.patch.object(
+        job_scheduler.redis_store, "llen", side_effect=lambda key: depths.get(key)
+    )
+
+    assert get_queue_depth(notification_type) == 7
+
+
+def test_scheduler_paces_at_min_rate_if_redis_fails(notify_api, mocker, fake_uuid):
+    mocker.patch.object(job_scheduler.redis_store, "active", True)
+    mocker.patch.object(
+        job_scheduler.redis_store, "pipeline", side_effect=ConnectionError()
+    )
+    mocker.patch.object(job_scheduler.redis_store, "llen", return_value=0)
+    mocker.patch.object(job_scheduler.redis_store, "set", side_effect=ConnectionError())
+    mocker.patch.object(
+        job_scheduler.redis_store, "delete", side_effect=ConnectionError()
+    )
+    scheduler = JobScheduler(fake_uuid, NotificationType.SMS)
+    scheduler.pipeline_rate = scheduler.rate = 1000
+
+    scheduler.refresh()
+    scheduler.finish()
+
+    assert scheduler.send_rate == 0
+    assert scheduler.active_jobs == 1
+    assert scheduler.rate == notify_api.config["JOB_SCHEDULER_MIN_RATE"]
@@ -0,0 +1,220 @@
+import json
+import uuid
+from unittest.mock import MagicMock, call
+
+import pytest
+
+from app import db
+from app.celery import message_queue
+from app.celery.message_queue import MessageQueueConsumer, persist_message_queue_chunk
+from app.config import QueueNames
+from app.enums import KeyType, NotificationStatus, NotificationType
+from app.models import Notification
+from app.utils import utc_now
+
+
+@pytest.fixture
+def rs(mocker):
+    rs = MagicMock()
+    mocker.patch("app.celery.message_queue.redis_store", rs)
+    return rs
+
+
+@pytest.fixture
+def deliver_sms_batch(mocker):
+    return mocker.patch("app.celery.provider_tasks.deliver_sms_batch.apply_async")
+
+
+def _serialized(notification_id):
+    return json.dumps(
+        {"id": str(notification_id), "notification_status": "created"}
+    ).encode("utf-8")
+
+
+def test_persist_chunk_saves_and_sends_a_notification(
+    sample_template, rs, deliver_sms_batch
+):
+    notification = Notification(
+        id=uuid.uuid4(),
+        to="+12028675309",
+        service_id=sample_template.service_id,
+        template_id=sample_template.id,
+        template_version=sample_template.version,
+        key_type=KeyType.NORMAL,
+        notification_type=NotificationType.SMS,
+        status=NotificationStatus.CREATED,
+        created_at=utc_now(),
+    )
+    chunk = [json.dumps(notification.serialize_for_redis(notification)).encode()]
+
+    assert persist_message_queue_chunk(chunk) == (1, 0)
+
+    assert db.session.get(Notification, notification.id).to == "+12028675309"
+    deliver_sms_batch.assert_called_once_with(
+        [[str(notification.id)]], queue="send-sms-tasks"
+    )
+    rs.pipeline.assert_not_called()
+
+
+def test_persist_chunk_only_sends_notifications_that_were_inserted(
+    mocker, rs, deliver_sms_batch
+):
+    new_id = uuid.uuid4()
+    dao_mock = mocker.patch(
+        "app.celery.message_queue.dao_batch_insert_notifications",
+        return_value=[new_id],
+    )
+
+    assert persist_message_queue_chunk(
+        [_serialized(uuid.uuid4()), _serialized(new_id)]
+    ) == (1, 0)
+
+    assert len(dao_mock.call_args[0][0]) == 2
+    deliver_sms_batch.assert_called_once_with([[str(new_id)]], queue="send-sms-tasks")
+
+
+def test_persist_chunk_sends_notifications_on_the_queue_they_were_given(
+    mocker, rs, deliver_sms_batch
+):
+    notify_id, other_id = uuid.uuid4(), uuid.uuid4()
+    mocker.patch(
+        "app.celery.message_queue.dao_batch_insert_notifications",
+        return_value=[notify_id, other_id],
+    )
+    notify_notification = {
+        "id": str(notify_id),
+        "notification_status": "created",
+        "queue": QueueNames.NOTIFY,
+    }
+
+    assert persist_message_queue_chunk(
+        [json.dumps(notify_notification).encode("utf-8"), _serialized(other_id)]
+    ) == (2, 0)
+
+    assert sorted(deliver_sms_batch.call_args_list) == sorted(
+        [
+            call([[str(notify_id)]], queue=QueueNames.NOTIFY),
+            call([[str(other_id)]], queue=QueueNames.SEND_SMS),
+        ]
+    )
+
+
+def test_persist_chunk_dead_letters_malformed_notifications(
+    mocker, rs, deliver_sms_batch
+):
+    dao_mock = mocker.patch(
+        "app.celery.message_queue.dao_batch_insert_notifications", return_value=[]
+    )
+    malformed = [b"not_a_valid_json", json.dumps({"id": 1}).encode("utf-8")]
+
+    assert persist_message_queue_chunk(
+        [malformed[0], _serialized(2), malformed[1]]
+    ) == (0, 2)
+
+    assert [n.id for n in dao_mock.call_args[0][0]] == ["2"]
+    pipe = rs.pipeline.return_value
+    pipe.rpush.assert_called_once_with("message_queue_dead_letters", *malformed)
+    pipe.ltrim.assert_called_once_with("message_queue_dead_letters", -100_000, -1)
+    pipe.execute.assert_called_once()
+
+
+def test_persist_chunk_dead_letters_a_chunk_that_fails_to_insert(
+    mocker, rs, deliver_sms_batch
+):
+    mocker.patch(
+        "app.celery.message_queue.dao_batch_insert_notifications",
+        side_effect=Exception("DB Error"),
+    )
+    chunk = [_serialized(1), _serialized(2)]
+
+    assert persist_message_queue_chunk(chunk) == (0, 2)
+
+    rs.rpush.assert_not_called()
+    rs.pipeline.return_value.rpush.assert_called_once_with(
+        "message_queue_dead_letters", *chunk
+    )
+    deliver_sms_batch.assert_not_called()
+
+
+@pytest.fixture
+def consumer():
+    return MessageQueueConsumer("0", batch_size=3, max_wait=0.5)
+
+
+def test_collect_fills_a_batch_with_what_is_waiting(consumer, rs):
+    rs.blmove.return_value = b"1"
+    rs.lmove_many.return_value = [b"2", b"3"]
+
+    assert consumer.collect() == [b"1", b"2", b"3"]
+
+    rs.blmove.assert_called_once_with(
+        "message_queue", "message_queue_processing-0", message_queue.IDLE_TIMEOUT
+    )
+    rs.lmove_many.assert_called_once_with(
+        "message_queue", "message_queue_processing-0", 2
+    )
+
+
+def test_collect_waits_up_to_max_wait_for_the_batch_to_fill(consumer, rs, mocker):
+    mocker.patch("app.celery.message_queue.monotonic", side_effect=[10, 10.2, 10.6])
+    rs.blmove.side_effect = [b"1", b"2"]
+    rs.lmove_many.return_value = []
+
+    assert consumer.collect() == [b"1", b"2"]
+
+    assert rs.blmove.call_args_list == [
+        call("message_queue", "message_queue_processing-0", message_queue.IDLE_TIMEOUT),
+        call("message_queue", "message_queue_processing-0", pytest.approx(0.3)),
+    ]
+
+
+def test_collect_returns_nothing_when_idle(consumer, rs):
+    rs.blmove.return_value = None
+
+    assert consumer.collect() == []
+    rs.lmove_many.assert_not_called()
+
+
+def test_flush_acknowledges_the_batch_once_it_is_saved(consumer, rs, mocker):
+    persist_mock = mocker.patch(
+        "app.celery.message_queue.persist_message_queue_chunk", return_value=(2, 0)
+    )
+
+    consumer.flush([b"1", b"2"])
+
+    persist_mock.assert_called_once_with([b"1", b"2"])
+    rs.delete.assert_called_once_with(
+        "message_queue_processing-0", raise_exception=True
+    )
+
+
+def test_flush_does_not_acknowledge_a_batch_that_failed(consumer, rs, mocker):
+    mocker.patch(
+        "app.celery.message_queue.persist_message_queue_chunk",
+        side_effect=ConnectionError("Redis down"),
+    )
+
+    with pytest.raises(ConnectionError):
+        consumer.flush([b"1"])
+
+    rs.delete.assert_not_called()
+
+
+def test_run_saves_an_unacknowledged_batch_first(consumer, rs, mocker):
+    rs.lrange.return_value = [b"1"]
+    mocker.patch.object(consumer, "collect", side_effect=consumer.stop)
+    flush_mock = mocker.patch.object(consumer, "flush")
+
+    consumer.run()
+
+    rs.lrange.assert_called_once_with("message_queue_processing-0", 0, -1)
+    flush_mock.assert_called_once_with([b"1"])
+
+
+def test_run_needs_redis(consumer, rs, mocker):
+    rs.active = False
+    collect_mock = mocker.patch.object(consumer, "collect")
+
+    consumer.run()
+
+    collect_mock.assert_not_called()
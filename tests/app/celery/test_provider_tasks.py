@@ -1,5 +1,6 @@
 import json
-from unittest.mock import ANY
+import uuid
+from unittest.mock import ANY, call
 
 import pytest
 from botocore.exceptions import ClientError
@@ -7,7 +8,12 @@ from celery.exceptions import MaxRetriesExceededError
 
 import app
 from app.celery import provider_tasks
-from app.celery.provider_tasks import deliver_email, deliver_sms
+from app.celery.provider_tasks import (
+    deliver_email,
+    deliver_sms,
+    deliver_sms_batch,
+    deliver_sms_in_batches,
+)
 from app.clients.email import EmailClientNonRetryableException
 from app.clients.email.aws_ses import (
     AwsSesClientException,
@@ -16,6 +22,7 @@ from app.clients.email.aws_ses import (
 from app.clients.sms import SmsClientResponseException
 from app.enums import NotificationStatus
 from app.exceptions import NotificationTechnicalFailureException
+from tests.app.db import create_notification
 
 
 def test_should_have_decorated_tasks_functions():
@@ -115,6 +122,47 @@ def test_should_go_into_technical_error_if_exceeds_retries_on_deliver_sms_task(
 # end of deliver_sms task tests, now deliver_email task tests
 
 
+def test_deliver_sms_batch_sends_the_rest_on_to_deliver_sms(sample_template, mocker):
+    batched, unbatched, failed = (
+        create_notification(template=sample_template) for _ in range(3)
+    )
+    not_saved_yet = str(uuid.uuid4())
+    send_batch = mocker.patch(
+        "app.delivery.send_to_providers.send_sms_batch_to_provider",
+        return_value=([unbatched.id], [failed.id]),
+    )
+    deliver_sms_mock = mocker.patch("app.celery.provider_tasks.deliver_sms.apply_async")
+
+    deliver_sms_batch(
+        [str(n.id) for n in (batched, unbatched, failed)] + [not_saved_yet]
+    )
+
+    assert sorted(n.id for n in send_batch.call_args[0][0]) == sorted(
+        n.id for n in (batched, unbatched, failed)
+    )
+    assert deliver_sms_mock.call_args_list == [
+        call([str(unbatched.id)], queue="send-sms-tasks"),
+        call([str(failed.id)], queue="retry-tasks"),
+        call([not_saved_yet], queue="retry-tasks"),
+    ]
+
+
+def test_deliver_sms_in_batches(notify_api, mocker):
+    mocker.patch.dict(notify_api.config, {"SMS_DELIVERY_BATCH_SIZE": 2})
+    deliver_batch_mock = mocker.patch(
+        "app.celery.provider_tasks.deliver_sms_batch.apply_async"
+    )
+    ids = [uuid.uuid4() for _ in range(5)]
+
+    deliver_sms_in_batches(ids)
+
+    assert deliver_batch_mock.call_args_list == [
+        call([[str(ids[0]), str(ids[1])]], queue="send-sms-tasks"),
+        call([[str(ids[2]), str(ids[3])]], queue="send-sms-tasks"),
+        call([[str(ids[4])]], queue="send-sms-tasks"),
+    ]
+
+
 def test_should_call_send_email_to_provider_from_deliver_email_task(
     sample_notification, mocker
 ):
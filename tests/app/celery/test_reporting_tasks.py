@@ -11,6 +11,7 @@ from app.celery.reporting_tasks import (
     create_nightly_billing,
     create_nightly_billing_for_day,
     create_nightly_notification_status,
+    create_nightly_notification_status_for_day,
     create_nightly_notification_status_for_service_and_day,
 )
 from app.config import QueueNames
@@ -27,15 +28,6 @@ from tests.app.db import (
 )
 
 
-def mocker_get_rate(
-    non_letter_rates, notification_type, local_date, rate_multiplier=None
-):
-    if notification_type == NotificationType.SMS:
-        return Decimal(1.33)
-    elif notification_type == NotificationType.EMAIL:
-        return Decimal(0)
-
-
 @freeze_time("2019-08-01T05:30")
 @pytest.mark.parametrize(
     "day_start, expected_kwargs",
@@ -55,71 +47,34 @@ def test_create_nightly_billing_triggers_tasks_for_days(
     assert mock_celery.apply_async.call_count == 10
     for i in range(10):
         assert mock_celery.apply_async.call_args_list[i][1]["kwargs"] == {
-            "process_day": expected_kwargs[i]
+            "process_day": expected_kwargs[i],
+            "dry_run": False,
         }
 
 
 @freeze_time("2019-08-01T00:30")
-def test_create_nightly_notification_status_triggers_tasks(
+def test_create_nightly_notification_status_triggers_tasks_for_days(
     notify_api,
-    sample_service,
-    sample_template,
     mocker,
 ):
     mock_celery = mocker.patch(
-        "app.celery.reporting_tasks.create_nightly_notification_status_for_service_and_day"
+        "app.celery.reporting_tasks.create_nightly_notification_status_for_day"
     ).apply_async
 
-    create_notification(template=sample_template, created_at="2019-07-31")
     create_nightly_notification_status()
 
-    mock_celery.assert_called_with(
-        kwargs={
-            "service_id": sample_service.id,
-            "process_day": "2019-07-31",
-            "notification_type": NotificationType.SMS,
-        },
-        queue=QueueNames.REPORTING,
-    )
-
-
-@freeze_time("2019-08-01T00:30")
-@pytest.mark.parametrize(
-    "notification_date, expected_types_aggregated",
-    [
-        ("2019-08-01", set()),
-        ("2019-07-31", {NotificationType.EMAIL, NotificationType.SMS}),
-        ("2019-07-28", {NotificationType.EMAIL, NotificationType.SMS}),
-        ("2019-07-21", set()),
-    ],
-)
-def test_create_nightly_notification_status_triggers_relevant_tasks(
-    notify_api,
-    sample_service,
-    mocker,
-    notification_date,
-    expected_types_aggregated,
-):
-    mock_celery = mocker.patch(
-        "app.celery.reporting_tasks.create_nightly_notification_status_for_service_and_day"
-    ).apply_async
-    for notification_type in NotificationType:
-        template = create_template(sample_service, template_type=notification_type)
-        create_notification(template=template, created_at=notification_date)
-
-    create_nightly_notification_status()
-
-    types = {
-        call.kwargs["kwargs"]["notification_type"] for call in mock_celery.mock_calls
-    }
-    assert types == expected_types_aggregated
+    assert mock_celery.call_args_list == [
+        mocker.call(
+            kwargs={"process_day": process_day},
+            queue=QueueNames.REPORTING,
+        )
+        for process_day in ("2019-07-31", "2019-07-30", "2019-07-29", "2019-07-28")
+    ]
 
 
-def test_create_nightly_billing_for_day_checks_history(
-    sample_service, sample_template, mocker
-):
+def test_create_nightly_billing_for_day_checks_history(sample_service, sample_template):
     yesterday = datetime.now() - timedelta(days=1)
-    mocker.patch("app.dao.fact_billing_dao.get_rate", side_effect=mocker_get_rate)
+    create_rate(datetime(2016, 1, 1), 1.33, NotificationType.SMS)
 
     create_notification(
         created_at=yesterday,
@@ -157,7 +112,6 @@ def _get_fact_billing_records():
 def test_create_nightly_billing_for_day_sms_rate_multiplier(
     sample_service,
     sample_template,
-    mocker,
     second_rate,
     records_num,
     billable_units,
@@ -165,7 +119,7 @@ def test_create_nightly_billing_for_day_sms_rate_multiplier(
 ):
     yesterday = datetime.now() - timedelta(days=1)
 
-    mocker.patch("app.dao.fact_billing_dao.get_rate", side_effect=mocker_get_rate)
+    create_rate(datetime(2016, 1, 1), 1.33, NotificationType.SMS)
 
     # These are sms notifications
     create_notification(
@@ -200,17 +154,17 @@ def test_create_nightly_billing_for_day_sms_rate_multiplier(
 
     for i, record in enumerate(records):
         assert record.local_date == datetime.date(yesterday)
-        assert record.rate == Decimal(1.33)
+        assert record.rate == Decimal("1.33")
         assert record.billable_units == billable_units
         assert record.rate_multiplier == multiplier[i]
 
 
 def test_create_nightly_billing_for_day_different_templates(
-    sample_service, sample_template, sample_email_template, mocker
+    sample_service, sample_template, sample_email_template
 ):
     yesterday = datetime.now() - timedelta(days=1)
 
-    mocker.patch("app.dao.fact_billing_dao.get_rate", side_effect=mocker_get_rate)
+    create_rate(datetime(2016, 1, 1), 1.33, NotificationType.SMS)
 
     create_notification(
         created_at=yesterday,
@@ -243,7 +197,7 @@ def test_create_nightly_billing_for_day_different_templates(
     assert len(records) == 2
     multiplier = [0, 1]
     billable_units = [0, 1]
-    rate = [0, Decimal(1.33)]
+    rate = [0, Decimal("1.33")]
 
     for i, record in enumerate(records):
         assert record.local_date == datetime.date(yesterday)
@@ -253,11 +207,11 @@ def test_create_nightly_billing_for_day_different_templates(
 
 
 def test_create_nightly_billing_for_day_same_sent_by(
-    sample_service, sample_template, sample_email_template, mocker
+    sample_service, sample_template, sample_email_template
 ):
     yesterday = datetime.now() - timedelta(days=1)
 
-    mocker.patch("app.dao.fact_billing_dao.get_rate", side_effect=mocker_get_rate)
+    create_rate(datetime(2016, 1, 1), 1.33, NotificationType.SMS)
 
     # These are sms notifications
     create_notification(
@@ -292,17 +246,17 @@ def test_create_nightly_billing_for_day_same_sent_by(
 
     for _, record in enumerate(records):
         assert record.local_date == datetime.date(yesterday)
-        assert record.rate == Decimal(1.33)
+        assert record.rate == Decimal("1.33")
         assert record.billable_units == 2
         assert record.rate_multiplier == 1.0
 
 
 def test_create_nightly_billing_for_day_null_sent_by_sms(
-    sample_service, sample_template, mocker
+    sample_service, sample_template
 ):
     yesterday = datetime.now() - timedelta(days=1)
 
-    mocker.patch("app.dao.fact_billing_dao.get_rate", side_effect=mocker_get_rate)
+    create_rate(datetime(2016, 1, 1), 1.33, NotificationType.SMS)
 
     create_notification(
         created_at=yesterday,
@@ -323,7 +277,7 @@ def test_create_nightly_billing_for_day_null_sent_by_sms(
 
     record = records[0]
     assert record.local_date == datetime.date(yesterday)
-    assert record.rate == Decimal(1.33)
+    assert record.rate == Decimal("1.33")
     assert record.billable_units == 1
     assert record.rate_multiplier == 1
     assert record.provider == "unknown"
@@ -344,10 +298,8 @@ def test_get_rate_for_sms_and_email(notify_db_session):
 
 @freeze_time("2018-03-26T04:30:00")
 # summer time starts on 2018-03-25
-def test_create_nightly_billing_for_day_use_BST(
-    sample_service, sample_template, mocker
-):
-    mocker.patch("app.dao.fact_billing_dao.get_rate", side_effect=mocker_get_rate)
+def test_create_nightly_billing_for_day_use_BST(sample_service, sample_template):
+    create_rate(datetime(2016, 1, 1), 1.33, NotificationType.SMS)
 
     # too late
     create_notification(
@@ -395,9 +347,9 @@ def test_create_nightly_billing_for_day_use_BST(
 
 @freeze_time("2018-01-15T08:30:00")
 def test_create_nightly_billing_for_day_update_when_record_exists(
-    sample_service, sample_template, mocker
+    sample_service, sample_template
 ):
-    mocker.patch("app.dao.fact_billing_dao.get_rate", side_effect=mocker_get_rate)
+    create_rate(datetime(2016, 1, 1), 1.33, NotificationType.SMS)
 
     create_notification(
         created_at=datetime.now() - timedelta(days=1),
@@ -441,6 +393,36 @@ def test_create_nightly_billing_for_day_update_when_record_exists(
     assert records[0].updated_at
 
 
+@freeze_time("2018-01-15T03:30:00")
+def test_create_nightly_billing_for_day_dry_run_logs_changes_without_writing(
+    sample_service, sample_template, mocker
+):
+    mock_logger = mocker.patch("app.celery.reporting_tasks.current_app.logger")
+    create_rate(datetime(2016, 1, 1), 1.33, NotificationType.SMS)
+    create_notification(
+        created_at=datetime.now() - timedelta(days=1),
+        template=sample_template,
+        status=NotificationStatus.DELIVERED,
+        sent_by="sns",
+        billable_units=3,
+    )
+
+    create_nightly_billing_for_day("2018-01-14", dry_run=True)
+
+    assert _get_fact_billing_records() == []
+    logged = [call.args[0] for call in mock_logger.info.call_args_list]
+    assert logged[1] == (
+        "create-nightly-billing-for-day task for 2018-01-14: dry run would write "
+        f"service {sample_service.id} template {sample_template.id} sms sns "
+        "rate 1.33 x1 international False: "
+        "notifications_sent None -> 1, billable_units None -> 3"
+    )
+    assert logged[2] == (
+        "create-nightly-billing-for-day task for 2018-01-14: "
+        "task complete (dry run). 1 rows would be updated in 0 seconds"
+    )
+
+
 def test_create_nightly_notification_status_for_service_and_day(notify_db_session):
     first_service = create_service(service_name="First Service")
     first_template = create_template(service=first_service)
@@ -597,6 +579,161 @@ def test_create_nightly_notification_status_for_service_and_day_overwrites_old_d
     assert updated_fact_data[1].notification_status == NotificationStatus.DELIVERED
 
 
+def test_create_nightly_notification_status_for_day(notify_db_session):
+    first_service = create_service(service_name="First Service")
+    first_template = create_template(service=first_service)
+    second_service = create_service(service_name="second Service")
+    second_template = create_template(
+        service=second_service,
+        template_type=TemplateType.EMAIL,
+    )
+    second_sms_template = create_template(service=second_service)
+
+    process_day = utc_now().date() - timedelta(days=5)
+    with freeze_time(datetime.combine(process_day, time.max)):
+        create_notification(
+            template=first_template, status=NotificationStatus.DELIVERED
+        )
+        create_notification(
+            template=first_template, status=NotificationStatus.DELIVERED
+        )
+        create_notification(template=second_template, status=NotificationStatus.FAILED)
+        create_notification(
+            template=second_sms_template,
+            status=NotificationStatus.SENDING,
+            key_type=KeyType.TEAM,
+        )
+        # test notifications are ignored
+        create_notification(
+            template=second_template,
+            status=NotificationStatus.SENDING,
+            key_type=KeyType.TEST,
+        )
+        # historical notifications are included
+        create_notification_history(
+            template=second_template,
+            status=NotificationStatus.DELIVERED,
+        )
+
+    # these created notifications from a different day get ignored
+    with freeze_time(datetime.combine(utc_now().date() - timedelta(days=4), time.max)):
+        create_notification(template=first_template)
+        create_notification_history(template=second_template)
+
+    create_nightly_notification_status_for_day(str(process_day))
+
+    new_fact_data = db.session.execute(select(FactNotificationStatus)).scalars().all()
+
+    assert sorted(
+        (
+            row.local_date,
+            row.template_id,
+            row.service_id,
+            row.job_id,
+            row.notification_type,
+            row.key_type,
+            row.notification_status,
+            row.notification_count,
+        )
+        for row in new_fact_data
+    ) == sorted(
+        [
+            (
+                process_day,
+                first_template.id,
+                first_service.id,
+                UUID("00000000-0000-0000-0000-000000000000"),
+                NotificationType.SMS,
+                KeyType.NORMAL,
+                NotificationStatus.DELIVERED,
+                2,
+            ),
+            (
+                process_day,
+                second_template.id,
+                second_service.id,
+                UUID("00000000-0000-0000-0000-000000000000"),
+                NotificationType.EMAIL,
+                KeyType.NORMAL,
+                NotificationStatus.FAILED,
+                1,
+            ),
+            (
+                process_day,
+                second_template.id,
+                second_service.id,
+                UUID("00000000-0000-0000-0000-000000000000"),
+                NotificationType.EMAIL,
+                KeyType.NORMAL,
+                NotificationStatus.DELIVERED,
+                1,
+            ),
+            (
+                process_day,
+                second_sms_template.id,
+                second_service.id,
+                UUID("00000000-0000-0000-0000-000000000000"),
+                NotificationType.SMS,
+                KeyType.TEAM,
+                NotificationStatus.SENDING,
+                1,
+            ),
+        ]
+    )
+
+
+def test_create_nightly_notification_status_for_day_overwrites_old_data(
+    notify_db_session,
+):
+    first_service = create_service(service_name="First Service")
+    first_template = create_template(service=first_service)
+    second_service = create_service(service_name="second Service")
+    second_template = create_template(service=second_service)
+    process_day = utc_now().date()
+
+    notification = create_notification(
+        template=first_template, status=NotificationStatus.SENDING
+    )
+    create_notification(template=second_template, status=NotificationStatus.SENDING)
+    create_nightly_notification_status_for_day(str(process_day))
+
+    # one service has changed since, and the other is written again by a
+    # task for just that service, as happens while an upgrade rolls out
+    notification.status = NotificationStatus.DELIVERED
+    create_nightly_notification_status_for_service_and_day(
+        str(process_day),
+        second_service.id,
+        NotificationType.SMS,
+    )
+    create_nightly_notification_status_for_day(str(process_day))
+
+    updated_fact_data = (
+        db.session.execute(select(FactNotificationStatus)).scalars().all()
+    )
+
+    assert {
+        (row.service_id, row.notification_status, row.notification_count)
+        for row in updated_fact_data
+    } == {
+        (first_service.id, NotificationStatus.DELIVERED, 1),
+        (second_service.id, NotificationStatus.SENDING, 1),
+    }
+
+
+def test_create_nightly_notification_status_for_day_logs_rows_written(
+    notify_db_session, sample_template, mocker
+):
+    mock_logger = mocker.patch("app.celery.reporting_tasks.current_app.logger")
+    create_notification(template=sample_template)
+
+    create_nightly_notification_status_for_day(str(utc_now().date()))
+
+    mock_logger.info.assert_called_once_with(
+        f"create-nightly-notification-status-for-day task for {utc_now().date()}: "
+        "1 rows written in 0 seconds"
+    )
+
+
 # the job runs at 04:30am EST time.
 @freeze_time("2019-04-02T04:30")
 def test_create_nightly_notification_status_for_service_and_day_respects_bst(
@@ -1,10 +1,12 @@
 import json
 from collections import namedtuple
-from datetime import timedelta
+from datetime import datetime, timedelta
 from unittest import mock
 from unittest.mock import ANY, MagicMock, call
 
 import pytest
+from celery.exceptions import MaxRetriesExceededError
+from freezegun import freeze_time
 
 from app.celery import scheduled_tasks
 from app.celery.scheduled_tasks import (
@@ -18,6 +20,7 @@ from app.celery.scheduled_tasks import (
     replay_created_notifications,
     run_scheduled_jobs,
 )
+from app.clients.cloudwatch.aws_cloudwatch import DeliveryReceipt
 from app.config import QueueNames, Test
 from app.dao.jobs_dao import dao_get_job_by_id
 from app.enums import JobStatus, NotificationStatus, TemplateType
@@ -25,6 +28,7 @@ from app.utils import utc_now
 from notifications_utils.clients.zendesk.zendesk_client import NotifySupportTicket
 from tests.app import load_example_csv
 from tests.app.db import create_job, create_notification, create_template
+from tests.conftest import set_config
 
 CHECK_JOB_STATUS_TOO_OLD_MINUTES = 241
 
@@ -311,10 +315,10 @@ def test_replay_created_notifications(notify_db_session, sample_service, mocker)
 
     replay_created_notifications()
     email_delivery_queue.assert_called_once_with(
-        [str(old_email.id)], queue="send-email-tasks", countdown=60
+        [str(old_email.id)], queue="send-email-tasks"
     )
     sms_delivery_queue.assert_called_once_with(
-        [str(old_sms.id)], queue="send-sms-tasks", countdown=60
+        [str(old_sms.id)], queue="send-sms-tasks"
     )
 
 
@@ -355,7 +359,7 @@ def test_check_for_missing_rows_in_completed_jobs_ignores_old_and_new_jobs(
     offset,
 ):
     mocker.patch(
-        "app.celery.tasks.s3.get_job_and_metadata_from_s3",
+        "app.celery.tasks.s3.get_job_lines_and_metadata_from_s3",
         return_value=(load_example_csv("multiple_email"), {"sender_id": None}),
     )
     mocker.patch("app.encryption.encrypt", return_value="something_encrypted")
@@ -377,7 +381,7 @@ def test_check_for_missing_rows_in_completed_jobs_ignores_old_and_new_jobs(
 
 def test_check_for_missing_rows_in_completed_jobs(mocker, sample_email_template):
     mocker.patch(
-        "app.celery.tasks.s3.get_job_and_metadata_from_s3",
+        "app.celery.tasks.s3.get_job_lines_and_metadata_from_s3",
         return_value=(load_example_csv("multiple_email"), {"sender_id": None}),
     )
     mocker.patch("app.encryption.encrypt", return_value="something_encrypted")
@@ -403,7 +407,7 @@ def test_check_for_missing_rows_in_completed_jobs_calls_save_email(
     mocker, sample_email_template
 ):
     mocker.patch(
-        "app.celery.tasks.s3.get_job_and_metadata_from_s3",
+        "app.celery.tasks.s3.get_job_lines_and_metadata_from_s3",
         return_value=(load_example_csv("multiple_email"), {"sender_id": None}),
     )
     save_email_task = mocker.patch("app.celery.tasks.save_email.apply_async")
@@ -435,7 +439,7 @@ def test_check_for_missing_rows_in_completed_jobs_uses_sender_id(
     mocker, sample_email_template, fake_uuid
 ):
     mocker.patch(
-        "app.celery.tasks.s3.get_job_and_metadata_from_s3",
+        "app.celery.tasks.s3.get_job_lines_and_metadata_from_s3",
         return_value=(load_example_csv("multiple_email"), {"sender_id": fake_uuid}),
     )
     mock_process_row = mocker.patch("app.celery.scheduled_tasks.process_row")
@@ -527,7 +531,10 @@ def test_check_for_services_with_high_failure_rates_or_sending_to_tv_numbers(
 
 
 def test_batch_insert_with_valid_notifications(mocker):
-    mocker.patch("app.celery.scheduled_tasks.dao_batch_insert_notifications")
+    persist_mock = mocker.patch(
+        "app.celery.scheduled_tasks.persist_message_queue_chunk",
+        return_value=(2, 0),
+    )
     rs = MagicMock()
     mocker.patch("app.celery.scheduled_tasks.redis_store", rs)
     notifications = [
@@ -536,89 +543,238 @@ def test_batch_insert_with_valid_notifications(mocker):
     ]
     serialized_notifications = [json.dumps(n).encode("utf-8") for n in notifications]
 
-    pipeline_mock = MagicMock()
-
-    rs.pipeline.return_value.__enter__.return_value = pipeline_mock
     rs.llen.return_value = len(notifications)
-    rs.lpop.side_effect = serialized_notifications
+    rs.lpop.return_value = serialized_notifications
 
     batch_insert_notifications()
 
     rs.llen.assert_called_once_with("message_queue")
-    rs.lpop.assert_called_with("message_queue")
+    rs.lpop.assert_called_once_with("message_queue", 2)
+    persist_mock.assert_called_once_with(serialized_notifications)
 
 
-def test_batch_insert_with_expired_notifications(mocker):
-    expired_time = utc_now() - timedelta(minutes=2)
-    mocker.patch(
-        "app.celery.scheduled_tasks.dao_batch_insert_notifications",
-        side_effect=Exception("DB Error"),
+def test_batch_insert_drains_in_chunks(notify_api, mocker):
+    persist_mock = mocker.patch(
+        "app.celery.scheduled_tasks.persist_message_queue_chunk",
+        side_effect=lambda chunk: (len(chunk), 0),
     )
     rs = MagicMock()
     mocker.patch("app.celery.scheduled_tasks.redis_store", rs)
-    notifications = [
-        {
-            "id": 1,
-            "notification_status": "pending",
-            "created_at": utc_now().isoformat(),
-        },
-        {
-            "id": 2,
-            "notification_status": "pending",
-            "created_at": expired_time.isoformat(),
-        },
+    serialized_notifications = [
+        json.dumps({"id": i, "notification_status": "pending"}).encode("utf-8")
+        for i in range(5)
     ]
-    serialized_notifications = [json.dumps(n).encode("utf-8") for n in notifications]
 
-    pipeline_mock = MagicMock()
-
-    rs.pipeline.return_value.__enter__.return_value = pipeline_mock
-    rs.llen.return_value = len(notifications)
-    rs.lpop.side_effect = serialized_notifications
+    rs.llen.return_value = 5
+    rs.lpop.side_effect = [
+        serialized_notifications[:2],
+        serialized_notifications[2:4],
+        serialized_notifications[4:],
+    ]
 
-    batch_insert_notifications()
+    with set_config(notify_api, "MESSAGE_QUEUE_DRAIN_CHUNK_SIZE", 2):
+        batch_insert_notifications()
 
-    rs.llen.assert_called_once_with("message_queue")
-    rs.rpush.assert_called_once()
-    requeued_notification = json.loads(rs.rpush.call_args[0][1])
-    assert requeued_notification["id"] == "1"
+    assert rs.lpop.call_args_list == [
+        call("message_queue", 2),
+        call("message_queue", 2),
+        call("message_queue", 1),
+    ]
+    assert persist_mock.call_count == 3
 
 
-def test_batch_insert_with_malformed_notifications(mocker):
+def test_batch_insert_stops_when_the_queue_is_emptied_early(mocker):
+    persist_mock = mocker.patch(
+        "app.celery.scheduled_tasks.persist_message_queue_chunk"
+    )
     rs = MagicMock()
     mocker.patch("app.celery.scheduled_tasks.redis_store", rs)
-    malformed_data = b"not_a_valid_json"
-    pipeline_mock = MagicMock()
 
-    rs.pipeline.return_value.__enter__.return_value = pipeline_mock
-    rs.llen.return_value = 1
-    rs.lpop.side_effect = [malformed_data]
+    rs.llen.return_value = 3
+    rs.lpop.return_value = None
 
-    with pytest.raises(json.JSONDecodeError):
-        batch_insert_notifications()
+    batch_insert_notifications()
+
+    rs.lpop.assert_called_once_with("message_queue", 3)
+    persist_mock.assert_not_called()
 
-    rs.llen.assert_called_once_with("message_queue")
-    rs.rpush.assert_not_called()
 
+@pytest.fixture
+def delivery_receipt_cursor(mocker):
+    cursor = {}
+    rs = mocker.patch("app.celery.scheduled_tasks.redis_store")
+    rs.get.side_effect = lambda key: cursor.get(key)
+    rs.set.side_effect = lambda key, value: cursor.update({key: value})
+    seen = {}
+    rs.zadd.side_effect = lambda key, mapping: seen.update(mapping)
+    rs.zrangebyscore.side_effect = lambda key, min, max: [
+        event_id.encode("utf-8") for event_id, score in seen.items() if score >= min
+    ]
+    rs.zremrangebyscore.side_effect = lambda key, min, max: [
+        seen.pop(event_id) for event_id, score in list(seen.items()) if score <= max
+    ]
+    return cursor
+
+
+def _run_process_delivery_receipts(mocker):
+    retry_mock = mocker.patch.object(
+        process_delivery_receipts, "retry", side_effect=MaxRetriesExceededError
+    )
+    process_delivery_receipts()
+    return retry_mock
 
-def test_process_delivery_receipts_success(mocker):
+
+def _cursor_ms(when):
+    return int(datetime.fromisoformat(when).timestamp() * 1000)
+
+
+@freeze_time("2024-06-01T12:00:00+00:00")
+def test_process_delivery_receipts_success(notify_api, mocker, delivery_receipt_cursor):
+    dao_update_mock = mocker.patch(
+        "app.celery.scheduled_tasks.dao_update_delivery_receipts",
+        side_effect=lambda batch, delivered: len(batch),
+    )
+    cloudwatch_mock = mocker.patch("app.celery.scheduled_tasks.AwsCloudwatchClient")
+    check_mock = cloudwatch_mock.return_value.check_delivery_receipts
+    receipts = [DeliveryReceipt(str(i), "", "", "", "", 0, str(i)) for i in range(2500)]
+    check_mock.return_value = (receipts[:2000], receipts[2000:])
+    logger_mock = mocker.patch.object(notify_api.logger, "info")
+
+    with set_config(notify_api, "DELIVERY_RECEIPT_BATCH_SIZE", 1000):
+        retry_mock = _run_process_delivery_receipts(mocker)
+
+    # with nothing read yet, start from the last three minutes
+    check_mock.assert_called_once_with(
+        datetime.fromisoformat("2024-06-01T11:56:00+00:00"),
+        datetime.fromisoformat("2024-06-01T11:59:00+00:00"),
+    )
+    assert dao_update_mock.call_count == 3
+    dao_update_mock.assert_any_call(receipts[:1000], True)
+    dao_update_mock.assert_any_call(receipts[1000:2000], True)
+    dao_update_mock.assert_any_call(receipts[2000:], False)
+    retry_mock.assert_not_called()
+    logger_mock.assert_called_with(
+        "Delivery receipts: received 2500, updated 2500 notifications, "
+        "read up to 2024-06-01T11:59:00+00:00"
+    )
+    assert delivery_receipt_cursor == {
+        "delivery-receipts-read-up-to": _cursor_ms("2024-06-01T11:59:00+00:00")
+    }
+
+
+@freeze_time("2024-06-01T12:00:00+00:00")
+def test_process_delivery_receipts_reads_on_from_the_cursor(
+    notify_api, mocker, delivery_receipt_cursor
+):
+    mocker.patch("app.celery.scheduled_tasks.dao_update_delivery_receipts")
+    cloudwatch_mock = mocker.patch("app.celery.scheduled_tasks.AwsCloudwatchClient")
+    check_mock = cloudwatch_mock.return_value.check_delivery_receipts
+    check_mock.return_value = ([], [])
+    delivery_receipt_cursor["delivery-receipts-read-up-to"] = _cursor_ms(
+        "2024-06-01T11:57:00+00:00"
+    )
+
+    _run_process_delivery_receipts(mocker)
+
+    # going back over the last five minutes for events cloudwatch was slow to index
+    check_mock.assert_called_once_with(
+        datetime.fromisoformat("2024-06-01T11:52:00+00:00"),
+        datetime.fromisoformat("2024-06-01T11:59:00+00:00"),
+    )
+
+
+@freeze_time("2024-06-01T12:00:00+00:00")
+def test_process_delivery_receipts_carries_on_when_out_of_quota(
+    notify_api, mocker, delivery_receipt_cursor
+):
     dao_update_mock = mocker.patch(
         "app.celery.scheduled_tasks.dao_update_delivery_receipts"
     )
     cloudwatch_mock = mocker.patch("app.celery.scheduled_tasks.AwsCloudwatchClient")
-    cloudwatch_mock.return_value.check_delivery_receipts.return_value = (
-        range(2000),
-        range(500),
+    no_quota = DeliveryReceipt("m1", "FAILURE", "", "No quota left for account", "", 0)
+    delivered = DeliveryReceipt("m2", "DELIVERED", "", "Delivered", "", 0)
+    cloudwatch_mock.return_value.check_delivery_receipts.side_effect = [
+        ([], [no_quota]),
+        ([delivered], []),
+        ([], []),
+    ]
+    warning_mock = mocker.patch.object(notify_api.logger, "warning")
+    delivery_receipt_cursor["delivery-receipts-read-up-to"] = _cursor_ms(
+        "2024-06-01T11:40:00+00:00"
     )
-    current_app_mock = mocker.patch("app.celery.scheduled_tasks.current_app")
-    current_app_mock.return_value = MagicMock()
-    processor = MagicMock()
-    processor.process_delivery_receipts = process_delivery_receipts
-    processor.retry = MagicMock()
 
-    processor.process_delivery_receipts()
-    assert dao_update_mock.call_count == 3
-    dao_update_mock.assert_any_call(list(range(1000)), True)
-    dao_update_mock.assert_any_call(list(range(1000, 2000)), True)
-    dao_update_mock.assert_any_call(list(range(500)), False)
-    processor.retry.assert_not_called()
+    retry_mock = _run_process_delivery_receipts(mocker)
+
+    retry_mock.assert_not_called()
+    warning_mock.assert_called_once()
+    assert dao_update_mock.call_args_list == [
+        call([no_quota], False),
+        call([delivered], True),
+    ]
+    assert delivery_receipt_cursor == {
+        "delivery-receipts-read-up-to": _cursor_ms("2024-06-01T11:59:00+00:00")
+    }
+
+
+def test_process_delivery_receipts_reads_late_events_once(
+    notify_api, mocker, delivery_receipt_cursor
+):
+    dao_update_mock = mocker.patch(
+        "app.celery.scheduled_tasks.dao_update_delivery_receipts"
+    )
+    cloudwatch_mock = mocker.patch("app.celery.scheduled_tasks.AwsCloudwatchClient")
+    check_mock = cloudwatch_mock.return_value.check_delivery_receipts
+    applied = DeliveryReceipt("m1", "DELIVERED", "", "", "", 0, "event-1")
+    late = DeliveryReceipt("m2", "DELIVERED", "", "", "", 0, "event-2")
+    check_mock.side_effect = [([applied], []), ([applied, late], [])]
+
+    with freeze_time("2024-06-01T12:00:00+00:00"):
+        _run_process_delivery_receipts(mocker)
+    with freeze_time("2024-06-01T12:02:00+00:00"):
+        _run_process_delivery_receipts(mocker)
+
+    # the second run goes back over the first, where the late event was logged
+    assert check_mock.call_args_list[1].args == (
+        datetime.fromisoformat("2024-06-01T11:54:00+00:00"),
+        datetime.fromisoformat("2024-06-01T12:01:00+00:00"),
+    )
+    assert dao_update_mock.call_args_list == [
+        call([applied], True),
+        call([late], True),
+    ]
+
+
+@freeze_time("2024-06-01T12:00:00+00:00")
+def test_process_delivery_receipts_catches_up_in_bounded_windows(
+    notify_api, mocker, delivery_receipt_cursor
+):
+    mocker.patch("app.celery.scheduled_tasks.dao_update_delivery_receipts")
+    cloudwatch_mock = mocker.patch("app.celery.scheduled_tasks.AwsCloudwatchClient")
+    check_mock = cloudwatch_mock.return_value.check_delivery_receipts
+    check_mock.side_effect = [([], []), ([], []), Exception("Cloudwatch is down")]
+    delivery_receipt_cursor["delivery-receipts-read-up-to"] = _cursor_ms(
+        "2024-06-01T10:00:00+00:00"
+    )
+
+    with set_config(notify_api, "DELIVERY_RECEIPT_MAX_WINDOWS_PER_RUN", 3):
+        retry_mock = _run_process_delivery_receipts(mocker)
+
+    assert [call.args for call in check_mock.call_args_list] == [
+        (
+            datetime.fromisoformat("2024-06-01T09:55:00+00:00"),
+            datetime.fromisoformat("2024-06-01T10:05:00+00:00"),
+        ),
+        (
+            datetime.fromisoformat("2024-06-01T10:05:00+00:00"),
+            datetime.fromisoformat("2024-06-01T10:15:00+00:00"),
+        ),
+        (
+            datetime.fromisoformat("2024-06-01T10:15:00+00:00"),
+            datetime.fromisoformat("2024-06-01T10:25:00+00:00"),
+        ),
+    ]
+    # the window that failed is read again next time
+    assert delivery_receipt_cursor == {
+        "delivery-receipts-read-up-to": _cursor_ms("2024-06-01T10:15:00+00:00")
+    }
+    retry_mock.assert_called_once()
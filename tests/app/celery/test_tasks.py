@@ -17,22 +17,29 @@ from app import db, get_encryption
 from app.celery import provider_tasks, tasks
 from app.celery.tasks import (
     __total_sending_limits_for_job_exceeded,
-    _generate_notifications_report,
+    _generate_notifications_reports,
+    generate_notification_reports_for_service,
+    generate_notification_reports_task,
     get_recipient_csv_and_template_and_sender_id,
     process_incomplete_job,
     process_incomplete_jobs,
     process_job,
     process_row,
+    process_rows_in_batches,
     s3,
     save_api_email,
     save_api_email_or_sms,
     save_api_sms,
     save_email,
+    save_email_batch,
     save_sms,
+    save_sms_batch,
     send_inbound_sms_to_service,
 )
+from app.clients.cloudwatch.aws_cloudwatch import DeliveryReceipt
 from app.config import QueueNames
 from app.dao import jobs_dao, service_email_reply_to_dao, service_sms_sender_dao
+from app.dao.notifications_dao import dao_update_delivery_receipts
 from app.enums import (
     JobStatus,
     KeyType,
@@ -95,30 +102,41 @@ def email_job_with_placeholders(
 # -------------- process_job tests -------------- #
 
 
+def _rows_in_batches(mock_apply_async):
+    return [
+        row
+        for call_args in mock_apply_async.call_args_list
+        for row in encryption.decrypt(call_args[0][0][1])["rows"]
+    ]
+
+
 def test_should_process_sms_job(sample_job, mocker):
     mocker.patch(
-        "app.celery.tasks.s3.get_job_and_metadata_from_s3",
+        "app.celery.tasks.s3.get_job_lines_and_metadata_from_s3",
         return_value=(load_example_csv("sms"), {"sender_id": None}),
     )
-    mocker.patch("app.celery.tasks.save_sms.apply_async")
+    mocker.patch("app.celery.tasks.save_sms_batch.apply_async")
     mock_encrypt = mocker.patch("app.celery.tasks.encryption.encrypt")
     mocker.patch("app.celery.tasks.create_uuid", return_value="uuid")
 
     process_job(sample_job.id)
-    s3.get_job_and_metadata_from_s3.assert_called_once_with(
+    s3.get_job_lines_and_metadata_from_s3.assert_called_once_with(
         service_id=str(sample_job.service.id), job_id=str(sample_job.id)
     )
-    assert mock_encrypt.call_args[0][0]["to"] == "+14254147755"
-    assert mock_encrypt.call_args[0][0]["template"] == str(sample_job.template.id)
-    assert (
-        mock_encrypt.call_args[0][0]["template_version"] == sample_job.template.version
-    )
-    assert mock_encrypt.call_args[0][0]["personalisation"] == {
-        "phonenumber": "+14254147755"
-    }
-    assert mock_encrypt.call_args[0][0]["row_number"] == 0
-    tasks.save_sms.apply_async.assert_called_once_with(
-        (str(sample_job.service_id), "uuid", ANY),
+    batch = mock_encrypt.call_args[0][0]
+    assert batch["template"] == str(sample_job.template.id)
+    assert batch["template_version"] == sample_job.template.version
+    assert batch["job"] == str(sample_job.id)
+    assert batch["rows"] == [
+        {
+            "id": "uuid",
+            "to": "+14254147755",
+            "row_number": 0,
+            "personalisation": {"phonenumber": "+14254147755"},
+        }
+    ]
+    tasks.save_sms_batch.apply_async.assert_called_once_with(
+        (str(sample_job.service_id), ANY),
         {},
         queue="database-tasks",
         expires=ANY,
@@ -129,16 +147,15 @@ def test_should_process_sms_job(sample_job, mocker):
 
 def test_should_process_sms_job_with_sender_id(sample_job, mocker, fake_uuid):
     mocker.patch(
-        "app.celery.tasks.s3.get_job_and_metadata_from_s3",
+        "app.celery.tasks.s3.get_job_lines_and_metadata_from_s3",
         return_value=(load_example_csv("sms"), {"sender_id": fake_uuid}),
     )
-    mocker.patch("app.celery.tasks.save_sms.apply_async")
-    mocker.patch("app.celery.tasks.create_uuid", return_value="uuid")
+    mocker.patch("app.celery.tasks.save_sms_batch.apply_async")
 
     process_job(sample_job.id, sender_id=fake_uuid)
 
-    tasks.save_sms.apply_async.assert_called_once_with(
-        (str(sample_job.service_id), "uuid", ANY),
+    tasks.save_sms_batch.apply_async.assert_called_once_with(
+        (str(sample_job.service_id), ANY),
         {"sender_id": fake_uuid},
         queue="database-tasks",
         expires=ANY,
@@ -148,13 +165,13 @@ def test_should_process_sms_job_with_sender_id(sample_job, mocker, fake_uuid):
 def test_should_not_process_job_if_already_pending(sample_template, mocker):
     job = create_job(template=sample_template, job_status=JobStatus.SCHEDULED)
 
-    mocker.patch("app.celery.tasks.s3.get_job_and_metadata_from_s3")
-    mocker.patch("app.celery.tasks.process_row")
+    mocker.patch("app.celery.tasks.s3.get_job_lines_and_metadata_from_s3")
+    mocker.patch("app.celery.tasks.process_rows")
 
     process_job(job.id)
 
-    assert s3.get_job_and_metadata_from_s3.called is False
-    assert tasks.process_row.called is False
+    assert s3.get_job_lines_and_metadata_from_s3.called is False
+    assert tasks.process_rows.called is False
 
 
 def test_should_process_job_if_send_limits_are_not_exceeded(
@@ -165,45 +182,44 @@ def test_should_process_job_if_send_limits_are_not_exceeded(
     job = create_job(template=template, notification_count=10)
 
     mocker.patch(
-        "app.celery.tasks.s3.get_job_and_metadata_from_s3",
+        "app.celery.tasks.s3.get_job_lines_and_metadata_from_s3",
         return_value=(load_example_csv("multiple_email"), {"sender_id": None}),
     )
-    mocker.patch("app.celery.tasks.save_email.apply_async")
-    mocker.patch("app.celery.tasks.create_uuid", return_value="uuid")
+    mocker.patch("app.celery.tasks.save_email_batch.apply_async")
     process_job(job.id)
 
-    s3.get_job_and_metadata_from_s3.assert_called_once_with(
+    s3.get_job_lines_and_metadata_from_s3.assert_called_once_with(
         service_id=str(job.service.id), job_id=str(job.id)
     )
     job = jobs_dao.dao_get_job_by_id(job.id)
     assert job.job_status == JobStatus.FINISHED
-    tasks.save_email.apply_async.assert_called_with(
+    tasks.save_email_batch.apply_async.assert_called_with(
         (
             str(job.service_id),
-            "uuid",
             ANY,
         ),
         {},
         queue="database-tasks",
         expires=ANY,
     )
+    assert len(_rows_in_batches(tasks.save_email_batch.apply_async)) == 10
 
 
 def test_should_not_create_save_task_for_empty_file(sample_job, mocker):
     mocker.patch(
-        "app.celery.tasks.s3.get_job_and_metadata_from_s3",
+        "app.celery.tasks.s3.get_job_lines_and_metadata_from_s3",
         return_value=(load_example_csv("empty"), {"sender_id": None}),
     )
-    mocker.patch("app.celery.tasks.save_sms.apply_async")
+    mocker.patch("app.celery.tasks.save_sms_batch.apply_async")
 
     process_job(sample_job.id)
 
-    s3.get_job_and_metadata_from_s3.assert_called_once_with(
+    s3.get_job_lines_and_metadata_from_s3.assert_called_once_with(
         service_id=str(sample_job.service.id), job_id=str(sample_job.id)
     )
     job = jobs_dao.dao_get_job_by_id(sample_job.id)
     assert job.job_status == JobStatus.FINISHED
-    assert tasks.save_sms.apply_async.called is False
+    assert tasks.save_sms_batch.apply_async.called is False
 
 
 def test_should_process_email_job(email_job_with_placeholders, mocker):
@@ -211,36 +227,37 @@ def test_should_process_email_job(email_job_with_placeholders, mocker):
     test@test.com,foo
     """
     mocker.patch(
-        "app.celery.tasks.s3.get_job_and_metadata_from_s3",
+        "app.celery.tasks.s3.get_job_lines_and_metadata_from_s3",
         return_value=(email_csv, {"sender_id": None}),
     )
-    mocker.patch("app.celery.tasks.save_email.apply_async")
+    mocker.patch("app.celery.tasks.save_email_batch.apply_async")
     mocker.patch("app.celery.tasks.create_uuid", return_value="uuid")
 
     mock_encrypt = mocker.patch("app.celery.tasks.encryption.encrypt")
 
     process_job(email_job_with_placeholders.id)
 
-    s3.get_job_and_metadata_from_s3.assert_called_once_with(
+    s3.get_job_lines_and_metadata_from_s3.assert_called_once_with(
         service_id=str(email_job_with_placeholders.service.id),
         job_id=str(email_job_with_placeholders.id),
     )
-    assert mock_encrypt.call_args[0][0]["to"] == "test@test.com"
-    assert mock_encrypt.call_args[0][0]["template"] == str(
-        email_job_with_placeholders.template.id
-    )
-    assert (
-        mock_encrypt.call_args[0][0]["template_version"]
-        == email_job_with_placeholders.template.version
-    )
-    assert mock_encrypt.call_args[0][0]["personalisation"] == {
-        "emailaddress": "test@test.com",
-        "name": "foo",
-    }
-    tasks.save_email.apply_async.assert_called_once_with(
+    batch = mock_encrypt.call_args[0][0]
+    assert batch["template"] == str(email_job_with_placeholders.template.id)
+    assert batch["template_version"] == email_job_with_placeholders.template.version
+    assert batch["rows"] == [
+        {
+            "id": "uuid",
+            "to": "test@test.com",
+            "row_number": 0,
+            "personalisation": {
+                "emailaddress": "test@test.com",
+                "name": "foo",
+            },
+        }
+    ]
+    tasks.save_email_batch.apply_async.assert_called_once_with(
         (
             str(email_job_with_placeholders.service_id),
-            "uuid",
             ANY,
         ),
         {},
@@ -258,16 +275,15 @@ def test_should_process_email_job_with_sender_id(
     test@test.com,foo
     """
     mocker.patch(
-        "app.celery.tasks.s3.get_job_and_metadata_from_s3",
+        "app.celery.tasks.s3.get_job_lines_and_metadata_from_s3",
         return_value=(email_csv, {"sender_id": fake_uuid}),
     )
-    mocker.patch("app.celery.tasks.save_email.apply_async")
-    mocker.patch("app.celery.tasks.create_uuid", return_value="uuid")
+    mocker.patch("app.celery.tasks.save_email_batch.apply_async")
 
     process_job(email_job_with_placeholders.id, sender_id=fake_uuid)
 
-    tasks.save_email.apply_async.assert_called_once_with(
-        (str(email_job_with_placeholders.service_id), "uuid", ANY),
+    tasks.save_email_batch.apply_async.assert_called_once_with(
+        (str(email_job_with_placeholders.service_id), ANY),
         {"sender_id": fake_uuid},
         queue="database-tasks",
         expires=ANY,
@@ -276,37 +292,45 @@ def test_should_process_email_job_with_sender_id(
 
 def test_should_process_all_sms_job(sample_job_with_placeholdered_template, mocker):
     mocker.patch(
-        "app.celery.tasks.s3.get_job_and_metadata_from_s3",
+        "app.celery.tasks.s3.get_job_lines_and_metadata_from_s3",
         return_value=(load_example_csv("multiple_sms"), {"sender_id": None}),
     )
-    mocker.patch("app.celery.tasks.save_sms.apply_async")
-    mocker.patch("app.celery.tasks.create_uuid", return_value="uuid")
-
-    mock_encrypt = mocker.patch("app.celery.tasks.encryption.encrypt")
+    mocker.patch("app.celery.tasks.save_sms_batch.apply_async")
 
     process_job(sample_job_with_placeholdered_template.id)
 
-    s3.get_job_and_metadata_from_s3.assert_called_once_with(
+    s3.get_job_lines_and_metadata_from_s3.assert_called_once_with(
         service_id=str(sample_job_with_placeholdered_template.service.id),
         job_id=str(sample_job_with_placeholdered_template.id),
     )
-    assert mock_encrypt.call_args[0][0]["to"] == "+14254147755"
-    assert mock_encrypt.call_args[0][0]["template"] == str(
-        sample_job_with_placeholdered_template.template.id
-    )
-    assert (
-        mock_encrypt.call_args[0][0]["template_version"]
-        == sample_job_with_placeholdered_template.template.version
-    )  # noqa
-    assert mock_encrypt.call_args[0][0]["personalisation"] == {
+    rows = _rows_in_batches(tasks.save_sms_batch.apply_async)
+    assert [row["row_number"] for row in rows] == list(range(10))
+    assert len({row["id"] for row in rows}) == 10
+    assert rows[0]["to"] == "+14254147755"
+    assert rows[0]["personalisation"] == {
         "phonenumber": "+14254147755",
         "name": "chris",
     }
-    assert tasks.save_sms.apply_async.call_count == 10
     job = jobs_dao.dao_get_job_by_id(sample_job_with_placeholdered_template.id)
     assert job.job_status == JobStatus.FINISHED
 
 
+def test_process_rows_in_batches_paces_each_batch(sample_job, mocker):
+    mock_process_rows = mocker.patch("app.celery.tasks.process_rows")
+    scheduler = Mock()
+    scheduler.batch_size.return_value = 4
+    rows = list(range(10))
+
+    process_rows_in_batches(rows, "template", sample_job, "service", scheduler)
+
+    assert scheduler.acquire.call_args_list == [call(4), call(4), call(2)]
+    assert [c[0][0] for c in mock_process_rows.call_args_list] == [
+        [0, 1, 2, 3],
+        [4, 5, 6, 7],
+        [8, 9],
+    ]
+
+
 # -------------- process_row tests -------------- #
 
 
@@ -439,7 +463,7 @@ def test_should_send_template_to_correct_sms_task_and_persist(
     assert persisted_notification.personalisation == {}
     assert persisted_notification.notification_type == NotificationType.SMS
     mocked_deliver_sms.assert_called_once_with(
-        [str(persisted_notification.id)], queue="send-sms-tasks", countdown=60
+        [str(persisted_notification.id)], queue="send-sms-tasks"
     )
 
 
@@ -480,7 +504,7 @@ def test_should_save_sms_if_restricted_service_and_valid_number(
     assert not persisted_notification.personalisation
     assert persisted_notification.notification_type == NotificationType.SMS
     provider_tasks.deliver_sms.apply_async.assert_called_once_with(
-        [str(persisted_notification.id)], queue="send-sms-tasks", countdown=60
+        [str(persisted_notification.id)], queue="send-sms-tasks"
     )
 
 
@@ -613,7 +637,7 @@ def test_should_save_sms_template_to_and_persist_with_job_id(sample_job, mocker)
     assert persisted_notification.notification_type == NotificationType.SMS
 
     provider_tasks.deliver_sms.apply_async.assert_called_once_with(
-        [str(persisted_notification.id)], queue="send-sms-tasks", countdown=60
+        [str(persisted_notification.id)], queue="send-sms-tasks"
     )
 
 
@@ -990,23 +1014,190 @@ def test_save_sms_uses_non_default_sms_sender_reply_to_text_if_provided(
     assert persisted_notification.reply_to_text == "new-sender"
 
 
+# -------- save_sms_batch and save_email_batch tests -------- #
+
+
+def _batch_json(job, rows):
+    return {
+        "template": str(job.template.id),
+        "template_version": job.template_version,
+        "job": str(job.id),
+        "rows": [
+            {
+                "id": str(uuid.uuid4()),
+                "to": to,
+                "row_number": row_number,
+                "personalisation": {},
+            }
+            for row_number, to in enumerate(rows)
+        ],
+    }
+
+
+def test_save_sms_batch_persists_rows_and_sends_them(sample_job, mocker):
+    deliver_sms_batch = mocker.patch(
+        "app.celery.provider_tasks.deliver_sms_batch.apply_async"
+    )
+    batch = _batch_json(sample_job, ["+14254147755", "+14254147167"])
+
+    save_sms_batch(str(sample_job.service_id), encryption.encrypt(batch))
+
+    notifications = (
+        db.session.execute(select(Notification).order_by(Notification.job_row_number))
+        .scalars()
+        .all()
+    )
+    assert [str(n.id) for n in notifications] == [row["id"] for row in batch["rows"]]
+    for notification in notifications:
+        assert notification.job_id == sample_job.id
+        assert notification.created_by_id == sample_job.created_by_id
+        assert notification.status == NotificationStatus.CREATED
+        assert notification.notification_type == NotificationType.SMS
+        assert notification.billable_units == 0
+        assert notification.to == "1"
+        assert notification.personalisation == {}
+        assert (
+            notification.reply_to_text
+            == sample_job.template.service.get_default_sms_sender()
+        )
+    deliver_sms_batch.assert_called_once_with([ANY], queue="send-sms-tasks")
+    assert sorted(deliver_sms_batch.call_args[0][0][0]) == sorted(
+        row["id"] for row in batch["rows"]
+    )
+
+
+def test_save_sms_batch_does_not_duplicate_a_redelivered_batch(sample_job, mocker):
+    deliver_sms_batch = mocker.patch(
+        "app.celery.provider_tasks.deliver_sms_batch.apply_async"
+    )
+    encrypted = encryption.encrypt(_batch_json(sample_job, ["+14254147755"]))
+
+    save_sms_batch(str(sample_job.service_id), encrypted)
+    save_sms_batch(str(sample_job.service_id), encrypted)
+
+    assert _get_notification_query_count() == 1
+    assert deliver_sms_batch.call_count == 1
+
+
+def test_save_sms_batch_saves_the_rest_of_a_batch_with_a_bad_row(sample_job, mocker):
+    deliver_sms_batch = mocker.patch(
+        "app.celery.provider_tasks.deliver_sms_batch.apply_async"
+    )
+    batch = _batch_json(sample_job, ["+14254147755", "12345", "+14254147167"])
+
+    save_sms_batch(str(sample_job.service_id), encryption.encrypt(batch))
+
+    saved = {
+        str(n.id) for n in db.session.execute(select(Notification)).scalars().all()
+    }
+    assert saved == {batch["rows"][0]["id"], batch["rows"][2]["id"]}
+    assert sorted(deliver_sms_batch.call_args[0][0][0]) == sorted(saved)
+
+
+def test_save_sms_batch_skips_rows_a_restricted_service_cannot_send_to(
+    notify_db_session, mocker
+):
+    user = create_user(mobile_number="+14254147755")
+    service = create_service(user=user, restricted=True)
+    template = create_template(service=service)
+    job = create_job(template)
+    deliver_sms_batch = mocker.patch(
+        "app.celery.provider_tasks.deliver_sms_batch.apply_async"
+    )
+    batch = _batch_json(job, ["+14254147755", "+12028675309"])
+
+    save_sms_batch(str(service.id), encryption.encrypt(batch))
+
+    notification = _get_notification_query_one()
+    assert str(notification.id) == batch["rows"][0]["id"]
+    deliver_sms_batch.assert_called_once_with(
+        [[batch["rows"][0]["id"]]], queue="send-sms-tasks"
+    )
+
+
+def test_save_sms_batch_uses_sms_sender_reply_to_text(notify_db_session, mocker):
+    service = create_service_with_defined_sms_sender(sms_sender_value="2028675309")
+    template = create_template(service=service)
+    job = create_job(template)
+    new_sender = service_sms_sender_dao.dao_add_sms_sender_for_service(
+        service.id, "new-sender", False
+    )
+    mocker.patch("app.celery.provider_tasks.deliver_sms_batch.apply_async")
+
+    save_sms_batch(
+        str(service.id),
+        encryption.encrypt(_batch_json(job, ["+14254147755"])),
+        sender_id=new_sender.id,
+    )
+
+    assert _get_notification_query_one().reply_to_text == "new-sender"
+
+
+def test_save_email_batch_persists_rows_and_sends_them(sample_email_template, mocker):
+    job = create_job(sample_email_template)
+    deliver_email = mocker.patch("app.celery.provider_tasks.deliver_email.apply_async")
+    batch = _batch_json(job, ["test1@test.com", "test2@test.com"])
+
+    save_email_batch(str(job.service_id), encryption.encrypt(batch))
+
+    assert _get_notification_query_count() == 2
+    assert deliver_email.call_args_list == [
+        call([row["id"]], queue="send-email-tasks") for row in batch["rows"]
+    ]
+
+
+def test_save_email_batch_uses_reply_to_text_when_sender_id_provided(
+    sample_email_template, mocker
+):
+    job = create_job(sample_email_template)
+    reply_to = create_reply_to_email(job.service, "reply@example.com")
+    mocker.patch("app.celery.provider_tasks.deliver_email.apply_async")
+
+    save_email_batch(
+        str(job.service_id),
+        encryption.encrypt(_batch_json(job, ["test@test.com"])),
+        sender_id=reply_to.id,
+    )
+
+    assert _get_notification_query_one().reply_to_text == "reply@example.com"
+
+
+def test_save_sms_batch_should_go_to_retry_queue_if_database_errors(sample_job, mocker):
+    deliver_sms_batch = mocker.patch(
+        "app.celery.provider_tasks.deliver_sms_batch.apply_async"
+    )
+    mocker.patch("app.celery.tasks.save_sms_batch.retry", side_effect=Retry)
+    mocker.patch(
+        "app.celery.tasks.dao_create_notifications", side_effect=SQLAlchemyError()
+    )
+
+    with pytest.raises(Retry):
+        save_sms_batch(
+            str(sample_job.service_id),
+            encryption.encrypt(_batch_json(sample_job, ["+14254147755"])),
+        )
+
+    assert not deliver_sms_batch.called
+    tasks.save_sms_batch.retry.assert_called_with(queue="retry-tasks", expires=ANY)
+
+
 def test_should_cancel_job_if_service_is_inactive(sample_service, sample_job, mocker):
     sample_service.active = False
 
     mocker.patch("app.celery.tasks.s3.get_job_from_s3")
-    mocker.patch("app.celery.tasks.process_row")
+    mocker.patch("app.celery.tasks.process_rows")
 
     process_job(sample_job.id)
 
     job = jobs_dao.dao_get_job_by_id(sample_job.id)
     assert job.job_status == JobStatus.CANCELLED
     s3.get_job_from_s3.assert_not_called()
-    tasks.process_row.assert_not_called()
+    tasks.process_rows.assert_not_called()
 
 
 def test_get_email_template_instance(mocker, sample_email_template, sample_job):
     mocker.patch(
-        "app.celery.tasks.s3.get_job_and_metadata_from_s3",
+        "app.celery.tasks.s3.get_job_lines_and_metadata_from_s3",
         return_value=("", {}),
     )
     sample_job.template_id = sample_email_template.id
@@ -1022,7 +1213,7 @@ def test_get_email_template_instance(mocker, sample_email_template, sample_job):
 
 def test_get_sms_template_instance(mocker, sample_template, sample_job):
     mocker.patch(
-        "app.celery.tasks.s3.get_job_and_metadata_from_s3",
+        "app.celery.tasks.s3.get_job_lines_and_metadata_from_s3",
         return_value=("", {}),
     )
     sample_job.template = sample_template
@@ -1179,10 +1370,13 @@ def test_send_inbound_sms_to_service_does_not_retries_if_request_returns_404(
 
 def test_process_incomplete_job_sms(mocker, sample_template):
     mocker.patch(
-        "app.celery.tasks.s3.get_job_and_metadata_from_s3",
-        return_value=(load_example_csv("multiple_sms"), {"sender_id": None}),
+        "app.celery.tasks.s3.get_job_lines_and_metadata_from_s3",
+        return_value=(
+            io.StringIO(load_example_csv("multiple_sms")),
+            {"sender_id": None},
+        ),
     )
-    save_sms = mocker.patch("app.celery.tasks.save_sms.apply_async")
+    save_sms = mocker.patch("app.celery.tasks.save_sms_batch.apply_async")
 
     job = create_job(
         template=sample_template,
@@ -1211,17 +1405,17 @@ def test_process_incomplete_job_sms(mocker, sample_template):
 
     assert completed_job.job_status == JobStatus.FINISHED
 
-    assert (
-        save_sms.call_count == 8
-    )  # There are 10 in the file and we've added two already
+    rows = _rows_in_batches(save_sms)
+    # There are 10 in the file and we've added two already
+    assert [row["row_number"] for row in rows] == list(range(2, 10))
 
 
 def test_process_incomplete_job_with_notifications_all_sent(mocker, sample_template):
     mocker.patch(
-        "app.celery.tasks.s3.get_job_and_metadata_from_s3",
+        "app.celery.tasks.s3.get_job_lines_and_metadata_from_s3",
         return_value=(load_example_csv("multiple_sms"), {"sender_id": None}),
     )
-    mock_save_sms = mocker.patch("app.celery.tasks.save_sms.apply_async")
+    mock_save_sms = mocker.patch("app.celery.tasks.save_sms_batch.apply_async")
 
     job = create_job(
         template=sample_template,
@@ -1264,10 +1458,10 @@ def test_process_incomplete_job_with_notifications_all_sent(mocker, sample_templ
 
 def test_process_incomplete_jobs_sms(mocker, sample_template):
     mocker.patch(
-        "app.celery.tasks.s3.get_job_and_metadata_from_s3",
+        "app.celery.tasks.s3.get_job_lines_and_metadata_from_s3",
         return_value=(load_example_csv("multiple_sms"), {"sender_id": None}),
     )
-    mock_save_sms = mocker.patch("app.celery.tasks.save_sms.apply_async")
+    mock_save_sms = mocker.patch("app.celery.tasks.save_sms_batch.apply_async")
 
     job = create_job(
         template=sample_template,
@@ -1324,16 +1518,16 @@ def test_process_incomplete_jobs_sms(mocker, sample_template):
     assert completed_job2.job_status == JobStatus.FINISHED
 
     assert (
-        mock_save_sms.call_count == 12
+        len(_rows_in_batches(mock_save_sms)) == 12
     )  # There are 20 in total over 2 jobs we've added 8 already
 
 
 def test_process_incomplete_jobs_no_notifications_added(mocker, sample_template):
     mocker.patch(
-        "app.celery.tasks.s3.get_job_and_metadata_from_s3",
+        "app.celery.tasks.s3.get_job_lines_and_metadata_from_s3",
         return_value=(load_example_csv("multiple_sms"), {"sender_id": None}),
     )
-    mock_save_sms = mocker.patch("app.celery.tasks.save_sms.apply_async")
+    mock_save_sms = mocker.patch("app.celery.tasks.save_sms_batch.apply_async")
 
     job = create_job(
         template=sample_template,
@@ -1356,15 +1550,15 @@ def test_process_incomplete_jobs_no_notifications_added(mocker, sample_template)
 
     assert completed_job.job_status == JobStatus.FINISHED
 
-    assert mock_save_sms.call_count == 10  # There are 10 in the csv file
+    assert len(_rows_in_batches(mock_save_sms)) == 10  # There are 10 in the csv file
 
 
 def test_process_incomplete_jobs(mocker):
     mocker.patch(
-        "app.celery.tasks.s3.get_job_and_metadata_from_s3",
+        "app.celery.tasks.s3.get_job_lines_and_metadata_from_s3",
         return_value=(load_example_csv("multiple_sms"), {"sender_id": None}),
     )
-    mock_save_sms = mocker.patch("app.celery.tasks.save_sms.apply_async")
+    mock_save_sms = mocker.patch("app.celery.tasks.save_sms_batch.apply_async")
 
     jobs = []
     process_incomplete_jobs(jobs)
@@ -1376,10 +1570,10 @@ def test_process_incomplete_jobs(mocker):
 
 def test_process_incomplete_job_no_job_in_database(mocker, fake_uuid):
     mocker.patch(
-        "app.celery.tasks.s3.get_job_and_metadata_from_s3",
+        "app.celery.tasks.s3.get_job_lines_and_metadata_from_s3",
         return_value=(load_example_csv("multiple_sms"), {"sender_id": None}),
     )
-    mock_save_sms = mocker.patch("app.celery.tasks.save_sms.apply_async")
+    mock_save_sms = mocker.patch("app.celery.tasks.save_sms_batch.apply_async")
 
     with pytest.raises(expected_exception=Exception):
         process_incomplete_job(fake_uuid)
@@ -1391,10 +1585,10 @@ def test_process_incomplete_job_no_job_in_database(mocker, fake_uuid):
 
 def test_process_incomplete_job_email(mocker, sample_email_template):
     mocker.patch(
-        "app.celery.tasks.s3.get_job_and_metadata_from_s3",
+        "app.celery.tasks.s3.get_job_lines_and_metadata_from_s3",
         return_value=(load_example_csv("multiple_email"), {"sender_id": None}),
     )
-    mock_email_saver = mocker.patch("app.celery.tasks.save_email.apply_async")
+    mock_email_saver = mocker.patch("app.celery.tasks.save_email_batch.apply_async")
 
     job = create_job(
         template=sample_email_template,
@@ -1423,7 +1617,7 @@ def test_process_incomplete_job_email(mocker, sample_email_template):
     assert completed_job.job_status == JobStatus.FINISHED
 
     assert (
-        mock_email_saver.call_count == 8
+        len(_rows_in_batches(mock_email_saver)) == 8
     )  # There are 10 in the file and we've added two already
 
 
@@ -1796,93 +1990,188 @@ def test_save_api_email_or_sms_sqlalchemy_error_with_max_retries():
         assert "Max retry failed" in mock_exception.call_args[0][0]
 
 
-def get_mock_notification():
-    notif = MagicMock()
-    notif.job_id = "job-id"
-    notif.service_id = "service-id"
-    notif.job_row_number = 5
-    notif.serialize_for_csv.return_value = {
-        "recipient": "1234567890",
-        "template_name": "Test Template",
-        "created_by_name": "Tester",
-        "carrier": "TestCarrier",
-        "status": "delivered",
-        "created_at": "2025-08-10T12:00:00",
-        "job_name": "Job A",
-        "provider_response": "Success",
+@pytest.fixture
+def uploaded_reports(mocker):
+    reports = {}
+
+    def upload(fileobj, bucket_name, file_location, content_type):
+        reports[file_location] = fileobj.read().decode("utf-8").splitlines()
+
+    mocker.patch("app.aws.s3.s3upload_fileobj", side_effect=upload)
+    return reports
+
+
+def _report_location(service, limit_days):
+    return f"{service.id}-service-notify/{limit_days}-day-report.csv"
+
+
+@freeze_time("2025-08-10 12:00")
+def test_generate_notifications_reports_writes_every_window_in_one_pass(
+    sample_template, uploaded_reports, mocker
+):
+    mock_delete = mocker.patch("app.aws.s3.delete_s3_object")
+    mocker.patch("app.aws.s3.get_phone_number_from_s3", return_value="+12028675309")
+    dao_spy = mocker.spy(tasks.notifications_dao, "dao_get_notifications_for_report")
+    job = create_job(sample_template, original_file_name="batch.csv")
+    create_notification(sample_template, created_at=datetime(2025, 8, 10, 9))
+    create_notification(
+        job=job, job_row_number=0, created_at=datetime(2025, 8, 8, 9, 30)
+    )
+    create_notification(sample_template, created_at=datetime(2025, 8, 4, 9))
+    create_notification(sample_template, created_at=datetime(2025, 7, 30, 9))
+    create_notification(
+        sample_template, created_at=datetime(2025, 8, 10, 10), key_type=KeyType.TEST
+    )
+
+    counts = _generate_notifications_reports(sample_template.service_id)
+
+    assert counts == {1: 1, 3: 2, 5: 2, 7: 3}
+    dao_spy.assert_called_once_with(sample_template.service_id, 7)
+    mock_delete.assert_not_called()
+    service = sample_template.service
+    assert uploaded_reports[_report_location(service, 1)] == [
+        "Phone Number,Template,Sent By,Carrier,Status,Time,Batch File,Carrier Response",
+        ",Template Name,,,Sending,2025-08-10 09:00:00,,",
+    ]
+    assert uploaded_reports[_report_location(service, 3)][1:] == [
+        ",Template Name,,,Sending,2025-08-10 09:00:00,,",
+        "+12028675309,Template Name,,,Sending,2025-08-08 09:30:00,batch.csv,",
+    ]
+    assert (
+        uploaded_reports[_report_location(service, 5)]
+        == uploaded_reports[_report_location(service, 3)]
+    )
+    assert uploaded_reports[_report_location(service, 7)][3] == (
+        ",Template Name,,,Sending,2025-08-04 09:00:00,,"
+    )
+
+
+@freeze_time("2025-08-10 12:00")
+def test_generate_notifications_reports_deletes_reports_with_nothing_in_them(
+    sample_template, uploaded_reports, mocker
+):
+    mock_delete = mocker.patch("app.aws.s3.delete_s3_object")
+    create_notification(sample_template, created_at=datetime(2025, 8, 5, 9))
+
+    counts = _generate_notifications_reports(sample_template.service_id)
+
+    assert counts == {1: 0, 3: 0, 5: 1, 7: 1}
+    service = sample_template.service
+    assert mock_delete.call_args_list == [
+        call(_report_location(service, 1)),
+        call(_report_location(service, 3)),
+    ]
+    assert set(uploaded_reports) == {
+        _report_location(service, 5),
+        _report_location(service, 7),
     }
-    return notif
-
-
-@patch("app.dao.notifications_dao.get_notifications_for_service")
-@patch("app.aws.s3.get_personalisation_from_s3")
-@patch("app.aws.s3.get_phone_number_from_s3")
-@patch("app.celery.tasks.get_csv_location")
-@patch("app.aws.s3.s3upload")
-@patch("app.aws.s3.delete_s3_object")
-@patch("app.celery.tasks.current_app")
-def test_generate_notifications_report_normal_case(
-    mock_current_app,
-    mock_delete,
-    mock_upload,
-    mock_get_csv_location,
-    mock_get_phone_number,
-    mock_get_personalisation,
-    mock_get_notifications,
-    notify_api,
+
+
+@freeze_time("2025-08-10 12:00")
+def test_generate_notifications_reports_stops_once_every_report_is_full(
+    sample_template, uploaded_reports, mocker
 ):
+    mocker.patch("app.aws.s3.delete_s3_object")
+    mocker.patch("app.celery.tasks.NOTIFICATION_REPORT_MAX_ROWS", 2)
+    for day in (10, 8, 6, 5):
+        create_notification(sample_template, created_at=datetime(2025, 8, day, 9))
+
+    counts = _generate_notifications_reports(sample_template.service_id)
+
+    assert counts == {1: 1, 3: 2, 5: 2, 7: 2}
+    assert len(uploaded_reports[_report_location(sample_template.service, 7)]) == 3
 
-    mock_get_notifications.return_value.items = [get_mock_notification()]
-    mock_get_phone_number.return_value = "1234567890"
-    mock_get_personalisation.return_value = {"name": "John"}
-    mock_get_csv_location.return_value = (
-        "my-bucket",
-        "some/file/location.csv",
-        "access",
-        "sekret",
-        "region",
+
+@pytest.fixture
+def report_watermarks(mocker):
+    watermarks = {}
+    mock_redis = mocker.patch("app.celery.tasks.redis_store")
+    mock_redis.get.side_effect = lambda key: watermarks.get(key)
+    mock_redis.set.side_effect = lambda key, value, ex: watermarks.update(
+        {key: value.encode("utf-8")}
     )
+    return watermarks
 
-    mock_current_app.config = {
-        "CSV_UPLOAD_BUCKET": {"bucket": "my-bucket", "region": "region"}
-    }
 
-    _generate_notifications_report("service-id", "report-id", 7)
+def test_generate_notification_reports_for_service_skips_unchanged_services(
+    sample_template, report_watermarks, mocker
+):
+    generate_mock = mocker.patch(
+        "app.celery.tasks._generate_notifications_reports", return_value={}
+    )
+    create_notification(sample_template)
+
+    generate_notification_reports_for_service(sample_template.service_id)
+    generate_notification_reports_for_service(sample_template.service_id)
+
+    generate_mock.assert_called_once_with(sample_template.service_id)
+
+
+def test_generate_notification_reports_for_service_runs_again_after_a_change(
+    sample_template, report_watermarks, mocker
+):
+    generate_mock = mocker.patch(
+        "app.celery.tasks._generate_notifications_reports", return_value={}
+    )
+    notification = create_notification(sample_template)
+    generate_notification_reports_for_service(sample_template.service_id)
+
+    notification.status = NotificationStatus.DELIVERED
+    db.session.commit()
+    generate_notification_reports_for_service(sample_template.service_id)
+
+    assert generate_mock.call_count == 2
+
+
+def test_generate_notification_reports_for_service_runs_again_after_a_delivery_receipt(
+    sample_template, report_watermarks, mocker
+):
+    generate_mock = mocker.patch(
+        "app.celery.tasks._generate_notifications_reports", return_value={}
+    )
+    notification = create_notification(
+        sample_template, status=NotificationStatus.PENDING, sent_at=utc_now()
+    )
+    notification.message_id = "message-1"
+    db.session.commit()
+    generate_notification_reports_for_service(sample_template.service_id)
+
+    dao_update_delivery_receipts(
+        [DeliveryReceipt("message-1", "DELIVERED", "carrier", "", None, 0.0)], True
+    )
+    generate_notification_reports_for_service(sample_template.service_id)
+    generate_notification_reports_for_service(sample_template.service_id)
+
+    assert generate_mock.call_count == 2
+    assert db.session.get(Notification, notification.id).updated_at is not None
+
+
+def test_generate_notification_reports_for_service_skips_idle_services_on_later_days(
+    sample_service, report_watermarks, mocker
+):
+    generate_mock = mocker.patch(
+        "app.celery.tasks._generate_notifications_reports", return_value={}
+    )
 
-    mock_get_personalisation.assert_called_once()
-    mock_get_phone_number.assert_called_once()
+    with freeze_time("2025-08-10 01:00"):
+        generate_notification_reports_for_service(sample_service.id)
+    with freeze_time("2025-08-11 01:00"):
+        generate_notification_reports_for_service(sample_service.id)
 
-    mock_upload.assert_called_once()
-    args, kwargs = mock_upload.call_args
-    assert kwargs["bucket_name"] == "my-bucket"
-    assert kwargs["file_location"] == "some/file/location.csv"
-    assert isinstance(kwargs["filedata"], io.BytesIO)
+    generate_mock.assert_called_once_with(sample_service.id)
 
 
-@patch("app.aws.s3.delete_s3_object")
-@patch("app.celery.tasks.get_csv_location")
-@patch("app.dao.notifications_dao.get_notifications_for_service")
-@patch("app.celery.tasks.current_app")
-def test_generate_notifications_report_no_notifications(
-    mock_current_app,
-    mock_get_notifications,
-    mock_get_csv_location,
-    mock_delete_s3,
-    notify_api,
+def test_generate_notification_reports_task_queues_each_active_service(
+    sample_service, mocker
 ):
-    mock_get_notifications.return_value.items = []
-    mock_get_csv_location.return_value = (
-        "bucket",
-        "service-id-service-notify/report-id.csv",
-        "access",
-        "secret",
-        "region",
+    inactive = create_service(service_name="inactive", active=False)
+    apply_async = mocker.patch(
+        "app.celery.tasks.generate_notification_reports_for_service.apply_async"
     )
 
-    _generate_notifications_report("service-id", "report-id", 7)
+    generate_notification_reports_task()
 
-    mock_current_app.logger.info.assert_any_call("SKIP service-id")
-    mock_delete_s3.assert_called_once_with("service-id-service-notify/report-id.csv")
-    mock_current_app.logger.info.assert_any_call(
-        "Deleted stale report service-id-service-notify/report-id.csv - no new data"
+    apply_async.assert_called_once_with(
+        [str(sample_service.id)], queue=QueueNames.PERIODIC
     )
+    assert str(inactive.id) not in str(apply_async.call_args_list)
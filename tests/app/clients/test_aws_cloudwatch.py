@@ -1,13 +1,17 @@
 import json
 
 # import os
-from datetime import datetime, timedelta
-from unittest.mock import MagicMock, patch
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, call, patch
 
 import pytest
 from flask import current_app
 
-from app.clients.cloudwatch.aws_cloudwatch import AwsCloudwatchClient
+from app.clients.cloudwatch.aws_cloudwatch import (
+    AwsCloudwatchClient,
+    DeliveryReceipt,
+    warn_if_out_of_quota,
+)
 
 
 def test_check_sms_no_event_error_condition(notify_api, mocker):
@@ -80,7 +84,7 @@ def test_extract_account_number_gov_staging():
     assert actual_account_number[4] == expected_account_number
 
 
-def test_event_to_db_format_with_missing_fields():
+def test_event_to_receipt_with_missing_fields():
     client = AwsCloudwatchClient()
     client.init_app(current_app)
 
@@ -89,18 +93,18 @@ def test_event_to_db_format_with_missing_fields():
         "status": "UNKNOWN",
         "delivery": {},
     }
-    result = client.event_to_db_format(event)
-    assert result == {
-        "notification.messageId": "12345",
-        "status": "UNKNOWN",
-        "delivery.phoneCarrier": "",
-        "delivery.providerResponse": "",
-        "delivery.priceInUSD": 0.0,
-        "@timestamp": "",
-    }
+    result = client.event_to_receipt(event)
+    assert result == DeliveryReceipt(
+        message_id="12345",
+        status="UNKNOWN",
+        carrier="",
+        provider_response="",
+        timestamp=None,
+        price_in_usd=0.0,
+    )
 
 
-def test_event_to_db_format_with_string_input():
+def test_event_to_receipt_with_string_input():
     event = json.dumps(
         {
             "notification": {"messageId": "67890", "timestamp": "2024-01-01T14:00:00Z"},
@@ -115,15 +119,15 @@ def test_event_to_db_format_with_string_input():
     client = AwsCloudwatchClient()
     client.init_app(current_app)
 
-    result = client.event_to_db_format(event)
-    assert result == {
-        "notification.messageId": "67890",
-        "status": "FAILED",
-        "delivery.phoneCarrier": "Verizon",
-        "delivery.providerResponse": "Error",
-        "delivery.priceInUSD": 0.00881,
-        "@timestamp": "2024-01-01T14:00:00Z",
-    }
+    result = client.event_to_receipt(event)
+    assert result == DeliveryReceipt(
+        message_id="67890",
+        status="FAILED",
+        carrier="Verizon",
+        provider_response="Error",
+        timestamp="2024-01-01T14:00:00Z",
+        price_in_usd=0.00881,
+    )
 
 
 @pytest.fixture
@@ -150,28 +154,28 @@ def test_warn_if_dev_is_opted_out():
     # del os.environ["NOTIFY_ENVIRONMENT"]
 
 
-def test_event_to_db_format(fake_event):
+def test_event_to_receipt(fake_event):
     client = AwsCloudwatchClient()
-    result = client.event_to_db_format(fake_event)
-    assert result["notification.messageId"] == "abc123"
-    assert result["status"] == "DELIVERED"
-    assert result["delivery.phoneCarrier"] == "Verizon"
-    assert result["delivery.providerResponse"] == "Success"
-    assert result["delivery.priceInUSD"] == 0.006
+    result = client.event_to_receipt(fake_event)
+    assert result.message_id == "abc123"
+    assert result.status == "DELIVERED"
+    assert result.carrier == "Verizon"
+    assert result.provider_response == "Success"
+    assert result.price_in_usd == 0.006
 
 
-def test_event_to_db_format_with_str(fake_event):
+def test_event_to_receipt_with_str(fake_event):
     client = AwsCloudwatchClient()
     event_str = json.dumps(fake_event)
-    result = client.event_to_db_format(event_str)
-    assert result["delivery.priceInUSD"] == 0.006
+    result = client.event_to_receipt(event_str)
+    assert result.price_in_usd == 0.006
 
 
-def test_event_to_db_Format_missing_price(fake_event):
+def test_event_to_receipt_missing_price(fake_event):
     client = AwsCloudwatchClient()
     fake_event["delivery"]["priceInUSD"] = ""
-    result = client.event_to_db_format(fake_event)
-    assert result["delivery.priceInUSD"] == 0.0
+    result = client.event_to_receipt(fake_event)
+    assert result.price_in_usd == 0.0
 
 
 def test_aws_value_or_default():
@@ -199,43 +203,69 @@ def test_get_log_with_pagination(mock_client):
         {"events": [{"message": "msg2"}]},
     ]
 
-    start = datetime.utcnow() - timedelta(minutes=5)
-    end = datetime.utcnow()
+    start = datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc)
+    end = datetime(2024, 1, 1, 12, 5, tzinfo=timezone.utc)
 
     logs = client._get_log("log-group", start, end)
+    assert mock_client.filter_log_events.call_count == 0
+
+    logs = list(logs)
     assert len(logs) == 2
     assert logs[0]["message"] == "msg1"
     assert logs[1]["message"] == "msg2"
+    assert mock_client.filter_log_events.call_args_list == [
+        call(logGroupName="log-group", startTime=1704110400000, endTime=1704110699999),
+        call(
+            logGroupName="log-group",
+            startTime=1704110400000,
+            endTime=1704110699999,
+            nextToken="abc",
+        ),
+    ]
+
+
+def _receipt_event(message_id, provider_response="V"):
+    return {
+        "message": json.dumps(
+            {
+                "notification": {"messageId": message_id, "timestamp": "t"},
+                "status": "DELIVERED",
+                "delivery": {
+                    "phoneCarrier": "x",
+                    "providerResponse": provider_response,
+                    "priceInUSD": "0.1",
+                },
+            }
+        )
+    }
 
 
-# @patch("app.clients.cloudwatch.aws_cloudwatch.current_app")
 def test_get_receipts():
     client = AwsCloudwatchClient()
     client._get_log = MagicMock(
-        return_value=[
-            {
-                "message": json.dumps(
-                    {
-                        "notification": {"messageId": "abc", "timestamp": "t"},
-                        "status": "DELIVERED",
-                        "delivery": {
-                            "phoneCarrier": "x",
-                            "providerResponse": "V",
-                            "priceInUSD": "0.1",
-                        },
-                    }
-                )
-            }
-        ]
+        return_value=iter(
+            [
+                _receipt_event("abc", "first"),
+                {"message": "not json"},
+                _receipt_event("def"),
+                _receipt_event("abc", "again"),
+            ]
+        )
     )
 
     result = client._get_receipts("group", datetime.utcnow(), datetime.utcnow())
-    assert len(result) == 1
-    event = json.loads(list(result)[0])
-    assert event["status"] == "DELIVERED"
+
+    assert [(r.message_id, r.provider_response) for r in result] == [
+        ("abc", "again"),
+        ("def", "V"),
+    ]
+    assert result[0].status == "DELIVERED"
+
+
+def _receipt(message_id, provider_response="V"):
+    return DeliveryReceipt(message_id, "DELIVERED", "x", provider_response, "t", 0.1)
 
 
-# @patch("app.clients.cloudwatch.aws_cloudwatch.current_app")
 @patch("app.clients.cloudwatch.aws_cloudwatch.cloud_config")
 def test_check_delivery_receipts(mock_cloud_config):
     client = AwsCloudwatchClient()
@@ -243,14 +273,25 @@ def test_check_delivery_receipts(mock_cloud_config):
     mock_cloud_config.ses_domain_arn = (
         "arn:aws:ses:us-north-1:123456789012:identity/example.com"
     )
-    client._get_receipts = MagicMock(
-        side_effect=[{"delivered1", "delivered2"}, {"failed1"}]
-    )
+    delivered_receipts = [_receipt("delivered1"), _receipt("delivered2")]
+    failed_receipts = [_receipt("failed1")]
+    client._get_receipts = MagicMock(side_effect=[delivered_receipts, failed_receipts])
 
     start = datetime.utcnow() - timedelta(minutes=10)
     end = datetime.utcnow()
 
     delivered, failed = client.check_delivery_receipts(start, end)
 
-    assert delivered == {"delivered1", "delivered2"}
-    assert failed == {"failed1"}
+    assert delivered == delivered_receipts
+    assert failed == failed_receipts
+
+
+@pytest.mark.parametrize(
+    "provider_response, warned", [("No quota left for account", True), ("V", False)]
+)
+def test_warn_if_out_of_quota(notify_api, mocker, provider_response, warned):
+    warning_mock = mocker.patch.object(notify_api.logger, "warning")
+
+    warn_if_out_of_quota([_receipt("failed1", provider_response)])
+
+    assert warning_mock.called is warned
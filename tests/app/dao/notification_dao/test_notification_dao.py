@@ -5,30 +5,36 @@ from unittest.mock import ANY, MagicMock, patch
 
 import pytest
 from freezegun import freeze_time
-from sqlalchemy import func, select
+from sqlalchemy import event, func, select
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.orm.exc import NoResultFound
 
 from app import db
+from app.clients.cloudwatch.aws_cloudwatch import DeliveryReceipt
 from app.dao.notifications_dao import (
+    dao_batch_insert_notifications,
     dao_close_out_delivery_receipts,
     dao_create_notification,
+    dao_create_notifications,
     dao_delete_notifications_by_id,
     dao_get_last_notification_added_for_job_id,
     dao_get_notification_by_reference,
     dao_get_notification_count_for_job_id,
     dao_get_notification_count_for_service,
     dao_get_notification_count_for_service_message_ratio,
+    dao_get_notification_csv_rows,
     dao_get_notification_history_by_reference,
     dao_get_notifications_by_recipient_or_reference,
     dao_timeout_notifications,
     dao_update_delivery_receipts,
     dao_update_notification,
     dao_update_notifications_by_reference,
+    dao_update_notifications_to_sending,
     get_notification_by_id,
     get_notification_with_personalisation,
     get_notifications_for_job,
     get_notifications_for_service,
+    get_page_of_notifications_for_service,
     get_recent_notifications_for_job,
     get_service_ids_with_notifications_on_date,
     notifications_not_yet_sent,
@@ -43,7 +49,7 @@ from app.enums import (
     NotificationType,
 )
 from app.models import Job, Notification, NotificationHistory
-from app.utils import utc_now
+from app.utils import encode_cursor, utc_now
 from tests.app.db import (
     create_ft_notification_status,
     create_job,
@@ -452,6 +458,57 @@ def test_save_notification_creates_sms(sample_template, sample_job):
     assert notification_from_db.status == NotificationStatus.CREATED
 
 
+def test_create_notifications_inserts_all_and_returns_their_ids(
+    sample_template, sample_job
+):
+    notifications = [
+        Notification(
+            **_notification_json(sample_template, job_id=sample_job.id),
+            id=uuid.uuid4(),
+            job_row_number=row_number,
+        )
+        for row_number in range(3)
+    ]
+
+    inserted_ids = dao_create_notifications(notifications)
+
+    assert set(inserted_ids) == {n.id for n in notifications}
+    for notification_from_db in _get_notification_query_all():
+        assert notification_from_db.to == "1"
+        assert notification_from_db.normalised_to == "1"
+        assert notification_from_db.personalisation == {}
+        assert notification_from_db.status == NotificationStatus.CREATED
+        assert notification_from_db.international is False
+
+
+def test_create_notifications_skips_notifications_that_already_exist(
+    sample_template, sample_job
+):
+    existing = create_notification(sample_template, job=sample_job, job_row_number=0)
+    notifications = [
+        Notification(**_notification_json(sample_template, id=existing.id)),
+        Notification(**_notification_json(sample_template, id=uuid.uuid4())),
+    ]
+
+    inserted_ids = dao_create_notifications(notifications)
+
+    assert inserted_ids == [notifications[1].id]
+    assert _get_notification_query_count() == 2
+
+
+def test_batch_insert_notifications_keeps_recipients_and_skips_existing(
+    sample_template,
+):
+    existing = create_notification(sample_template)
+    notification = Notification(**_notification_json(sample_template, id=uuid.uuid4()))
+
+    assert dao_batch_insert_notifications([existing, notification]) == [notification.id]
+    assert dao_batch_insert_notifications([]) == []
+
+    assert _get_notification_query_count() == 2
+    assert db.session.get(Notification, notification.id).to == "+44709123456"
+
+
 def _get_notification_query_all():
     stmt = select(Notification)
     return db.session.execute(stmt).scalars().all()
@@ -722,6 +779,100 @@ def test_get_all_notifications_for_job_by_status(sample_job):
     )
 
 
+def _walk_pages(get_page):
+    pages = []
+    cursor = None
+    while True:
+        items, cursor = get_page(cursor)
+        pages.append(items)
+        if cursor is None:
+            return pages
+
+
+def test_get_page_of_notifications_for_service_follows_cursors(sample_template):
+    with freeze_time("2024-01-01 12:00"):
+        same_time = [create_notification(sample_template) for _ in range(3)]
+    with freeze_time("2024-01-01 13:00"):
+        newest = create_notification(sample_template)
+    oldest = create_notification(sample_template, created_at=datetime(2024, 1, 1, 11))
+    expected = [newest] + sorted(same_time, key=lambda n: n.id, reverse=True) + [oldest]
+
+    pages = _walk_pages(
+        lambda cursor: get_page_of_notifications_for_service(
+            sample_template.service_id, page_size=2, cursor=cursor
+        )
+    )
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [n.id for page in pages for n in page] == [n.id for n in expected]
+
+
+def test_get_page_of_notifications_for_service_by_page_number(sample_template):
+    for hour in range(5):
+        create_notification(sample_template, created_at=datetime(2024, 1, 1, hour))
+
+    items, cursor = get_page_of_notifications_for_service(
+        sample_template.service_id, page=3, page_size=2
+    )
+
+    assert [n.created_at.hour for n in items] == [0]
+    assert cursor is None
+
+
+def test_get_page_of_notifications_for_service_without_a_next_page(sample_template):
+    create_notification(sample_template)
+
+    items, cursor = get_page_of_notifications_for_service(
+        sample_template.service_id, page_size=1
+    )
+
+    assert len(items) == 1
+    assert cursor is None
+
+
+@pytest.mark.parametrize("cursor", ["rubbish", encode_cursor(1), encode_cursor(1, 2)])
+def test_get_page_of_notifications_for_service_rejects_bad_cursors(
+    sample_template, cursor
+):
+    with pytest.raises(ValueError):
+        get_page_of_notifications_for_service(sample_template.service_id, cursor=cursor)
+
+
+@pytest.mark.parametrize(
+    "get_page, expected_rows",
+    [
+        (get_notifications_for_job, [0, 1, 2, 3, 4]),
+        (get_recent_notifications_for_job, [4, 3, 2, 1, 0]),
+    ],
+)
+def test_notifications_for_job_follow_cursors(sample_job, get_page, expected_rows):
+    for row in (3, 0, 4, 1, 2):
+        create_notification(job=sample_job, job_row_number=row)
+
+    def get_job_page(cursor):
+        pagination = get_page(
+            sample_job.service_id, sample_job.id, page_size=2, cursor=cursor
+        )
+        return pagination.items, pagination.next_cursor
+
+    pages = _walk_pages(get_job_page)
+
+    assert [n.job_row_number for page in pages for n in page] == expected_rows
+
+
+def test_get_notifications_for_job_counts_every_page(sample_job):
+    for row in range(3):
+        create_notification(job=sample_job, job_row_number=row)
+
+    pagination = get_notifications_for_job(
+        sample_job.service_id, sample_job.id, page=2, page_size=2
+    )
+
+    assert [n.job_row_number for n in pagination.items] == [2]
+    assert pagination.total == 3
+    assert pagination.next_cursor is None
+
+
 def test_dao_get_notification_count_for_job_id(notify_db_session):
     service = create_service()
     template = create_template(service)
@@ -1438,11 +1589,49 @@ def test_notifications_not_yet_sent_return_no_rows(sample_service, notification_
     assert len(results) == 0
 
 
+def test_dao_get_notification_csv_rows_serialize_like_serialize_for_csv(
+    sample_job, sample_email_template, sample_user
+):
+    notifications = [
+        create_notification(
+            sample_email_template,
+            created_by_id=sample_user.id,
+            status=NotificationStatus.PERMANENT_FAILURE,
+        ),
+        create_notification(job=sample_job, job_row_number=2, client_reference="ref"),
+        create_notification(sample_email_template),
+    ]
+    notification_ids = [n.id for n in notifications]
+    statements = []
+
+    def count_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count_statement)
+    try:
+        rows = dao_get_notification_csv_rows(notification_ids)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count_statement)
+
+    assert len(statements) == 1
+    assert [Notification.serialize_row_for_csv(row) for row in rows] == [
+        n.serialize_for_csv() for n in notifications
+    ]
+
+
+def test_dao_get_notification_csv_rows_of_an_empty_page():
+    assert dao_get_notification_csv_rows([]) == []
+
+
 def test_update_delivery_receipts(mocker):
     mock_session = mocker.patch("app.dao.notifications_dao.db.session")
     receipts = [
-        '{"notification.messageId": "msg1", "delivery.phoneCarrier": "carrier1", "delivery.providerResponse": "resp1", "@timestamp": "2024-01-01T12:00:00", "delivery.priceInUSD": "0.00881"}',  # noqa
-        '{"notification.messageId": "msg2", "delivery.phoneCarrier": "carrier2", "delivery.providerResponse": "resp2", "@timestamp": "2024-01-01T13:00:00", "delivery.priceInUSD": "0.00881"}',  # noqa
+        DeliveryReceipt(
+            "msg1", "DELIVERED", "carrier1", "resp1", "2024-01-01T12:00:00", 0.00881
+        ),
+        DeliveryReceipt(
+            "msg2", "DELIVERED", "carrier2", "resp2", "2024-01-01T13:00:00", 0.00881
+        ),
     ]
     delivered = True
     mock_update = MagicMock()
@@ -1451,9 +1640,9 @@ def test_update_delivery_receipts(mocker):
     mock_update.where.return_value = mock_where
     mock_where.values.return_value = mock_values
 
-    mock_session.execute.return_value = None
+    mock_session.execute.return_value = MagicMock(rowcount=2)
     with patch("app.dao.notifications_dao.update", return_value=mock_update):
-        dao_update_delivery_receipts(receipts, delivered)
+        assert dao_update_delivery_receipts(receipts, delivered) == 2
     mock_update.where.assert_called_once()
     mock_where.values.assert_called_once()
     mock_session.execute.assert_called_once_with(mock_values)
@@ -1466,6 +1655,97 @@ def test_update_delivery_receipts(mocker):
     assert "provider_response" in kwargs
 
 
+@pytest.mark.parametrize(
+    "delivered, expected_status",
+    [(True, NotificationStatus.DELIVERED), (False, NotificationStatus.FAILED)],
+)
+def test_update_delivery_receipts_joins_receipts_to_notifications(
+    sample_template, delivered, expected_status
+):
+    first = create_notification(sample_template, status=NotificationStatus.SENDING)
+    second = create_notification(sample_template, status=NotificationStatus.SENDING)
+    untouched = create_notification(sample_template, status=NotificationStatus.SENDING)
+    first.message_id, second.message_id, untouched.message_id = "msg1", "msg2", "msg3"
+    db.session.commit()
+
+    def receipt(message_id, carrier, timestamp):
+        return DeliveryReceipt(
+            message_id=message_id,
+            status="DELIVERED" if delivered else "FAILED",
+            carrier=carrier,
+            provider_response=f"response from {carrier}",
+            timestamp=timestamp,
+            price_in_usd=0.00881,
+        )
+
+    receipts = [
+        receipt("msg1", "carrier1", "2024-01-01 12:00:00"),
+        receipt("msg2", "carrier2", "2024-01-01 13:00:00"),
+        # seen again in a later search
+        receipt("msg1", "carrier1", "2024-01-01 12:00:01"),
+        # not one of ours
+        receipt("msg4", "carrier4", "2024-01-01 14:00:00"),
+    ]
+
+    assert dao_update_delivery_receipts(receipts, delivered) == 2
+
+    db.session.expire_all()
+    assert first.status == expected_status
+    assert first.carrier == "carrier1"
+    assert first.provider_response == "response from carrier1"
+    assert first.sent_at == datetime(2024, 1, 1, 12, 0, 1)
+    assert first.message_cost == 0.00881
+    assert second.carrier == "carrier2"
+    assert second.sent_at == datetime(2024, 1, 1, 13, 0, 0)
+    assert untouched.status == NotificationStatus.SENDING
+    assert untouched.carrier is None
+
+
+@freeze_time("2024-01-01 12:00:00")
+def test_update_notifications_to_sending(sample_template):
+    first = create_notification(sample_template, status=NotificationStatus.CREATED)
+    delivered = create_notification(sample_template, status=NotificationStatus.CREATED)
+    untouched = create_notification(sample_template, status=NotificationStatus.CREATED)
+    delivered.status = NotificationStatus.DELIVERED
+    db.session.commit()
+
+    assert (
+        dao_update_notifications_to_sending(
+            [(first.id, "msg1", 1), (delivered.id, "msg2", 3)], "sns"
+        )
+        == 2
+    )
+
+    db.session.expire_all()
+    assert first.status == NotificationStatus.SENDING
+    assert first.message_id == "msg1"
+    assert first.billable_units == 1
+    assert first.sent_by == "sns"
+    assert first.sent_at == datetime(2024, 1, 1, 12, 0, 0)
+    assert first.to == "1"
+    assert delivered.status == NotificationStatus.DELIVERED
+    assert delivered.message_id == "msg2"
+    assert delivered.billable_units == 3
+    assert untouched.status == NotificationStatus.CREATED
+    assert untouched.message_id is None
+
+
+def test_update_delivery_receipts_keeps_sent_at_without_a_timestamp(sample_template):
+    sent_at = datetime(2024, 1, 1, 11, 0, 0)
+    notification = create_notification(
+        sample_template, status=NotificationStatus.SENDING, sent_at=sent_at
+    )
+    notification.message_id = "msg1"
+    db.session.commit()
+
+    receipt = DeliveryReceipt("msg1", "DELIVERED", "carrier1", "", None, 0.0)
+    assert dao_update_delivery_receipts([receipt], True) == 1
+
+    db.session.expire_all()
+    assert notification.status == NotificationStatus.DELIVERED
+    assert notification.sent_at == sent_at
+
+
 def test_close_out_delivery_receipts(mocker):
     mock_session = mocker.patch("app.dao.notifications_dao.db.session")
     mock_update = MagicMock()
@@ -1545,7 +1825,7 @@ def test_sanitize_successful_notification_by_id():
             notification_id, carrier, provider_response
         )
         mock_text.assert_called_once_with(
-            "\n    update notifications set provider_response=:response, carrier=:carrier,\n    notification_status='delivered', sent_at=:sent_at, \"to\"='1', normalised_to='1'\n    where id=:notification_id\n    "  # noqa
+            "\n    update notifications set provider_response=:response, carrier=:carrier,\n    notification_status='delivered', sent_at=:sent_at, updated_at=:sent_at,\n    \"to\"='1', normalised_to='1'\n    where id=:notification_id\n    "  # noqa
         )
         mock_session.execute.assert_called_once_with(
             mock_text.return_value,
@@ -12,6 +12,7 @@ from app.dao.fact_billing_dao import (
     fetch_billing_totals_for_year,
     fetch_daily_sms_provider_volumes_for_platform,
     fetch_daily_volumes_for_platform,
+    fetch_fact_billing_changes_for_day,
     fetch_monthly_billing_for_year,
     fetch_sms_billing_for_all_services,
     fetch_sms_free_allowance_remainder_until_date,
@@ -20,6 +21,7 @@ from app.dao.fact_billing_dao import (
     get_rate,
     get_rates_for_billing,
     query_organization_sms_usage_for_year,
+    update_fact_billing_for_day,
 )
 from app.dao.organization_dao import dao_add_service_to_organization
 from app.enums import KeyType, NotificationStatus, NotificationType, TemplateType
@@ -429,6 +431,113 @@ def test_get_rate_chooses_right_rate_depending_on_date(
     assert rate == expected_rate
 
 
+@pytest.mark.parametrize(
+    "process_day,expected_rate",
+    [(date(2018, 9, 30), Decimal("1.2")), (date(2018, 10, 1), Decimal("2.2"))],
+)
+def test_update_fact_billing_for_day_bills_every_service_at_the_rate_for_the_day(
+    notify_db_session, process_day, expected_rate
+):
+    create_rate(datetime(2016, 1, 1), 1.2, NotificationType.SMS)
+    create_rate(datetime(2018, 9, 30, 23, 0), 2.2, NotificationType.SMS)
+    sms_template = create_template(service=create_service(service_name="a"))
+    email_template = create_template(
+        service=create_service(service_name="b"), template_type=TemplateType.EMAIL
+    )
+    for template in (sms_template, sms_template, email_template):
+        create_notification(
+            template=template,
+            status=NotificationStatus.DELIVERED,
+            created_at=datetime.combine(process_day, datetime.min.time())
+            + timedelta(hours=12),
+            billable_units=2,
+            sent_by="sns",
+        )
+
+    assert update_fact_billing_for_day(process_day) == 2
+
+    rows = db.session.execute(select(FactBilling)).scalars().all()
+    assert sorted(
+        (
+            row.local_date,
+            row.service_id,
+            row.notification_type,
+            row.provider,
+            row.rate,
+            row.billable_units,
+            row.notifications_sent,
+        )
+        for row in rows
+    ) == sorted(
+        [
+            (
+                process_day,
+                sms_template.service_id,
+                NotificationType.SMS,
+                "sns",
+                expected_rate,
+                4,
+                2,
+            ),
+            (
+                process_day,
+                email_template.service_id,
+                NotificationType.EMAIL,
+                "ses",
+                0,
+                0,
+                1,
+            ),
+        ]
+    )
+
+
+def test_fetch_fact_billing_changes_for_day_only_returns_rows_that_would_change(
+    notify_db_session,
+):
+    create_rate(datetime(2016, 1, 1), 1.5, NotificationType.SMS)
+    process_day = date(2018, 1, 14)
+    created_at = datetime(2018, 1, 14, 12, 0)
+    unchanged, changed, new = (
+        create_template(service=create_service(service_name=name))
+        for name in ("unchanged", "changed", "new")
+    )
+    for template in (unchanged, changed, new):
+        create_notification(
+            template=template,
+            status=NotificationStatus.DELIVERED,
+            created_at=created_at,
+            sent_by="sns",
+        )
+    create_notification(
+        template=changed,
+        status=NotificationStatus.DELIVERED,
+        created_at=created_at,
+        sent_by="sns",
+    )
+    for template in (unchanged, changed):
+        create_ft_billing(process_day, template, provider="sns", rate=1.5)
+
+    changes = fetch_fact_billing_changes_for_day(process_day)
+
+    assert [
+        (
+            change.service_id,
+            change.current_notifications_sent,
+            change.notifications_sent,
+        )
+        for change in sorted(changes, key=lambda change: change.notifications_sent)
+    ] == [
+        (new.service_id, None, 1),
+        (changed.service_id, 1, 2),
+    ]
+    # nothing is written
+    assert (
+        db.session.execute(select(func.count()).select_from(FactBilling)).scalar_one()
+        == 2
+    )
+
+
 def test_fetch_monthly_billing_for_year(notify_db_session):
     service = set_up_yearly_data()
     create_annual_billing(
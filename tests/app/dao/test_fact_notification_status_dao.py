@@ -17,6 +17,7 @@ from app.dao.fact_notification_status_dao import (
     fetch_stats_for_all_services_by_date_range,
     get_total_notifications_for_date_range,
     update_fact_notification_status,
+    update_fact_notification_status_for_day,
 )
 from app.enums import KeyType, NotificationStatus, NotificationType, TemplateType
 from app.models import FactNotificationStatus
@@ -1127,3 +1128,46 @@ def test_update_fact_notification_status_respects_gmt_bst(
     )
     result = db.session.execute(stmt)
     assert result.rowcount == expected_count
+
+
+def test_update_fact_notification_status_for_day_only_replaces_the_types_given(
+    sample_template,
+    sample_email_template,
+):
+    process_day = date(2022, 3, 26)
+    create_ft_notification_status(
+        process_day,
+        template=sample_template,
+        notification_status=NotificationStatus.SENDING,
+    )
+    create_ft_notification_status(process_day, template=sample_email_template, count=5)
+    create_ft_notification_status(
+        process_day - timedelta(days=1), template=sample_template
+    )
+    create_notification(template=sample_template, created_at="2022-03-26T12:00")
+    create_notification(template=sample_template, created_at="2022-03-26T13:00")
+
+    assert (
+        update_fact_notification_status_for_day(process_day, (NotificationType.SMS,))
+        == 1
+    )
+
+    rows = db.session.execute(select(FactNotificationStatus)).scalars().all()
+    assert sorted(
+        (
+            row.local_date,
+            row.notification_type,
+            row.notification_status,
+            row.notification_count,
+        )
+        for row in rows
+    ) == [
+        (
+            process_day - timedelta(days=1),
+            NotificationType.SMS,
+            NotificationStatus.DELIVERED,
+            1,
+        ),
+        (process_day, NotificationType.EMAIL, NotificationStatus.DELIVERED, 5),
+        (process_day, NotificationType.SMS, NotificationStatus.CREATED, 2),
+    ]
@@ -6,6 +6,7 @@ import pytest
 from flask import current_app
 from requests import HTTPError
 from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
 
 import app
 from app import db, notification_provider_clients
@@ -1171,6 +1172,23 @@ def test_get_html_email_options_return_email_branding_from_serialised_service(
     }
 
 
+def test_get_html_email_options_caches_email_branding_of_serialised_service(
+    sample_service, mocker
+):
+    sample_service.email_branding = create_email_branding()
+    service = SerialisedService.from_id(sample_service.id)
+    dao_mock = mocker.patch(
+        "app.delivery.send_to_providers.dao_get_email_branding_by_id",
+        wraps=send_to_providers.dao_get_email_branding_by_id,
+    )
+
+    first = get_html_email_options(service)
+    second = get_html_email_options(service)
+
+    assert first == second
+    dao_mock.assert_called_once_with(service.email_branding)
+
+
 def test_get_html_email_options_add_email_branding_from_service(sample_service):
     branding = create_email_branding()
     sample_service.email_branding = branding
@@ -1184,3 +1202,133 @@ def test_get_html_email_options_add_email_branding_from_service(sample_service):
         "brand_text": branding.text,
         "brand_name": branding.name,
     }
+
+
+def test_send_sms_batch_to_provider_sends_concurrently_and_updates_once(
+    sample_sms_template_with_html, mocker
+):
+    mocker.patch("app.delivery.send_to_providers._get_verify_code", return_value=None)
+    sender = sample_sms_template_with_html.service.get_default_sms_sender()
+    sent, failing = (
+        create_notification(
+            template=sample_sms_template_with_html,
+            personalisation={},
+            status=NotificationStatus.CREATED,
+            reply_to_text=sender,
+        )
+        for _ in range(2)
+    )
+    already_sent = create_notification(
+        template=sample_sms_template_with_html, status=NotificationStatus.SENDING
+    )
+
+    def send_sms(**kwargs):
+        if kwargs["reference"] == str(failing.id):
+            raise HTTPError()
+        return f"message-{kwargs['reference']}"
+
+    mock_sns = MagicMock(send_sms=MagicMock(side_effect=send_sms))
+    mock_sns.name = "sns"
+    mocker.patch(
+        "app.delivery.send_to_providers.provider_to_use", return_value=mock_sns
+    )
+    mocker.patch(
+        "app.delivery.send_to_providers.get_phone_number_from_s3",
+        return_value="2028675309",
+    )
+    mocker.patch(
+        "app.delivery.send_to_providers.get_personalisation_from_s3",
+        return_value={"name": "Jo"},
+    )
+    mock_update = mocker.patch(
+        "app.delivery.send_to_providers.dao_update_notifications_to_sending",
+        wraps=notifications_dao.dao_update_notifications_to_sending,
+    )
+
+    unbatched, failed = send_to_providers.send_sms_batch_to_provider(
+        [sent, failing, already_sent]
+    )
+
+    assert unbatched == [already_sent.id]
+    assert failed == [failing.id]
+    assert mock_sns.send_sms.call_count == 2
+    mock_sns.send_sms.assert_any_call(
+        to="2028675309",
+        content="Sample service: Hello Jo\nHere is <em>some HTML</em> & entities",
+        reference=str(sent.id),
+        sender=sender,
+        international=False,
+    )
+    mock_update.assert_called_once_with([(sent.id, f"message-{sent.id}", 1)], "sns")
+
+    sent = db.session.get(Notification, sent.id)
+    assert sent.status == NotificationStatus.SENDING
+    assert sent.message_id == f"message-{sent.id}"
+    assert sent.sent_by == "sns"
+    assert sent.billable_units == 1
+    assert db.session.get(Notification, failing.id).status == NotificationStatus.CREATED
+
+
+def test_send_sms_batch_to_provider_records_sent_sms_one_at_a_time_if_batch_update_fails(
+    sample_sms_template_with_html, mocker
+):
+    mocker.patch("app.delivery.send_to_providers._get_verify_code", return_value=None)
+    sender = sample_sms_template_with_html.service.get_default_sms_sender()
+    notifications = [
+        create_notification(
+            template=sample_sms_template_with_html,
+            personalisation={},
+            status=NotificationStatus.CREATED,
+            reply_to_text=sender,
+        )
+        for _ in range(2)
+    ]
+    mock_sns = MagicMock(
+        send_sms=MagicMock(side_effect=lambda **kwargs: f"m-{kwargs['reference']}")
+    )
+    mock_sns.name = "sns"
+    mocker.patch(
+        "app.delivery.send_to_providers.provider_to_use", return_value=mock_sns
+    )
+    mocker.patch(
+        "app.delivery.send_to_providers.get_phone_number_from_s3",
+        return_value="2028675309",
+    )
+    mocker.patch(
+        "app.delivery.send_to_providers.get_personalisation_from_s3",
+        return_value={"name": "Jo"},
+    )
+    mocker.patch(
+        "app.delivery.send_to_providers.dao_update_notifications_to_sending",
+        side_effect=OperationalError("UPDATE", {}, Exception("deadlock detected")),
+    )
+    mock_logger = mocker.patch("app.delivery.send_to_providers.current_app.logger")
+    ids = [notification.id for notification in notifications]
+
+    unbatched, failed = send_to_providers.send_sms_batch_to_provider(notifications)
+
+    assert unbatched == []
+    assert failed == []
+    assert str((str(ids[0]), f"m-{ids[0]}")) in mock_logger.exception.call_args[0][0]
+    for notification_id in ids:
+        notification = db.session.get(Notification, notification_id)
+        assert notification.status == NotificationStatus.SENDING
+        assert notification.message_id == f"m-{notification_id}"
+        assert notification.sent_by == "sns"
+        assert notification.billable_units == 1
+
+
+def test_send_sms_batch_to_provider_leaves_test_keys_and_inactive_services(
+    sample_template, sample_sms_template_with_html, mocker
+):
+    test_key_notification = create_notification(
+        template=sample_template, key_type=KeyType.TEST
+    )
+    sample_sms_template_with_html.service.active = False
+    inactive_notification = create_notification(template=sample_sms_template_with_html)
+    mock_provider = mocker.patch("app.delivery.send_to_providers.provider_to_use")
+
+    assert send_to_providers.send_sms_batch_to_provider(
+        [test_key_notification, inactive_notification]
+    ) == ([test_key_notification.id, inactive_notification.id], [])
+    mock_provider.assert_not_called()
@@ -1,4 +1,5 @@
 import datetime
+import json
 import uuid
 from collections import namedtuple
 
@@ -9,6 +10,7 @@ from sqlalchemy import func, select
 from sqlalchemy.exc import SQLAlchemyError
 
 from app import db
+from app.config import QueueNames
 from app.enums import KeyType, NotificationType, ServicePermissionType, TemplateType
 from app.errors import BadRequestError
 from app.models import Notification, NotificationHistory
@@ -252,20 +254,66 @@ def test_send_notification_to_queue(
 ):
     mocked = mocker.patch("app.celery.{}.apply_async".format(expected_task))
     Notification = namedtuple(
-        "Notification", ["id", "key_type", "notification_type", "created_at"]
+        "Notification",
+        [
+            "id",
+            "key_type",
+            "notification_type",
+            "created_at",
+            "awaiting_persistence",
+        ],
     )
     notification = Notification(
         id=uuid.uuid4(),
         key_type=key_type,
         notification_type=notification_type,
         created_at=datetime.datetime(2016, 11, 11, 16, 8, 18),
+        awaiting_persistence=False,
     )
 
     send_notification_to_queue(notification=notification, queue=requested_queue)
 
-    mocked.assert_called_once_with(
-        [str(notification.id)], queue=expected_queue, countdown=60
+    mocked.assert_called_once_with([str(notification.id)], queue=expected_queue)
+
+
+def test_send_notification_to_queue_leaves_queued_sms_to_the_message_queue(
+    sample_template, mocker
+):
+    mocked = mocker.patch("app.celery.provider_tasks.deliver_sms.apply_async")
+    notification = Notification(
+        id=uuid.uuid4(),
+        key_type=KeyType.NORMAL,
+        notification_type=NotificationType.SMS,
     )
+    notification.awaiting_persistence = True
+
+    send_notification_to_queue(notification)
+
+    mocked.assert_not_called()
+
+
+def test_persist_notification_queues_sms_with_the_queue_to_send_it_on(
+    sample_template, sample_api_key, mocker, monkeypatch
+):
+    monkeypatch.setenv("NOTIFY_ENVIRONMENT", "development")
+    mock_redis = mocker.patch("app.notifications.process_notifications.redis_store")
+
+    notification = persist_notification(
+        template_id=sample_template.id,
+        template_version=sample_template.version,
+        recipient="+12028675309",
+        service=sample_template.service,
+        personalisation={},
+        notification_type=NotificationType.SMS,
+        api_key_id=sample_api_key.id,
+        key_type=sample_api_key.key_type,
+        queue=QueueNames.NOTIFY,
+    )
+
+    assert notification.awaiting_persistence
+    key, payload = mock_redis.rpush.call_args[0]
+    assert key == "message_queue"
+    assert json.loads(payload)["queue"] == QueueNames.NOTIFY
 
 
 def test_send_notification_to_queue_throws_exception_deletes_notification(
@@ -278,7 +326,7 @@ def test_send_notification_to_queue_throws_exception_deletes_notification(
     with pytest.raises(Boto3Error):
         send_notification_to_queue(sample_notification, False)
     mocked.assert_called_once_with(
-        [str(sample_notification.id)], queue="send-sms-tasks", countdown=60
+        [str(sample_notification.id)], queue="send-sms-tasks"
     )
 
     assert _get_notification_query_count() == 0
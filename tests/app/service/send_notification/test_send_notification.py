@@ -149,9 +149,7 @@ def test_send_notification_with_placeholders_replaced(
                 {"template_version": sample_email_template_with_placeholders.version}
             )
 
-            mocked.assert_called_once_with(
-                [notification_id], queue="send-email-tasks", countdown=60
-            )
+            mocked.assert_called_once_with([notification_id], queue="send-email-tasks")
             assert response.status_code == 201
             assert response_data["body"] == "Hello Jo\nThis is an email from GOV.UK"
             assert response_data["subject"] == "Jo"
@@ -421,9 +419,7 @@ def test_should_allow_valid_sms_notification(notify_api, sample_template, mocker
             response_data = json.loads(response.data)["data"]
             notification_id = response_data["notification"]["id"]
 
-            mocked.assert_called_once_with(
-                [notification_id], queue="send-sms-tasks", countdown=60
-            )
+            mocked.assert_called_once_with([notification_id], queue="send-sms-tasks")
             assert response.status_code == 201
             assert notification_id
             assert "subject" not in response_data
@@ -479,7 +475,7 @@ def test_should_allow_valid_email_notification(
             response_data = json.loads(response.get_data(as_text=True))["data"]
             notification_id = response_data["notification"]["id"]
             app.celery.provider_tasks.deliver_email.apply_async.assert_called_once_with(
-                [notification_id], queue="send-email-tasks", countdown=60
+                [notification_id], queue="send-email-tasks"
             )
 
             assert response.status_code == 201
@@ -623,7 +619,7 @@ def test_should_send_email_if_team_api_key_and_a_service_user(
     )
 
     app.celery.provider_tasks.deliver_email.apply_async.assert_called_once_with(
-        [fake_uuid], queue="send-email-tasks", countdown=60
+        [fake_uuid], queue="send-email-tasks"
     )
     assert response.status_code == 201
 
@@ -661,7 +657,7 @@ def test_should_send_sms_to_anyone_with_test_key(
         ],
     )
     app.celery.provider_tasks.deliver_sms.apply_async.assert_called_once_with(
-        [fake_uuid], queue="send-sms-tasks", countdown=60
+        [fake_uuid], queue="send-sms-tasks"
     )
     assert response.status_code == 201
 
@@ -700,7 +696,7 @@ def test_should_send_email_to_anyone_with_test_key(
     )
 
     app.celery.provider_tasks.deliver_email.apply_async.assert_called_once_with(
-        [fake_uuid], queue="send-email-tasks", countdown=60
+        [fake_uuid], queue="send-email-tasks"
     )
     assert response.status_code == 201
 
@@ -738,7 +734,7 @@ def test_should_send_sms_if_team_api_key_and_a_service_user(
     )
 
     app.celery.provider_tasks.deliver_sms.apply_async.assert_called_once_with(
-        [fake_uuid], queue="send-sms-tasks", countdown=60
+        [fake_uuid], queue="send-sms-tasks"
     )
     assert response.status_code == 201
 
@@ -795,7 +791,7 @@ def test_should_persist_notification(
         ],
     )
 
-    mocked.assert_called_once_with([fake_uuid], queue=queue_name, countdown=60)
+    mocked.assert_called_once_with([fake_uuid], queue=queue_name)
     assert response.status_code == 201
 
     notification = notifications_dao.get_notification_by_id(fake_uuid)
@@ -856,7 +852,7 @@ def test_should_delete_notification_and_return_error_if_redis_fails(
         )
     assert str(e.value) == "failed to talk to redis"
 
-    mocked.assert_called_once_with([fake_uuid], queue=queue_name, countdown=60)
+    mocked.assert_called_once_with([fake_uuid], queue=queue_name)
     assert not notifications_dao.get_notification_by_id(fake_uuid)
     assert not db.session.get(NotificationHistory, fake_uuid)
 
@@ -1143,9 +1139,7 @@ def test_should_allow_store_original_number_on_sms_notification(
     response_data = json.loads(response.data)["data"]
     notification_id = response_data["notification"]["id"]
 
-    mocked.assert_called_once_with(
-        [notification_id], queue="send-sms-tasks", countdown=60
-    )
+    mocked.assert_called_once_with([notification_id], queue="send-sms-tasks")
     assert response.status_code == 201
     assert notification_id
     notifications = db.session.execute(select(Notification)).scalars().all()
@@ -1875,7 +1875,8 @@ def test_get_all_notifications_for_service_formatted_for_csv(client, sample_temp
     resp = json.loads(response.get_data(as_text=True))
     assert response.status_code == 200
     assert len(resp["notifications"]) == 1
-    assert resp["notifications"][0]["recipient"] == notification.to
+    # the recipient is only known for notifications sent from a job
+    assert resp["notifications"][0]["recipient"] == ""
     assert not resp["notifications"][0]["row_number"]
     assert resp["notifications"][0]["template_name"] == sample_template.name
     assert resp["notifications"][0]["template_type"] == notification.notification_type
@@ -2156,6 +2157,54 @@ def test_get_notifications_for_service_pagination_links(
     assert "next" not in resp["links"]
 
 
+def test_get_notifications_for_service_next_page_from_cursor(
+    admin_request, sample_template
+):
+    notifications = [
+        create_notification(sample_template, created_at=datetime(2024, 1, 1, hour))
+        for hour in range(3)
+    ]
+
+    resp = admin_request.get(
+        "service.get_all_notifications_for_service",
+        service_id=sample_template.service_id,
+        page_size=2,
+    )
+
+    assert [n["id"] for n in resp["notifications"]] == [
+        str(notifications[2].id),
+        str(notifications[1].id),
+    ]
+    assert "cursor=" in resp["links"]["next"]
+
+    resp = admin_request.get(
+        "service.get_all_notifications_for_service",
+        service_id=sample_template.service_id,
+        page_size=2,
+        page=2,
+        cursor=resp["next_cursor"],
+    )
+
+    assert [n["id"] for n in resp["notifications"]] == [str(notifications[0].id)]
+    assert resp["next_cursor"] is None
+    assert "next" not in resp["links"]
+    assert "?page=1" in resp["links"]["prev"]
+    assert "cursor=" not in resp["links"]["prev"]
+
+
+def test_get_notifications_for_service_with_an_invalid_cursor(
+    admin_request, sample_template
+):
+    resp = admin_request.get(
+        "service.get_all_notifications_for_service",
+        service_id=sample_template.service_id,
+        cursor="rubbish",
+        _expected_status=400,
+    )
+
+    assert resp["message"] == {"cursor": ["Invalid pagination cursor"]}
+
+
 @pytest.mark.parametrize(
     "should_prefix",
     [
@@ -2759,7 +2808,7 @@ def test_verify_reply_to_email_address_should_send_verification_email(
     assert notification.template_id == verify_reply_to_address_email_template.id
     assert response["data"] == {"id": str(notification.id)}
     mocked.assert_called_once_with(
-        [str(notification.id)], queue="notify-internal-tasks", countdown=60
+        [str(notification.id)], queue="notify-internal-tasks"
     )
     assert (
         notification.reply_to_text
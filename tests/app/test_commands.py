@@ -32,6 +32,8 @@ from app.commands import (
     promote_user_to_platform_admin,
     purge_csv_bucket,
     purge_functional_test_data,
+    replay_message_queue_dead_letters,
+    run_message_queue_consumer,
     update_jobs_archived_flag,
     update_templates,
 )
@@ -846,3 +848,30 @@ def test_clear_redis_list(monkeypatch, notify_api):
     assert result.exit_code == 0
     assert ltrim_calls == [("test_list", 1, 0)]
     assert logger_info_calls == ["Cleared redis list test_list. Before: 5 after 0"]
+
+
+def test_replay_message_queue_dead_letters(mocker, notify_api):
+    mock_redis_store = mocker.patch("app.commands.redis_store")
+    mock_redis_store.lpop.side_effect = [[b"1", b"2"], [b"3"], None]
+
+    result = notify_api.test_cli_runner().invoke(replay_message_queue_dead_letters)
+
+    assert result.exit_code == 0
+    mock_redis_store.lpop.assert_called_with("message_queue_dead_letters", 1000)
+    assert mock_redis_store.rpush.call_args_list == [
+        mocker.call("message_queue", b"1", b"2"),
+        mocker.call("message_queue", b"3"),
+    ]
+
+
+def test_run_message_queue_consumer(mocker, notify_api):
+    mocker.patch("app.commands.signal.signal")
+    consumer_mock = mocker.patch("app.commands.MessageQueueConsumer")
+
+    result = notify_api.test_cli_runner().invoke(
+        run_message_queue_consumer, ["-n", "2"]
+    )
+
+    assert result.exit_code == 0
+    consumer_mock.assert_called_once_with("2", batch_size=1000, max_wait=0.5)
+    consumer_mock.return_value.run.assert_called_once_with()
@@ -0,0 +1,330 @@
+import json
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+from sqlalchemy.orm.exc import NoResultFound
+
+from app import model_cache as app_model_cache
+from app.dao.dao_utils import transaction
+from app.dao.email_branding_dao import dao_update_email_branding
+from app.dao.service_email_reply_to_dao import archive_reply_to_email_address
+from app.dao.service_sms_sender_dao import dao_add_sms_sender_for_service
+from app.dao.service_permissions_dao import (
+    dao_add_service_permission,
+    dao_remove_service_permission,
+)
+from app.dao.services_dao import (
+    dao_archive_service,
+    dao_resume_service,
+    dao_suspend_service,
+    dao_update_service,
+)
+from app.dao.templates_dao import dao_update_template
+from app.model_cache import (
+    INVALIDATION_CHANNEL,
+    ModelCache,
+    email_branding_key,
+    service_key,
+    service_senders_key,
+    template_key,
+)
+from app.serialised_models import SerialisedService
+from tests.app.db import create_email_branding, create_reply_to_email
+
+
+class FakeRedis:
+    active = False
+
+    def __init__(self):
+        self.values = {}
+        self.published = []
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value.encode("utf-8")
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+
+@pytest.fixture
+def redis():
+    return FakeRedis()
+
+
+@pytest.fixture
+def cache(redis):
+    return ModelCache(redis)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = {"now": 1000.0}
+    monkeypatch.setattr(time, "monotonic", lambda: clock["now"])
+    return clock
+
+
+def test_get_loads_a_missing_key_into_both_tiers(cache, redis):
+    load = Mock(return_value={"data": {"id": 1}})
+
+    assert cache.get("service-1", load) == {"data": {"id": 1}}
+    assert cache.get("service-1", load) == {"data": {"id": 1}}
+
+    load.assert_called_once_with()
+    assert json.loads(redis.values["service-1"]) == {"data": {"id": 1}}
+    assert cache.stats()["local_hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_get_reads_the_redis_tier_before_loading(cache, redis):
+    redis.values["service-1"] = b'{"data": {"id": 1}}'
+    load = Mock()
+
+    assert cache.get("service-1", load) == {"data": {"id": 1}}
+    assert cache.get("service-1", load) == {"data": {"id": 1}}
+
+    load.assert_not_called()
+    assert cache.stats()["redis_hits"] == 1
+    assert cache.stats()["local_hits"] == 1
+    assert cache.stats()["local_hit_rate"] == 0.5
+
+
+def test_entries_are_kept_briefly_until_subscribed(cache, clock):
+    load = Mock(return_value={"data": {}})
+    cache.get("service-1", load)
+    cache.subscribed = True
+    cache.get("service-2", load)
+
+    clock["now"] += 3
+
+    cache.get("service-1", load)
+    cache.get("service-2", load)
+    assert cache.stats()["local_hits"] == 1
+    assert cache.stats()["redis_hits"] == 1
+
+
+def test_least_recently_used_entries_are_dropped_first(redis):
+    cache = ModelCache(redis, max_size=2)
+    for key in ("a", "b", "a", "c"):
+        cache.get(key, lambda: {})
+
+    assert list(cache._entries) == ["a", "c"]
+
+
+def test_only_one_thread_loads_a_missing_key(cache):
+    loading = threading.Event()
+    finish = threading.Event()
+
+    def load():
+        loading.set()
+        finish.wait(5)
+        return {"data": {}}
+
+    load = Mock(side_effect=load)
+    threads = [
+        threading.Thread(target=cache.get, args=("service-1", load)) for _ in range(5)
+    ]
+    threads[0].start()
+    loading.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    finish.set()
+    for thread in threads:
+        thread.join(5)
+
+    load.assert_called_once_with()
+    assert cache.stats()["local_hits"] == 4
+    assert cache._loading == {}
+
+
+def test_a_load_that_is_invalidated_is_not_cached(cache, redis):
+    def load():
+        cache.invalidate("service-1")
+        return {"data": {"name": "old"}}
+
+    assert cache.get("service-1", load) == {"data": {"name": "old"}}
+
+    assert "service-1" not in cache._entries
+    assert "service-1" not in redis.values
+    assert cache.get("service-1", lambda: {"data": {"name": "new"}}) == {
+        "data": {"name": "new"}
+    }
+
+
+def test_invalidate_drops_key_everywhere(cache, redis):
+    cache.get("service-1", lambda: {"data": {}})
+
+    cache.invalidate("service-1")
+
+    assert "service-1" not in cache._entries
+    assert "service-1" not in redis.values
+    assert redis.published == [(INVALIDATION_CHANNEL, "service-1")]
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_invalidations_from_other_processes_evict_entries(cache, mocker, notify_api):
+    cache.get("service-1", lambda: {"data": {}})
+    cache.get("service-2", lambda: {"data": {}})
+
+    def listen():
+        yield {"type": "subscribe", "data": 1}
+        cache.get("service-2", lambda: {"data": {}})
+        yield {"type": "message", "data": b"service-2"}
+        assert cache.subscribed
+        raise ConnectionError()
+
+    cache.redis_client.pubsub = Mock(return_value=Mock(listen=listen))
+    mocker.patch("app.model_cache.time.sleep", side_effect=StopIteration)
+
+    with pytest.raises(StopIteration):
+        cache._receive_invalidations(notify_api.logger)
+
+    cache.redis_client.pubsub.return_value.subscribe.assert_called_once_with(
+        INVALIDATION_CHANNEL
+    )
+    assert cache.stats()["invalidations"] == 1
+    assert not cache.subscribed
+    assert cache._entries == {}
+
+
+def test_a_new_process_listens_for_invalidations(cache, mocker, notify_api):
+    cache.redis_client.active = True
+    thread_mock = mocker.patch("app.model_cache.threading.Thread")
+    cache._entries["service-1"] = ({}, 0)
+
+    cache._listen()
+    cache._listen()
+
+    thread_mock.return_value.start.assert_called_once_with()
+    assert cache._entries == {}
+
+    mocker.patch("app.model_cache.os.getpid", return_value=-1)
+    cache._listen()
+    assert thread_mock.return_value.start.call_count == 2
+
+
+def test_updating_a_service_invalidates_it_once_committed(sample_service, mocker):
+    invalidate = mocker.patch.object(app_model_cache, "invalidate")
+
+    with transaction():
+        sample_service.name = "new name"
+        dao_update_service(sample_service)
+        invalidate.assert_not_called()
+
+    invalidate.assert_called_once_with(service_key(sample_service.id))
+
+
+def test_updates_that_are_rolled_back_are_not_invalidated(
+    sample_service, mocker, notify_db_session
+):
+    invalidate = mocker.patch.object(app_model_cache, "invalidate")
+
+    with pytest.raises(ValueError):
+        with transaction():
+            sample_service.name = "new name"
+            dao_update_service(sample_service)
+            raise ValueError()
+    notify_db_session.commit()
+
+    invalidate.assert_not_called()
+
+
+def test_updating_a_template_invalidates_its_latest_version(sample_template, mocker):
+    invalidate = mocker.patch.object(app_model_cache, "invalidate")
+    sample_template.content = "new content"
+
+    dao_update_template(sample_template)
+
+    invalidate.assert_called_once_with(
+        template_key(sample_template.id, sample_template.service_id)
+    )
+    assert template_key(sample_template.id, sample_template.service_id) == (
+        f"service-{sample_template.service_id}-template-{sample_template.id}-version-None"
+    )
+
+
+def test_service_senders_are_cached(sample_service, mocker):
+    reply_to = create_reply_to_email(sample_service, "reply@example.com")
+    get = mocker.spy(app_model_cache, "get")
+
+    service = SerialisedService.from_id(sample_service.id)
+
+    assert service.sms_sender_numbers == frozenset({"testing"})
+    assert service.email_reply_to_addresses == frozenset({"reply@example.com"})
+    assert service.get_email_reply_to(reply_to.id) == "reply@example.com"
+    assert get.call_args_list[-1][0][0] == service_senders_key(sample_service.id)
+    assert get.call_count == 2
+
+
+def test_service_senders_raise_for_unknown_ids(sample_service):
+    service = SerialisedService.from_id(sample_service.id)
+
+    with pytest.raises(NoResultFound):
+        service.get_sms_sender(sample_service.id)
+    with pytest.raises(NoResultFound):
+        service.get_email_reply_to(sample_service.id)
+
+
+def test_adding_an_sms_sender_invalidates_the_service_senders(sample_service, mocker):
+    invalidate = mocker.patch.object(app_model_cache, "invalidate")
+
+    dao_add_sms_sender_for_service(sample_service.id, "new sender", is_default=False)
+
+    invalidate.assert_called_once_with(service_senders_key(sample_service.id))
+
+
+def test_archiving_a_reply_to_invalidates_the_service_senders(sample_service, mocker):
+    create_reply_to_email(sample_service, "default@example.com")
+    reply_to = create_reply_to_email(
+        sample_service, "reply@example.com", is_default=False
+    )
+    invalidate = mocker.patch.object(app_model_cache, "invalidate")
+
+    archive_reply_to_email_address(sample_service.id, reply_to.id)
+
+    invalidate.assert_called_once_with(service_senders_key(sample_service.id))
+
+
+def test_updating_an_email_branding_invalidates_it(notify_db_session, mocker):
+    email_branding = create_email_branding()
+    invalidate = mocker.patch.object(app_model_cache, "invalidate")
+
+    dao_update_email_branding(email_branding, text="new text")
+
+    invalidate.assert_called_once_with(email_branding_key(email_branding.id))
+
+
+@pytest.mark.parametrize(
+    "update_service",
+    [
+        dao_suspend_service,
+        dao_resume_service,
+        lambda service_id: dao_add_service_permission(service_id, "inbound_sms"),
+        lambda service_id: dao_remove_service_permission(service_id, "sms"),
+    ],
+)
+def test_changing_a_service_invalidates_it(sample_service, mocker, update_service):
+    invalidate = mocker.patch.object(app_model_cache, "invalidate")
+
+    update_service(sample_service.id)
+
+    invalidate.assert_called_once_with(service_key(sample_service.id))
+
+
+def test_archiving_a_service_invalidates_it_and_its_templates(sample_template, mocker):
+    invalidate = mocker.patch.object(app_model_cache, "invalidate")
+    service_id = sample_template.service_id
+
+    dao_archive_service(service_id)
+
+    assert sorted(call.args[0] for call in invalidate.call_args_list) == sorted(
+        [service_key(service_id), template_key(sample_template.id, service_id)]
+    )
@@ -7,6 +7,8 @@ from freezegun import freeze_time
 from app.enums import ServicePermissionType, TemplateType
 from app.utils import (
     check_suspicious_id,
+    decode_cursor,
+    encode_cursor,
     get_midnight_in_utc,
     get_public_notify_type_text,
     get_template_instance,
@@ -173,3 +175,15 @@ def test_is_suspicious_input(sample_job):
 
     returnVal = is_suspicious_input("1 OR pg_sleep(1)")
     assert returnVal is True
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(datetime(2024, 1, 1, 12, 30), 5)
+
+    assert decode_cursor(cursor) == ["2024-01-01 12:30:00", 5]
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", "e30=", "é"])
+def test_decode_cursor_rejects_anything_else(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
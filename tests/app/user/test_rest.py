@@ -9,6 +9,7 @@ from freezegun import freeze_time
 from sqlalchemy import delete, func, select
 
 from app import db
+from app.config import QueueNames
 from app.dao.service_user_dao import dao_get_service_user, dao_update_service_user
 from app.enums import AuthType, KeyType, NotificationType, PermissionType, UserState
 from app.models import Notification, Permission, User
@@ -293,6 +294,7 @@ def test_post_user_attribute(admin_request, sample_user, user_attribute, user_va
                 key_type=KeyType.NORMAL,
                 notification_type=NotificationType.EMAIL,
                 personalisation={},
+                queue=QueueNames.NOTIFY,
                 recipient="newuser@mail.com",
                 reply_to_text="notify@gov.uk",
                 service=mock.ANY,
@@ -308,6 +310,7 @@ def test_post_user_attribute(admin_request, sample_user, user_attribute, user_va
                 key_type=KeyType.NORMAL,
                 notification_type=NotificationType.SMS,
                 personalisation={},
+                queue=QueueNames.NOTIFY,
                 recipient="+14254147755",
                 reply_to_text="testing",
                 service=mock.ANY,
@@ -703,7 +706,7 @@ def test_send_already_registered_email(
     stmt = select(Notification)
     notification = db.session.execute(stmt).scalars().first()
     mocked.assert_called_once_with(
-        ([str(notification.id)]), queue="notify-internal-tasks", countdown=60
+        ([str(notification.id)]), queue="notify-internal-tasks"
     )
     assert (
         notification.reply_to_text
@@ -742,7 +745,7 @@ def test_send_user_confirm_new_email_returns_204(
     stmt = select(Notification)
     notification = db.session.execute(stmt).scalars().first()
     mocked.assert_called_once_with(
-        ([str(notification.id)]), queue="notify-internal-tasks", countdown=60
+        ([str(notification.id)]), queue="notify-internal-tasks"
     )
     assert (
         notification.reply_to_text
@@ -231,7 +231,7 @@ def test_send_user_sms_code(client, sample_user, sms_code_template, mocker):
     assert notification.reply_to_text == notify_service.get_default_sms_sender()
 
     app.celery.provider_tasks.deliver_sms.apply_async.assert_called_once_with(
-        ([str(notification.id)]), queue="notify-internal-tasks", countdown=60
+        ([str(notification.id)]), queue="notify-internal-tasks"
     )
 
 
@@ -267,7 +267,7 @@ def test_send_user_code_for_sms_with_optional_to_field(
     notification = db.session.execute(select(Notification)).scalars().first()
     assert notification.to == "1"
     app.celery.provider_tasks.deliver_sms.apply_async.assert_called_once_with(
-        ([str(notification.id)]), queue="notify-internal-tasks", countdown=60
+        ([str(notification.id)]), queue="notify-internal-tasks"
     )
 
 
@@ -349,7 +349,7 @@ def test_send_new_user_email_verification(
     notification = db.session.execute(select(Notification)).scalars().first()
     assert _get_verify_code_count() == 0
     mocked.assert_called_once_with(
-        ([str(notification.id)]), queue="notify-internal-tasks", countdown=60
+        ([str(notification.id)]), queue="notify-internal-tasks"
     )
     assert (
         notification.reply_to_text
@@ -494,9 +494,7 @@ def test_send_user_email_code(
     )
     assert noti.to == "1"
     assert str(noti.template_id) == current_app.config["EMAIL_2FA_TEMPLATE_ID"]
-    deliver_email.assert_called_once_with(
-        [str(noti.id)], queue="notify-internal-tasks", countdown=60
-    )
+    deliver_email.assert_called_once_with([str(noti.id)], queue="notify-internal-tasks")
 
 
 def test_send_user_email_code_with_urlencoded_next_param(
@@ -175,6 +175,83 @@ def test_delete_multi(mocked_redis_client):
     mocked_redis_client.redis_store.delete.assert_called_with("a", "b", "c")
 
 
+def test_lpop_count(mocked_redis_client, mocker):
+    mocker.patch.object(
+        mocked_redis_client.redis_store, "lpop", return_value=[b"a", b"b"]
+    )
+
+    assert mocked_redis_client.lpop("list", 2) == [b"a", b"b"]
+    mocked_redis_client.redis_store.lpop.assert_called_once_with("list", 2)
+
+
+def test_rpush_multi(mocked_redis_client, mocker):
+    mocker.patch.object(mocked_redis_client.redis_store, "rpush")
+
+    mocked_redis_client.rpush("list", "a", "b")
+
+    mocked_redis_client.redis_store.rpush.assert_called_once_with("list", "a", "b")
+
+
+def test_lmove_many(mocked_redis_client, mocker):
+    move_mock = Mock(return_value=[b"a"])
+    mocker.patch.dict(mocked_redis_client.scripts, {"move-list-values": move_mock})
+
+    assert mocked_redis_client.lmove_many("from", "to", 10) == [b"a"]
+    move_mock.assert_called_once_with(keys=["from", "to"], args=[10])
+
+
+def test_lmove_many_moves_nothing_if_not_enabled(mocked_redis_client):
+    mocked_redis_client.active = False
+
+    assert mocked_redis_client.lmove_many("from", "to", 10) == []
+
+
+def test_sorted_set_commands(mocked_redis_client, mocker):
+    for command in ("zadd", "zrangebyscore", "zremrangebyscore", "expire"):
+        mocker.patch.object(mocked_redis_client.redis_store, command)
+
+    mocked_redis_client.zadd("set", {"a": 1})
+    mocked_redis_client.zrangebyscore("set", 1, "+inf")
+    mocked_redis_client.zremrangebyscore("set", "-inf", 1)
+    mocked_redis_client.expire("set", 60)
+
+    mocked_redis_client.redis_store.zadd.assert_called_once_with("set", {"a": 1})
+    mocked_redis_client.redis_store.zrangebyscore.assert_called_once_with(
+        "set", 1, "+inf"
+    )
+    mocked_redis_client.redis_store.zremrangebyscore.assert_called_once_with(
+        "set", "-inf", 1
+    )
+    mocked_redis_client.redis_store.expire.assert_called_once_with("set", 60)
+
+
+def test_zrangebyscore_is_empty_if_not_enabled(mocked_redis_client):
+    mocked_redis_client.active = False
+
+    assert mocked_redis_client.zrangebyscore("set", 1, "+inf") == []
+
+
+def test_publish(mocked_redis_client, mocker):
+    mocker.patch.object(mocked_redis_client.redis_store, "publish", return_value=2)
+
+    assert mocked_redis_client.publish("channel", "message") == 2
+    mocked_redis_client.redis_store.publish.assert_called_once_with(
+        "channel", "message"
+    )
+
+
+def test_publish_logs_errors(mocked_redis_client, mocker):
+    mocker.patch.object(
+        mocked_redis_client.redis_store, "publish", side_effect=Exception()
+    )
+    mock_logger = mocker.patch("flask.Flask.logger")
+
+    assert mocked_redis_client.publish("channel", "message") is None
+    mock_logger.exception.assert_called_once_with(
+        "Redis error performing publish on channel"
+    )
+
+
 @pytest.mark.parametrize(
     ("input", "output"),
     [
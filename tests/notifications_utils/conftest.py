@@ -3,12 +3,37 @@ import requests_mock
 from flask import Flask
 
 from notifications_utils import request_helper
+from notifications_utils.template import (
+    compile_email_shell,
+    compile_template,
+    get_placeholders,
+)
 
 
 class FakeService:
     id = "1234"
 
 
+@pytest.fixture(autouse=True)
+def clear_compiled_templates():
+    # tests mock Field and the formatters, which would otherwise be cached into later tests
+    compile_template.cache_clear()
+    compile_email_shell.cache_clear()
+    get_placeholders.cache_clear()
+
+
+@pytest.fixture()
+def uncompiled_templates(mocker):
+    # for tests of what each formatter is given when a template is rendered in full
+    mocker.patch("notifications_utils.template.compile_template", return_value=None)
+
+
+@pytest.fixture()
+def uncompiled_email_shells(mocker):
+    # for tests of what the jinja template is given when an email is rendered in full
+    mocker.patch("notifications_utils.template.compile_email_shell", return_value=None)
+
+
 @pytest.fixture()
 def app():
     flask_app = Flask(__name__)
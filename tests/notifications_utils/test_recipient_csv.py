@@ -2,6 +2,7 @@ import itertools
 import string
 import unicodedata
 from functools import partial
+from io import StringIO
 from random import choice, randrange
 from unittest.mock import Mock
 
@@ -15,6 +16,8 @@ from notifications_utils.recipients import (
     RecipientCSV,
     Row,
     first_column_headings,
+    strip_all_whitespace_from_lines,
+    validate_phone_number,
 )
 from notifications_utils.template import EmailPreviewTemplate, SMSMessageTemplate
 
@@ -159,7 +162,10 @@ def test_recipient_column_headers(template_type, expected):
         ),
     ],
 )
-def test_get_rows(file_contents, template_type, expected):
+@pytest.mark.parametrize("as_stream", [False, True])
+def test_get_rows(file_contents, template_type, expected, as_stream):
+    if as_stream:
+        file_contents = StringIO(file_contents)
     rows = list(
         RecipientCSV(file_contents, template=_sample_template(template_type)).rows
     )
@@ -200,6 +206,65 @@ def test_get_rows_does_no_error_checking_of_rows_or_cells(mocker):
     assert cell_recipient_error_mock.called is False
 
 
+def test_get_rows_from_a_stream_reads_it_lazily():
+    lines_read = []
+
+    def lines():
+        yield "phone number,name\n"
+        for i in range(1, 5):
+            line = f"0790090000{i},A\n"
+            lines_read.append(line)
+            yield line
+
+    recipients = RecipientCSV(lines(), template=_sample_template("sms"))
+    assert recipients.column_headers == ["phone number", "name"]
+
+    rows = recipients.get_rows()
+    assert next(rows).recipient == "07900900001"
+    # one line ahead, to know whether to strip trailing whitespace from it
+    assert len(lines_read) == 2
+    assert [row.recipient for row in rows] == [
+        "07900900002",
+        "07900900003",
+        "07900900004",
+    ]
+
+
+@pytest.mark.parametrize("as_stream", [False, True])
+def test_get_rows_from_a_start_index(mocker, as_stream):
+    file_contents = "phone number\n07900900001\n07900900002\n07900900003\n"
+    row_mock = mocker.patch("notifications_utils.recipients.Row")
+
+    recipients = RecipientCSV(
+        StringIO(file_contents) if as_stream else file_contents,
+        template=_sample_template("sms"),
+    )
+    rows = list(recipients.get_rows(start_index=2))
+
+    assert len(rows) == 1
+    assert row_mock.call_args.kwargs["index"] == 2
+    assert row_mock.call_args.args[0] == {"phone number": "07900900003"}
+
+
+@pytest.mark.parametrize(
+    "lines, expected",
+    [
+        ([], []),
+        (["\n", " ,\n"], []),
+        (["\ufeff,a,b\n", "1,2\n"], ["a,b\n", "1,2"]),
+        (["a\n", "\n", "b,,\n", " \n", ",\n"], ["a\n", "\n", "b"]),
+        (["a,\n"], ["a"]),
+    ],
+)
+def test_strip_all_whitespace_from_lines(lines, expected):
+    assert list(strip_all_whitespace_from_lines(lines, extra_characters=",")) == (
+        expected
+    )
+    assert "".join(expected) == "".join(lines).strip(
+        " \n\ufeff,"
+    ), "should match stripping the whole file"
+
+
 def test_get_rows_only_iterates_over_file_once(mocker):
     row_mock = mocker.patch("notifications_utils.recipients.Row")
 
@@ -363,7 +428,11 @@ def test_overly_big_list_stops_processing_rows_beyond_max(mocker):
     assert big_csv.too_many_rows
     assert len(big_csv) == 123
 
-    # …but we’ve only called the expensive whitespace function on each
+    # …which can be counted without looking at any of their cells…
+    assert mock_strip_and_remove_obscure_whitespace.call_args_list == []
+    assert len(big_csv.rows) == 123
+
+    # …and we’ve only called the expensive whitespace function on each
     # of the 2 cells in the first 10 rows
     assert len(mock_strip_and_remove_obscure_whitespace.call_args_list) == 20
 
@@ -889,12 +958,14 @@ def test_ignores_spaces_and_case_in_placeholders(key, expected):
         (" \n\r\t\u000a\u000d\u180e\u200b\u200c\u200d\u2060\ufeff", None),
     ],
 )
-def test_ignores_leading_whitespace_in_file(character, name):
+@pytest.mark.parametrize("as_stream", [False, True])
+def test_ignores_leading_whitespace_in_file(character, name, as_stream):
     if name is not None:
         assert unicodedata.name(character) == name
 
+    file_contents = "{}emailaddress\ntest@example.com".format(character)
     recipients = RecipientCSV(
-        "{}emailaddress\ntest@example.com".format(character),
+        StringIO(file_contents) if as_stream else file_contents,
         template=_sample_template("email"),
     )
     first_row = recipients[0]
@@ -1154,3 +1225,69 @@ def test_recipient_csv_checks_should_validate_flag(should_validate):
 
     assert template.is_message_empty.called is should_validate
     assert recipients._get_error_for_field.called is should_validate
+
+
+def test_rows_with_errors_only_builds_the_rows_that_have_errors(mocker, app):
+    row = mocker.patch("notifications_utils.recipients.Row", wraps=Row)
+    recipients = RecipientCSV(
+        """
+            phone number,name
+            2348675309,A
+            12345,B
+            2348675301,
+            2348675302,D
+        """,
+        template=_sample_template("sms", "((name))"),
+    )
+
+    assert recipients.has_errors
+    assert recipients.error_row_indexes == [1, 2]
+    assert row.call_count == 0
+
+    assert _index_rows(recipients.rows_with_errors) == {1, 2}
+    assert _index_rows(recipients.rows_with_bad_recipients) == {1}
+    assert _index_rows(recipients.rows_with_missing_data) == {2}
+    assert row.call_count == 2
+
+
+def test_each_recipient_is_only_validated_once(mocker, app):
+    validate_phone_number_mock = mocker.patch(
+        "notifications_utils.recipients.validate_phone_number",
+        wraps=validate_phone_number,
+    )
+    recipients = RecipientCSV(
+        """
+            phone number,name
+            2348675309,A
+            (234) 867-5309,B
+            +1 234 867 5309,C
+            1-234-867-5309,D
+            12345,E
+            12345,F
+            +447700900460,G
+        """,
+        template=_sample_template("sms", "((name))"),
+        allow_international_sms=True,
+    )
+
+    assert _index_rows(recipients.rows_with_bad_recipients) == {4, 5}
+    # the US numbers are all the same one, and recognised without phonenumbers
+    assert sorted(
+        call.args[0] for call in validate_phone_number_mock.call_args_list
+    ) == [
+        "+447700900460",
+        "12345",
+    ]
+
+
+def test_stream_can_be_read_after_checking_for_errors(app):
+    def lines():
+        yield "phone number,name\n"
+        yield "2348675309,A\n"
+        yield "12345,B\n"
+
+    recipients = RecipientCSV(lines(), template=_sample_template("sms"))
+
+    assert recipients.has_errors
+    assert len(recipients) == 2
+    assert [row.recipient for row in recipients.get_rows()] == ["2348675309", "12345"]
@@ -1,14 +1,18 @@
+import phonenumbers
 import pytest
 
 from notifications_utils.recipients import (
     InvalidEmailError,
     InvalidPhoneError,
+    _is_valid_us_number,
     allowed_to_send_to,
     format_phone_number_human_readable,
     format_recipient,
     get_international_phone_info,
+    get_recipient_errors,
     international_phone_info,
     is_us_phone_number,
+    parse_phone_number,
     show_mangled_number_clues,
     try_validate_and_format_phone_number,
     validate_and_format_phone_number,
@@ -252,6 +256,38 @@ def test_get_international_info_raises(phone_number):
     assert str(error.value) == "Not a valid country prefix"
 
 
+@pytest.mark.parametrize(
+    ("phone_number", "expected"),
+    [
+        ("202-555-0104", ("+12025550104", False, "1", 1)),
+        ("+447123456789", ("+447123456789", True, "44", 1)),
+        ("+23051234567", ("+23051234567", True, "230", 1)),
+    ],
+)
+def test_parse_phone_number(phone_number, expected):
+    assert parse_phone_number(phone_number) == expected
+
+
+def test_parse_phone_number_parses_each_number_once(mocker):
+    parse = mocker.patch(
+        "notifications_utils.recipients.phonenumbers.parse",
+        wraps=phonenumbers.parse,
+    )
+    number = "+447123456780"
+
+    first = parse_phone_number(number)
+    calls = parse.call_count
+
+    assert validate_phone_number(number, international=True) == first.e164
+    assert get_international_phone_info(number).country_prefix == "44"
+    assert parse.call_count == calls
+
+
+def test_parse_phone_number_raises():
+    with pytest.raises(InvalidPhoneError):
+        parse_phone_number("+21 4321 0987")
+
+
 @pytest.mark.parametrize("phone_number", valid_us_phone_numbers)
 @pytest.mark.parametrize(
     "extra_args",
@@ -428,3 +464,73 @@ def test_try_format_recipient_doesnt_throw():
 
 def test_format_phone_number_human_readable_doenst_throw():
     assert format_phone_number_human_readable("ALPHANUM3R1C") == "ALPHANUM3R1C"
+
+
+def test_get_recipient_errors_validates_each_us_number_once(app):
+    assert get_recipient_errors(
+        ["2025550104", "(202) 555-0104", "+1 202 555 0104", "+2025550104", "12345"],
+        "sms",
+    ) == {
+        "2025550104": None,
+        "(202) 555-0104": None,
+        "+1 202 555 0104": None,
+        "+2025550104": "Not a US number",
+        "12345": "Not enough digits",
+    }
+
+
+@pytest.mark.parametrize("allow_international_sms", [False, True])
+def test_get_recipient_errors_match_validating_each_number(
+    app, allow_international_sms
+):
+    recipients = [
+        "2025550104",
+        "(202) 555-0104",
+        "+1 202 555 0104",
+        "6496798330",  # Turks and Caicos, without the +
+        "(876) 893-6698",  # Jamaica, without the +
+        "+1 876 893 6698",
+        "1-242-555-0104",  # Bahamas
+        "+447900900123",
+        "12345",
+    ]
+
+    def error(recipient):
+        try:
+            validate_phone_number(recipient, international=allow_international_sms)
+        except InvalidPhoneError as e:
+            return str(e)
+        return None
+
+    assert get_recipient_errors(recipients, "sms", allow_international_sms) == {
+        recipient: error(recipient) for recipient in recipients
+    }
+
+
+def test_get_recipient_errors_for_email_addresses(app):
+    assert get_recipient_errors(["test@example.com", "test"], "email") == {
+        "test@example.com": None,
+        "test": "Not a valid email address",
+    }
+
+
+@pytest.mark.parametrize(
+    "phone_number",
+    valid_us_phone_numbers
+    + [
+        "+12425550104",  # Bahamas
+        "+16135550104",  # Canada
+        "+12025550100",
+        "+12021234567",
+        "+18005550104",
+    ],
+)
+def test_is_valid_us_number_agrees_with_validate_phone_number(phone_number):
+    e164 = "+1" + "".join(filter(str.isdigit, phone_number))[-10:]
+    try:
+        valid = validate_phone_number(e164) == e164
+    except InvalidPhoneError:
+        valid = False
+
+    # it may leave a valid number to be checked the slow way, but never the reverse
+    assert valid or not _is_valid_us_number(e164)
@@ -1,6 +1,11 @@
 import pytest
 
-from notifications_utils.sanitise_text import SanitiseASCII, SanitiseSMS, SanitiseText
+from notifications_utils.sanitise_text import (
+    SanitiseASCII,
+    SanitiseSMS,
+    SanitiseText,
+    get_translation_table,
+)
 
 params, ids = zip(
     (("a", "a"), "ascii char (a)"),
@@ -106,6 +111,25 @@ def test_encode_string(content, expected):
     assert SanitiseASCII.encode(content) == expected
 
 
+def test_encode_works_out_each_character_once(mocker):
+    get_translation_table.cache_clear()
+    encode_char = mocker.spy(SanitiseSMS, "encode_char")
+
+    assert SanitiseSMS.encode("ō–🐮 ō–🐮") == "o-? o-?"
+    assert SanitiseSMS.encode("🐮ō") == "?o"
+    assert SanitiseSMS.get_non_compatible_characters("ō–🐮") == {"🐮"}
+
+    assert sorted(call.args[0] for call in encode_char.call_args_list) == [
+        "ō",
+        "–",
+        "🐮",
+    ]
+
+
+def test_encode_replaces_ascii_that_is_not_in_the_sms_character_set():
+    assert SanitiseSMS.encode("`tab\there`") == "?tab here?"
+
+
 @pytest.mark.parametrize(
     ("content", "cls", "expected"),
     [
@@ -8,19 +8,23 @@ from markupsafe import Markup
 from ordered_set import OrderedSet
 
 from notifications_utils.formatters import unlink_govuk_escaped
+from notifications_utils.markdown import notify_email_markdown
 from notifications_utils.template import (
     BaseBroadcastTemplate,
     BaseEmailTemplate,
     BroadcastMessageTemplate,
     BroadcastPreviewTemplate,
+    CompiledTemplate,
     EmailPreviewTemplate,
     HTMLEmailTemplate,
     PlainTextEmailTemplate,
     SMSBodyPreviewTemplate,
+    SMSFragments,
     SMSMessageTemplate,
     SMSPreviewTemplate,
     SubjectMixin,
     Template,
+    get_sms_fragments,
 )
 
 
@@ -364,6 +368,7 @@ def test_preheader_is_at_start_of_html_emails():
 )
 def test_content_of_preheader_in_html_emails(
     mock_jinja_template,
+    uncompiled_email_shells,
     content,
     values,
     expected_preheader,
@@ -398,6 +403,7 @@ def test_markdown_in_templates(
     extra_args,
     result,
     markdown_renderer,
+    uncompiled_templates,
 ):
     with mock.patch(markdown_renderer, return_value="") as mock_markdown_renderer:
         str(
@@ -1147,6 +1153,48 @@ def test_sms_fragment_count_accounts_for_non_latin_characters(
     assert template.fragment_count == expected_sms_fragment_count
 
 
+@pytest.mark.parametrize(
+    ("message", "expected_fragments"),
+    [
+        ("", SMSFragments("UCS-2", 0, 0)),
+        ("Your code is 12345", SMSFragments("GSM-7", 18, 1)),
+        ("a" * 160, SMSFragments("GSM-7", 160, 1)),
+        ("a" * 161, SMSFragments("GSM-7", 161, 2)),
+        ("a" * 306, SMSFragments("GSM-7", 306, 2)),
+        ("Tab\tand\u3000ideographic space", SMSFragments("GSM-7", 25, 1)),
+        ("Ça coûte £5 à Zürich", SMSFragments("UCS-2", 20, 1)),
+        # extended GSM characters are not counted as GSM
+        ("Costs €5 {or less}", SMSFragments("UCS-2", 18, 1)),
+        ("Привет", SMSFragments("UCS-2", 6, 1)),
+        ("я" * 70, SMSFragments("UCS-2", 70, 1)),
+        ("я" * 71, SMSFragments("UCS-2", 71, 2)),
+    ],
+)
+def test_get_sms_fragments(message, expected_fragments):
+    assert get_sms_fragments(message) == expected_fragments
+
+
+def test_sms_fragments_are_counted_once_for_each_set_of_values(mocker):
+    template = SMSMessageTemplate(
+        {"content": "Hello ((name))", "template_type": "sms"}, {"name": "Jo"}
+    )
+    get_sms_fragments_mock = mocker.patch(
+        "notifications_utils.template.get_sms_fragments",
+        wraps=get_sms_fragments,
+    )
+
+    assert template.fragments == SMSFragments("GSM-7", 8, 1)
+    assert str(template) == "Hello Jo"
+    assert template.fragment_count == 1
+    assert get_sms_fragments_mock.call_count == 1
+
+    template.values = {"name": "Jo" * 80}
+
+    assert template.fragments == SMSFragments("GSM-7", 166, 2)
+    assert str(template) == "Hello " + "Jo" * 80
+    assert get_sms_fragments_mock.call_count == 2
+
+
 @pytest.mark.parametrize(
     "template_class",
     [
@@ -1433,6 +1481,7 @@ def test_templates_handle_html_and_redacting(
     template_type,
     extra_args,
     expected_field_calls,
+    uncompiled_templates,
 ):
     assert str(
         template_class(
@@ -1548,6 +1597,7 @@ def test_templates_remove_whitespace_before_punctuation(
     template_type,
     extra_args,
     expected_remove_whitespace_calls,
+    uncompiled_templates,
 ):
     template = template_class(
         {"content": "content", "subject": "subject", "template_type": template_type},
@@ -1620,6 +1670,7 @@ def test_templates_make_quotes_smart_and_dashes_en(
     template_type,
     extra_args,
     expected_calls,
+    uncompiled_templates,
 ):
     template = template_class(
         {"content": "content", "subject": "subject", "template_type": template_type},
@@ -2281,3 +2332,160 @@ def test_broadcast_message_single_counts_diacritics_in_gsm(
     )
     assert template.encoded_content_count == 1
     assert template.max_content_count == 1_395
+
+
+compiled_email_template = {
+    "content": (
+        "Dear ((name)),\n\n"
+        "Your reference is ((reference)).\n\n"
+        "* ((item)) on GOV.UK\n"
+        "* see https://www.example.com/apply - it’s quick"
+    ),
+    "subject": "Reference ((reference)) received",
+    "template_type": "email",
+}
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        {"name": "Jo Smith", "reference": "AB12", "item": "Passport"},
+        {"name": "Jo", "reference": 12, "item": "1"},
+        # not compiled, these go through the formatting in full
+        {"name": "**Jo**", "reference": "AB-12", "item": "GOV.UK"},
+        {"name": "Jo", "reference": "AB12"},
+    ],
+)
+@pytest.mark.parametrize(
+    "render",
+    [
+        lambda values: str(HTMLEmailTemplate(compiled_email_template, values)),
+        lambda values: str(PlainTextEmailTemplate(compiled_email_template, values)),
+        lambda values: PlainTextEmailTemplate(compiled_email_template, values).subject,
+        lambda values: str(
+            SMSMessageTemplate(
+                {**compiled_email_template, "template_type": "sms"},
+                values,
+                prefix="Service",
+            )
+        ),
+    ],
+)
+def test_compiled_templates_render_the_same_as_in_full(mocker, render, values):
+    compiled = render(values)
+
+    mocker.patch("notifications_utils.template.compile_template", return_value=None)
+
+    assert compiled == render(values)
+
+
+def test_compiled_template_is_only_formatted_once(mocker):
+    markdown = mocker.patch(
+        "notifications_utils.template.notify_email_markdown",
+        wraps=notify_email_markdown,
+    )
+
+    first = HTMLEmailTemplate(
+        compiled_email_template,
+        {"name": "Jo", "reference": "AB12", "item": "Passport"},
+    ).html_body
+    second = HTMLEmailTemplate(
+        compiled_email_template,
+        {"name": "Sam", "reference": "CD34", "item": "Licence"},
+    ).html_body
+
+    assert markdown.call_count == 1
+    assert "Dear Jo," in first
+    assert "Dear Sam," in second
+    assert "CD34" in second
+
+
+def test_values_that_could_change_the_formatting_are_rendered_in_full():
+    template = HTMLEmailTemplate(
+        compiled_email_template,
+        {"name": "O'Brien - Jo", "reference": "AB12", "item": "Passport"},
+    )
+
+    assert CompiledTemplate.values_for(template) is None
+    assert "Dear O’Brien – Jo," in template.html_body
+
+
+@pytest.mark.parametrize(
+    "branding",
+    [
+        {},
+        {"complete_html": False},
+        {"govuk_banner": False, "brand_banner": True, "brand_colour": "#f00"},
+        {
+            "govuk_banner": False,
+            "brand_logo": "https://example.com/logo.png",
+            "brand_text": "Brand <& text>",
+            "brand_name": "Brand",
+        },
+    ],
+)
+@pytest.mark.parametrize(
+    "values",
+    [
+        {"name": "Jo", "reference": "AB12", "item": "Passport"},
+        {"name": "<b>O'Brien</b> & ((co))", "reference": '"AB"', "item": ""},
+    ],
+)
+def test_email_shells_render_the_same_as_in_full(mocker, branding, values):
+    compiled = str(HTMLEmailTemplate(compiled_email_template, values, **branding))
+
+    mocker.patch("notifications_utils.template.compile_email_shell", return_value=None)
+
+    assert compiled == str(
+        HTMLEmailTemplate(compiled_email_template, values, **branding)
+    )
+
+
+def test_email_shell_is_only_rendered_once_per_branding(mocker):
+    render = mocker.patch.object(
+        HTMLEmailTemplate.jinja_template,
+        "render",
+        wraps=HTMLEmailTemplate.jinja_template.render,
+    )
+
+    first = str(HTMLEmailTemplate(compiled_email_template, {"name": "Jo"}))
+    second = str(HTMLEmailTemplate(compiled_email_template, {"name": "Sam"}))
+    branded = str(HTMLEmailTemplate(compiled_email_template, {}, brand_banner=True))
+
+    assert render.call_count == 2
+    assert "Dear Jo," in first
+    assert "Dear Sam," in second
+    assert branded != first
+
+
+def test_branding_that_looks_like_a_marker_is_rendered_in_full():
+    email = str(
+        HTMLEmailTemplate(
+            compiled_email_template,
+            {},
+            govuk_banner=False,
+            brand_logo="https://example.com/logo.png",
+            brand_text="XNOTIFYEMAILSHELLbodyX",
+        )
+    )
+
+    assert "XNOTIFYEMAILSHELLbodyX" in email
+    assert "Dear ((name))," not in email
+
+
+@pytest.mark.parametrize(
+    ("content", "can_compile"),
+    [
+        ("Dear ((name)),", True),
+        ("Your code is ((code)). It expires soon", True),
+        ("((name))\n\n((title)): welcome!", True),
+        ("((a??conditional))", False),
+        ("GOV.((domain))", False),
+        ("((name))’s application", False),
+        ("[((text))](https://example.com)", False),
+        ("((number)). at the start of a line is a list", False),
+        ("XNOTIFYPLACEHOLDER0X", False),
+    ],
+)
+def test_compiled_template_can_compile(content, can_compile):
+    assert CompiledTemplate.can_compile(content) is can_compile